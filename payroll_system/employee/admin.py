@@ -4,9 +4,20 @@ from .models import Employee
 # Register the models so that they appear in the admin interface
 
 class EmployeeAdmin(admin.ModelAdmin):
-    list_display = ('first_name', 'last_name', 'email', 'hire_date')  # Columns to show in the list view
+    list_display = ('first_name', 'last_name', 'email', 'hire_date', 'status')  # Columns to show in the list view
     search_fields = ('first_name', 'last_name', 'email')  # Fields you can search by
-    list_filter = ('hire_date',)  # Filter by hire date
+    list_filter = ('status', 'hire_date')  # Filter by status and hire date
+    actions = ['mark_active', 'mark_inactive']
+
+    @admin.action(description="Mark selected employees as Active")
+    def mark_active(self, request, queryset):
+        updated = queryset.set_status(Employee.STATUS_ACTIVE)
+        self.message_user(request, f"{updated} employee(s) marked as Active.")
+
+    @admin.action(description="Mark selected employees as Inactive")
+    def mark_inactive(self, request, queryset):
+        updated = queryset.set_status(Employee.STATUS_INACTIVE)
+        self.message_user(request, f"{updated} employee(s) marked as Inactive.")
 
 # Register the custom admin class with the model
 admin.site.register(Employee, EmployeeAdmin)
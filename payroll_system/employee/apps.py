@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EmployeeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'employee'
+
+    def ready(self):
+        # Connect the signal handlers that keep the employee directory up to date.
+        from . import signals  # noqa: F401
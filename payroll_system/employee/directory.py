@@ -0,0 +1,225 @@
+"""
+Process-local directory of employee names, positions and statuses.
+
+Nearly every payroll page needs an employee's name or position: the employee
+dropdown of the payroll form, the payroll summary, payslip headers and the
+employee checks of batch and punch uploads. Each process keeps those fields
+of every employee in memory instead: one EmployeeEntry per employee (a
+__slots__ object, with positions and statuses interned so repeated values are
+stored once), keyed by id and loaded with a single query.
+
+The directory is reloaded only when EmployeeDirectoryVersion changes, so an
+up-to-date directory costs one single-row query. The signal handlers in
+employee.signals bump the version when an employee is saved or deleted, and
+EmployeeQuerySet bumps it on update() and bulk_create(), which bypass those
+signals. Within a request the version is only checked once: the directory
+found by the first lookup is kept in a Local until the request finishes or the
+version is bumped, so views and form fields can look it up as often as they
+need. The directory always reads the default database, also inside views that
+send their reads to the reporting database, so it is never loaded from a
+lagging snapshot. The benchmark_employee_directory command measures its memory
+use and lookup latency.
+"""
+import sys
+import threading
+
+from asgiref.local import Local
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F
+from django.dispatch import receiver
+from django.http import Http404
+
+from .models import Employee, EmployeeDirectoryVersion
+
+ENTRY_FIELDS = ('id', 'first_name', 'last_name', 'position', 'status')
+
+
+class EmployeeEntry:
+    """
+    The directory fields of one employee.
+
+    Entries are shared by every request of the process and must not be modified.
+    """
+
+    __slots__ = ENTRY_FIELDS
+
+    def __init__(self, id, first_name, last_name, position, status):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.position = sys.intern(position)
+        self.status = sys.intern(status)
+
+    def __str__(self):
+        """
+        Returns the full name, like Employee.__str__.
+        """
+        return f"{self.first_name} {self.last_name}"
+
+    def __repr__(self):
+        return f'<EmployeeEntry {self.id}: {self}>'
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def is_active(self):
+        return self.status == Employee.STATUS_ACTIVE
+
+    def to_model(self):
+        """
+        Returns an Employee instance built from the entry without a query.
+
+        Only the directory fields are loaded; the others (email, hire_date) are deferred
+        and fetched from the database if they are accessed.
+        """
+        return Employee.from_db(None, ENTRY_FIELDS, [getattr(self, field) for field in ENTRY_FIELDS])
+
+
+class EmployeeDirectory:
+    """
+    Every employee's EmployeeEntry, by id.
+
+    Attributes:
+        version (int): The EmployeeDirectoryVersion the directory was loaded at.
+    """
+
+    __slots__ = ('version', '_entries')
+
+    def __init__(self, version, rows):
+        """
+        Args:
+            version (int): The EmployeeDirectoryVersion the rows were read at.
+            rows (iterable): (id, first_name, last_name, position, status) tuples in id order.
+        """
+        self.version = version
+        self._entries = {row[0]: EmployeeEntry(*row) for row in rows}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        """
+        Iterates over all entries in id order.
+        """
+        return iter(self._entries.values())
+
+    def __contains__(self, employee_id):
+        return self.get(employee_id) is not None
+
+    def get(self, employee_id):
+        """
+        Returns the entry of an employee, or None if there is no such employee.
+
+        Args:
+            employee_id: The id, as an int or a string such as a GET parameter.
+        """
+        try:
+            return self._entries.get(int(employee_id))
+        except (TypeError, ValueError):
+            return None
+
+    def active(self):
+        """
+        Returns the entries of active employees in id order.
+        """
+        return [entry for entry in self._entries.values() if entry.status == Employee.STATUS_ACTIVE]
+
+    def positions(self, employee_ids):
+        """
+        Returns {employee_id: position} for the given ids that belong to an employee.
+        """
+        entries = self._entries
+        return {employee_id: entries[employee_id].position for employee_id in employee_ids if employee_id in entries}
+
+
+def load_directory(version=0):
+    """
+    Reads the directory fields of all employees with a single query.
+
+    Args:
+        version (int): The EmployeeDirectoryVersion being loaded.
+
+    Returns:
+        EmployeeDirectory: The loaded directory.
+    """
+    employees = Employee.objects.using(DEFAULT_DB_ALIAS).order_by('id').values_list(*ENTRY_FIELDS)
+    return EmployeeDirectory(version, employees.iterator())
+
+
+_directory = None
+_load_lock = threading.Lock()
+# The directory resolved by the current request, if it is handling one.
+_request_state = Local()
+
+
+@receiver(request_started)
+def _start_request(sender, **kwargs):
+    _request_state.in_request = True
+    _request_state.directory = None
+
+
+@receiver(request_finished)
+def _finish_request(sender, **kwargs):
+    _request_state.in_request = False
+    _request_state.directory = None
+
+
+def current_version():
+    """
+    Returns the current EmployeeDirectoryVersion, 0 before any employee was changed.
+    """
+    versions = EmployeeDirectoryVersion.objects.using(DEFAULT_DB_ALIAS)
+    return versions.values_list('version', flat=True).first() or 0
+
+
+def current_directory():
+    """
+    Returns the employee directory, reloading it if employees changed since this process loaded it.
+
+    Costs one single-row query when the loaded directory is still current, and nothing
+    for further lookups within the same request.
+    """
+    global _directory
+    directory = getattr(_request_state, 'directory', None)
+    if directory is not None:
+        return directory
+    version = current_version()
+    directory = _directory
+    if directory is None or directory.version != version:
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # The version may count this transaction's own changes, which could still be
+            # rolled back, so a directory loaded here is not shared with other requests.
+            return load_directory(version)
+        with _load_lock:
+            if _directory is None or _directory.version != version:
+                _directory = load_directory(version)
+            directory = _directory
+    if getattr(_request_state, 'in_request', False):
+        _request_state.directory = directory
+    return directory
+
+
+def get_entry_or_404(employee_id, employees=None):
+    """
+    Returns an employee's directory entry, raising Http404 if there is no such employee.
+
+    Args:
+        employee_id: The id, as an int or a string such as a GET parameter.
+        employees (EmployeeDirectory): The directory already resolved by the caller, if any.
+    """
+    entry = (employees or current_directory()).get(employee_id)
+    if entry is None:
+        raise Http404("No Employee matches the given query.")
+    return entry
+
+
+def bump_version():
+    """
+    Marks the employee directory of every process as stale.
+    """
+    _request_state.directory = None
+    if not EmployeeDirectoryVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        EmployeeDirectoryVersion.objects.get_or_create(pk=1, defaults={'version': 1})
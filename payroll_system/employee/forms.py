@@ -1,4 +1,7 @@
 from django import forms
+from django.forms.models import ModelChoiceIterator
+
+from . import directory
 from .models import Employee
 
 class EmployeeForm(forms.ModelForm):
@@ -11,9 +14,114 @@ class EmployeeForm(forms.ModelForm):
     - email: The email address of the employee.
     - hire_date: The date when the employee was hired.
     - position: The employee's job position.
+    - bank_account: The account net salaries are paid into (optional).
 
     The form will also validate the data to ensure that all necessary fields are filled.
     """
     class Meta:
         model = Employee
-        fields = ['first_name', 'last_name', 'email', 'hire_date', 'position']
+        fields = ['first_name', 'last_name', 'email', 'hire_date', 'position', 'bank_account']
+
+
+
+class EmployeeImportForm(forms.Form):
+    """
+    Form for importing many employees from a CSV or Excel file.
+
+    - employee_file: Rows with first_name, last_name, email, hire_date, position and optional status and bank_account columns.
+    - update_existing: Update employees whose email is already on file instead of rejecting those rows.
+    """
+    employee_file = forms.FileField(
+        help_text="CSV or Excel file with first_name, last_name, email, hire_date and position columns."
+    )
+    update_existing = forms.BooleanField(
+        required=False,
+        help_text="Update employees whose email already exists instead of reporting those rows as errors."
+    )
+
+
+class BulkStatusForm(forms.Form):
+    """
+    Form for changing the status of many employees at once.
+
+    The employees are either the ones selected in the employee list (employee_ids), or
+    every employee matching the filter:
+    - project: Employees with payroll records on this project.
+    - no_payroll_since: Employees without any payroll record on or after this date.
+    """
+    status = forms.ChoiceField(choices=Employee.STATUS_CHOICES)
+    employee_ids = forms.Field(required=False, widget=forms.MultipleHiddenInput())
+    project = forms.CharField(max_length=200, required=False)
+    no_payroll_since = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean_employee_ids(self):
+        """
+        Parses the list of selected employee IDs.
+        """
+        values = self.cleaned_data.get('employee_ids') or []
+        try:
+            return [int(item) for item in values]
+        except ValueError:
+            raise forms.ValidationError("Invalid employee selection.")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not (cleaned_data.get('employee_ids') or cleaned_data.get('project') or cleaned_data.get('no_payroll_since')):
+            raise forms.ValidationError("Select employees or provide a project or date filter.")
+        return cleaned_data
+
+
+class DirectoryChoiceIterator(ModelChoiceIterator):
+    """
+    Lists the choices of an EmployeeChoiceField from the employee directory.
+    """
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for entry in self.field.entries():
+            yield (entry.id, self.field.label_from_instance(entry))
+
+    def __len__(self):
+        return len(self.field.entries()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.entries())
+
+
+class EmployeeChoiceField(forms.ModelChoiceField):
+    """
+    Dropdown of active employees served from the employee directory.
+
+    Neither rendering the choices nor validating the selection queries the employee
+    table; the selected employee is returned as an Employee built from its directory
+    entry (see EmployeeEntry.to_model).
+
+    Attributes:
+        include_id (int): An employee offered even if inactive, such as the employee of
+            the record being edited.
+    """
+    iterator = DirectoryChoiceIterator
+
+    def __init__(self, *args, include_id=None, **kwargs):
+        kwargs.setdefault('queryset', Employee.active.all())
+        super().__init__(*args, **kwargs)
+        self.include_id = include_id
+
+    def entries(self):
+        """
+        Returns the directory entries offered as choices, in id order.
+        """
+        return [
+            entry for entry in directory.current_directory()
+            if entry.is_active or entry.id == self.include_id
+        ]
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        entry = directory.current_directory().get(value)
+        if entry is None or not (entry.is_active or entry.id == self.include_id):
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value},
+            )
+        return entry.to_model()
@@ -0,0 +1,203 @@
+"""
+Bulk import of employees from a CSV or Excel file.
+
+Creating employees one at a time through EmployeeForm costs a unique check on
+email and an INSERT per employee. Here the whole file is validated at once
+with pandas (required values, lengths, email format, hire dates, statuses and
+emails repeated within the file), the emails already in the database are
+loaded into a set with a single query, and the new employees are inserted
+with chunked bulk_create. With update_existing, rows whose email belongs to
+an existing employee update that employee instead of being rejected.
+
+Invalid rows never stop the valid ones from being imported; every row gets
+a line in the returned report saying what happened to it.
+"""
+from io import BytesIO
+
+import pandas as pd
+
+REQUIRED_COLUMNS = ['first_name', 'last_name', 'email', 'hire_date', 'position']
+
+# Optional column; employees are created as Active without it.
+STATUS_COLUMN = 'status'
+
+# Optional column; employees are created without a bank account without it.
+BANK_ACCOUNT_COLUMN = 'bank_account'
+BANK_ACCOUNT_PATTERN = r'[0-9][0-9 -]*'
+
+TEXT_LENGTHS = {'first_name': 100, 'last_name': 100, 'position': 100, 'email': 254, 'bank_account': 34}
+
+# The address forms accepted by Django's EmailValidator, minus quoted local parts and IP literals.
+EMAIL_PATTERN = (
+    r"[-!#$%&'*+/=?^_`{}|~0-9A-Za-z]+(?:\.[-!#$%&'*+/=?^_`{}|~0-9A-Za-z]+)*"
+    r"@(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z0-9-]{2,63}(?<!-)"
+)
+
+INSERT_BATCH_SIZE = 1000
+
+RESULT_CREATED = 'created'
+RESULT_UPDATED = 'updated'
+RESULT_UNCHANGED = 'unchanged'
+RESULT_ERROR = 'error'
+
+
+def read_employee_file(name, content):
+    """
+    Reads an uploaded CSV or Excel file into a DataFrame of strings.
+
+    Raises:
+        ValueError: If the file cannot be read.
+    """
+    try:
+        if name.lower().endswith('.csv'):
+            return pd.read_csv(BytesIO(content), dtype=str, keep_default_na=False)
+        return pd.read_excel(BytesIO(content), dtype=str, keep_default_na=False)
+    except Exception as e:
+        raise ValueError(f"Could not read file: {e}")
+
+
+def validate_employee_frame(df):
+    """
+    Validates employee rows with column-wise checks.
+
+    Args:
+        df (DataFrame): The rows as read by read_employee_file.
+
+    Returns:
+        tuple: (rows, errors), where rows is a DataFrame of cleaned values (hire_date as
+               date, status and bank_account filled in) and errors a Series holding an error message, or ''
+               for valid rows. Both use the index of df.
+
+    Raises:
+        ValueError: If a required column is missing.
+    """
+    from .models import Employee
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+
+    rows = pd.DataFrame(index=df.index)
+    errors = pd.Series('', index=df.index, dtype=object)
+
+    for column in ['first_name', 'last_name', 'position', 'email']:
+        values = df[column].fillna('').astype(str).str.strip()
+        errors[values.str.len() > TEXT_LENGTHS[column]] = f'{column} is longer than {TEXT_LENGTHS[column]} characters.'
+        errors[values == ''] = f'{column} is required.'
+        rows[column] = values
+
+    hire_dates = pd.to_datetime(df['hire_date'].fillna('').astype(str).str.strip(), errors='coerce')
+    errors[hire_dates.isna()] = 'Invalid hire_date (expected yyyy-mm-dd).'
+    rows['hire_date'] = hire_dates.dt.date
+
+    if STATUS_COLUMN in df.columns:
+        statuses = df[STATUS_COLUMN].fillna('').astype(str).str.strip().str.capitalize()
+        statuses = statuses.replace('', Employee.STATUS_ACTIVE)
+        valid_statuses = [value for value, _ in Employee.STATUS_CHOICES]
+        errors[~statuses.isin(valid_statuses)] = f"Invalid status (expected {' or '.join(valid_statuses)})."
+        rows['status'] = statuses
+    else:
+        rows['status'] = Employee.STATUS_ACTIVE
+
+    if BANK_ACCOUNT_COLUMN in df.columns:
+        accounts = df[BANK_ACCOUNT_COLUMN].fillna('').astype(str).str.strip()
+        errors[(accounts != '') & ~accounts.str.fullmatch(BANK_ACCOUNT_PATTERN)] = (
+            'Invalid bank_account (use digits, spaces and dashes).'
+        )
+        errors[accounts.str.len() > TEXT_LENGTHS['bank_account']] = (
+            f"bank_account is longer than {TEXT_LENGTHS['bank_account']} characters."
+        )
+        rows['bank_account'] = accounts
+    else:
+        rows['bank_account'] = ''
+
+    emails = rows['email']
+    errors[(emails != '') & ~emails.str.fullmatch(EMAIL_PATTERN)] = 'Invalid email address.'
+
+    # Emails are unique regardless of case; later rows repeating an email are rejected.
+    keys = emails.str.lower()
+    rows['email_key'] = keys
+    repeated = keys.duplicated() & (keys != '')
+    if repeated.any():
+        first_rows = pd.Series(df.index, index=df.index).groupby(keys).transform('min') + 2
+        errors[repeated] = 'Duplicate email in file (first on row ' + first_rows[repeated].astype(str) + ').'
+    return rows, errors
+
+
+def import_employees(df, update_existing=False, batch_size=INSERT_BATCH_SIZE):
+    """
+    Creates (and optionally updates) employees from validated file rows.
+
+    Args:
+        df (DataFrame): The rows as read by read_employee_file.
+        update_existing (bool): Whether rows whose email already exists update that
+            employee. Without it such rows are reported as errors.
+        batch_size (int): Rows per INSERT or UPDATE statement.
+
+    Returns:
+        dict: Counts per result ('created', 'updated', 'unchanged', 'error') and 'report',
+              one {'row', 'email', 'result', 'message'} per file row in file order, where
+              row is the spreadsheet row number.
+
+    Raises:
+        ValueError: If a required column is missing.
+    """
+    from django.db import transaction
+
+    from .models import Employee
+
+    rows, errors = validate_employee_frame(df)
+
+    # One query for every existing email instead of a unique check per row.
+    existing = {email.lower(): employee_id for email, employee_id in Employee.objects.values_list('email', 'id')}
+    exists = rows['email_key'].isin(existing.keys()) & (errors == '')
+    if not update_existing:
+        errors[exists] = 'An employee with this email already exists.'
+        exists[:] = False
+
+    fields = REQUIRED_COLUMNS + ['status', 'bank_account']
+    # Without a status or bank_account column, updates leave that field of each employee as it is.
+    optional_columns = {'status': STATUS_COLUMN, 'bank_account': BANK_ACCOUNT_COLUMN}
+    update_fields = [
+        field for field in fields
+        if field != 'email' and (field not in optional_columns or optional_columns[field] in df.columns)
+    ]
+    valid = errors == ''
+    to_create = rows[valid & ~exists]
+    to_update = rows[valid & exists]
+
+    results = pd.Series(RESULT_ERROR, index=df.index, dtype=object)
+    results[to_create.index] = RESULT_CREATED
+
+    updates = []
+    if len(to_update):
+        ids = to_update['email_key'].map(existing)
+        current = {
+            values['id']: values
+            for values in Employee.objects.filter(id__in=ids.tolist()).values('id', *update_fields)
+        }
+        for index, employee_id, record in zip(to_update.index, ids, to_update[update_fields].to_dict('records')):
+            # The stored email keeps its spelling; only the other fields are updated.
+            if all(current[employee_id][field] == record[field] for field in update_fields):
+                results[index] = RESULT_UNCHANGED
+            else:
+                results[index] = RESULT_UPDATED
+                updates.append(Employee(id=employee_id, **record))
+
+    with transaction.atomic():
+        Employee.objects.bulk_create(
+            [Employee(**record) for record in to_create[fields].to_dict('records')],
+            batch_size=batch_size,
+        )
+        Employee.objects.bulk_update(updates, update_fields, batch_size=batch_size)
+
+    report = [
+        {'row': int(index) + 2, 'email': email, 'result': result, 'message': message}
+        for index, email, result, message in zip(df.index, rows['email'], results, errors)
+    ]
+    counts = results.value_counts()
+    summary = {
+        name: int(counts.get(name, 0)) for name in (RESULT_CREATED, RESULT_UPDATED, RESULT_UNCHANGED, RESULT_ERROR)
+    }
+    summary['report'] = report
+    return summary
@@ -0,0 +1,104 @@
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from employee import directory
+from employee.models import Employee
+
+POSITIONS = ['Mason', 'Carpenter', 'Electrician', 'Plumber', 'Foreman', 'Helper', 'Welder', 'Painter']
+
+
+def _synthetic_rows(count):
+    statuses = [Employee.STATUS_ACTIVE] * 9 + [Employee.STATUS_INACTIVE]
+    return [
+        (index, f'First{index}', f'Last{index}', POSITIONS[index % len(POSITIONS)], statuses[index % len(statuses)])
+        for index in range(1, count + 1)
+    ]
+
+
+def _allocated(build):
+    """
+    Returns the object built by build() and the bytes it allocated.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        built = build()
+        allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return built, allocated
+
+
+def _per_call(timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return f"p50 {statistics.median(timings) * 1e6:.2f} us, p95 {p95 * 1e6:.2f} us"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the memory used by the employee directory for synthetic employees and the latency of "
+        "employee lookups from the directory compared with database queries. Nothing is written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=10000, help="Number of synthetic employees.")
+        parser.add_argument('--lookups', type=int, default=10000, help="Number of lookups timed per method.")
+
+    def handle(self, *args, **options):
+        count = options['employees']
+
+        # The rows are generated inside the measurement so the names they hold are counted.
+        loaded, directory_bytes = _allocated(lambda: directory.EmployeeDirectory(0, _synthetic_rows(count)))
+        _, model_bytes = _allocated(lambda: [
+            Employee(id=row[0], first_name=row[1], last_name=row[2], email=f'employee{row[0]}@example.invalid',
+                     hire_date=date(2020, 1, 1), position=row[3], status=row[4])
+            for row in _synthetic_rows(count)
+        ])
+        per_10k = 10000 / count if count else 0
+        self.stdout.write(f"Memory for {count} employees:")
+        self.stdout.write(
+            f"  directory        {directory_bytes / 1024:10.0f} KiB  ({directory_bytes * per_10k / 2 ** 20:.1f} MiB per 10k)"
+        )
+        self.stdout.write(
+            f"  Employee objects {model_bytes / 1024:10.0f} KiB  ({model_bytes * per_10k / 2 ** 20:.1f} MiB per 10k)"
+        )
+
+        lookups = options['lookups']
+        ids = [random.randint(1, count) for _ in range(lookups)]
+        timings = []
+        for employee_id in ids:
+            started = time.perf_counter()
+            loaded.get(employee_id)
+            timings.append(time.perf_counter() - started)
+        self.stdout.write(f"Lookups ({lookups} each):")
+        self.stdout.write(f"  directory entry            {_per_call(timings)}")
+
+        existing = list(Employee.objects.values_list('id', flat=True)[:lookups])
+        if existing:
+            self._database_lookups(existing, lookups)
+        else:
+            self.stdout.write("  (no employees in the database; database lookups were skipped)")
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    def _database_lookups(self, existing, lookups):
+        directory.current_directory()
+        timings = []
+        for _ in range(lookups):
+            started = time.perf_counter()
+            directory.current_directory().get(random.choice(existing))
+            timings.append(time.perf_counter() - started)
+        self.stdout.write(f"  current directory + entry  {_per_call(timings)}")
+
+        timings = []
+        for _ in range(lookups):
+            started = time.perf_counter()
+            Employee.objects.only('first_name', 'last_name', 'position', 'status').get(pk=random.choice(existing))
+            timings.append(time.perf_counter() - started)
+        self.stdout.write(f"  Employee.objects.get       {_per_call(timings)}")
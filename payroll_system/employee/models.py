@@ -1,5 +1,82 @@
+from django.core.validators import RegexValidator
 from django.db import models
 
+# Employees whose values are read back per query after a bulk update.
+UPDATE_READ_BATCH_SIZE = 1000
+
+
+class EmployeeQuerySet(models.QuerySet):
+    """
+    QuerySet with the filters and bulk updates used to manage employee statuses.
+
+    update() and bulk_create() (and bulk_update(), which runs update()) do not send
+    model signals, so they mark the employee directory as stale themselves and send
+    employee_rows_changed with the values before and after.
+    """
+    def update(self, **kwargs):
+        from .directory import bump_version
+        from .signals import employee_rows_changed
+
+        notify = employee_rows_changed.has_listeners(self.model)
+        fields = [self.model._meta.get_field(name).attname for name in kwargs]
+        if notify:
+            before = {values['id']: values for values in self.values('id', *fields)}
+        updated = super().update(**kwargs)
+        if updated:
+            bump_version()
+            if notify:
+                ids = list(before)
+                changes = []
+                for start in range(0, len(ids), UPDATE_READ_BATCH_SIZE):
+                    after = self.model._base_manager.filter(id__in=ids[start:start + UPDATE_READ_BATCH_SIZE])
+                    changes.extend((before[values['id']], values) for values in after.values('id', *fields))
+                employee_rows_changed.send(sender=self.model, changes=changes)
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .directory import bump_version
+        from .signals import employee_rows_changed
+
+        created = super().bulk_create(objs, *args, **kwargs)
+        if created:
+            bump_version()
+            employee_rows_changed.send(sender=self.model, changes=[
+                (None, {field.attname: getattr(employee, field.attname) for field in self.model._meta.concrete_fields})
+                for employee in created
+                if employee.pk is not None
+            ])
+        return created
+
+    def on_project(self, project):
+        """
+        Employees with at least one payroll record on the given project.
+        """
+        return self.filter(payroll__project=project)
+
+    def without_payroll_since(self, since):
+        """
+        Employees without any payroll record on or after the given date.
+        """
+        return self.exclude(payroll__date__gte=since)
+
+    def set_status(self, status):
+        """
+        Sets the status of every employee in the queryset with a single UPDATE.
+
+        Returns:
+            int: The number of employees updated.
+        """
+        return self.update(status=status)
+
+
+class ActiveEmployeeManager(models.Manager.from_queryset(EmployeeQuerySet)):
+    """
+    Manager returning only employees whose status is 'Active'.
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(status=Employee.STATUS_ACTIVE)
+
+
 class Employee(models.Model):
     """
     Model representing an Employee.
@@ -11,6 +88,11 @@ class Employee(models.Model):
     - hire_date: The date when the employee was hired.
     - position: The employee's job position.
     - status: The employment status, which can be either 'Active' or 'Inactive'.
+    - bank_account: The account number net salaries are paid into (see payroll.disbursement).
+
+    Managers:
+        objects: All employees.
+        active: Only employees with an 'Active' status.
 
     Methods:
         __str__: Returns the full name of the employee in the format "First Name Last Name".
@@ -22,15 +104,35 @@ class Employee(models.Model):
     hire_date = models.DateField()
     position = models.CharField(max_length=100)
 
+    STATUS_ACTIVE = 'Active'
+    STATUS_INACTIVE = 'Inactive'
     STATUS_CHOICES = [
-        ('Active', 'Active'),
-        ('Inactive', 'Inactive'),
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_INACTIVE, 'Inactive'),
     ]
     status = models.CharField(
         max_length=10,
         choices=STATUS_CHOICES,
-        default='Active',
+        default=STATUS_ACTIVE,
+        db_index=True,
     )
+    bank_account = models.CharField(
+        max_length=34,
+        blank=True,
+        validators=[RegexValidator(r'^[0-9][0-9 -]*$', "Enter the account number using digits, spaces and dashes.")],
+    )
+
+    objects = EmployeeQuerySet.as_manager()
+    active = ActiveEmployeeManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Keeps the values loaded from the database so signal handlers can compute what changed on save.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     def __str__(self):
         """
@@ -41,3 +143,14 @@ class Employee(models.Model):
         """
         return f"{self.first_name} {self.last_name}"
 
+
+
+class EmployeeDirectoryVersion(models.Model):
+    """
+    Single-row counter bumped whenever an employee is created, changed or deleted.
+
+    Each process keeps the employee directory (see employee.directory) in memory and
+    reloads it only when this version differs from the one it loaded.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
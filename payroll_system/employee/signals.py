@@ -0,0 +1,24 @@
+"""
+Signals that keep the process-local employee directory in sync.
+
+Saving or deleting an employee bumps EmployeeDirectoryVersion so every process
+reloads its directory on the next lookup. Bulk updates and inserts do not
+send these signals; EmployeeQuerySet bumps the version for them and sends
+employee_rows_changed instead.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import directory
+from .models import Employee
+
+# Sent with sender=Employee and changes, a list of (old_values, new_values) dicts by attname
+# (old_values None for inserted employees), after bulk updates and inserts. old_values and
+# new_values of updates only hold the id and the updated fields.
+employee_rows_changed = Signal()
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def employee_changed(sender, **kwargs):
+    directory.bump_version()
@@ -1,3 +1,152 @@
-from django.test import TestCase
+from datetime import date, datetime, time
+from decimal import Decimal
 
-# Create your tests here.
+import pandas as pd
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from payroll.models import Payroll
+
+from . import directory, importer
+from .models import Employee
+
+
+def make_employee(number=1, **kwargs):
+    return Employee.objects.create(**{
+        'first_name': f'First{number}',
+        'last_name': 'Last',
+        'email': f'employee{number}@example.com',
+        'hire_date': date(2020, 1, 1),
+        'position': 'Mason',
+        **kwargs,
+    })
+
+
+def make_payroll(employee, record_date, project='Tower A'):
+    tz = timezone.get_default_timezone()
+    return Payroll.objects.create(
+        employee=employee, date=record_date, project=project,
+        daily_rate=Decimal('500.00'), total_hours_worked=Decimal('8.00'), overtime_hour=Decimal('0.00'),
+        subtotal=Decimal('500.00'), net_salary=Decimal('500.00'),
+        time_in=timezone.make_aware(datetime.combine(record_date, time(8)), tz),
+        time_out=timezone.make_aware(datetime.combine(record_date, time(16)), tz),
+    )
+
+
+class EmployeeDirectoryRequestTests(TransactionTestCase):
+    # A directory loaded inside a transaction is never kept, so the employee is committed first.
+    def setUp(self):
+        self.employee = make_employee(1)
+
+    def test_version_is_checked_once_per_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('payroll_summary'), {'employee': self.employee.pk})
+        self.assertEqual(response.status_code, 200)
+        version_queries = [query for query in queries if 'employee_employeedirectoryversion' in query['sql']]
+        self.assertEqual(len(version_queries), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('generate_payroll'))
+        version_queries = [query for query in queries if 'employee_employeedirectoryversion' in query['sql']]
+        self.assertEqual(len(version_queries), 1)
+
+
+class EmployeeDirectoryTests(TestCase):
+    def setUp(self):
+        self.employee = make_employee(1)
+
+    def test_update_and_bulk_create_reload_the_directory(self):
+        self.assertEqual(directory.current_directory().get(self.employee.pk).position, 'Mason')
+
+        Employee.objects.filter(pk=self.employee.pk).update(position='Carpenter')
+        self.assertEqual(directory.current_directory().get(self.employee.pk).position, 'Carpenter')
+
+        created = Employee.objects.bulk_create([
+            Employee(first_name='New', last_name='Hire', email='new@example.com', hire_date=date(2024, 1, 1),
+                     position='Mason'),
+        ])
+        self.assertEqual(str(directory.current_directory().get(created[0].pk)), 'New Hire')
+
+
+class BulkStatusTests(TestCase):
+    def setUp(self):
+        self.idle = make_employee(1)
+        self.busy = make_employee(2)
+        self.elsewhere = make_employee(3)
+        make_payroll(self.idle, date(2024, 1, 5))
+        make_payroll(self.busy, date(2024, 1, 5))
+        make_payroll(self.busy, date(2024, 6, 1))
+        make_payroll(self.elsewhere, date(2024, 1, 5), project='Tower B')
+
+    def test_filter_updates_matching_employees_in_one_statement(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('bulk_update_employee_status'), {
+                'status': Employee.STATUS_INACTIVE, 'project': 'Tower A', 'no_payroll_since': '2024-03-01',
+            })
+        self.assertRedirects(response, reverse('employee_list'), fetch_redirect_response=False)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "employee_employee"')]), 1)
+        self.assertEqual(
+            list(Employee.objects.filter(status=Employee.STATUS_INACTIVE).values_list('id', flat=True)), [self.idle.pk]
+        )
+        self.assertEqual(set(Employee.active.values_list('id', flat=True)), {self.busy.pk, self.elsewhere.pk})
+
+    def test_selected_employees_are_updated(self):
+        self.client.post(reverse('bulk_update_employee_status'), {
+            'status': Employee.STATUS_INACTIVE, 'employee_ids': [self.busy.pk, self.elsewhere.pk],
+        })
+        self.assertEqual(list(Employee.active.values_list('id', flat=True)), [self.idle.pk])
+
+    def test_without_selection_or_filter_nothing_changes(self):
+        self.client.post(reverse('bulk_update_employee_status'), {'status': Employee.STATUS_INACTIVE})
+        self.assertEqual(Employee.active.count(), 3)
+
+
+class EmployeeImportTests(TestCase):
+    def frame(self, rows):
+        return pd.DataFrame(
+            [dict(zip(['first_name', 'last_name', 'email', 'hire_date', 'position', 'status'], row)) for row in rows]
+        ).astype(str)
+
+    def test_duplicates_are_reported_per_row(self):
+        make_employee(1, email='existing@example.com')
+        result = importer.import_employees(self.frame([
+            ('Ana', 'Cruz', 'ana@example.com', '2024-01-15', 'Mason', ''),
+            ('Ana', 'Cruz', 'ANA@example.com', '2024-01-15', 'Mason', ''),
+            ('Ben', 'Reyes', 'Existing@Example.com', '2024-02-01', 'Welder', 'inactive'),
+            ('Cy', 'Lim', 'not-an-email', '2024-02-01', 'Welder', ''),
+            ('Di', 'Go', 'di@example.com', '2024-02-30', 'Welder', 'retired'),
+        ]))
+
+        self.assertEqual((result['created'], result['error']), (1, 4))
+        self.assertEqual([line['row'] for line in result['report']], [2, 3, 4, 5, 6])
+        self.assertEqual(
+            [line['message'] for line in result['report']],
+            [
+                '',
+                'Duplicate email in file (first on row 2).',
+                'An employee with this email already exists.',
+                'Invalid email address.',
+                'Invalid status (expected Active or Inactive).',
+            ],
+        )
+        self.assertEqual(Employee.objects.get(email='ana@example.com').status, Employee.STATUS_ACTIVE)
+
+    def test_existing_employees_are_updated_when_asked(self):
+        employee = make_employee(1, email='ben@example.com', position='Mason')
+        rows = [
+            ('Ben', 'Last', 'BEN@example.com', '2020-01-01', 'Foreman', 'Active'),
+            ('New', 'Hire', 'new@example.com', '2024-03-01', 'Mason', 'Active'),
+        ]
+        result = importer.import_employees(self.frame(rows), update_existing=True)
+        self.assertEqual((result['created'], result['updated'], result['error']), (1, 1, 0))
+        employee.refresh_from_db()
+        self.assertEqual(
+            (employee.email, employee.first_name, employee.position), ('ben@example.com', 'Ben', 'Foreman')
+        )
+        self.assertEqual(directory.current_directory().get(employee.pk).position, 'Foreman')
+
+        again = importer.import_employees(self.frame(rows), update_existing=True)
+        self.assertEqual((again['created'], again['updated'], again['unchanged']), (0, 0, 2))
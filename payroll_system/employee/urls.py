@@ -14,6 +14,10 @@ urlpatterns = [
     # This will render the addEmployee view to display a form for creating a new employee.
     path('employee/add/', views.addEmployee, name='add_employee'),
 
+    # Route to import many employees from a CSV or Excel file.
+    # This will render the importEmployees view with the upload form and the per-row import report.
+    path('employee/import/', views.importEmployees, name='import_employees'),
+
     # Route to edit an existing employee's details.
     # The employee_id is passed in the URL to identify which employee to edit.
     path('employee/edit/<int:employee_id>/', views.editEmployee, name='edit_employee'),
@@ -22,4 +26,8 @@ urlpatterns = [
     # The employee_id is passed in the URL to identify the employee whose status needs to be updated.
     path('employee/update_status/<int:employee_id>/', views.updateEmployeeStatus, name='update_employee_status'),
 
+    # Route to update the employment status of many employees at once.
+    # The employees are selected in the list or matched by a project/date filter.
+    path('employee/bulk_update_status/', views.bulkUpdateEmployeeStatus, name='bulk_update_employee_status'),
+
 ]
\ No newline at end of file
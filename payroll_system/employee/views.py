@@ -1,7 +1,13 @@
 from django.shortcuts import get_object_or_404, redirect, render
-from .forms import EmployeeForm
+from .forms import BulkStatusForm, EmployeeForm, EmployeeImportForm
+from . import importer
 from .models import Employee
+from django.conf import settings
+from payroll import ledger
 from django.contrib import messages
+from django.db.models import Case, Value, When
+from django.http import Http404
+from django.views.decorators.http import require_POST
 
 def employeeList(request):
     """
@@ -17,7 +23,10 @@ def employeeList(request):
         HttpResponse: Renders the employee_list.html template with all employees.
     """
     employees = Employee.objects.all()
-    return render(request, 'employee_list.html', {'employees': employees})
+    return render(request, 'employee_list.html', {
+        'employees': employees,
+        'status_form': BulkStatusForm(),
+    })
 
 def addEmployee(request):
     """
@@ -53,12 +62,55 @@ def addEmployee(request):
         form = EmployeeForm()
         return render(request, 'add_employee.html', {'form': form})
 
+def importEmployees(request):
+    """
+    View to import many employees at once from a CSV or Excel file.
+
+    Valid rows are created (or, with update_existing, update the employee with the
+    same email); invalid rows are skipped. The page then shows what happened to
+    every row of the file.
+
+    Args:
+        request: The HTTP request object.
+
+    Returns:
+        HttpResponse: Renders the 'import_employees.html' template with the form and,
+        after an upload, the per-row report.
+    """
+    result = None
+    if request.method == 'POST':
+        form = EmployeeImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['employee_file']
+            try:
+                df = importer.read_employee_file(upload.name, upload.read())
+                result = importer.import_employees(df, update_existing=form.cleaned_data['update_existing'])
+            except ValueError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(
+                    request,
+                    f"{result['created']} employees created, {result['updated']} updated, "
+                    f"{result['unchanged']} unchanged, {result['error']} rows with errors."
+                )
+        else:
+            for field in form:
+                for error in field.errors:
+                    messages.error(request, f"Error in {field.label}: {error}")
+    else:
+        form = EmployeeImportForm()
+    return render(request, 'import_employees.html', {'form': form, 'result': result})
+
 def employeeDetails(request, employee_id):
     """
     View to display details of a specific employee.
 
     Retrieves a specific employee based on the given employee_id and renders
-    the 'employee_detail.html' template with the employee's information.
+    the 'employee_detail.html' template with the employee's information and
+    their payroll totals per month. The optional months GET parameter sets how
+    many months are shown (PAYROLL_HISTORY_MONTHS by default). The totals come
+    from the cached monthly ledger, so the page stays fast for employees with
+    years of payroll records.
 
     Args:
         request: The HTTP request object.
@@ -69,7 +121,18 @@ def employeeDetails(request, employee_id):
         employee details.
     """
     employee = get_object_or_404(Employee, id=employee_id)
-    return render(request, 'employee_details.html', {'employee': employee})
+    try:
+        months = int(request.GET.get('months', settings.PAYROLL_HISTORY_MONTHS))
+    except ValueError:
+        months = settings.PAYROLL_HISTORY_MONTHS
+    history = ledger.monthly_history(employee, months)
+    return render(request, 'employee_details.html', {
+        'employee': employee,
+        'history': history,
+        'history_totals': {name: sum(month[name] for month in history) for name in ledger.TOTALS},
+        'month_choices': [choice for choice in (6, 12, 24, 36) if choice <= settings.PAYROLL_HISTORY_MAX_MONTHS],
+        'months': len(history),
+    })
 
 def editEmployee(request, employee_id):
     """
@@ -121,8 +184,8 @@ def updateEmployeeStatus(request, employee_id):
     """
     View to update the employment status of a specific employee.
 
-    Retrieves the employee based on the given employee_id and toggles their
-    status between 'Active' and 'Inactive'. The updated status is saved in the database.
+    Toggles the employee's status between 'Active' and 'Inactive' with a single
+    UPDATE statement, without loading the employee first.
 
     Args:
         request: The HTTP request object.
@@ -131,13 +194,51 @@ def updateEmployeeStatus(request, employee_id):
     Returns:
         HttpResponse: Redirects to the employee list after the status update.
     """
-    employee = get_object_or_404(Employee, id=employee_id)
-    
-    if employee.status == 'Active':
-        employee.status = 'Inactive'
-    else:
-        employee.status = 'Active'
-    
-    employee.save()
+    updated = Employee.objects.filter(id=employee_id).update(
+        status=Case(
+            When(status=Employee.STATUS_ACTIVE, then=Value(Employee.STATUS_INACTIVE)),
+            default=Value(Employee.STATUS_ACTIVE),
+        )
+    )
+    if not updated:
+        raise Http404("No Employee matches the given query.")
+
+    return redirect('employee_list')
+
+@require_POST
+def bulkUpdateEmployeeStatus(request):
+    """
+    View to set the employment status of many employees at once.
 
+    The employees are either the ones selected in the employee list, or every employee
+    matching the filter (payroll records on a project and/or no payroll since a date).
+    Whichever is used, all of them are updated with a single UPDATE statement.
+
+    Args:
+        request: The HTTP request object.
+
+    Returns:
+        HttpResponse: Redirects to the employee list with a message showing how many
+        employees were updated.
+    """
+    form = BulkStatusForm(request.POST)
+    if not form.is_valid():
+        for error in form.non_field_errors():
+            messages.error(request, error)
+        for field in form:
+            for error in field.errors:
+                messages.error(request, f"Error in {field.label}: {error}")
+        return redirect('employee_list')
+
+    employees = Employee.objects.all()
+    if form.cleaned_data['employee_ids']:
+        employees = employees.filter(id__in=form.cleaned_data['employee_ids'])
+    if form.cleaned_data['project']:
+        employees = employees.on_project(form.cleaned_data['project'])
+    if form.cleaned_data['no_payroll_since']:
+        employees = employees.without_payroll_since(form.cleaned_data['no_payroll_since'])
+
+    status = form.cleaned_data['status']
+    updated = employees.set_status(status)
+    messages.success(request, f"{updated} employee(s) set to {status}.")
     return redirect('employee_list')
@@ -1,6 +1,229 @@
-from django.contrib import admin
-from .models import Payroll
+from django import forms
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, Max, Min, Sum
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
 
-# Register the models so that they appear in the admin interface
-admin.site.register(Payroll)
+from . import archive, bulk, exports, periods
+from .models import AuditEntry, Holiday, PayPeriod, PayRuleSet, Payroll, PositionRate
+
+# Changelists with at most this many rows are counted exactly.
+EXACT_COUNT_LIMIT = 10000
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator that avoids a full COUNT(*) on large unfiltered tables.
+
+    Results are counted exactly up to EXACT_COUNT_LIMIT rows. Beyond that, an unfiltered
+    queryset uses the database's table statistics (PostgreSQL) or the highest primary key,
+    which only costs an index lookup. Filtered querysets are always counted exactly, since
+    the admin filters run on indexed columns.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if queryset.query.where:
+            return queryset.count()
+        exact = queryset.order_by().values('pk')[:EXACT_COUNT_LIMIT + 1].count()
+        if exact <= EXACT_COUNT_LIMIT:
+            return exact
+        return max(self._estimate(queryset), exact)
+
+    def _estimate(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+        return queryset.order_by().aggregate(last=Max('pk'))['last'] or 0
+
+
+class PayrollAdminForm(forms.ModelForm):
+    """
+    Admin form for payroll records that rejects dates within a closed pay period and
+    records that duplicate an archived one.
+    """
+
+    class Meta:
+        model = Payroll
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        record_date = cleaned_data.get('date')
+        if record_date:
+            try:
+                periods.check_open([record_date])
+            except periods.PeriodClosed as e:
+                raise forms.ValidationError(str(e))
+            employee = cleaned_data.get('employee')
+            if employee is not None and archive.archived_keys([(employee.pk, record_date)]):
+                raise forms.ValidationError(f"{employee} already has an archived payroll record on {record_date}.")
+        return cleaned_data
+
+
+class PayrollAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'date', 'project', 'total_hours_worked', 'subtotal', 'deductions', 'net_salary')
+    list_select_related = ('employee',)  # Load employee names in the changelist query
+    list_filter = ('date', 'project', 'employee')  # Filters on indexed columns
+    date_hierarchy = 'date'
+    ordering = ('-date', '-id')
+    raw_id_fields = ('employee',)
+    show_full_result_count = False  # Skip the second, unfiltered COUNT(*) on every page
+    paginator = ApproximateCountPaginator
+    actions = ['recompute_pay', 'export_selected_csv', 'delete_period']
+    form = PayrollAdminForm
+
+    def _in_closed_period(self, obj):
+        return obj is not None and bool(periods.closed_dates([obj.date]))
+
+    def has_change_permission(self, request, obj=None):
+        # Records of a closed period are shown read-only, so their snapshots stay accurate.
+        return super().has_change_permission(request, obj) and not self._in_closed_period(obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return super().has_delete_permission(request, obj) and not self._in_closed_period(obj)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # The built-in delete action loads and lists every selected record; delete_period scales instead.
+        actions.pop('delete_selected', None)
+        return actions
+
+    def _touches_closed_period(self, request, queryset):
+        try:
+            periods.check_open(queryset.order_by().values_list('date', flat=True).distinct())
+        except periods.PeriodClosed as e:
+            self.message_user(request, str(e), level=messages.ERROR)
+            return True
+        return False
+
+    @admin.action(description="Recompute pay for selected payroll records")
+    def recompute_pay(self, request, queryset):
+        if self._touches_closed_period(request, queryset):
+            return
+        updated = bulk.recompute_pay(queryset)
+        self.message_user(request, f"{updated} payroll record(s) recomputed.")
+
+    @admin.action(description="Export selected payroll records as CSV")
+    def export_selected_csv(self, request, queryset):
+        rows = queryset.order_by('date', 'employee_id').values_list(*[field for _, field in exports.EXPORT_COLUMNS])
+        response = StreamingHttpResponse(exports.csv_chunks(rows), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="payroll_selected.csv"'
+        return response
 
+    @admin.action(description="Delete selected payroll records (period)", permissions=['delete'])
+    def delete_period(self, request, queryset):
+        if self._touches_closed_period(request, queryset):
+            return None
+        if request.POST.get('confirm'):
+            deleted = bulk.delete_payrolls(queryset)
+            self.message_user(request, f"{deleted} payroll record(s) deleted.")
+            return None
+
+        summary = queryset.order_by().aggregate(
+            records=Count('id'), employees=Count('employee', distinct=True),
+            first_date=Min('date'), last_date=Max('date'), net_salary=Sum('net_salary'),
+        )
+        return TemplateResponse(request, 'admin/payroll/payroll/delete_period_confirmation.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Delete payroll records',
+            'opts': self.model._meta,
+            'summary': summary,
+            'selected_ids': request.POST.getlist(admin.helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action': 'delete_period',
+        })
+
+
+class PayRuleSetAdmin(admin.ModelAdmin):
+    list_display = (
+        'name', 'is_active', 'overtime_threshold', 'overtime_multiplier', 'night_differential_rate',
+        'rest_day', 'rest_day_multiplier', 'max_deduction_ratio', 'updated_at',
+    )
+    list_filter = ('is_active',)
+
+
+class HolidayAdmin(admin.ModelAdmin):
+    list_display = ('date', 'name', 'multiplier')
+    date_hierarchy = 'date'
+    ordering = ('-date',)
+
+
+class PayPeriodAdmin(admin.ModelAdmin):
+    list_display = ('name', 'start_date', 'end_date', 'status', 'closed_at')
+    list_filter = ('status',)
+    ordering = ('-start_date',)
+    readonly_fields = ('status', 'closed_at', 'version')
+    actions = ['close_periods', 'reopen_periods']
+
+    def get_readonly_fields(self, request, obj=None):
+        # The dates of a closed period define which records are locked and snapshotted.
+        if obj is not None and obj.is_closed:
+            return ('start_date', 'end_date', *self.readonly_fields)
+        return self.readonly_fields
+
+    @admin.action(description="Close selected pay periods and write their snapshots")
+    def close_periods(self, request, queryset):
+        for period in queryset.filter(status=PayPeriod.STATUS_OPEN):
+            try:
+                employees = periods.close_period(period)
+            except (periods.PeriodClosed, periods.PeriodChanged) as e:
+                self.message_user(request, str(e), level=messages.ERROR)
+                continue
+            self.message_user(request, f"{period} closed with snapshots for {employees} employee(s).")
+
+    @admin.action(description="Reopen selected pay periods and delete their snapshots")
+    def reopen_periods(self, request, queryset):
+        for period in queryset.filter(status=PayPeriod.STATUS_CLOSED):
+            try:
+                periods.reopen_period(period)
+            except periods.PeriodOpen as e:
+                self.message_user(request, str(e), level=messages.ERROR)
+                continue
+            self.message_user(request, f"{period} reopened.", level=messages.WARNING)
+
+
+class PositionRateAdmin(admin.ModelAdmin):
+    list_display = ('position', 'daily_rate')
+    search_fields = ('position',)
+
+
+class AuditEntryAdmin(admin.ModelAdmin):
+    """
+    Read-only view of the append-only audit trail.
+    """
+    list_display = ('changed_at', 'username', 'model', 'object_id', 'employee_id', 'record_date', 'action')
+    list_filter = ('model', 'action')
+    search_fields = ('username',)
+    date_hierarchy = 'changed_at'
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# Register the models so that they appear in the admin interface
+admin.site.register(Payroll, PayrollAdmin)
+admin.site.register(PayRuleSet, PayRuleSetAdmin)
+admin.site.register(Holiday, HolidayAdmin)
+admin.site.register(PositionRate, PositionRateAdmin)
+admin.site.register(PayPeriod, PayPeriodAdmin)
+admin.site.register(AuditEntry, AuditEntryAdmin)
@@ -0,0 +1,178 @@
+"""
+Detection of overlapping and implausible time entries.
+
+The unique (employee, date) constraint only rejects exact duplicates. The
+detector here also finds shifts of the same employee that overlap in time,
+shifts longer than 24 hours, shifts that end before they start and records
+whose date is not the day the shift started.
+
+Instead of comparing every pair of records, find_anomalies sorts the records
+by (employee, time_in) once and sweeps them with a running maximum of the
+time_out values seen so far for the employee: a shift overlaps an earlier one
+exactly when it starts before that maximum. Sorting dominates, so a scan is
+O(n log n). scan() runs the detector over a scope of Payroll records and keeps
+PayrollAnomaly in step with the result; it is called after each batch upload
+for the uploaded employees and dates, and over the whole table by the
+detect_payroll_anomalies command.
+"""
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Payroll, PayrollAnomaly
+
+MAX_SHIFT_SECONDS = 24 * 60 * 60
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def find_anomalies(ids, employee_ids, dates, starts, ends):
+    """
+    Finds the anomalous records among a set of time entries.
+
+    Args:
+        ids (ndarray): int64 payroll ids.
+        employee_ids (ndarray): int64 employee ids.
+        dates (ndarray): int64 day ordinals of the record dates.
+        starts (ndarray): int64 time_in as seconds since the epoch.
+        ends (ndarray): int64 time_out as seconds since the epoch.
+
+    Returns:
+        list: (payroll id, kind, other payroll id or None) tuples.
+    """
+    if not len(ids):
+        return []
+
+    order = np.lexsort((ids, starts, employee_ids))
+    ids, employee_ids, dates, starts, ends = (
+        values[order] for values in (ids, employee_ids, dates, starts, ends)
+    )
+    count = len(ids)
+    found = []
+
+    durations = ends - starts
+    for position in np.flatnonzero(durations <= 0):
+        found.append((int(ids[position]), PayrollAnomaly.KIND_NEGATIVE, None))
+    for position in np.flatnonzero(durations > MAX_SHIFT_SECONDS):
+        found.append((int(ids[position]), PayrollAnomaly.KIND_TOO_LONG, None))
+
+    # Shift every employee's times into its own band so one running maximum over the whole
+    # sorted array never carries a time_out from one employee over to the next.
+    first_of_employee = np.r_[True, employee_ids[1:] != employee_ids[:-1]]
+    band = np.cumsum(first_of_employee) - 1
+    base = min(starts.min(), ends.min())
+    width = max(starts.max(), ends.max()) - base + 1
+    end_keys = ends - base + band * width
+    start_keys = starts - base + band * width
+
+    latest_end = np.maximum.accumulate(end_keys)
+    # Position of the record holding the running maximum, to report what a shift overlaps with.
+    holder = np.maximum.accumulate(np.where(end_keys == latest_end, np.arange(count), 0))
+    overlaps = np.zeros(count, dtype=bool)
+    overlaps[1:] = ~first_of_employee[1:] & (start_keys[1:] < latest_end[:-1])
+    for position in np.flatnonzero(overlaps):
+        found.append((int(ids[position]), PayrollAnomaly.KIND_OVERLAP, int(ids[holder[position - 1]])))
+
+    start_days = _local_days(starts)
+    for position in np.flatnonzero(start_days != dates):
+        found.append((int(ids[position]), PayrollAnomaly.KIND_DATE_MISMATCH, None))
+    return found
+
+
+def _local_days(seconds):
+    """
+    Converts epoch seconds to day ordinals in the current time zone.
+    """
+    # Offsets are looked up once per distinct UTC hour rather than once per record.
+    hours, positions = np.unique(seconds // 3600, return_inverse=True)
+    offsets = np.array([
+        timezone.localtime(datetime.fromtimestamp(int(hour) * 3600, tz=dt_timezone.utc)).utcoffset().total_seconds()
+        for hour in hours
+    ], dtype=np.int64)
+    local = seconds + offsets[positions]
+    return local // 86400 + EPOCH_ORDINAL
+
+
+def _describe(kind, record, other):
+    time_in = timezone.localtime(record['time_in'])
+    time_out = timezone.localtime(record['time_out'])
+    shift = f"{time_in:%Y-%m-%d %H:%M} to {time_out:%Y-%m-%d %H:%M}"
+    if kind == PayrollAnomaly.KIND_OVERLAP and other is not None:
+        other_in = timezone.localtime(other['time_in'])
+        other_out = timezone.localtime(other['time_out'])
+        return (
+            f"Shift {shift} overlaps the shift of {other['date']} "
+            f"({other_in:%Y-%m-%d %H:%M} to {other_out:%Y-%m-%d %H:%M})."
+        )
+    if kind == PayrollAnomaly.KIND_TOO_LONG:
+        hours = (record['time_out'] - record['time_in']).total_seconds() / 3600
+        return f"Shift {shift} lasts {hours:.1f} hours."
+    if kind == PayrollAnomaly.KIND_NEGATIVE:
+        return f"Shift {shift} ends before it starts."
+    return f"Recorded on {record['date']}, but the shift {shift} started on {time_in:%Y-%m-%d}."
+
+
+def scan(employee_ids=None, start_date=None, end_date=None):
+    """
+    Detects anomalies among payroll records and records them as PayrollAnomaly rows.
+
+    Unresolved anomalies of the scanned records that are no longer found are removed;
+    resolved ones are kept as they are.
+
+    Args:
+        employee_ids (iterable): Only scan these employees. Defaults to every employee.
+        start_date (date): Only scan records on or after this date.
+        end_date (date): Only scan records on or before this date.
+
+    Returns:
+        int: The number of unresolved anomalies found in the scope.
+    """
+    scope = Payroll.objects.all()
+    if employee_ids is not None:
+        scope = scope.filter(employee_id__in=set(employee_ids))
+    # A shift can overlap one from the previous day, so read one day more on each side.
+    context = scope
+    if start_date:
+        scope = scope.filter(date__gte=start_date)
+        context = context.filter(date__gte=start_date - timedelta(days=1))
+    if end_date:
+        scope = scope.filter(date__lte=end_date)
+        context = context.filter(date__lte=end_date + timedelta(days=1))
+
+    rows = list(context.values_list('id', 'employee_id', 'date', 'time_in', 'time_out'))
+    count = len(rows)
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    employees = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+    dates = np.fromiter((row[2].toordinal() for row in rows), dtype=np.int64, count=count)
+    starts = np.fromiter((int(row[3].timestamp()) for row in rows), dtype=np.int64, count=count)
+    ends = np.fromiter((int(row[4].timestamp()) for row in rows), dtype=np.int64, count=count)
+
+    in_scope = {
+        row[0] for row in rows
+        if (not start_date or row[2] >= start_date) and (not end_date or row[2] <= end_date)
+    }
+    found = [anomaly for anomaly in find_anomalies(ids, employees, dates, starts, ends) if anomaly[0] in in_scope]
+
+    involved = {anomaly[0] for anomaly in found} | {anomaly[2] for anomaly in found if anomaly[2]}
+    records = {
+        record['id']: record
+        for record in Payroll.objects.filter(id__in=involved).values('id', 'employee_id', 'date', 'time_in', 'time_out')
+    }
+    anomalies = [
+        PayrollAnomaly(
+            payroll_id=payroll_id,
+            other_payroll_id=other_id,
+            employee_id=records[payroll_id]['employee_id'],
+            date=records[payroll_id]['date'],
+            kind=kind,
+            detail=_describe(kind, records[payroll_id], records.get(other_id))[:255],
+        )
+        for payroll_id, kind, other_id in found
+    ]
+
+    with transaction.atomic():
+        PayrollAnomaly.objects.filter(payroll__in=scope, resolved=False).delete()
+        PayrollAnomaly.objects.bulk_create(anomalies, batch_size=1000, ignore_conflicts=True)
+    return PayrollAnomaly.objects.filter(payroll__in=scope, resolved=False).count()
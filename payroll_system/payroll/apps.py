@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PayrollConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payroll'
+
+    def ready(self):
+        # Connect the signal handlers that keep derived payroll tables up to date.
+        from . import signals  # noqa: F401
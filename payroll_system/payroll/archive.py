@@ -0,0 +1,386 @@
+"""
+Hot/cold partitioning of payroll records.
+
+Whole months older than the archive horizon are moved from the Payroll table
+into ArchivedPayroll in chunked batches, and per-employee monthly totals are
+kept in ArchivedPayrollTotal. payroll_history, history_totals and
+employee_period_totals read live and archived records together, touching the
+archive only when the requested range reaches back into it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db import connections, router, transaction
+from django.db.models import BooleanField, Count, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from employee.models import Employee
+
+from . import columnar
+from .columnar import TOTAL_FIELDS
+from .models import ArchivedPayroll, ArchivedPayrollTotal, Payroll, PayrollAnomaly
+from .signals import suppress_row_signals
+
+ARCHIVED_FIELDS = [
+    'employee_id', 'daily_rate', 'allowance', 'total_hours_worked', 'overtime_pay', 'overtime_hour',
+    'night_differential_pay', 'night_differential_hour', 'deductions', 'deduction_remarks',
+    'subtotal', 'net_salary', 'date', 'time_in', 'time_out', 'project', 'created_at',
+]
+
+HISTORY_FIELDS = ['id'] + ARCHIVED_FIELDS[:-1]
+
+# Sort keys accepted by employee_period_totals -> ORDER BY expression.
+SUMMARY_SORTS = {
+    'name': 'last_name, first_name',
+    'days_worked': 'days_worked',
+    'first_date': 'first_date',
+    'last_date': 'last_date',
+    **{field: field for field in TOTAL_FIELDS},
+}
+
+
+def archive_cutoff(horizon_days=None):
+    """
+    Returns the first date that stays in the hot table.
+
+    The cutoff is rounded down to the first of the month so months are always
+    archived whole.
+
+    Args:
+        horizon_days (int): How many days of history to keep hot. Defaults to
+                            settings.PAYROLL_ARCHIVE_HORIZON_DAYS.
+
+    Returns:
+        date: Records dated before this are eligible for archiving.
+    """
+    if horizon_days is None:
+        horizon_days = settings.PAYROLL_ARCHIVE_HORIZON_DAYS
+    boundary = timezone.localdate() - timedelta(days=horizon_days)
+    return boundary.replace(day=1)
+
+
+def _refresh_totals(keys):
+    """
+    Recomputes ArchivedPayrollTotal rows for the given (employee_id, month) pairs.
+    """
+    employee_ids = {employee_id for employee_id, _ in keys}
+    months = {month for _, month in keys}
+    rows = (
+        ArchivedPayroll.objects.filter(employee_id__in=employee_ids, date__gte=min(months))
+        .annotate(month=TruncMonth('date'))
+        .filter(month__in=months)
+        .values('employee_id', 'month')
+        .annotate(**_centavo_sums(days_worked=Count('id')))
+    )
+    totals = [
+        ArchivedPayrollTotal(**_to_decimals(row)) for row in rows if (row['employee_id'], row['month']) in keys
+    ]
+    ArchivedPayrollTotal.objects.bulk_create(
+        totals,
+        update_conflicts=True,
+        unique_fields=['employee', 'month'],
+        update_fields=['days_worked'] + TOTAL_FIELDS,
+    )
+
+
+def archive_payroll(cutoff, chunk_size=5000, dry_run=False):
+    """
+    Moves Payroll records dated before the cutoff into the archive, one chunk at a time.
+
+    Each chunk is copied, deleted and added to the monthly totals of its months inside its
+    own transaction, so an interrupted run leaves every record either live or archived
+    (with its month's totals), never both, and can simply be re-run. The records'
+    anomalies, resolved or not, are moved to the archived copies.
+
+    Args:
+        cutoff (date): Records dated before this date are archived.
+        chunk_size (int): Number of records moved per transaction.
+        dry_run (bool): Only count the records that would be archived.
+
+    Returns:
+        dict: The number of 'archived' records and the number of 'months' whose totals were refreshed.
+    """
+    pending = Payroll.objects.filter(date__lt=cutoff)
+    if dry_run:
+        return {'archived': pending.count(), 'months': 0}
+
+    archived = 0
+    touched = set()
+    while True:
+        with transaction.atomic():
+            ids = list(pending.order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            rows = list(Payroll.objects.filter(id__in=ids).values('id', *ARCHIVED_FIELDS))
+            ArchivedPayroll.objects.bulk_create(
+                [ArchivedPayroll(original_id=row.pop('id'), **row) for row in rows],
+                ignore_conflicts=True,
+            )
+            # Anomalies follow their records into the archive instead of cascading away with them.
+            PayrollAnomaly.objects.filter(payroll_id__in=ids).update(
+                archived_payroll=Subquery(
+                    ArchivedPayroll.objects.filter(original_id=OuterRef('payroll_id')).values('pk')[:1]
+                ),
+                payroll=None,
+            )
+            # Archiving moves records without changing them, so derived tables such as the
+            # year-to-date ledger must not treat this as a deletion.
+            with suppress_row_signals():
+                Payroll.objects.filter(id__in=ids).delete()
+            # Refreshed with the chunk, so an interrupted run never leaves moved months without totals.
+            months = {(row['employee_id'], row['date'].replace(day=1)) for row in rows}
+            _refresh_totals(months)
+        touched.update(months)
+        archived += len(ids)
+
+    return {'archived': archived, 'months': len(touched)}
+
+
+def archived_until():
+    """
+    Returns the latest date held in the archive, or None when nothing has been archived.
+    """
+    return ArchivedPayroll.objects.aggregate(last=Max('date'))['last']
+
+
+def reaches_archive(start_date):
+    """
+    Returns whether a date range starting at start_date (None for no lower bound) includes archived records.
+    """
+    if start_date is None:
+        return ArchivedPayroll.objects.exists()
+    last_archived = archived_until()
+    return last_archived is not None and start_date <= last_archived
+
+
+def archived_keys(keys):
+    """
+    Returns which (employee_id, date) pairs already have an archived record.
+
+    Archived records are outside the Payroll (employee, date) unique constraint, so
+    writes that create or move live records check here to avoid duplicating them.
+
+    Args:
+        keys (iterable): (employee_id, date) pairs to look up.
+
+    Returns:
+        set: The pairs among keys that are in ArchivedPayroll.
+    """
+    keys = set(keys)
+    if not keys or not reaches_archive(min(record_date for _, record_date in keys)):
+        return set()
+    found = ArchivedPayroll.objects.filter(
+        employee_id__in={employee_id for employee_id, _ in keys},
+        date__in={record_date for _, record_date in keys},
+    ).values_list('employee_id', 'date')
+    return keys.intersection(found)
+
+
+def payroll_history(employee=None, start_date=None, end_date=None):
+    """
+    Returns payroll records for an optional employee and date range, including archived ones.
+
+    The archive is only queried when the range reaches back into it; otherwise this is
+    a plain query on the hot Payroll table. Rows are dictionaries with the Payroll fields
+    plus 'archived', which is True for rows read from the archive (their 'id' is the
+    original Payroll id and they can no longer be edited).
+
+    Args:
+        employee (Employee or int): Only return the records of this employee (or employee id).
+        start_date (date): Only return records on or after this date.
+        end_date (date): Only return records on or before this date.
+
+    Returns:
+        QuerySet: Row dictionaries ordered by date.
+    """
+    filters = Q()
+    if employee is not None:
+        filters &= Q(employee=employee)
+    if start_date:
+        filters &= Q(date__gte=start_date)
+    if end_date:
+        filters &= Q(date__lte=end_date)
+
+    live = Payroll.objects.filter(filters).values(*HISTORY_FIELDS).annotate(
+        archived=Value(False, output_field=BooleanField())
+    )
+    if not reaches_archive(start_date):
+        return live.order_by('date', 'employee_id')
+
+    old = ArchivedPayroll.objects.filter(filters).annotate(
+        archived=Value(True, output_field=BooleanField())
+    ).values(*(['original_id'] + HISTORY_FIELDS[1:] + ['archived']))
+    return live.union(old, all=True).order_by('date', 'employee_id')
+
+
+def history_totals(employee=None, start_date=None, end_date=None):
+    """
+    Sums payroll columns over live and archived records for an optional employee and date range.
+
+    Archived months that lie entirely inside the range are read from the precomputed
+    ArchivedPayrollTotal rows; only partial months at the edges of the range are summed
+    from individual archived records.
+
+    Args:
+        employee (Employee or int): Only include the records of this employee (or employee id).
+        start_date (date): Only include records on or after this date.
+        end_date (date): Only include records on or before this date.
+
+    Returns:
+        dict: 'days_worked' and one sum per field in TOTAL_FIELDS.
+    """
+    aggregates = _centavo_sums(days_worked=Count('id'))
+    live = Payroll.objects.all()
+    if employee is not None:
+        live = live.filter(employee=employee)
+    if start_date:
+        live = live.filter(date__gte=start_date)
+    if end_date:
+        live = live.filter(date__lte=end_date)
+    totals = live.aggregate(**aggregates)
+    totals = {key: value or 0 for key, value in totals.items()}
+
+    if not reaches_archive(start_date):
+        return _to_decimals(totals)
+
+    # Archived months lying entirely inside [start_date, end_date] come from the monthly totals.
+    first_full_month = None
+    if start_date:
+        first_full_month = start_date if start_date.day == 1 else _next_month(start_date)
+    after_full_months = None
+    if end_date:
+        after_full_months = _next_month(end_date)
+        if after_full_months - timedelta(days=1) != end_date:
+            after_full_months = end_date.replace(day=1)
+
+    monthly = ArchivedPayrollTotal.objects.all()
+    edges = ArchivedPayroll.objects.all()
+    if employee is not None:
+        monthly = monthly.filter(employee=employee)
+        edges = edges.filter(employee=employee)
+    if first_full_month:
+        monthly = monthly.filter(month__gte=first_full_month)
+    if after_full_months:
+        monthly = monthly.filter(month__lt=after_full_months)
+
+    # Partial months at either end of the range are summed from individual archived records.
+    if first_full_month and after_full_months and first_full_month >= after_full_months:
+        edge_ranges = Q(date__gte=start_date, date__lte=end_date)
+    else:
+        edge_ranges = Q(pk__in=[])
+        if first_full_month:
+            edge_ranges |= Q(date__gte=start_date, date__lt=first_full_month)
+        if after_full_months:
+            edge_ranges |= Q(date__gte=after_full_months, date__lte=end_date)
+
+    archived_totals = [
+        monthly.aggregate(**_centavo_sums(days_worked=Sum('days_worked'))),
+        edges.filter(edge_ranges).aggregate(**aggregates),
+    ]
+    for part in archived_totals:
+        for key, value in part.items():
+            totals[key] += value or 0
+    return _to_decimals(totals)
+
+
+def employee_period_totals(start_date=None, end_date=None, sort='name', page=1, per_page=50):
+    """
+    Returns one page of per-employee totals for a date range, including archived records.
+
+    The grouping, sorting, paging and the count of employees all happen in a single SQL
+    query, so the cost does not grow with the number of records returned to Python.
+    Amounts are summed as integer centavos, so the totals are exact on every database.
+
+    Args:
+        start_date (date): Only include records on or after this date.
+        end_date (date): Only include records on or before this date.
+        sort (str): A key of SUMMARY_SORTS, prefixed with '-' for descending order.
+        page (int): The 1-based page number; pages past the end return the last page.
+        per_page (int): Number of employees per page.
+
+    Returns:
+        Page: A Django Page of dictionaries with 'employee_id', 'first_name', 'last_name',
+              'days_worked', 'first_date', 'last_date' and one total per field in TOTAL_FIELDS.
+    """
+    descending = sort.startswith('-')
+    order = SUMMARY_SORTS.get(sort.lstrip('-'), SUMMARY_SORTS['name'])
+    if descending:
+        order = ', '.join(f'{column} DESC' for column in order.split(', '))
+
+    filters = Q()
+    if start_date:
+        filters &= Q(date__gte=start_date)
+    if end_date:
+        filters &= Q(date__lte=end_date)
+    amounts = {f'{field}_centavos': columnar.centavos(field) for field in TOTAL_FIELDS}
+    sources = [Payroll.objects.filter(filters)]
+    if reaches_archive(start_date):
+        sources.append(ArchivedPayroll.objects.filter(filters))
+
+    selects = []
+    params = []
+    for queryset in sources:
+        sql, source_params = queryset.values('employee_id', 'date', **amounts).query.sql_with_params()
+        selects.append(f'SELECT * FROM ({sql}) source')
+        params.extend(source_params)
+
+    sums = ', '.join(f'SUM({field}_centavos) AS {field}' for field in TOTAL_FIELDS)
+    grouped = (
+        f'SELECT employee.id AS employee_id, employee.first_name, employee.last_name, '
+        f'COUNT(*) AS days_worked, MIN(records.date) AS first_date, MAX(records.date) AS last_date, {sums} '
+        f'FROM ({" UNION ALL ".join(selects)}) records '
+        f'INNER JOIN {Employee._meta.db_table} employee ON employee.id = records.employee_id '
+        f'GROUP BY employee.id, employee.first_name, employee.last_name'
+    )
+    sql = (
+        f'SELECT grouped.*, COUNT(*) OVER () AS employee_count FROM ({grouped}) grouped '
+        f'ORDER BY {order}, employee_id LIMIT %s OFFSET %s'
+    )
+
+    connection = connections[router.db_for_read(Payroll)]
+    page = max(page, 1)
+    rows, employee_count = _fetch_summary_page(connection, sql, params + [per_page, (page - 1) * per_page])
+    if not rows and page > 1:
+        # Past the last page: count the employees and return the last page instead.
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM ({grouped}) grouped', params)
+            page = max((cursor.fetchone()[0] + per_page - 1) // per_page, 1)
+        rows, employee_count = _fetch_summary_page(connection, sql, params + [per_page, (page - 1) * per_page])
+
+    paginator = Paginator([], per_page)
+    paginator.count = employee_count
+    return Page(rows, page, paginator)
+
+
+def _fetch_summary_page(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        records = cursor.fetchall()
+    date_field = Payroll._meta.get_field('date')
+    rows = []
+    employee_count = 0
+    for record in records:
+        row = dict(zip(names, record))
+        employee_count = row.pop('employee_count')
+        for field in TOTAL_FIELDS:
+            row[field] = columnar.to_decimal(row[field] or 0)
+        row['first_date'] = date_field.to_python(row['first_date'])
+        row['last_date'] = date_field.to_python(row['last_date'])
+        rows.append(row)
+    return rows, employee_count
+
+
+def _centavo_sums(**aggregates):
+    # Amounts are summed as integer centavos: SQLite sums decimals as floating point.
+    return dict(aggregates, **{field: Sum(columnar.centavos(field)) for field in TOTAL_FIELDS})
+
+
+def _to_decimals(row):
+    return {key: columnar.to_decimal(value or 0) if key in TOTAL_FIELDS else value for key, value in row.items()}
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
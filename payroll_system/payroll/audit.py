@@ -0,0 +1,314 @@
+"""
+Buffered, append-only audit trail of Payroll and Employee changes.
+
+Every created, changed or deleted Payroll or Employee record gets an
+AuditEntry holding a compact JSON diff (see encode_changes). Single-record
+saves and deletes are recorded by the signal handlers in payroll.signals from
+the values loaded with the record (_loaded_values); bulk operations (batch
+uploads, punch materialization, pay recomputes, chunked deletes, employee
+imports and status updates) record the before and after values they already
+read or read once per batch.
+
+Entries are never inserted one by one while a request or import runs:
+
+- record() queues them with transaction.on_commit, so changes that are
+  rolled back are never audited.
+- Committed changes go into a process-wide buffer as the raw value pairs
+  they were recorded with. flush() encodes them to JSON diffs and writes
+  them with executemany() INSERTs when the request finishes, after its
+  response has been sent, or earlier once the buffer holds
+  PAYROLL_AUDIT_FLUSH_SIZE entries. Encoding at flush time and
+  skipping AuditEntry instances and bulk_create's per-field preparation
+  keep the audit's cost on an import's path to a small fraction of the
+  import itself.
+  AuditMiddleware also remembers the user making each request's changes.
+- Outside requests (management commands, the shell) entries are written as
+  soon as they are committed, still one INSERT per recorded batch.
+
+Archiving moves records unchanged and is not audited.
+"""
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import AuditEntry, Payroll
+
+logger = logging.getLogger(__name__)
+
+# Records whose values are read per query by values_by_id.
+READ_BATCH_SIZE = 1000
+
+# Entries written per executemany() INSERT.
+INSERT_BATCH_SIZE = 1000
+
+# AuditEntry columns, in the order of the buffered row tuples.
+COLUMNS = ('changed_at', 'model', 'object_id', 'employee_id', 'record_date', 'action', 'username', 'changes')
+
+# Values stored in the JSON as they are; others are converted by _json_value first.
+JSON_TYPES = {str, int, float, bool, type(None)}
+
+# One shared encoder, so encoding an entry does not build an encoder per call.
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+_state = Local()
+# Recorded batches: (changed_at, model, username, [(old_values, new_values), ...]).
+_buffer = []
+_buffered_count = 0
+_buffer_lock = threading.Lock()
+
+
+def encode_changes(old_values, new_values):
+    """
+    Encodes a change as compact JSON.
+
+    Args:
+        old_values (dict): Field values (by attname) before the change; None for a created record.
+        new_values (dict): Field values after the change; None for a deleted record.
+
+    Returns:
+        str: {"field": value} with the values of a created or deleted record that are not
+             empty (None, '' or zero), i.e. its difference from an empty record, or
+             {"field": [old, new]} with only the changed fields of an updated record (fields
+             missing from old_values, such as deferred ones, are not compared). None if an
+             update changed nothing.
+    """
+    if old_values is None or new_values is None:
+        values = new_values if old_values is None else old_values
+        changes = {
+            # _json_value inlined, as this runs for every field of every imported record.
+            field: (
+                value if value.__class__ in JSON_TYPES
+                else value.isoformat() if value.__class__ is datetime else str(value)
+            )
+            for field, value in values.items()
+            if field != 'id' and value is not None and value != '' and value != 0
+        }
+    else:
+        changes = {
+            field: [_json_value(old_values.get(field)), _json_value(value)]
+            for field, value in new_values.items()
+            if field != 'id' and field in old_values and old_values[field] != value
+            and not (old_values.get(field) in (None, '') and value in (None, ''))
+        }
+        if not changes:
+            return None
+    return _encoder.encode(changes)
+
+
+def _json_value(value):
+    # Decimals, dates and times are stored as their string form, datetimes in ISO format.
+    if value.__class__ in JSON_TYPES:
+        return value
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def decode_changes(entry):
+    """
+    Returns the changes of an AuditEntry as (field, old, new) tuples for display.
+    """
+    changes = json.loads(entry.changes)
+    if entry.action == AuditEntry.ACTION_UPDATE:
+        return [(field, old, new) for field, (old, new) in changes.items()]
+    if entry.action == AuditEntry.ACTION_CREATE:
+        return [(field, None, value) for field, value in changes.items()]
+    return [(field, value, None) for field, value in changes.items()]
+
+
+def current_username():
+    """
+    Returns the user making the current changes: the one given to buffered(), else the
+    authenticated user of the current request, else ''.
+    """
+    username = getattr(_state, 'username', '')
+    request = getattr(_state, 'request', None)
+    if username or request is None:
+        return username
+    # Resolved only when something is audited, so other requests never load their user for it.
+    user = getattr(request, 'user', None)
+    return user.get_username() if user is not None and user.is_authenticated else ''
+
+
+def record(model, changes):
+    """
+    Audits a batch of changes to records of one model once the current transaction commits.
+
+    The changes are kept as they are and only encoded when the buffer is flushed, so
+    the value dicts must not be modified afterwards.
+
+    Args:
+        model (str): AuditEntry.MODEL_PAYROLL or AuditEntry.MODEL_EMPLOYEE.
+        changes (iterable): (old_values, new_values) pairs of field values by attname;
+            old_values is None for created records and new_values None for deleted ones.
+    """
+    changes = list(changes)
+    if changes:
+        batch = (timezone.now(), model, current_username(), changes)
+        transaction.on_commit(lambda: _add(batch))
+
+
+def _add(batch):
+    global _buffered_count
+    with _buffer_lock:
+        _buffer.append(batch)
+        _buffered_count += len(batch[3])
+        full = _buffered_count >= settings.PAYROLL_AUDIT_FLUSH_SIZE
+    if full or not getattr(_state, 'buffering', False):
+        flush()
+
+
+def _rows(batches, ops):
+    """
+    Yields AuditEntry row tuples, in COLUMNS order, for the changes of recorded batches.
+    """
+    for changed_at, model, username, changes in batches:
+        changed_at = ops.adapt_datetimefield_value(changed_at)
+        payroll = model == AuditEntry.MODEL_PAYROLL
+        for old_values, new_values in changes:
+            encoded = encode_changes(old_values, new_values)
+            if encoded is None:
+                continue
+            if old_values is None:
+                action, values = AuditEntry.ACTION_CREATE, new_values
+            elif new_values is None:
+                action, values = AuditEntry.ACTION_DELETE, old_values
+            else:
+                action, values = AuditEntry.ACTION_UPDATE, new_values
+            yield (
+                changed_at,
+                model,
+                values['id'],
+                values.get('employee_id') if payroll else values['id'],
+                ops.adapt_datefield_value(values.get('date')) if payroll else None,
+                action,
+                username,
+                encoded,
+            )
+
+
+def flush():
+    """
+    Encodes the buffered changes and writes them with one executemany() INSERT per
+    INSERT_BATCH_SIZE entries.
+
+    Returns:
+        int: The number of entries written.
+    """
+    global _buffer, _buffered_count
+    with _buffer_lock:
+        batches, _buffer, _buffered_count = _buffer, [], 0
+    if not batches:
+        return 0
+    connection = connections[DEFAULT_DB_ALIAS]
+    rows = list(_rows(batches, connection.ops))
+    if not rows:
+        return 0
+    quote = connection.ops.quote_name
+    sql = (
+        f'INSERT INTO {quote(AuditEntry._meta.db_table)} ({", ".join(quote(column) for column in COLUMNS)}) '
+        f'VALUES ({", ".join(["%s"] * len(COLUMNS))})'
+    )
+    try:
+        with transaction.atomic(using=DEFAULT_DB_ALIAS), connection.cursor() as cursor:
+            for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                cursor.executemany(sql, rows[start:start + INSERT_BATCH_SIZE])
+    except DatabaseError:
+        logger.exception("Could not write %d audit entries; they are kept for the next flush.", len(rows))
+        with _buffer_lock:
+            _buffer[:0] = batches
+            _buffered_count += sum(len(batch[3]) for batch in batches)
+        return 0
+    return len(rows)
+
+
+@contextmanager
+def buffered(username='', flush_on_exit=True):
+    """
+    Buffers the audit entries recorded in the block and attributes them to a user.
+
+    Args:
+        username (str): The user making the changes.
+        flush_on_exit (bool): Whether to write the buffered entries when the block ends.
+    """
+    previous = (getattr(_state, 'username', ''), getattr(_state, 'buffering', False))
+    _state.username = username
+    _state.buffering = True
+    try:
+        yield
+    finally:
+        _state.username, _state.buffering = previous
+        if flush_on_exit and not previous[1]:
+            flush()
+
+
+class AuditMiddleware:
+    """
+    Attributes the changes made by a request to its user and buffers their audit entries.
+
+    The entries are written when the request finishes (see flush_after_request).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        previous = getattr(_state, 'request', None)
+        _state.request = request
+        try:
+            with buffered(flush_on_exit=False):
+                return self.get_response(request)
+        finally:
+            _state.request = previous
+
+
+@receiver(request_finished)
+def flush_after_request(sender, **kwargs):
+    flush()
+
+
+def model_values(instance):
+    """
+    Returns the concrete field values of a model instance by attname.
+    """
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+
+
+def values_by_id(queryset, ids, fields):
+    """
+    Returns {id: values} for the given ids, reading READ_BATCH_SIZE records per query.
+    """
+    values_by_id = {}
+    ids = list(ids)
+    for start in range(0, len(ids), READ_BATCH_SIZE):
+        for values in queryset.filter(pk__in=ids[start:start + READ_BATCH_SIZE]).values('id', *fields):
+            values_by_id[values['id']] = values
+    return values_by_id
+
+
+def payroll_values(keys):
+    """
+    Returns the current values of the payroll records with the given (employee_id, date) keys.
+
+    Returns:
+        dict: {(employee_id, date): values by attname} for the keys that have a record.
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+    dates = [key[1] for key in keys]
+    records = Payroll.objects.filter(
+        employee_id__in={key[0] for key in keys}, date__range=(min(dates), max(dates))
+    ).values(*[field.attname for field in Payroll._meta.concrete_fields])
+    return {
+        (values['employee_id'], values['date']): values
+        for values in records.iterator()
+        if (values['employee_id'], values['date']) in keys
+    }
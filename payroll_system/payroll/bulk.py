@@ -0,0 +1,69 @@
+"""
+Set-based maintenance operations on many Payroll records at once.
+
+These run as UPDATE/DELETE statements over a queryset instead of saving or
+deleting model instances one by one, notify derived tables (such as the
+year-to-date ledger) once through payroll_rows_changed and record their
+changes in the audit trail in batches.
+"""
+from django.db import transaction
+
+from . import audit, calculations, rules
+from .models import AuditEntry, Payroll
+from .signals import send_rows_changed, suppress_row_signals
+
+DELETE_CHUNK_SIZE = 5000
+
+
+def recompute_pay(queryset):
+    """
+    Recomputes overtime pay, night differential pay, subtotal and net salary from the stored
+    rates and hours with a single UPDATE, applying the current pay rules.
+
+    Args:
+        queryset (QuerySet): The Payroll records to recompute.
+
+    Returns:
+        int: The number of records updated.
+    """
+    expressions = calculations.pay_expressions(rules.current_rules())
+    fields = ['employee_id', 'date', *expressions]
+    with transaction.atomic():
+        before = {values['id']: values for values in queryset.values('id', *fields)}
+        updated = Payroll.objects.filter(pk__in=queryset.values('pk')).update(**expressions)
+        after = audit.values_by_id(Payroll.objects.all(), before, fields)
+        audit.record(AuditEntry.MODEL_PAYROLL, [(before[record_id], values) for record_id, values in after.items()])
+        send_rows_changed((values['employee_id'], values['date']) for values in before.values())
+    return updated
+
+
+def delete_payrolls(queryset, chunk_size=DELETE_CHUNK_SIZE):
+    """
+    Deletes payroll records in chunks of ids inside one transaction, so memory use does not
+    grow with the number of records deleted.
+
+    The per-record ledger handlers are skipped; the ledger is refreshed once for every
+    (employee, year) touched when the transaction commits.
+
+    Args:
+        queryset (QuerySet): The Payroll records to delete.
+        chunk_size (int): Number of records deleted per DELETE statement.
+
+    Returns:
+        int: The number of records deleted.
+    """
+    deleted = 0
+    keys = set()
+    with transaction.atomic(), suppress_row_signals():
+        while True:
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+            chunk = Payroll.objects.filter(pk__in=ids)
+            rows = list(chunk.values(*[field.attname for field in Payroll._meta.concrete_fields]))
+            keys.update((row['employee_id'], row['date']) for row in rows)
+            audit.record(AuditEntry.MODEL_PAYROLL, [(row, None) for row in rows])
+            chunk.delete()
+            deleted += len(ids)
+        send_rows_changed(keys)
+    return deleted
@@ -0,0 +1,225 @@
+"""
+Server-side payroll pay computations.
+
+These mirror the formulas used by the payroll form in static/js/payroll.js so
+rows produced by batch jobs match rows entered by hand. Every function works on
+NumPy arrays so a whole batch of rows is computed at once; pay_expressions
+expresses the same rules as database expressions for set-based updates.
+"""
+from decimal import Decimal
+from fractions import Fraction
+
+import numpy as np
+from django.db.models import BigIntegerField, Case, DecimalField, ExpressionWrapper, Value, When
+
+from . import columnar
+
+REGULAR_HOURS = 8
+OVERTIME_THRESHOLD = 10
+OVERTIME_MULTIPLIER = 1.25
+NIGHT_DIFFERENTIAL_RATE = 0.1
+
+
+def round_centavos(values):
+    """
+    Rounds an array of peso amounts to two decimal places, half away from zero.
+
+    Args:
+        values (ndarray): Amounts in pesos.
+
+    Returns:
+        ndarray: The amounts rounded to the nearest centavo.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return np.sign(values) * np.floor(np.abs(values) * 100 + 0.5) / 100
+
+
+def _rule_terms(rules):
+    """
+    Returns (overtime threshold in hundredths of an hour, overtime multiplier, night differential rate).
+    """
+    if rules is None:
+        return (
+            OVERTIME_THRESHOLD * 100,
+            Fraction(str(OVERTIME_MULTIPLIER)),
+            Fraction(str(NIGHT_DIFFERENTIAL_RATE)),
+        )
+    return (
+        round(rules.overtime_threshold * 100),
+        rules.overtime_multiplier,
+        rules.night_differential_rate,
+    )
+
+
+def overtime_hours(total_hours, rules=None):
+    """
+    Returns the overtime portion of the given total hours worked.
+
+    Overtime only starts once an employee has worked more than the overtime threshold
+    (OVERTIME_THRESHOLD hours unless the pay rules set another).
+
+    Args:
+        total_hours (ndarray): Total hours worked per row.
+        rules (CompiledRules): The pay rules to apply. Defaults to the built-in rules.
+
+    Returns:
+        ndarray: Overtime hours per row.
+    """
+    threshold, _, _ = _rule_terms(rules)
+    total_hours = np.asarray(total_hours, dtype=np.float64)
+    return np.clip(total_hours - threshold / 100, 0, None)
+
+
+def compute_pay(daily_rate, total_hours, overtime_hour, night_differential_hour, allowance, deductions,
+                premium=None, rules=None):
+    """
+    Computes overtime pay, night differential pay, subtotal and net salary for a batch of rows.
+
+    Break time is deducted the same way as the payroll form: a shift reaching the overtime
+    threshold (10 hours by default) counts as 8 paid hours with no further break, shorter
+    shifts lose 2 hours from 6 hours up and 1 hour below that.
+
+    Amounts and hours are converted to integer hundredths first, so every product is exact
+    and each pay component is rounded once, half away from zero, to the centavo. The
+    subtotal is the sum of the rounded components.
+
+    Args:
+        daily_rate (ndarray): The daily rate per row.
+        total_hours (ndarray): Total hours worked per row.
+        overtime_hour (ndarray): Overtime hours per row.
+        night_differential_hour (ndarray): Night differential hours per row.
+        allowance (ndarray): Allowance per row.
+        deductions (ndarray): Deductions per row.
+        premium (ndarray): Holiday/rest-day premium per row in hundredths of the normal rate
+                           (see CompiledRules.premiums). Defaults to the normal rate.
+        rules (CompiledRules): The pay rules to apply. Defaults to the built-in rules.
+
+    Returns:
+        dict: int64 arrays of centavos for 'overtime_pay', 'night_differential_pay',
+              'subtotal' and 'net_salary'.
+    """
+    threshold, overtime, night = _rule_terms(rules)
+    rate = columnar.to_hundredths(daily_rate)
+    total_hours = columnar.to_hundredths(total_hours)
+    overtime_hour = columnar.to_hundredths(overtime_hour)
+    night_differential_hour = columnar.to_hundredths(night_differential_hour)
+    allowance = columnar.to_hundredths(allowance)
+    deductions = columnar.to_hundredths(deductions)
+    if premium is None:
+        premium = np.full(rate.shape, 100, dtype=np.int64)
+    premium = np.asarray(premium, dtype=np.int64)
+
+    full_shift = total_hours >= threshold
+    net_hour = np.where(full_shift, REGULAR_HOURS * 100, total_hours)
+    break_hour = np.where(full_shift, 0, np.where(net_hour >= 600, 200, 100))
+    paid_hours = np.clip(net_hour - break_hour, 0, None)
+
+    # rate is centavos per REGULAR_HOURS, hours are hundredths and premium is in hundredths,
+    # so pay = rate * premium * hours / (8 * 100 * 100).
+    rate = rate * premium
+    hour_scale = REGULAR_HOURS * 100 * 100
+    base_pay = columnar.divide_round_half_up(rate * paid_hours, hour_scale)
+    overtime_pay = columnar.divide_round_half_up(
+        rate * overtime_hour * overtime.numerator, hour_scale * overtime.denominator
+    )
+    night_differential_pay = columnar.divide_round_half_up(
+        rate * night_differential_hour * night.numerator, hour_scale * night.denominator
+    )
+    subtotal = np.where(total_hours > 0, base_pay + overtime_pay + night_differential_pay + allowance, 0)
+    net_salary = subtotal - deductions
+
+    return {
+        'overtime_pay': overtime_pay,
+        'night_differential_pay': night_differential_pay,
+        'subtotal': subtotal,
+        'net_salary': net_salary,
+    }
+
+
+def _half_up_quotient(numerator, denominator):
+    # Integer division in SQL truncates, so (2n + d) / 2d rounds non-negative n half up.
+    return ExpressionWrapper(
+        (numerator * 2 + denominator) / (denominator * 2), output_field=BigIntegerField()
+    )
+
+
+def _premium_expression(rules):
+    """
+    Builds a database expression for the premium of each row's date, in hundredths.
+    """
+    cases = []
+    if rules is not None:
+        holidays = {}
+        for day, premium in zip(rules.holiday_dates.astype(object), rules.holiday_premiums.tolist()):
+            holidays.setdefault(premium, []).append(day)
+        cases = [When(date__in=days, then=Value(premium)) for premium, days in holidays.items()]
+        if rules.rest_day is not None:
+            # Django numbers weekdays from Sunday = 1; the rules from Monday = 0.
+            cases.append(When(date__week_day=(rules.rest_day + 1) % 7 + 1, then=Value(rules.rest_day_premium)))
+    if not cases:
+        return Value(100, output_field=BigIntegerField())
+    return Case(*cases, default=Value(100), output_field=BigIntegerField())
+
+
+def pay_expressions(rules=None):
+    """
+    Returns database expressions that recompute the pay fields of Payroll rows in place.
+
+    The expressions follow compute_pay exactly, including holiday and rest-day premiums,
+    integer centavo arithmetic and half-up rounding, so a set-based
+    Payroll.objects.filter(...).update(**pay_expressions(rules)) stores the same values
+    compute_pay would. Rates and hours must not be negative.
+
+    Args:
+        rules (CompiledRules): The pay rules to apply. Defaults to the built-in rules.
+
+    Returns:
+        dict: Expressions for 'overtime_pay', 'night_differential_pay', 'subtotal' and 'net_salary'.
+    """
+    threshold, overtime, night = _rule_terms(rules)
+    rate = columnar.centavos('daily_rate') * _premium_expression(rules)
+    total_hours = columnar.centavos('total_hours_worked')
+    paid_hours = Case(
+        When(total_hours_worked__gte=Decimal(threshold) / 100, then=Value(REGULAR_HOURS * 100)),
+        When(total_hours_worked__gte=6, then=total_hours - 200),
+        When(total_hours_worked__gte=1, then=total_hours - 100),
+        default=Value(0),
+        output_field=BigIntegerField(),
+    )
+
+    hour_scale = REGULAR_HOURS * 100 * 100
+    base_pay = _half_up_quotient(rate * paid_hours, hour_scale)
+    overtime_pay = _half_up_quotient(
+        rate * columnar.centavos('overtime_hour') * overtime.numerator, hour_scale * overtime.denominator
+    )
+    night_differential_pay = _half_up_quotient(
+        rate * columnar.centavos('night_differential_hour') * night.numerator, hour_scale * night.denominator
+    )
+    subtotal = Case(
+        When(
+            total_hours_worked__gt=0,
+            then=base_pay + overtime_pay + night_differential_pay + columnar.centavos('allowance'),
+        ),
+        default=Value(0),
+        output_field=BigIntegerField(),
+    )
+    net_salary = subtotal - columnar.centavos('deductions')
+
+    def to_amount(centavos):
+        return ExpressionWrapper(
+            centavos * Value(Decimal('0.01')), output_field=DecimalField(max_digits=10, decimal_places=2)
+        )
+
+    return {
+        'overtime_pay': to_amount(overtime_pay),
+        'night_differential_pay': to_amount(night_differential_pay),
+        'subtotal': to_amount(subtotal),
+        'net_salary': to_amount(net_salary),
+    }
+
+
+def to_decimal(value):
+    """
+    Converts a computed float amount (such as hours) to a two decimal place Decimal.
+    """
+    return Decimal(f'{value:.2f}')
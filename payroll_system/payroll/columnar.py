@@ -0,0 +1,182 @@
+"""
+Columnar fixed-point engine for payroll reporting.
+
+Money and hour columns are loaded from the database as int64 NumPy arrays of
+centavos (hundredths), computed in SQL so no Decimal objects are created per
+row. Sums and group-bys (by employee, project or month) run over those
+arrays and are converted back to Decimal only for the final results, which
+makes them identical to adding the original two-decimal Decimal values one by
+one. The paginated all-employee summary groups the same centavos()
+expression in SQL, so only one page of employees leaves the database.
+"""
+from decimal import Decimal
+from itertools import chain
+
+import numpy as np
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+
+# Columns summed by payroll reports. Hours are stored with two decimals as well,
+# so they use the same fixed-point representation.
+TOTAL_FIELDS = [
+    'total_hours_worked', 'overtime_hour', 'night_differential_hour', 'overtime_pay',
+    'night_differential_pay', 'allowance', 'deductions', 'subtotal', 'net_salary',
+]
+
+
+class PayrollColumns:
+    """
+    A batch of payroll rows held column by column.
+
+    Attributes:
+        values (dict): Field name -> int64 array of hundredths (centavos for money).
+        keys (dict): Grouping column name -> array of raw values (ids, dates, projects).
+    """
+
+    def __init__(self, values, keys=None):
+        self.values = values
+        self.keys = keys or {}
+
+    def __len__(self):
+        return len(next(iter(self.values.values()))) if self.values else 0
+
+    def totals(self):
+        """
+        Returns the sum of every value column as a two-decimal Decimal.
+        """
+        return {name: to_decimal(column.sum()) for name, column in self.values.items()}
+
+    def group_totals(self, key):
+        """
+        Sums every value column per distinct value of a key column.
+
+        Args:
+            key (str): A key column loaded with load(), e.g. 'employee_id', 'project' or 'month'.
+
+        Returns:
+            list: (key_value, totals) tuples ordered by key value, where totals maps each
+                  value column to a Decimal and includes 'count', the number of rows.
+        """
+        if not len(self):
+            return []
+        labels, inverse = np.unique(self.keys[key], return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+        counts = np.diff(np.r_[starts, len(order)])
+        sums = {name: np.add.reduceat(column[order], starts) for name, column in self.values.items()}
+        return [
+            (_python_value(label), dict(
+                {name: to_decimal(sums[name][index]) for name in self.values}, count=int(counts[index])
+            ))
+            for index, label in enumerate(labels)
+        ]
+
+
+def centavos(field):
+    """
+    Returns a database expression for a two-decimal field scaled to an integer number of hundredths.
+    """
+    return Cast(Round(F(field) * 100), output_field=BigIntegerField())
+
+
+def load(queryset, fields=TOTAL_FIELDS, keys=()):
+    """
+    Loads payroll columns from a queryset with a single values_list() query.
+
+    Rows are streamed from the database cursor straight into the arrays, so no list of
+    row tuples is built on the way.
+
+    Args:
+        queryset (QuerySet): The Payroll (or ArchivedPayroll, ProjectDailyCost) rows to load.
+        fields (list): Two-decimal fields to load as int64 hundredths.
+        keys (iterable): Grouping columns to load as they are. 'month' is derived from 'date'.
+
+    Returns:
+        PayrollColumns: The loaded columns.
+    """
+    keys = list(keys)
+    key_fields = ['date' if key == 'month' else key for key in keys]
+    annotations = {f'_c_{field}': centavos(field) for field in fields}
+    rows = queryset.order_by().annotate(**annotations).values_list(*annotations, *key_fields).iterator()
+
+    width = len(fields)
+    key_columns = [[] for _ in keys]
+    if keys:
+        rows = _collect_keys(rows, width, key_columns)
+    matrix = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, width)
+
+    values = {field: matrix[:, index] for index, field in enumerate(fields)}
+    loaded_keys = {}
+    for key, column in zip(keys, key_columns):
+        column = np.array(column, dtype='datetime64[D]' if key in ('date', 'month') else object)
+        if key == 'month':
+            column = column.astype('datetime64[M]')
+        loaded_keys[key] = column
+    return PayrollColumns(values, loaded_keys)
+
+
+def _collect_keys(rows, width, key_columns):
+    # Yields the value part of each row and appends its key values to key_columns.
+    for row in rows:
+        for column, value in zip(key_columns, row[width:]):
+            column.append(value)
+        yield row[:width]
+
+
+def concatenate(parts):
+    """
+    Joins PayrollColumns loaded with the same fields and keys, e.g. from live and archived records.
+    """
+    parts = list(parts)
+    return PayrollColumns(
+        {name: np.concatenate([part.values[name] for part in parts]) for name in parts[0].values},
+        {name: np.concatenate([part.keys[name] for part in parts]) for name in parts[0].keys},
+    )
+
+
+def totals(queryset, fields=TOTAL_FIELDS):
+    """
+    Sums the given fields of a queryset, returning two-decimal Decimals.
+
+    Equivalent to sum(getattr(row, field) for row in queryset) for each field, without
+    creating a Decimal or model instance per row.
+    """
+    return load(queryset, fields).totals()
+
+
+def to_decimal(hundredths):
+    """
+    Converts an integer number of hundredths (e.g. centavos) to a two-decimal Decimal.
+    """
+    return Decimal(int(hundredths)).scaleb(-2)
+
+
+def to_hundredths(values):
+    """
+    Converts amounts with at most two decimals (floats, Decimals or arrays) to int64 hundredths.
+    """
+    return np.rint(np.asarray(values, dtype=np.float64) * 100).astype(np.int64)
+
+
+def divide_round_half_up(numerator, denominator):
+    """
+    Divides integer arrays and rounds half away from zero, the same as Decimal ROUND_HALF_UP.
+
+    Args:
+        numerator (ndarray): int64 dividends.
+        denominator (int): A positive integer divisor.
+
+    Returns:
+        ndarray: The rounded int64 quotients.
+    """
+    numerator = np.asarray(numerator, dtype=np.int64)
+    magnitude = (np.abs(numerator) * 2 + denominator) // (denominator * 2)
+    return np.sign(numerator) * magnitude
+
+
+def _python_value(value):
+    if isinstance(value, np.datetime64):
+        return value.astype(object)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
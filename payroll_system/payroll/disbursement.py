@@ -0,0 +1,399 @@
+"""
+Bank disbursement files for closed pay periods.
+
+Instead of retyping net salaries into the bank's upload format, a payout file
+is generated from a closed pay period:
+
+- payouts() sums each employee's net salary over the period's live and
+  archived records in one grouped query, as integer centavos like the payroll
+  summary, joined with the employee's name and bank account. Rows are fetched
+  from the cursor in chunks while the file is written, so there is no query
+  per employee and memory use does not grow with the number of employees.
+- A writer renders the bank's format: a header line, one detail line per
+  employee and a trailer line with the control totals banks use to check that
+  a file arrived complete (record count, amount total and a hash total of the
+  account numbers). Writers subclass DisbursementWriter and are listed by
+  format name in settings.PAYROLL_DISBURSEMENT_WRITERS, so another bank's
+  format is added without touching this module.
+- file_chunks() streams the file and reconciles it before the trailer is
+  written: the count and total of the payouts must equal those of the
+  period's frozen totals (PayPeriodTotal). Otherwise DisbursementMismatch is
+  raised and the file ends without a trailer, which banks reject.
+
+Only closed periods are disbursed, so their records cannot change while the
+file is generated.
+"""
+import csv
+import re
+import unicodedata
+from collections import namedtuple
+from decimal import Decimal
+from io import StringIO
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from employee.models import Employee
+
+from . import columnar
+from .archive import reaches_archive
+from .exports import FETCH_CHUNK_SIZE, FLUSH_BYTES
+from .models import ArchivedPayroll, PayPeriodTotal, Payroll
+
+# One employee's payout; amount is in centavos.
+Payout = namedtuple('Payout', ['employee_id', 'first_name', 'last_name', 'bank_account', 'amount'])
+
+# Hash totals keep their lowest 15 digits, the width of the fixed-width trailer field.
+HASH_MODULUS = 10 ** 15
+
+
+class DisbursementError(Exception):
+    """
+    Raised when a disbursement file cannot be generated.
+    """
+
+
+class DisbursementMismatch(DisbursementError):
+    """
+    Raised when a disbursement file does not reconcile with the period's totals.
+    """
+
+
+class ControlTotals:
+    """
+    The control totals of a disbursement file, accumulated as its detail lines are written.
+
+    Attributes:
+        count (int): The number of payouts.
+        amount (int): The sum of the payouts, in centavos.
+        account_hash (int): The sum of the account numbers (digits only), modulo HASH_MODULUS.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.amount = 0
+        self.account_hash = 0
+
+    def add(self, payout):
+        self.count += 1
+        self.amount += payout.amount
+        self.account_hash = (self.account_hash + int(account_digits(payout.bank_account))) % HASH_MODULUS
+
+    @property
+    def total(self):
+        """
+        The sum of the payouts as a two-decimal Decimal.
+        """
+        return columnar.to_decimal(self.amount)
+
+
+def account_digits(bank_account):
+    """
+    Returns the digits of an account number, without the spaces and dashes it may be entered with.
+    """
+    return re.sub(r'\D', '', bank_account)
+
+
+def ascii_name(text):
+    """
+    Returns text in upper case without accents or other non-ASCII characters, as bank formats require.
+    """
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').upper()
+
+
+class DisbursementWriter:
+    """
+    Base class of the disbursement file formats.
+
+    file_chunks() calls header() once, detail() for every payout and trailer() with the
+    control totals; each returns the text of its line(s), including line endings.
+    """
+
+    # Shown on the download button.
+    label = ''
+    extension = 'txt'
+    content_type = 'text/plain'
+
+    def __init__(self, period, company=None, funding_account=None):
+        """
+        Args:
+            period (PayPeriod): The closed period being disbursed.
+            company (str): Company name for the header. Defaults to settings.PAYROLL_DISBURSEMENT_COMPANY.
+            funding_account (str): The account the payouts are drawn from.
+                Defaults to settings.PAYROLL_DISBURSEMENT_ACCOUNT.
+        """
+        self.period = period
+        self.company = ascii_name(company if company is not None else settings.PAYROLL_DISBURSEMENT_COMPANY)
+        self.funding_account = account_digits(
+            funding_account if funding_account is not None else settings.PAYROLL_DISBURSEMENT_ACCOUNT
+        )
+        self.created_at = timezone.localtime()
+
+    def header(self):
+        raise NotImplementedError
+
+    def detail(self, payout):
+        raise NotImplementedError
+
+    def trailer(self, totals):
+        raise NotImplementedError
+
+    def filename(self):
+        return f'disbursement_{self.period.start_date}_{self.period.end_date}.{self.extension}'
+
+
+class CsvWriter(DisbursementWriter):
+    """
+    CSV payout file with H (header), D (detail) and T (trailer) records.
+
+    H,<created yyyymmdd>,<period start>,<period end>,<funding account>,<company>
+    D,<account>,<name>,<amount>,<employee id>
+    T,<count>,<total>,<account hash>
+    """
+
+    label = 'CSV'
+    extension = 'csv'
+    content_type = 'text/csv'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._buffer = StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _line(self, values):
+        self._writer.writerow(values)
+        line = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return line
+
+    def header(self):
+        return self._line([
+            'H', f'{self.created_at:%Y%m%d}', f'{self.period.start_date:%Y%m%d}', f'{self.period.end_date:%Y%m%d}',
+            self.funding_account, self.company,
+        ])
+
+    def detail(self, payout):
+        return self._line([
+            'D', account_digits(payout.bank_account), ascii_name(f'{payout.last_name} {payout.first_name}'),
+            columnar.to_decimal(payout.amount), payout.employee_id,
+        ])
+
+    def trailer(self, totals):
+        return self._line(['T', totals.count, totals.total, totals.account_hash])
+
+
+class FixedWidthWriter(DisbursementWriter):
+    """
+    Fixed-width payout file of RECORD_LENGTH-character lines.
+
+    Header:  'H', created, period start, period end (yyyymmdd), funding account (34), company (40)
+    Detail:  'D', account (34), name (40), amount in centavos (15, zero-padded), employee id (10)
+    Trailer: 'T', count (8), total in centavos (17), account hash (15)
+
+    Text fields are left-aligned and padded with spaces; names are truncated to fit.
+    """
+
+    label = 'Fixed-width'
+    extension = 'txt'
+    content_type = 'text/plain'
+
+    RECORD_LENGTH = 100
+    LINE_ENDING = '\r\n'
+
+    def _line(self, *fields):
+        return ''.join(fields).ljust(self.RECORD_LENGTH) + self.LINE_ENDING
+
+    def _number(self, value, width, name):
+        if value < 0:
+            raise DisbursementError(f"Negative {name} {value} cannot be written.")
+        text = str(value).zfill(width)
+        if len(text) > width:
+            raise DisbursementError(f"The {name} {value} does not fit in {width} digits.")
+        return text
+
+    def header(self):
+        return self._line(
+            'H', f'{self.created_at:%Y%m%d}', f'{self.period.start_date:%Y%m%d}', f'{self.period.end_date:%Y%m%d}',
+            self.funding_account.ljust(34)[:34], self.company.ljust(40)[:40],
+        )
+
+    def detail(self, payout):
+        return self._line(
+            'D',
+            account_digits(payout.bank_account).ljust(34),
+            ascii_name(f'{payout.last_name} {payout.first_name}').ljust(40)[:40],
+            self._number(payout.amount, 15, 'amount'),
+            self._number(payout.employee_id, 10, 'employee id'),
+        )
+
+    def trailer(self, totals):
+        return self._line(
+            'T',
+            self._number(totals.count, 8, 'record count'),
+            self._number(totals.amount, 17, 'total'),
+            self._number(totals.account_hash, 15, 'account hash'),
+        )
+
+
+def get_writer_class(file_format):
+    """
+    Returns the writer class configured for a format name in settings.PAYROLL_DISBURSEMENT_WRITERS.
+
+    Raises:
+        DisbursementError: If no writer is configured for the format.
+    """
+    try:
+        return import_string(settings.PAYROLL_DISBURSEMENT_WRITERS[file_format])
+    except KeyError:
+        raise DisbursementError(f"Unknown disbursement format: {file_format}")
+
+
+def writer_formats():
+    """
+    Returns (format name, label) pairs of the configured writers.
+    """
+    return [(name, get_writer_class(name).label or name) for name in settings.PAYROLL_DISBURSEMENT_WRITERS]
+
+
+def _period_filter(period):
+    return Q(date__gte=period.start_date, date__lte=period.end_date)
+
+
+def payouts_sql(period):
+    """
+    Returns (sql, params) of the grouped payout query of a period.
+
+    Rows are (employee_id, first_name, last_name, bank_account, amount in centavos) in
+    employee id order, for employees whose net salary in the period is not zero.
+    """
+    sources = [Payroll.objects.filter(_period_filter(period))]
+    if reaches_archive(period.start_date):
+        sources.append(ArchivedPayroll.objects.filter(_period_filter(period)))
+
+    selects = []
+    params = []
+    for queryset in sources:
+        sql, source_params = queryset.values(
+            'employee_id', net_centavos=columnar.centavos('net_salary')
+        ).query.sql_with_params()
+        selects.append(f'SELECT * FROM ({sql}) source')
+        params.extend(source_params)
+
+    employee = Employee._meta.db_table
+    sql = (
+        f'SELECT employee.id, employee.first_name, employee.last_name, employee.bank_account, '
+        f'SUM(records.net_centavos) AS amount '
+        f'FROM ({" UNION ALL ".join(selects)}) records '
+        f'INNER JOIN {employee} employee ON employee.id = records.employee_id '
+        f'GROUP BY employee.id, employee.first_name, employee.last_name, employee.bank_account '
+        f'HAVING SUM(records.net_centavos) <> 0 '
+        f'ORDER BY employee.id'
+    )
+    return sql, params
+
+
+def payouts(period, using=None):
+    """
+    Yields the period's Payout rows, read with a single grouped query in chunks of FETCH_CHUNK_SIZE.
+
+    Args:
+        period (PayPeriod): The pay period.
+        using (str): The database to read. Defaults to the one payroll reads are routed to.
+    """
+    sql, params = payouts_sql(period)
+    with connections[using or router.db_for_read(Payroll)].cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield Payout(*row)
+
+
+def missing_accounts(period):
+    """
+    Returns the employees paid in the period who have no bank account on file.
+    """
+    paid = Q(id__in=Payroll.objects.filter(_period_filter(period)).values('employee_id'))
+    if reaches_archive(period.start_date):
+        paid |= Q(id__in=ArchivedPayroll.objects.filter(_period_filter(period)).values('employee_id'))
+    return Employee.objects.filter(paid, bank_account='').order_by('last_name', 'first_name')
+
+
+def expected_totals(period, using=None):
+    """
+    Returns the payout count and total (centavos) of a closed period, from its frozen totals.
+    """
+    totals = PayPeriodTotal.objects.using(using or router.db_for_read(PayPeriodTotal)).filter(
+        period=period
+    ).exclude(net_salary=0).aggregate(count=Count('id'), total=Sum('net_salary'))
+    return totals['count'], int((totals['total'] or Decimal(0)) * 100)
+
+
+def reconcile(period, totals, using=None):
+    """
+    Checks the control totals of a disbursement file against the period's frozen totals.
+
+    Raises:
+        DisbursementMismatch: If the count or the total differs.
+    """
+    count, amount = expected_totals(period, using)
+    if (totals.count, totals.amount) != (count, amount):
+        raise DisbursementMismatch(
+            f"The disbursement file for {period} does not reconcile: {totals.count} payout(s) totalling "
+            f"{totals.total}, but the period's totals are {count} payout(s) totalling {columnar.to_decimal(amount)}."
+        )
+
+
+def file_chunks(period, writer, totals=None):
+    """
+    Generates a disbursement file, yielding roughly FLUSH_BYTES of text at a time.
+
+    The database is chosen when this is called, so the rows are read from the same
+    database when the file is streamed after the view has returned.
+
+    Args:
+        period (PayPeriod): A closed pay period.
+        writer (DisbursementWriter): The file format.
+        totals (ControlTotals): Accumulates the control totals of the file, for callers
+            that report them; a new one is used by default.
+
+    Returns:
+        generator: str pieces of the file.
+
+    Raises:
+        DisbursementError: If the period is open. While streaming, DisbursementError if a payout
+            has no bank account, is negative or does not fit the format, and DisbursementMismatch if the file
+            does not reconcile; the trailer is not written in either case.
+    """
+    if not period.is_closed:
+        raise DisbursementError(f"The pay period {period} is open; close it before disbursing.")
+    using = router.db_for_read(Payroll)
+    return _chunks(period, writer, totals if totals is not None else ControlTotals(), using)
+
+
+def _chunks(period, writer, totals, using):
+    parts = [writer.header()]
+    size = len(parts[0])
+    for payout in payouts(period, using):
+        name = f"{payout.first_name} {payout.last_name} (employee {payout.employee_id})"
+        if not account_digits(payout.bank_account):
+            raise DisbursementError(f"{name} has no bank account.")
+        if payout.amount < 0:
+            raise DisbursementError(f"{name} has a negative net salary of {columnar.to_decimal(payout.amount)}.")
+        line = writer.detail(payout)
+        totals.add(payout)
+        parts.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+    reconcile(period, totals, using)
+    parts.append(writer.trailer(totals))
+    yield ''.join(parts)
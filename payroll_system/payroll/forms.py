@@ -1,15 +1,17 @@
 from decimal import Decimal
+import numpy as np
 from django import forms
+from . import archive, calculations, columnar, periods, rules
 from .models import Payroll
 from django.core.exceptions import ValidationError
-from employee.models import Employee
+from employee.forms import EmployeeChoiceField
 
 class PayrollForm(forms.ModelForm):
     """
     Form for creating and updating Payroll records.
 
     This form handles the payroll processing for an employee, including:
-    - employee: The employee receiving the payroll.
+    - employee: The employee receiving the payroll, listed from the employee directory.
     - time_in: The time the employee started working on a particular day.
     - time_out: The time the employee finished working on that day.
     - total_hours_worked: The total number of hours worked by the employee on that day.
@@ -25,9 +27,15 @@ class PayrollForm(forms.ModelForm):
     - night_differential_pay: The pay corresponding to the night differential hours worked.
 
     The form performs validation to ensure that:
-    - Overtime cannot be recorded if total hours worked is less than 10.
+    - Overtime cannot be recorded if total hours worked is less than the overtime threshold.
     - Total hours worked must be greater than zero.
-    - Deductions cannot exceed the gross salary.
+    - Deductions cannot exceed the allowed share of the gross salary.
+    - The record's date is not within a closed pay period.
+
+    Pay rules (overtime threshold and multiplier, night differential rate, holiday and
+    rest-day premiums, position rates and the deductions cap) come from the current
+    compiled pay rules. The pay columns are recomputed on the server with those rules;
+    the values shown by the browser are only a preview.
     """
     
     class Meta:
@@ -38,8 +46,7 @@ class PayrollForm(forms.ModelForm):
             'project', 'allowance', 'night_differential_pay', 'night_differential_hour'
         ]
 
-    employee = forms.ModelChoiceField(
-        queryset=Employee.objects.all(),
+    employee = EmployeeChoiceField(
         required=True,
         widget=forms.Select(attrs={'class': 'form-control'})
     )
@@ -47,8 +54,8 @@ class PayrollForm(forms.ModelForm):
     daily_rate = forms.DecimalField(
         max_digits=10,
         decimal_places=2,
-        required=True,
-        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Daily Rate'})
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Daily Rate (blank for position rate)'})
     )
 
     time_in = forms.DateTimeField(
@@ -122,6 +129,11 @@ class PayrollForm(forms.ModelForm):
         """
         payroll = kwargs.get('instance')
         super().__init__(*args, **kwargs)
+        self.pay_rules = rules.current_rules()
+
+        if payroll and payroll.employee_id:
+            # Keep an existing record editable even if its employee has since been deactivated.
+            self.fields['employee'].include_id = payroll.employee_id
 
         if payroll:
             self.fields['total_hours_worked'].initial = payroll.total_hours_worked
@@ -130,17 +142,46 @@ class PayrollForm(forms.ModelForm):
             self.fields['subtotal'].initial = payroll.subtotal
             self.fields['net_salary'].initial = payroll.net_salary
 
+    def client_rules(self):
+        """
+        Returns the pay rules in the form used by static/js/payroll.js for its live preview.
+        """
+        pay_rules = self.pay_rules
+        position_rates = {}
+        for entry in self.fields['employee'].entries():
+            rate = pay_rules.daily_rate(entry.position)
+            if rate is not None:
+                position_rates[str(entry.id)] = float(rate)
+        return {
+            'overtimeThreshold': float(pay_rules.overtime_threshold),
+            'overtimeMultiplier': float(pay_rules.overtime_multiplier),
+            'nightDifferentialRate': float(pay_rules.night_differential_rate),
+            'restDay': pay_rules.rest_day,
+            'restDayPremium': pay_rules.rest_day_premium,
+            'holidays': {
+                str(day): premium
+                for day, premium in zip(pay_rules.holiday_dates.astype(object), pay_rules.holiday_premiums.tolist())
+            },
+            'positionRates': position_rates,
+        }
+
     def clean(self):
         """
         Custom form validation to ensure the following:
-        - Overtime hours cannot be recorded if total hours worked is less than 10.
+        - Overtime hours cannot be recorded if total hours worked is less than the overtime threshold.
         - Total hours worked must be greater than zero.
-        - Deductions cannot exceed gross salary.
-        
+        - Deductions cannot exceed the allowed share of the gross salary.
+        - The record's date is not within a closed pay period.
+        - The employee has no archived record on that date.
+
+        A missing daily rate is taken from the employee's position, and the overtime pay,
+        night differential pay, subtotal and net salary are computed with the pay rules.
+
         Returns:
             cleaned_data: A dictionary containing cleaned data from the form.
         """
         cleaned_data = super().clean()
+        pay_rules = self.pay_rules
         total_hours_worked = cleaned_data.get('total_hours_worked')
         deductions = cleaned_data.get('deductions')
     
@@ -152,26 +193,53 @@ class PayrollForm(forms.ModelForm):
         night_differential_hour = Decimal(night_differential_hour) if night_differential_hour else Decimal(0)
         deductions = Decimal(deductions) if deductions else Decimal(0)
         allowance = Decimal(allowance) if allowance else Decimal(0)
+        threshold = Decimal(pay_rules.overtime_threshold.numerator) / pay_rules.overtime_threshold.denominator
 
         # Check for overtime hours error
         if total_hours_worked is not None:
-            if overtime_hour > 0 and total_hours_worked <= 10:
-                raise ValidationError("Overtime cannot be recorded if total hours worked is less than 10.")
+            if overtime_hour > 0 and total_hours_worked <= threshold:
+                raise ValidationError(f"Overtime cannot be recorded if total hours worked is less than {threshold:g}.")
             
-            if overtime_hour > 0 and (total_hours_worked - overtime_hour) < 10:
+            if overtime_hour > 0 and (total_hours_worked - overtime_hour) < threshold:
                 raise ValidationError("Overtime hours cannot exceed total hours worked")
         
         # Check for total hours worked error
         if total_hours_worked is not None and total_hours_worked <= 0:
             raise ValidationError("Total hours worked cannot be less than or equal to zero.")
-        
-        # Calculate gross salary and net salary
+
+        time_in = cleaned_data.get('time_in')
+        if time_in:
+            try:
+                periods.check_open([time_in.date()])
+            except periods.PeriodClosed as e:
+                raise ValidationError(str(e))
+
+        employee = cleaned_data.get('employee')
+        if time_in and employee is not None and archive.archived_keys([(employee.pk, time_in.date())]):
+            raise ValidationError(f"{employee} already has an archived payroll record on {time_in.date()}.")
+        daily_rate = cleaned_data.get('daily_rate')
+        if not daily_rate and employee is not None:
+            daily_rate = pay_rules.daily_rate(employee.position)
+            if daily_rate is None:
+                raise ValidationError(f"Enter a daily rate; the position {employee.position} has no standard rate.")
+            cleaned_data['daily_rate'] = daily_rate
+
+        # Calculate gross salary and net salary with the pay rules
+        if total_hours_worked is not None and daily_rate and time_in:
+            pay = calculations.compute_pay(
+                [daily_rate], [total_hours_worked], [overtime_hour], [night_differential_hour],
+                [allowance], [deductions],
+                premium=pay_rules.premiums(np.array([time_in.date()], dtype='datetime64[D]')),
+                rules=pay_rules,
+            )
+            for field, centavos in pay.items():
+                cleaned_data[field] = columnar.to_decimal(centavos[0])
         gross_salary = cleaned_data.get('subtotal')
         net_salary = gross_salary - deductions if gross_salary is not None else 0
 
-        # Ensure deductions do not exceed gross salary
-        if gross_salary and deductions > gross_salary:
-            raise ValidationError("Deductions cannot exceed the gross salary.")
+        # Ensure deductions stay within the allowed share of the gross salary
+        if gross_salary and deductions > pay_rules.deduction_limit(gross_salary):
+            raise ValidationError("Deductions cannot exceed the allowed share of the gross salary.")
 
         cleaned_data['net_salary'] = net_salary
         cleaned_data['overtime_hour'] = overtime_hour
@@ -181,5 +249,34 @@ class PayrollForm(forms.ModelForm):
         return cleaned_data
 
 
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """
+    File field that accepts one or more uploaded files and cleans to a list.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(item, initial) for item in data]
+        return [single_file_clean(data, initial)]
+
+
 class PayrollUploadForm(forms.Form):
-    excel_file = forms.FileField()
\ No newline at end of file
+    excel_file = MultipleFileField(
+        help_text="One or more Excel/CSV files, or a ZIP of them."
+    )
+    all_sheets = forms.BooleanField(
+        required=False,
+        help_text="Read every sheet of each workbook instead of only the first one."
+    )
+
+class PunchUploadForm(forms.Form):
+    punch_file = forms.FileField(help_text="CSV or Excel file with employee_id, punched_at and direction columns.")
+    source = forms.CharField(max_length=100, required=False, help_text="Optional site or device name.")
@@ -0,0 +1,584 @@
+"""
+Batch upload of payroll records from one or many Excel/CSV sources.
+
+Parsing and validating spreadsheets with pandas/openpyxl is CPU-bound, so
+each source file is parsed in a separate worker process. Workers only see
+file bytes and return plain rows; everything that touches the database
+(employee lookups, duplicate checks and the bulk insert) happens on the main
+process once all sources are parsed.
+
+Worker processes import this module without Django being set up, so models
+are only imported inside the functions that run on the main process.
+
+Sites often upload the same or a slightly edited file again, so re-uploads
+are fingerprinted at three levels:
+
+- Files: the SHA-256 of each imported file is stored in PayrollUpload. A file
+  with the same content is recognized before it is read, as long as the
+  records it produced are still there.
+- Chunks: every sheet is split into chunks of rows at content-defined
+  boundaries (see chunk_bounds), so inserting or deleting a row only changes
+  the chunk around it. Workers skip chunks already stored in
+  PayrollUploadChunk for the previous upload under the same name, without
+  parsing them.
+- Rows: each record keeps the fingerprint of the row it was imported from
+  (Payroll.fingerprint). Rows of changed chunks whose record has the same
+  fingerprint are left alone. A changed row only overwrites a record that was
+  imported from the previous upload of the same file; any other existing
+  record (entered by hand, generated from punches, corrected after an import
+  or imported from another file) is still rejected as already existing.
+
+A re-upload of a large, mostly unchanged file therefore only parses and
+writes the chunks around the edited rows.
+"""
+import hashlib
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+REQUIRED_COLUMNS = [
+    'employee_id', 'daily_rate', 'allowance', 'total_hours_worked', 'overtime_pay',
+    'overtime_hour', 'night_differential_pay', 'night_differential_hour',
+    'deductions', 'deduction_remarks', 'subtotal', 'net_salary', 'date',
+    'time_in', 'time_out', 'project'
+]
+
+DECIMAL_COLUMNS = [
+    'daily_rate', 'allowance', 'total_hours_worked', 'overtime_pay', 'overtime_hour',
+    'night_differential_pay', 'night_differential_hour', 'deductions', 'subtotal', 'net_salary',
+]
+
+TEXT_COLUMNS = ['deduction_remarks', 'project']
+
+SPREADSHEET_EXTENSIONS = ('.xlsx', '.xlsm', '.xls', '.csv')
+
+# Fields rewritten when a re-uploaded row changes an existing record.
+UPSERT_FIELDS = DECIMAL_COLUMNS + TEXT_COLUMNS + ['time_in', 'time_out', 'fingerprint', 'from_punches']
+
+INSERT_BATCH_SIZE = 1000
+
+# A chunk ends after a row whose hash is a multiple of CHUNK_AVERAGE_ROWS, and holds
+# between CHUNK_MIN_ROWS and CHUNK_MAX_ROWS rows (the last chunk of a sheet may be smaller).
+CHUNK_AVERAGE_ROWS = 256
+CHUNK_MIN_ROWS = 64
+CHUNK_MAX_ROWS = 1024
+
+
+def expand_sources(uploaded_files):
+    """
+    Turns uploaded files into a list of (name, content) sources, unpacking ZIP archives.
+
+    Args:
+        uploaded_files (list): The uploaded Excel, CSV or ZIP files.
+
+    Returns:
+        list: (name, bytes) tuples in upload order, with ZIP members in archive order.
+    """
+    sources = []
+    for uploaded_file in uploaded_files:
+        content = uploaded_file.read()
+        if uploaded_file.name.lower().endswith('.zip'):
+            with zipfile.ZipFile(BytesIO(content)) as archive:
+                for member in archive.infolist():
+                    member_name = os.path.basename(member.filename)
+                    if member.is_dir() or member_name.startswith(('.', '~$')) or '__MACOSX' in member.filename:
+                        continue
+                    if member_name.lower().endswith(SPREADSHEET_EXTENSIONS):
+                        sources.append((f'{uploaded_file.name}/{member.filename}', archive.read(member)))
+        else:
+            sources.append((uploaded_file.name, content))
+    return sources
+
+
+def _parse_times(series):
+    text = series.astype(str).str.strip()
+    parsed = pd.to_datetime(text, format='%H:%M:%S', errors='coerce')
+    return parsed.fillna(pd.to_datetime(text, format='%I:%M %p', errors='coerce'))
+
+
+def row_fingerprint(values):
+    """
+    Returns the fingerprint of a parsed payroll row: a 16 hex digit hash of its uploaded values.
+    """
+    text = repr([values[column] for column in REQUIRED_COLUMNS])
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+def _cell_text(df):
+    # Cells as text, so a row hashes the same whatever dtype pandas inferred for its columns from
+    # the other rows (an integer column is read as floats once a cell is blank, for instance).
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            values = values.astype('float64')
+        columns[column] = values.astype(str).where(values.notna(), '')
+    return pd.DataFrame(columns, index=df.index)
+
+
+def chunk_bounds(df):
+    """
+    Splits a sheet into chunks of rows at boundaries that depend only on the rows' content.
+
+    Each row is hashed from the text of its cells, and a chunk ends after a row whose hash is a
+    multiple of CHUNK_AVERAGE_ROWS. Rows inserted into or removed from a re-uploaded sheet
+    therefore only change the chunk they fall in, while the others keep their fingerprints.
+
+    Args:
+        df (DataFrame): The sheet as read by pandas.
+
+    Returns:
+        list: (fingerprint, start, end) tuples covering the sheet's rows in order, where start
+              and end are row positions and the fingerprint hashes the column names and values.
+    """
+    row_hashes = pd.util.hash_pandas_object(_cell_text(df), index=False).to_numpy()
+    columns = '\x1f'.join(str(column) for column in df.columns).encode()
+    cuts = (np.flatnonzero(row_hashes % CHUNK_AVERAGE_ROWS == 0) + 1).tolist() + [len(df)]
+
+    bounds = []
+    start = 0
+    for end in cuts:
+        while end - start > CHUNK_MAX_ROWS:
+            bounds.append((start, start + CHUNK_MAX_ROWS))
+            start += CHUNK_MAX_ROWS
+        if end - start >= CHUNK_MIN_ROWS or (end == len(df) and end > start):
+            bounds.append((start, end))
+            start = end
+    return [
+        (hashlib.blake2b(columns + row_hashes[start:end].tobytes(), digest_size=16).hexdigest(), start, end)
+        for start, end in bounds
+    ]
+
+
+def parse_sheet(df):
+    """
+    Validates one sheet of payroll rows and converts it to plain Python values.
+
+    Missing decimals default to 0.00 and missing text to an empty string, the
+    same defaults the single-file upload has always used.
+
+    Args:
+        df (DataFrame): The sheet as read by pandas.
+
+    Returns:
+        tuple: (rows, errors) where rows is a list of (row_number, values) and errors
+               is a list of (row_number, message). Row numbers match the spreadsheet, and the
+               values include the row's fingerprint.
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        return [], [(None, f"Missing required column: {column}") for column in missing]
+
+    # Sheets are read with a default index, so row N of the sheet (after the header) has index N - 2.
+    df = df.dropna(how='all')
+    errors = pd.Series('', index=df.index, dtype=object)
+
+    employee_ids = pd.to_numeric(df['employee_id'], errors='coerce')
+    errors[employee_ids.isna()] = 'Invalid employee_id.'
+
+    decimals = {}
+    for column in DECIMAL_COLUMNS:
+        values = pd.to_numeric(df[column], errors='coerce')
+        errors[values.isna() & df[column].notna()] = f'Invalid number in {column}.'
+        decimals[column] = values.fillna(0).round(2)
+
+    dates = pd.to_datetime(df['date'], errors='coerce')
+    time_in = _parse_times(df['time_in'])
+    time_out = _parse_times(df['time_out'])
+    errors[time_out.isna()] = 'Invalid time_out (expected hh:mm:ss).'
+    errors[time_in.isna()] = 'Invalid time_in (expected hh:mm:ss).'
+    errors[dates.isna()] = 'Invalid date (expected yyyy-mm-dd).'
+
+    texts = {column: df[column].fillna('').astype(str) for column in TEXT_COLUMNS}
+
+    rows = []
+    invalid = errors != ''
+    for index in df.index[~invalid]:
+        date_value = dates[index].date()
+        values = {
+            'employee_id': int(employee_ids[index]),
+            'date': date_value,
+            'time_in': datetime.combine(date_value, time_in[index].time()),
+            'time_out': datetime.combine(date_value, time_out[index].time()),
+        }
+        for column in DECIMAL_COLUMNS:
+            values[column] = Decimal(f'{decimals[column][index]:.2f}')
+        for column in TEXT_COLUMNS:
+            values[column] = texts[column][index]
+        values['fingerprint'] = row_fingerprint(values)
+        rows.append((int(index) + 2, values))
+
+    sheet_errors = [(int(index) + 2, errors[index]) for index in df.index[invalid]]
+    return rows, sheet_errors
+
+
+def parse_source(name, content, all_sheets=False, known_chunks=frozenset()):
+    """
+    Reads and validates a single source file. Runs inside a worker process.
+
+    Args:
+        name (str): The file name, used to pick the reader and label errors.
+        content (bytes): The file contents.
+        all_sheets (bool): Whether to read every sheet of a workbook instead of only the first.
+        known_chunks (frozenset): Fingerprints of chunks already imported, which are not parsed.
+
+    Returns:
+        dict: 'rows', a list of (location, values) in file order, 'errors', a list of
+              (location, message), where location is 'file / sheet / row N', 'chunks', the
+              (fingerprint, row fingerprints, first date, last date) of each parsed chunk,
+              'chunk_fingerprints', the fingerprints of all chunks in file order, and
+              'unchanged', the number of rows in skipped chunks.
+    """
+    try:
+        if name.lower().endswith('.csv'):
+            sheets = {'': pd.read_csv(BytesIO(content))}
+        else:
+            sheets = pd.read_excel(BytesIO(content), sheet_name=None if all_sheets else 0)
+            if isinstance(sheets, pd.DataFrame):
+                sheets = {'': sheets}
+    except Exception as e:
+        return {
+            'rows': [], 'errors': [(name, f"Could not read file: {e}")],
+            'chunks': [], 'chunk_fingerprints': [], 'unchanged': 0,
+        }
+
+    result = {'rows': [], 'errors': [], 'chunks': [], 'chunk_fingerprints': [], 'unchanged': 0}
+    for sheet_name, df in sheets.items():
+        if all_sheets and 'date' not in df.columns:
+            # Notes or lookup sheets in a project workbook carry no payroll rows.
+            continue
+        label = f'{name} / {sheet_name}' if sheet_name else name
+        if any(column not in df.columns for column in REQUIRED_COLUMNS):
+            # Reported once for the sheet by parse_sheet.
+            bounds = [(None, 0, len(df))]
+        else:
+            bounds = chunk_bounds(df)
+        for fingerprint, start, end in bounds:
+            chunk = df.iloc[start:end]
+            result['chunk_fingerprints'].append(fingerprint)
+            if fingerprint in known_chunks:
+                result['unchanged'] += int(chunk.notna().any(axis=1).sum())
+                continue
+            rows, errors = parse_sheet(chunk)
+            result['rows'].extend((f'{label} / row {number}', values) for number, values in rows)
+            result['errors'].extend(
+                (f'{label} / row {number}' if number else label, message) for number, message in errors
+            )
+            dates = [values['date'] for _, values in rows]
+            result['chunks'].append((
+                fingerprint, [values['fingerprint'] for _, values in rows],
+                min(dates, default=None), max(dates, default=None),
+            ))
+    return result
+
+
+def parse_sources(sources, all_sheets=False, max_workers=None, known_chunks=frozenset()):
+    """
+    Parses every source, fanning out to a process pool when there is more than one.
+
+    Args:
+        sources (list): (name, bytes) tuples as returned by expand_sources.
+        all_sheets (bool): Whether to read every sheet of each workbook.
+        max_workers (int): Size of the process pool. Defaults to the number of CPUs.
+        known_chunks (frozenset): Fingerprints of chunks already imported, which are not parsed.
+
+    Returns:
+        list: One parse_source result per source, in source order.
+    """
+    if len(sources) <= 1 or max_workers == 1:
+        return [parse_source(name, content, all_sheets, known_chunks) for name, content in sources]
+
+    workers = min(max_workers or os.cpu_count() or 1, len(sources))
+    names = [name for name, _ in sources]
+    contents = [content for _, content in sources]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(
+            parse_source, names, contents, [all_sheets] * len(sources), [known_chunks] * len(sources)
+        ))
+
+
+def apply_pay_rules(rows, pay_rules):
+    """
+    Recomputes the pay columns of parsed rows with the pay rules, for the whole batch at once.
+
+    Overtime pay, night differential pay, subtotal and net salary are derived from the daily
+    rate, hours, allowance and deductions the same way as for manually entered and punch
+    generated records, including holiday and rest-day premiums.
+
+    Args:
+        rows (list): (location, values) tuples; values are updated in place.
+        pay_rules (CompiledRules): The pay rules to apply.
+
+    Returns:
+        list: (location, message) errors for rows whose deductions exceed the allowed share
+              of the gross salary.
+    """
+    from . import calculations, columnar
+
+    if not rows:
+        return []
+    values = [row for _, row in rows]
+    columns = {
+        column: [float(row[column]) for row in values]
+        for column in ('daily_rate', 'total_hours_worked', 'overtime_hour', 'night_differential_hour',
+                       'allowance', 'deductions')
+    }
+    pay = calculations.compute_pay(
+        columns['daily_rate'], columns['total_hours_worked'], columns['overtime_hour'],
+        columns['night_differential_hour'], columns['allowance'], columns['deductions'],
+        premium=pay_rules.premiums([row['date'] for row in values]),
+        rules=pay_rules,
+    )
+    for column, centavos in pay.items():
+        for row, amount in zip(values, centavos.tolist()):
+            row[column] = columnar.to_decimal(amount)
+
+    errors = []
+    for location, row in rows:
+        if row['subtotal'] and row['deductions'] > pay_rules.deduction_limit(row['subtotal']):
+            errors.append((location, "Deductions exceed the allowed share of the gross salary."))
+    return errors
+
+
+def applied_chunks(chunks):
+    """
+    Returns the chunks among the given ones whose rows are all still stored as imported.
+
+    A chunk stops counting as applied once one of its records is deleted, archived, saved
+    by hand or rewritten from another upload, so uploading it again parses its rows: deleted
+    records are restored and the others are reported as already existing.
+
+    Args:
+        chunks (list): PayrollUploadChunk instances.
+
+    Returns:
+        set: The fingerprints of the applied chunks.
+    """
+    from .models import Payroll
+
+    first_dates = [chunk.first_date for chunk in chunks if chunk.first_date]
+    stored = set()
+    if first_dates:
+        last_date = max(chunk.last_date for chunk in chunks if chunk.last_date)
+        stored = set(
+            Payroll.objects.filter(date__range=(min(first_dates), last_date))
+            .exclude(fingerprint='').values_list('fingerprint', flat=True).iterator()
+        )
+    return {chunk.fingerprint for chunk in chunks if stored.issuperset(chunk.row_fingerprint_list())}
+
+
+def import_payroll_sources(sources, all_sheets=False, max_workers=None):
+    """
+    Validates all sources together and writes their new and changed payroll rows in one transaction.
+
+    Files already imported with the same content, chunks of rows already imported from the
+    previous upload under the same name, and rows whose record was imported from an
+    identical row are skipped (see the module docstring). Other rows are inserted, or
+    overwrite their record when it was imported from the previous upload of the same file.
+    Nothing is written if any row is invalid, references an employee missing from the
+    employee directory, would change a record dated within a closed pay period, has an
+    (employee_id, date) that appears twice across the uploaded files, or would replace
+    any other existing record.
+    Pay columns are recomputed with the current pay rules (see apply_pay_rules), and rows
+    without a daily rate use the standard rate of the employee's position.
+
+    Args:
+        sources (list): (name, bytes) tuples as returned by expand_sources.
+        all_sheets (bool): Whether to read every sheet of each workbook.
+        max_workers (int): Size of the process pool used for parsing.
+
+    Returns:
+        dict: 'created' and 'updated', the number of payroll records inserted and overwritten,
+              'unchanged', the number of uploaded rows skipped because they were already
+              imported, 'skipped_files', the names of the sources imported before with the same
+              content, 'errors', a list of (location, message) explaining why the upload was
+              rejected, and 'anomalies', the number of overlapping or implausible shifts found
+              among the changed employees' records around the changed dates (see anomalies.scan).
+    """
+    from django.db import transaction
+    from django.utils import timezone
+
+    from employee import directory
+    from . import anomalies, archive, audit, periods, rules
+    from .models import AuditEntry, Payroll, PayrollUpload, PayrollUploadChunk
+    from .signals import send_rows_changed
+
+    content_hashes = [hashlib.sha256(content).hexdigest() for _, content in sources]
+    uploads = PayrollUpload.objects.filter(all_sheets=all_sheets)
+    identical = {upload.content_hash: upload for upload in uploads.filter(content_hash__in=content_hashes)}
+    previous = {}
+    for upload in uploads.filter(name__in=[name for name, _ in sources]).order_by('-uploaded_at'):
+        previous.setdefault(upload.name, upload)
+    chunks = {
+        chunk.fingerprint: chunk
+        for chunk in PayrollUploadChunk.objects.filter(fingerprint__in={
+            fingerprint
+            for upload in [*identical.values(), *previous.values()]
+            for fingerprint in upload.chunk_fingerprint_list()
+        })
+    }
+    applied = applied_chunks(list(chunks.values()))
+
+    pending, unchanged, skipped_files = [], 0, []
+    for (name, content), content_hash in zip(sources, content_hashes):
+        upload = identical.get(content_hash)
+        if upload is not None and applied.issuperset(upload.chunk_fingerprint_list()):
+            unchanged += upload.records
+            skipped_files.append(name)
+        else:
+            pending.append((name, content, content_hash))
+
+    results = parse_sources(
+        [(name, content) for name, content, _ in pending],
+        all_sheets=all_sheets, max_workers=max_workers, known_chunks=frozenset(applied),
+    )
+    rows = [row for result in results for row in result['rows']]
+    errors = [error for result in results for error in result['errors']]
+    # Fingerprints of the rows imported from the previous upload of each row's file, whose
+    # records that file may overwrite.
+    owned = []
+    for (name, _, content_hash), result in zip(pending, results):
+        fingerprints = {
+            row_fingerprint
+            for upload in (identical.get(content_hash), previous.get(name)) if upload is not None
+            for fingerprint in upload.chunk_fingerprint_list() if fingerprint in chunks
+            for row_fingerprint in chunks[fingerprint].row_fingerprint_list()
+        }
+        owned.extend([fingerprints] * len(result['rows']))
+
+    seen = {}
+    for location, values in rows:
+        key = (values['employee_id'], values['date'])
+        if key in seen:
+            errors.append((location, f"Duplicate entry for employee {key[0]} on {key[1]} (also in {seen[key]})."))
+        else:
+            seen[key] = location
+
+    employee_ids = {key[0] for key in seen}
+    positions = directory.current_directory().positions(employee_ids)
+    known_ids = set(positions)
+    for location, values in rows:
+        if values['employee_id'] not in known_ids:
+            errors.append((location, f"Employee with ID {values['employee_id']} does not exist."))
+
+    # Rows whose record was imported from an identical row are left as they are, and records
+    # imported from the previous upload of the same file are overwritten.
+    existing = {}
+    if seen:
+        dates = [key[1] for key in seen]
+        existing = {
+            (employee_id, date): fingerprint
+            for employee_id, date, fingerprint in Payroll.objects.filter(
+                employee_id__in=known_ids, date__range=(min(dates), max(dates))
+            ).values_list('employee_id', 'date', 'fingerprint').iterator()
+            if (employee_id, date) in seen
+        }
+    changed = []
+    for (location, values), owned_fingerprints in zip(rows, owned):
+        key = (values['employee_id'], values['date'])
+        if key not in existing:
+            changed.append((location, values))
+        elif existing[key] == values['fingerprint']:
+            continue
+        elif existing[key] in owned_fingerprints:
+            changed.append((location, values))
+        else:
+            errors.append((location, f"A payroll record for employee {key[0]} on {key[1]} already exists."))
+
+    pay_rules = rules.current_rules()
+    for location, values in changed:
+        if not values['daily_rate'] and values['employee_id'] in known_ids:
+            position_rate = pay_rules.daily_rate(positions[values['employee_id']])
+            if position_rate is None:
+                errors.append((location, "No daily_rate given and the employee's position has no standard rate."))
+            else:
+                values['daily_rate'] = position_rate
+    if not errors:
+        errors.extend(apply_pay_rules(changed, pay_rules))
+
+    if changed:
+        closed = periods.closed_dates([values['date'] for _, values in changed])
+        for location, values in changed:
+            if values['date'] in closed:
+                errors.append((location, f"The pay period {closed[values['date']]} is closed."))
+        archived = archive.archived_keys((values['employee_id'], values['date']) for _, values in changed)
+        for location, values in changed:
+            key = (values['employee_id'], values['date'])
+            if key in archived:
+                errors.append((location, f"A payroll record for employee {key[0]} on {key[1]} is already archived."))
+
+    if errors:
+        return {'created': 0, 'updated': 0, 'unchanged': 0, 'skipped_files': [], 'errors': errors, 'anomalies': 0}
+
+    tz = timezone.get_default_timezone()
+    created, updated = [], []
+    for _, values in changed:
+        values = dict(values)
+        values['time_in'] = timezone.make_aware(values['time_in'], tz)
+        values['time_out'] = timezone.make_aware(values['time_out'], tz)
+        payroll = Payroll(**values)
+        (updated if (payroll.employee_id, payroll.date) in existing else created).append(payroll)
+
+    found = 0
+    with transaction.atomic():
+        if changed:
+            Payroll.objects.bulk_create(created, batch_size=INSERT_BATCH_SIZE)
+            changes = [(None, audit.model_values(payroll)) for payroll in created]
+            if updated:
+                # Upserted rows do not get their ids back, so the audit reads the records before.
+                before = audit.payroll_values((payroll.employee_id, payroll.date) for payroll in updated)
+                Payroll.objects.bulk_create(
+                    updated,
+                    batch_size=INSERT_BATCH_SIZE,
+                    update_conflicts=True,
+                    unique_fields=['employee', 'date'],
+                    update_fields=UPSERT_FIELDS,
+                )
+                for payroll in updated:
+                    old_values = before[(payroll.employee_id, payroll.date)]
+                    changes.append((old_values, {
+                        **old_values, **{field: getattr(payroll, field) for field in UPSERT_FIELDS},
+                    }))
+            audit.record(AuditEntry.MODEL_PAYROLL, changes)
+            keys = {(payroll.employee_id, payroll.date) for payroll in created + updated}
+            send_rows_changed(keys)
+            dates = [key[1] for key in keys]
+            found = anomalies.scan(
+                employee_ids={key[0] for key in keys}, start_date=min(dates), end_date=max(dates)
+            )
+
+        PayrollUploadChunk.objects.bulk_create(
+            [
+                PayrollUploadChunk(
+                    fingerprint=fingerprint, row_fingerprints=''.join(row_fingerprints),
+                    first_date=first_date, last_date=last_date,
+                )
+                for result in results
+                for fingerprint, row_fingerprints, first_date, last_date in result['chunks']
+            ],
+            batch_size=INSERT_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        for (name, _, content_hash), result in zip(pending, results):
+            PayrollUpload.objects.update_or_create(
+                content_hash=content_hash, all_sheets=all_sheets,
+                defaults={
+                    'name': name,
+                    'chunk_fingerprints': ''.join(result['chunk_fingerprints']),
+                    'records': result['unchanged'] + sum(len(chunk[1]) for chunk in result['chunks']),
+                },
+            )
+    return {
+        'created': len(created),
+        'updated': len(updated),
+        'unchanged': unchanged + sum(result['unchanged'] for result in results) + len(rows) - len(changed),
+        'skipped_files': skipped_files,
+        'errors': [],
+        'anomalies': found,
+    }
@@ -0,0 +1,337 @@
+"""
+Per-employee monthly ledger with running year-to-date totals.
+
+Single-record changes are applied as deltas: the month's totals and the
+year-to-date totals of that month and every later month of the same year are
+adjusted with two UPDATE statements. Bulk changes and full rebuilds recompute
+whole (employee, year) partitions with one grouped query that uses SQL window
+functions for the running totals.
+
+monthly_history serves the monthly trend on the employee details page from
+the ledger: one indexed query per employee, kept in the Django cache until
+one of the employee's payroll records changes. Every function that writes the
+ledger drops the cached history of the employees it touched once its
+transaction commits.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from .models import ArchivedPayrollTotal, Payroll, PayrollLedger
+
+# Ledger total -> Payroll field it is summed from.
+LEDGER_SOURCES = {
+    'hours': 'total_hours_worked',
+    'overtime_hours': 'overtime_hour',
+    'overtime_pay': 'overtime_pay',
+    'gross': 'subtotal',
+    'deductions': 'deductions',
+    'net': 'net_salary',
+}
+
+# Ledger total -> ArchivedPayrollTotal field holding the same monthly sum.
+ARCHIVED_SOURCES = {
+    'days_worked': 'days_worked',
+    'hours': 'total_hours_worked',
+    'overtime_hours': 'overtime_hour',
+    'overtime_pay': 'overtime_pay',
+    'gross': 'subtotal',
+    'deductions': 'deductions',
+    'net': 'net_salary',
+}
+
+TOTALS = ['days_worked'] + list(LEDGER_SOURCES)
+
+REQUIRED_FIELDS = {'employee_id', 'date', *LEDGER_SOURCES.values()}
+
+# Cached monthly history of one employee, for the window ending in the given month (yyyymm).
+HISTORY_CACHE_KEY = 'payroll_history:{employee_id}:{month}'
+# Invalidation only reaches every server process through a shared cache backend; the
+# timeout bounds how long another process's local-memory cache can serve an old history.
+HISTORY_CACHE_TIMEOUT = 60 * 60
+
+
+def contribution(values):
+    """
+    Returns what one payroll record adds to its month in the ledger.
+
+    Args:
+        values (dict): Payroll field values, including employee_id and date.
+
+    Returns:
+        dict: One amount per ledger total.
+    """
+    amounts = {name: Decimal(values[field] or 0) for name, field in LEDGER_SOURCES.items()}
+    amounts['days_worked'] = 1
+    return amounts
+
+
+def _apply(employee_id, year, month, amounts, sign):
+    if sign < 0:
+        # A removal only adjusts an existing month; it never creates one.
+        ledger = PayrollLedger.objects.filter(employee_id=employee_id, year=year, month=month).first()
+        if ledger is None:
+            return
+        created = False
+    else:
+        ledger, created = PayrollLedger.objects.get_or_create(employee_id=employee_id, year=year, month=month)
+    if created:
+        previous = PayrollLedger.objects.filter(
+            employee_id=employee_id, year=year, month__lt=month
+        ).order_by('-month').first()
+        if previous:
+            PayrollLedger.objects.filter(pk=ledger.pk).update(
+                **{f'ytd_{name}': getattr(previous, f'ytd_{name}') for name in TOTALS}
+            )
+
+    PayrollLedger.objects.filter(pk=ledger.pk).update(
+        **{name: F(name) + sign * amount for name, amount in amounts.items()}
+    )
+    PayrollLedger.objects.filter(employee_id=employee_id, year=year, month__gte=month).update(
+        **{f'ytd_{name}': F(f'ytd_{name}') + sign * amount for name, amount in amounts.items()}
+    )
+    if sign < 0:
+        # A month without any records left has no ledger row, as after a rebuild.
+        PayrollLedger.objects.filter(pk=ledger.pk, days_worked__lte=0).delete()
+
+
+def record_change(old_values, new_values):
+    """
+    Applies a single payroll record change to the ledger.
+
+    Args:
+        old_values (dict): The record's values before the change, or None if it was created.
+        new_values (dict): The record's values after the change, or None if it was deleted.
+    """
+    snapshots = [values for values in (old_values, new_values) if values is not None]
+    if not all(REQUIRED_FIELDS.issubset(values) for values in snapshots):
+        # A partially loaded record cannot be turned into a delta; recompute its year instead.
+        refresh_ledger({(values['employee_id'], values['date']) for values in snapshots if 'date' in values})
+        return
+
+    with transaction.atomic():
+        for values, sign in ((old_values, -1), (new_values, 1)):
+            if values is not None:
+                record_date = values['date']
+                _apply(values['employee_id'], record_date.year, record_date.month, contribution(values), sign)
+        invalidate_history({values['employee_id'] for values in snapshots})
+
+
+def _monthly_totals_sql(employee_ids=None, years=None):
+    """
+    Builds the grouped, windowed query returning one ledger row per employee and month.
+    """
+    live = Payroll.objects.all()
+    archived = ArchivedPayrollTotal.objects.all()
+    if employee_ids is not None:
+        live = live.filter(employee_id__in=employee_ids)
+        archived = archived.filter(employee_id__in=employee_ids)
+    if years is not None:
+        live = live.filter(date__gte=date(min(years), 1, 1), date__lte=date(max(years), 12, 31))
+        archived = archived.filter(month__gte=date(min(years), 1, 1), month__lte=date(max(years), 12, 31))
+
+    live = live.annotate(
+        period_year=ExtractYear('date'), period_month=ExtractMonth('date')
+    ).values('employee_id', 'period_year', 'period_month').annotate(
+        days_worked=Count('id'), **{name: Sum(field) for name, field in LEDGER_SOURCES.items()}
+    ).order_by()
+    archived = archived.annotate(
+        period_year=ExtractYear('month'),
+        period_month=ExtractMonth('month'),
+        **{f'archived_{name}': F(field) for name, field in ARCHIVED_SOURCES.items()},
+    ).values('employee_id', 'period_year', 'period_month', *[f'archived_{name}' for name in TOTALS])
+
+    columns = ['employee_id', 'period_year', 'period_month'] + TOTALS
+    live_sql, live_params = live.query.sql_with_params()
+    archived_sql, archived_params = archived.query.sql_with_params()
+    archived_columns = ['employee_id', 'period_year', 'period_month'] + [f'archived_{name}' for name in TOTALS]
+
+    sums = ', '.join(f'SUM({name}) AS {name}' for name in TOTALS)
+    running = ', '.join(
+        f'SUM(SUM({name})) OVER (PARTITION BY employee_id, period_year ORDER BY period_month) AS ytd_{name}'
+        for name in TOTALS
+    )
+    sql = (
+        f'SELECT employee_id, period_year, period_month, {sums}, {running} FROM ('
+        f'SELECT {", ".join(columns)} FROM ({live_sql}) live '
+        f'UNION ALL SELECT {", ".join(archived_columns)} FROM ({archived_sql}) archived'
+        f') months GROUP BY employee_id, period_year, period_month'
+    )
+    return sql, live_params + archived_params
+
+
+def _ledger_rows(employee_ids=None, years=None):
+    sql, params = _monthly_totals_sql(employee_ids, years)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        for record in cursor.fetchall():
+            row = dict(zip(names, record))
+            yield PayrollLedger(
+                employee_id=row['employee_id'],
+                year=row['period_year'],
+                month=row['period_month'],
+                **{name: row[name] or 0 for name in TOTALS},
+                **{f'ytd_{name}': row[f'ytd_{name}'] or 0 for name in TOTALS},
+            )
+
+
+def refresh_ledger(keys):
+    """
+    Recomputes the ledger for every (employee, year) touched by a bulk change.
+
+    Args:
+        keys (iterable): (employee_id, date) pairs of the payroll records that changed.
+    """
+    partitions = {(employee_id, record_date.year) for employee_id, record_date in keys}
+    if not partitions:
+        return
+    employee_ids = {employee_id for employee_id, _ in partitions}
+    years = {year for _, year in partitions}
+
+    # Every (employee, year) combination of the touched employees and years is recomputed,
+    # so one DELETE and one grouped query cover the whole change.
+    with transaction.atomic():
+        rows = list(_ledger_rows(employee_ids, years))
+        PayrollLedger.objects.filter(employee_id__in=employee_ids, year__in=years).delete()
+        PayrollLedger.objects.bulk_create(rows, batch_size=1000)
+        invalidate_history(employee_ids)
+
+
+def rebuild_ledger(year=None):
+    """
+    Rebuilds the ledger from scratch from live and archived payroll records.
+
+    Args:
+        year (int): Only rebuild this year. Defaults to every year.
+
+    Returns:
+        int: The number of ledger rows written.
+    """
+    years = {year} if year else None
+    with transaction.atomic():
+        rows = list(_ledger_rows(years=years))
+        existing = PayrollLedger.objects.all()
+        if year:
+            existing = existing.filter(year=year)
+        employee_ids = set(existing.values_list('employee_id', flat=True).distinct())
+        employee_ids.update(row.employee_id for row in rows)
+        existing.delete()
+        PayrollLedger.objects.bulk_create(rows, batch_size=1000)
+        invalidate_history(employee_ids)
+    return len(rows)
+
+
+def year_to_date(employee, as_of):
+    """
+    Returns an employee's year-to-date totals up to and including a date.
+
+    Reads the ledger row of the previous month and adds the current month's records up
+    to as_of; when as_of is the last day of its month the ledger row is used directly.
+
+    Args:
+        employee (Employee or int): The employee or its id.
+        as_of (date): The last day to include.
+
+    Returns:
+        dict: One running total per ledger total (days_worked, hours, overtime_hours,
+              overtime_pay, gross, deductions, net).
+    """
+    month_end = (as_of.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    month = as_of.month if as_of == month_end else as_of.month - 1
+    ledger = PayrollLedger.objects.filter(
+        employee=employee, year=as_of.year, month__lte=month
+    ).order_by('-month').first()
+    totals = {name: getattr(ledger, f'ytd_{name}') if ledger else 0 for name in TOTALS}
+
+    if as_of != month_end:
+        month_to_date = Payroll.objects.filter(
+            employee=employee, date__gte=as_of.replace(day=1), date__lte=as_of
+        ).aggregate(days_worked=Count('id'), **{name: Sum(field) for name, field in LEDGER_SOURCES.items()})
+        for name in TOTALS:
+            totals[name] += month_to_date[name] or 0
+
+    return {
+        name: value if name == 'days_worked' else Decimal(value).quantize(Decimal('0.01'))
+        for name, value in totals.items()
+    }
+
+
+def _history_key(employee_id, today=None):
+    today = today or timezone.localdate()
+    return HISTORY_CACHE_KEY.format(employee_id=employee_id, month=f'{today:%Y%m}')
+
+
+def invalidate_history(employee_ids):
+    """
+    Drops the cached monthly history of the given employees once the current transaction commits.
+    """
+    keys = [_history_key(employee_id) for employee_id in set(employee_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _load_history(employee_id, first_month, last_month):
+    rows = PayrollLedger.objects.filter(
+        employee_id=employee_id,
+        year__gte=first_month.year,
+        year__lte=last_month.year,
+    ).values('year', 'month', *TOTALS)
+    return {
+        (row['year'], row['month']): {name: row[name] for name in TOTALS}
+        for row in rows
+        if first_month <= date(row['year'], row['month'], 1) <= last_month
+    }
+
+
+def monthly_history(employee, months=None, today=None):
+    """
+    Returns an employee's payroll totals for each of the last months, including archived records.
+
+    The ledger rows of the last settings.PAYROLL_HISTORY_MAX_MONTHS months are read with one
+    indexed query and cached per employee until a payroll record of the employee changes
+    (see invalidate_history), so the cost does not depend on how many records they have.
+
+    Args:
+        employee (Employee or int): The employee or its id.
+        months (int): How many months to return, up to PAYROLL_HISTORY_MAX_MONTHS.
+            Defaults to settings.PAYROLL_HISTORY_MONTHS.
+        today (date): The date whose month is the last one returned. Defaults to today.
+
+    Returns:
+        list: One dictionary per month, most recent first, with 'month' and 'month_end' (its
+              first and last day) and one total per ledger total; months without records have zeros.
+    """
+    employee_id = getattr(employee, 'pk', employee)
+    today = today or timezone.localdate()
+    months = max(1, min(months or settings.PAYROLL_HISTORY_MONTHS, settings.PAYROLL_HISTORY_MAX_MONTHS))
+    last_month = today.replace(day=1)
+    first_month = _add_months(last_month, 1 - settings.PAYROLL_HISTORY_MAX_MONTHS)
+
+    key = _history_key(employee_id, today)
+    history = cache.get(key)
+    if history is None:
+        history = _load_history(employee_id, first_month, last_month)
+        cache.set(key, history, HISTORY_CACHE_TIMEOUT)
+
+    empty = {name: 0 if name == 'days_worked' else Decimal('0.00') for name in TOTALS}
+    result = []
+    for offset in range(months):
+        month = _add_months(last_month, -offset)
+        month_end = _add_months(month, 1) - timedelta(days=1)
+        result.append({'month': month, 'month_end': month_end, **history.get((month.year, month.month), empty)})
+    return result
+
+
+def _add_months(month, count):
+    """
+    Returns the first day of the month count months after the given one (before it when negative).
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from payroll.archive import archive_cutoff, archive_payroll
+
+
+class Command(BaseCommand):
+    help = "Moves payroll records older than the archive horizon into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horizon-days', type=int,
+            help="Days of history to keep in the live table. Defaults to PAYROLL_ARCHIVE_HORIZON_DAYS.",
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Records moved per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many records would move.")
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['horizon_days'])
+        result = archive_payroll(cutoff, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f"{result['archived']} payroll records dated before {cutoff} would be archived.")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Archived {result['archived']} payroll records dated before {cutoff} "
+                f"and refreshed {result['months']} monthly totals."
+            ))
@@ -0,0 +1,126 @@
+import statistics
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+
+from employee.models import Employee
+from payroll import archive, bulk
+from payroll.models import Payroll
+from payroll.reporting import refresh_snapshot, reporting_configured, use_reporting
+
+
+def _summary(timings):
+    if not timings:
+        return "no operations"
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return f"p50 {statistics.median(timings) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, max {timings[-1] * 1000:.1f} ms"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures write and report throughput under mixed load, first with reports reading the default "
+        "database and then with reports reading the reporting snapshot. Creates temporary benchmark "
+        "employees and payroll records and deletes them afterwards; run it against a development database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10, help="Duration of each phase.")
+        parser.add_argument('--writers', type=int, default=2, help="Threads saving payroll records.")
+        parser.add_argument('--readers', type=int, default=4, help="Threads running the all-employee summary.")
+
+    def handle(self, *args, **options):
+        if not reporting_configured():
+            raise CommandError("Set PAYROLL_REPORTING_DB to a snapshot path to compare against a reporting database.")
+
+        employees = [
+            Employee.objects.create(
+                first_name='Benchmark', last_name=f'Writer {index}', email=f'benchmark-{uuid.uuid4().hex}@example.invalid',
+                position='Benchmark', hire_date=date.today(),
+            )
+            for index in range(options['writers'])
+        ]
+        try:
+            day_offset = 0
+            for use_snapshot in (False, True):
+                if use_snapshot:
+                    refresh_snapshot()
+                result = self._run_phase(employees, day_offset, use_snapshot, options)
+                day_offset += result['writes'] + 1
+                label = 'Reports on reporting DB' if use_snapshot else 'Reports on default DB'
+                self.stdout.write(f"{label}:")
+                self.stdout.write(
+                    f"  writes  {result['writes'] / options['seconds']:8.1f}/s  {_summary(result['write_timings'])}"
+                )
+                self.stdout.write(
+                    f"  reports {result['reads'] / options['seconds']:8.1f}/s  {_summary(result['read_timings'])}"
+                )
+                self.stdout.write(f"  'database is locked' errors: {result['locked']}")
+        finally:
+            bulk.delete_payrolls(Payroll.objects.filter(employee__in=employees))
+            Employee.objects.filter(pk__in=[employee.pk for employee in employees]).delete()
+        self.stdout.write(self.style.SUCCESS("Done. Benchmark records were removed."))
+
+    def _run_phase(self, employees, day_offset, use_snapshot, options):
+        deadline = time.perf_counter() + options['seconds']
+        lock = threading.Lock()
+        result = {'writes': 0, 'reads': 0, 'write_timings': [], 'read_timings': [], 'locked': 0}
+        start_day = date(2000, 1, 1) + timedelta(days=day_offset)
+
+        def record(kind, elapsed=None, locked=False):
+            with lock:
+                if locked:
+                    result['locked'] += 1
+                else:
+                    result[f'{kind}s'] += 1
+                    result[f'{kind}_timings'].append(elapsed)
+
+        def writer(employee):
+            day = start_day
+            try:
+                while time.perf_counter() < deadline:
+                    now = timezone.now()
+                    started = time.perf_counter()
+                    try:
+                        # Like a saved payroll form: the record and its ledger and rollup updates.
+                        with transaction.atomic():
+                            Payroll.objects.create(
+                                employee=employee, date=day, time_in=now, time_out=now, daily_rate=500,
+                                total_hours_worked=8, overtime_hour=0, subtotal=500, net_salary=500,
+                                project='Benchmark',
+                            )
+                    except OperationalError:
+                        record('write', locked=True)
+                        continue
+                    record('write', time.perf_counter() - started)
+                    day += timedelta(days=1)
+            finally:
+                connections.close_all()
+
+        def reader():
+            try:
+                with use_reporting(use_snapshot):
+                    while time.perf_counter() < deadline:
+                        started = time.perf_counter()
+                        try:
+                            list(archive.employee_period_totals(sort='-subtotal'))
+                            archive.history_totals()
+                        except OperationalError:
+                            record('read', locked=True)
+                            continue
+                        record('read', time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=writer, args=(employee,)) for employee in employees]
+        threads += [threading.Thread(target=reader) for _ in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return result
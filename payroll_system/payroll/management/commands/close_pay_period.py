@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll import periods
+from payroll.models import PayPeriod
+
+
+class Command(BaseCommand):
+    help = (
+        "Closes a pay period, locking its payroll records and writing its per-employee totals and "
+        "payslips, or reopens it with --reopen."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('period_id', type=int, help="ID of the pay period.")
+        parser.add_argument('--reopen', action='store_true', help="Reopen the period and delete its snapshots.")
+
+    def handle(self, *args, **options):
+        try:
+            period = PayPeriod.objects.get(pk=options['period_id'])
+        except PayPeriod.DoesNotExist:
+            raise CommandError(f"Pay period {options['period_id']} does not exist.")
+
+        if options['reopen']:
+            try:
+                periods.reopen_period(period)
+            except periods.PeriodOpen as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"{period} reopened."))
+            return
+
+        try:
+            employees = periods.close_period(period)
+        except (periods.PeriodClosed, periods.PeriodChanged) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"{period} closed with snapshots for {employees} employee(s)."))
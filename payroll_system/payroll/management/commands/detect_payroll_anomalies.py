@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payroll.anomalies import scan
+
+
+class Command(BaseCommand):
+    help = (
+        "Scans payroll records for overlapping shifts, shifts longer than 24 hours, shifts that end "
+        "before they start and records dated on another day than their shift. Meant to run nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="Only scan records from the last DAYS days. Scans the whole table by default.",
+        )
+
+    def handle(self, *args, **options):
+        start_date = None
+        if options['days'] is not None:
+            start_date = timezone.localdate() - timedelta(days=options['days'])
+        found = scan(start_date=start_date)
+        self.stdout.write(self.style.SUCCESS(f"{found} open payroll anomalies."))
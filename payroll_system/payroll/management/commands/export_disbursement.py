@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll import disbursement
+from payroll.models import PayPeriod
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes the bank disbursement file of a closed pay period, reconciled with the period's "
+        "frozen totals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('period_id', type=int, help="ID of the closed pay period.")
+        parser.add_argument(
+            '--format', dest='file_format', default='fixed', choices=list(settings.PAYROLL_DISBURSEMENT_WRITERS),
+            help="File format (default: fixed).",
+        )
+        parser.add_argument('--output', help="Path of the file to write. Defaults to the format's file name.")
+
+    def handle(self, *args, **options):
+        try:
+            period = PayPeriod.objects.get(pk=options['period_id'])
+        except PayPeriod.DoesNotExist:
+            raise CommandError(f"Pay period {options['period_id']} does not exist.")
+
+        writer = disbursement.get_writer_class(options['file_format'])(period)
+        output = options['output'] or writer.filename()
+        # Written under a temporary name, so a file that fails to reconcile is never left behind.
+        partial = f'{output}.partial'
+        totals = disbursement.ControlTotals()
+        started = time.perf_counter()
+        try:
+            with open(partial, 'w', encoding='ascii', newline='') as handle:
+                for chunk in disbursement.file_chunks(period, writer, totals):
+                    handle.write(chunk)
+        except disbursement.DisbursementError as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise CommandError(str(e))
+        os.replace(partial, output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output}: {totals.count} payout(s) totalling {totals.total}, account hash "
+            f"{totals.account_hash}, reconciled with {period} in {time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,68 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _fetch(url):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=120) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        status = error.code
+    return status, time.perf_counter() - started
+
+
+def _latency_summary(timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return f"p50 {statistics.median(timings) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, max {timings[-1] * 1000:.0f} ms"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures list page latency against a running server, first on its own and then while "
+        "payslip exports run concurrently."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('employee_id', type=int, help="Employee whose payslip is exported.")
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help="Address of the running server.")
+        parser.add_argument('--list-path', default='/employee/employee/', help="Page whose latency is measured.")
+        parser.add_argument('--list-requests', type=int, default=30, help="List page requests per phase.")
+        parser.add_argument('--exports', type=int, default=8, help="Concurrent export requests in the second phase.")
+        parser.add_argument('--format', choices=['pdf', 'excel'], default='pdf', help="Payslip format to export.")
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        list_url = base_url + options['list_path']
+        export_path = 'export-payslip-pdf' if options['format'] == 'pdf' else 'generate_payslip_excel'
+        export_url = f"{base_url}/payroll/{export_path}/{options['employee_id']}/"
+
+        try:
+            _fetch(list_url)
+        except urllib.error.URLError as error:
+            raise CommandError(f"Could not reach {list_url}: {error.reason}")
+
+        baseline = [_fetch(list_url)[1] for _ in range(options['list_requests'])]
+        self.stdout.write(f"List page alone:         {_latency_summary(baseline)}")
+
+        with ThreadPoolExecutor(max_workers=options['exports']) as executor:
+            exports = [executor.submit(_fetch, export_url) for _ in range(options['exports'])]
+            under_load = [_fetch(list_url)[1] for _ in range(options['list_requests'])]
+            export_results = [future.result() for future in exports]
+        self.stdout.write(f"List page during exports: {_latency_summary(under_load)}")
+
+        statuses = {}
+        for status, _ in export_results:
+            statuses[status] = statuses.get(status, 0) + 1
+        summary = ', '.join(f"{count} x {status}" for status, count in sorted(statuses.items()))
+        self.stdout.write(
+            f"Exports: {summary} ({_latency_summary([elapsed for _, elapsed in export_results])})"
+        )
+        self.stdout.write(self.style.SUCCESS("Done. 503 responses are exports turned away by the render queue limit."))
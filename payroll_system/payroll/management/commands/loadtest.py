@@ -0,0 +1,361 @@
+import http.cookiejar
+import io
+import itertools
+import logging
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import date, timedelta
+
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.utils import timezone
+
+from employee.models import Employee
+from payroll import bulk
+from payroll.importer import REQUIRED_COLUMNS
+from payroll.models import Payroll
+from payroll.signals import send_rows_changed
+
+ENDPOINTS = ['generate', 'summary', 'all_summary', 'payslip', 'upload']
+
+DEFAULT_MIX = 'generate=4,summary=3,all_summary=1,payslip=2,upload=1'
+
+# Text a successful write response contains; write responses without it count as errors.
+SUCCESS_MARKERS = {
+    'generate': b'successfully generated',
+    'upload': b'uploaded successfully',
+}
+
+LOCKED_MARKER = b'database is locked'
+
+# A concurrency level saturates an endpoint when it adds less than this much throughput.
+SATURATION_GAIN = 1.1
+
+FIRST_DAY = date(2001, 1, 1)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise CommandError(f"Unknown endpoint '{name}' in --mix; choose from {', '.join(ENDPOINTS)}.")
+        try:
+            mix[name] = int(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight for '{name}' in --mix.")
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def _percentile(timings, fraction):
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+class InProcessTransport:
+    """
+    Sends requests through Django's test client, inside this process.
+    """
+
+    def __init__(self):
+        self.client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+
+    def get(self, path):
+        return self._result(self.client.get(path, follow=True))
+
+    def post(self, path, data, files=None):
+        payload = dict(data)
+        for field, (name, content) in (files or {}).items():
+            payload[field] = SimpleUploadedFile(name, content)
+        return self._result(self.client.post(path, payload, follow=True))
+
+    def close(self):
+        connections.close_all()
+
+    def _result(self, response):
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, body
+
+
+class HttpTransport:
+    """
+    Sends requests to a running server over HTTP, keeping cookies like a browser.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data, files=None):
+        token = next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), None)
+        if token is None:
+            self.get(path)
+            token = next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+        data = dict(data, csrfmiddlewaretoken=token)
+        headers = {'Referer': self.base_url + path}
+        if files:
+            body, content_type = _multipart(data, files)
+        else:
+            body, content_type = urllib.parse.urlencode(data).encode(), 'application/x-www-form-urlencoded'
+        headers['Content-Type'] = content_type
+        return self._open(urllib.request.Request(self.base_url + path, data=body, headers=headers))
+
+    def close(self):
+        pass
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=120) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+def _multipart(data, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in data.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for field, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Workload:
+    """
+    Builds the requests of each endpoint against the synthetic dataset.
+
+    New payroll records (from generate and upload) take the next free (employee, date)
+    slot after the seeded days, so concurrent writers never collide on the unique constraint.
+    """
+
+    def __init__(self, employee_ids, days, upload_rows, payslip_format):
+        self.employee_ids = employee_ids
+        self.days = days
+        self.upload_rows = upload_rows
+        self.payslip_path = 'export-payslip-pdf' if payslip_format == 'pdf' else 'generate_payslip_excel'
+        self._slots = itertools.count()
+        self._lock = threading.Lock()
+
+    def _next_slots(self, count):
+        with self._lock:
+            numbers = [next(self._slots) for _ in range(count)]
+        return [
+            (self.employee_ids[number % len(self.employee_ids)],
+             FIRST_DAY + timedelta(days=self.days + number // len(self.employee_ids)))
+            for number in numbers
+        ]
+
+    def run(self, endpoint, transport):
+        if endpoint == 'generate':
+            ((employee_id, day),) = self._next_slots(1)
+            return transport.post('/payroll/payroll/generate_payroll/', {
+                'employee': employee_id,
+                'time_in': f'{day}T08:00', 'time_out': f'{day}T17:00',
+                'total_hours_worked': '8', 'overtime_hour': '0', 'night_differential_hour': '0',
+                'daily_rate': '500', 'allowance': '0', 'deductions': '0', 'deduction_remarks': '',
+                'overtime_pay': '0', 'night_differential_pay': '0', 'subtotal': '500', 'net_salary': '500',
+                'project': 'Loadtest',
+            })
+        if endpoint == 'summary':
+            employee_id = random.choice(self.employee_ids)
+            start = FIRST_DAY + timedelta(days=random.randrange(max(self.days - 15, 1)))
+            return transport.get(
+                f'/payroll/payroll/payroll_summary/?employee={employee_id}'
+                f'&start_date={start}&end_date={start + timedelta(days=14)}'
+            )
+        if endpoint == 'all_summary':
+            start = FIRST_DAY + timedelta(days=random.randrange(max(self.days - 15, 1)))
+            return transport.get(
+                f'/payroll/payroll/payroll_summary/?sort=-subtotal'
+                f'&start_date={start}&end_date={start + timedelta(days=14)}'
+            )
+        if endpoint == 'payslip':
+            return transport.get(f'/payroll/{self.payslip_path}/{random.choice(self.employee_ids)}/')
+        if endpoint == 'upload':
+            return transport.post(
+                '/payroll/batch-upload/', {}, files={'excel_file': ('loadtest.csv', self._upload_csv())}
+            )
+        raise ValueError(endpoint)
+
+    def _upload_csv(self):
+        rows = [
+            {
+                **dict.fromkeys(REQUIRED_COLUMNS, 0),
+                'employee_id': employee_id, 'date': day.isoformat(), 'daily_rate': 500, 'total_hours_worked': 8,
+                'time_in': '08:00:00', 'time_out': '16:00:00', 'project': 'Loadtest', 'deduction_remarks': '',
+            }
+            for employee_id, day in self._next_slots(self.upload_rows)
+        ]
+        buffer = io.BytesIO()
+        pd.DataFrame(rows, columns=REQUIRED_COLUMNS).to_csv(buffer, index=False)
+        return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a payday traffic mix (payroll entry, summaries, payslips, batch uploads) with many concurrent "
+        "workers and reports throughput, latency percentiles, error rates and the concurrency at which each "
+        "endpoint saturates. Seeds a synthetic dataset first and removes it afterwards; run it against a "
+        "development database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', help="Drive a running server over HTTP instead of the in-process test client.")
+        parser.add_argument('--concurrency', default='1,4,8,16', help="Comma-separated worker counts, one step each.")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds each concurrency step runs.")
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Endpoint weights (endpoints: {', '.join(ENDPOINTS)}).")
+        parser.add_argument('--employees', type=int, default=50, help="Synthetic employees to create.")
+        parser.add_argument('--days', type=int, default=60, help="Days of payroll history per synthetic employee.")
+        parser.add_argument('--upload-rows', type=int, default=20, help="Payroll rows per batch upload.")
+        parser.add_argument('--payslip-format', choices=['excel', 'pdf'], default='excel', help="Payslip format to request.")
+        parser.add_argument('--keep-data', action='store_true', help="Keep the synthetic dataset after the run.")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        if not mix:
+            raise CommandError("--mix must give at least one endpoint a positive weight.")
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of numbers.")
+        base_url = options['base_url'].rstrip('/') if options['base_url'] else None
+        if base_url:
+            try:
+                HttpTransport(base_url).get('/payroll/payroll/payroll_summary/')
+            except urllib.error.URLError as error:
+                raise CommandError(f"Could not reach {base_url}: {error.reason}")
+
+        if not base_url:
+            # Failed requests are counted in the report; their tracebacks would drown it.
+            logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+        employee_ids = self._seed(options['employees'], options['days'])
+        workload = Workload(employee_ids, options['days'], options['upload_rows'], options['payslip_format'])
+        try:
+            steps = []
+            for level in levels:
+                stats = self._run_step(workload, mix, level, options['duration'], base_url)
+                steps.append((level, stats))
+                self._report_step(level, stats, options['duration'])
+            self._report_saturation(steps, mix, options['duration'])
+        finally:
+            if not options['keep_data']:
+                bulk.delete_payrolls(Payroll.objects.filter(employee_id__in=employee_ids))
+                Employee.objects.filter(id__in=employee_ids).delete()
+                self.stdout.write("Synthetic dataset removed.")
+
+    def _seed(self, employee_count, days):
+        run = uuid.uuid4().hex[:8]
+        employees = Employee.objects.bulk_create([
+            Employee(
+                first_name='Loadtest', last_name=f'{run} {index}', email=f'loadtest-{run}-{index}@example.invalid',
+                position='Loadtest', hire_date=FIRST_DAY,
+            )
+            for index in range(employee_count)
+        ])
+        employee_ids = list(
+            Employee.objects.filter(email__startswith=f'loadtest-{run}-').order_by('id').values_list('id', flat=True)
+        )
+        now = timezone.now()
+        records = [
+            Payroll(
+                employee_id=employee_id, date=FIRST_DAY + timedelta(days=offset), time_in=now, time_out=now,
+                daily_rate=500, total_hours_worked=8, overtime_hour=0, subtotal=500, net_salary=500,
+                project=f'Loadtest {offset % 5}',
+            )
+            for employee_id in employee_ids for offset in range(days)
+        ]
+        Payroll.objects.bulk_create(records, batch_size=2000)
+        send_rows_changed((record.employee_id, record.date) for record in records)
+        self.stdout.write(f"Seeded {len(employees)} employees with {len(records)} payroll records.")
+        return employee_ids
+
+    def _run_step(self, workload, mix, workers, duration, base_url):
+        endpoints = list(mix)
+        weights = [mix[name] for name in endpoints]
+        stats = {name: {'timings': [], 'errors': 0, 'locked': 0} for name in endpoints}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker():
+            transport = HttpTransport(base_url) if base_url else InProcessTransport()
+            try:
+                while time.perf_counter() < deadline:
+                    endpoint = random.choices(endpoints, weights)[0]
+                    started = time.perf_counter()
+                    try:
+                        status, body = workload.run(endpoint, transport)
+                    except Exception as error:
+                        status, body = None, str(error).encode()
+                    elapsed = time.perf_counter() - started
+                    marker = SUCCESS_MARKERS.get(endpoint)
+                    with lock:
+                        entry = stats[endpoint]
+                        if LOCKED_MARKER in body:
+                            entry['locked'] += 1
+                        elif status is None or status >= 400 or (marker and marker not in body):
+                            entry['errors'] += 1
+                        else:
+                            entry['timings'].append(elapsed)
+            finally:
+                transport.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats
+
+    def _report_step(self, workers, stats, duration):
+        total = sum(len(entry['timings']) for entry in stats.values())
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{workers} workers: {total / duration:.1f} successful requests/s"))
+        self.stdout.write(
+            f"  {'endpoint':<12} {'ok/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'locked':>7}"
+        )
+        for name, entry in stats.items():
+            timings = sorted(entry['timings'])
+            attempts = len(timings) + entry['errors'] + entry['locked']
+            if timings:
+                p50, p95, p99 = (
+                    statistics.median(timings) * 1000, _percentile(timings, 0.95) * 1000, _percentile(timings, 0.99) * 1000
+                )
+                latency = f"{p50:8.0f} {p95:8.0f} {p99:8.0f}"
+            else:
+                latency = f"{'-':>8} {'-':>8} {'-':>8}"
+            error_rate = f"{(entry['errors'] / attempts * 100) if attempts else 0:6.1f}%"
+            locked_rate = f"{(entry['locked'] / attempts * 100) if attempts else 0:6.1f}%"
+            self.stdout.write(f"  {name:<12} {len(timings) / duration:7.1f} {latency} {error_rate} {locked_rate}")
+
+    def _report_saturation(self, steps, mix, duration):
+        self.stdout.write(self.style.MIGRATE_HEADING("Saturation"))
+        for name in mix:
+            best_level, best_rate = None, 0
+            for level, stats in steps:
+                rate = len(stats[name]['timings']) / duration
+                if best_level is None or rate >= best_rate * SATURATION_GAIN:
+                    best_level, best_rate = level, rate
+            if best_level == steps[-1][0]:
+                self.stdout.write(f"  {name:<12} still scaling at {best_level} workers ({best_rate:.1f} ok/s)")
+            else:
+                self.stdout.write(f"  {name:<12} saturates at {best_level} workers ({best_rate:.1f} ok/s)")
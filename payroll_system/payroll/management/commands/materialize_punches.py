@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from payroll.punches import materialize_punches
+
+
+class Command(BaseCommand):
+    help = "Pairs stored time-clock punches into shifts and upserts the resulting payroll records."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help="First shift date to process (yyyy-mm-dd). Defaults to yesterday.")
+        parser.add_argument('--end-date', help="Last shift date to process (yyyy-mm-dd). Defaults to the start date.")
+
+    def handle(self, *args, **options):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        start_date = parse_date(options['start_date']) if options['start_date'] else yesterday
+        end_date = parse_date(options['end_date']) if options['end_date'] else start_date
+        if not start_date or not end_date or start_date > end_date:
+            raise CommandError("Please provide a valid date range.")
+
+        result = materialize_punches(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(
+            f"{start_date} to {end_date}: {result['punches']} punches, {result['shifts']} shifts, "
+            f"{result['upserted']} payroll records upserted, {result['unpaired']} unpaired punches."
+        ))
+        if result['locked']:
+            self.stdout.write(self.style.WARNING(
+                f"Left out {result['locked']} shifts dated within closed pay periods."
+            ))
+        if result['conflicts']:
+            self.stdout.write(self.style.WARNING(
+                f"Left {result['conflicts']} payroll records entered by hand or uploaded unchanged."
+            ))
+        if result['skipped_employees']:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped employees without a daily rate on record: {result['skipped_employees']}"
+            ))
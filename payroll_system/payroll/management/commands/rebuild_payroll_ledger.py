@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from payroll.ledger import rebuild_ledger
+
+
+class Command(BaseCommand):
+    help = "Recomputes the year-to-date payroll ledger from live and archived payroll records."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help="Only rebuild this year.")
+
+    def handle(self, *args, **options):
+        rows = rebuild_ledger(options['year'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} ledger rows."))
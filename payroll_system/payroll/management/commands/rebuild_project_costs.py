@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from payroll.projects import rebuild_project_costs
+
+
+class Command(BaseCommand):
+    help = "Recomputes the per-project daily labor cost rollups from live and archived payroll records."
+
+    def handle(self, *args, **options):
+        rows = rebuild_project_costs()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} project cost rows."))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll.reporting import refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = "Copies the default SQLite database to the reporting snapshot with the SQLite backup API."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, help="Keep running and refresh the snapshot every this many seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            try:
+                refresh_snapshot()
+            except ImproperlyConfigured as error:
+                raise CommandError(str(error))
+            self.stdout.write(self.style.SUCCESS(
+                f"Refreshed the reporting snapshot in {time.perf_counter() - started:.2f} s."
+            ))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.db import models
 from django.utils import timezone
 from employee.models import Employee
@@ -25,6 +27,12 @@ class Payroll(models.Model):
     - time_out: The time the employee clocked out for the day.
     - project: An optional project associated with the employee's work.
     - created_at: The timestamp when the payroll record was created.
+    - fingerprint: For uploaded records, a hash of the uploaded row the record was last imported
+      from, so a re-upload of the same file only rewrites records whose row changed (see
+      importer.row_fingerprint). Cleared when the record is saved by hand.
+    - from_punches: Whether the record was built from time-clock punches by
+      punches.materialize_punches, which only rewrites such records. Cleared when the
+      record is saved by hand.
 
     Methods:
         __str__: Returns a string representation of the Payroll object, showing the employee and the date of the payroll.
@@ -47,11 +55,41 @@ class Payroll(models.Model):
     time_out = models.DateTimeField()
     project = models.CharField(max_length=200, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    fingerprint = models.CharField(max_length=16, blank=True, default='')
+    from_punches = models.BooleanField(default=False)
 
     class Meta:
         constraints = [
             UniqueConstraint(fields=['employee', 'date'], name='unique_employee_date')
         ]
+        indexes = [
+            models.Index(fields=['date'], name='payroll_date_idx'),
+            models.Index(fields=['project', 'date'], name='payroll_project_date_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Keeps the values loaded from the database so signal handlers can compute what changed on save.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the record and clears its fingerprint and from_punches.
+
+        Records are saved one by one when they are entered or corrected by hand, so they no
+        longer match any uploaded row or punches, and neither a re-upload nor punch
+        materialization may overwrite them.
+        """
+        self.fingerprint = ''
+        self.from_punches = False
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'fingerprint', 'from_punches'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """
         Returns a string representation of the Payroll object, showing the employee and the date of the payroll.
@@ -60,3 +98,723 @@ class Payroll(models.Model):
             "Leo Dellosa - 2025-03-15"
         """
         return f'{self.employee} - {self.date}'
+
+
+class Punch(models.Model):
+    """
+    Model representing a single raw time-clock punch.
+
+    Punches are append-only events captured from time clocks or imported from
+    a site's punch export. They are never edited; the materialize_punches job
+    pairs them into shifts and upserts the resulting Payroll rows.
+    - employee: The employee who punched.
+    - punched_at: The moment the punch was recorded.
+    - direction: Whether the punch is a clock-in ('in') or a clock-out ('out').
+    - source: Optional identifier of the device or file the punch came from.
+    - created_at: The timestamp when the punch was received.
+
+    Methods:
+        __str__: Returns the employee, direction and time of the punch.
+    """
+
+    DIRECTION_IN = 'in'
+    DIRECTION_OUT = 'out'
+    DIRECTION_CHOICES = [
+        (DIRECTION_IN, 'In'),
+        (DIRECTION_OUT, 'Out'),
+    ]
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='punches')
+    punched_at = models.DateTimeField()
+    direction = models.CharField(max_length=3, choices=DIRECTION_CHOICES)
+    source = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['employee', 'punched_at', 'direction'], name='unique_employee_punch')
+        ]
+        indexes = [
+            models.Index(fields=['punched_at'], name='punch_punched_at_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Saves a new punch. Existing punches are immutable and cannot be updated.
+        """
+        if not self._state.adding:
+            raise ValueError("Punches are append-only and cannot be modified.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        """
+        Returns a string representation of the Punch object.
+
+        Example:
+            "Leo Dellosa - in 2025-03-15 08:00"
+        """
+        return f'{self.employee} - {self.direction} {self.punched_at:%Y-%m-%d %H:%M}'
+
+
+class ArchivedPayroll(models.Model):
+    """
+    Model representing a Payroll record that has been moved out of the hot Payroll table.
+
+    Rows older than the archive horizon are moved here by the archive_payroll command so
+    everyday queries on Payroll stay small. The fields mirror Payroll, plus:
+    - original_id: The id the record had in the Payroll table.
+    - archived_at: The timestamp when the record was archived.
+
+    Archived records are read-only; use payroll.archive.payroll_history to read them
+    together with live records.
+    """
+
+    original_id = models.BigIntegerField(unique=True)
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='archived_payrolls')
+    daily_rate = models.DecimalField(max_digits=10, decimal_places=2)
+    allowance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_hours_worked = models.DecimalField(max_digits=5, decimal_places=2)
+    overtime_pay = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    overtime_hour = models.DecimalField(max_digits=10, decimal_places=2)
+    night_differential_pay = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    night_differential_hour = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    deductions = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    deduction_remarks = models.CharField(max_length=200, blank=True, null=True)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    net_salary = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    date = models.DateField()
+    time_in = models.DateTimeField()
+    time_out = models.DateTimeField()
+    project = models.CharField(max_length=200, blank=True, null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['employee', 'date'], name='archived_employee_date_idx'),
+            models.Index(fields=['date'], name='archived_date_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the ArchivedPayroll object.
+
+        Example:
+            "Leo Dellosa - 2023-03-15 (archived)"
+        """
+        return f'{self.employee} - {self.date} (archived)'
+
+
+class ArchivedPayrollTotal(models.Model):
+    """
+    Model representing precomputed monthly payroll totals of an employee for an archived month.
+
+    Totals are refreshed whenever records of that month are archived, so reports over
+    archived periods never need to scan individual archived records.
+    - employee: The employee the totals belong to.
+    - month: The first day of the archived month.
+    - days_worked: The number of payroll records in the month.
+    - The remaining fields hold the sums of the matching Payroll columns.
+    """
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='archived_payroll_totals')
+    month = models.DateField()
+    days_worked = models.PositiveIntegerField(default=0)
+    total_hours_worked = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime_hour = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    night_differential_hour = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime_pay = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    night_differential_pay = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    allowance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    deductions = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    net_salary = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['employee', 'month'], name='unique_archived_employee_month')
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the ArchivedPayrollTotal object.
+
+        Example:
+            "Leo Dellosa - 2023-03"
+        """
+        return f'{self.employee} - {self.month:%Y-%m}'
+
+
+class PayrollLedger(models.Model):
+    """
+    Model representing an employee's payroll totals for one month, with running year-to-date totals.
+
+    The ledger is kept up to date incrementally as Payroll records are created, updated and
+    deleted, so year-to-date figures are a single indexed lookup. It can be rebuilt from
+    scratch with the rebuild_payroll_ledger command.
+    - employee: The employee the totals belong to.
+    - year, month: The calendar month the totals cover.
+    - days_worked, hours, overtime_hours, overtime_pay, gross, deductions, net:
+      Totals of the employee's payroll records in that month.
+    - ytd_*: The same totals accumulated from January up to and including that month.
+    """
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='payroll_ledger')
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+
+    days_worked = models.IntegerField(default=0)
+    hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime_pay = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    gross = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    deductions = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    net = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    ytd_days_worked = models.IntegerField(default=0)
+    ytd_hours = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ytd_overtime_hours = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ytd_overtime_pay = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ytd_gross = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ytd_deductions = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ytd_net = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['employee', 'year', 'month'], name='unique_ledger_employee_month')
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the PayrollLedger object.
+
+        Example:
+            "Leo Dellosa - 2025-03"
+        """
+        return f'{self.employee} - {self.year}-{self.month:02d}'
+
+
+class PayRuleSet(models.Model):
+    """
+    Model representing the pay rules applied when payroll records are computed.
+
+    Only the active rule set with the most recent update is used. When no rule set
+    exists, the defaults below (the rules the payroll form has always used) apply.
+    - name: A label for the rule set.
+    - overtime_threshold: Hours after which a shift counts as a full 8 paid hours and overtime may be recorded.
+    - overtime_multiplier: Multiplier applied to the hourly rate for overtime hours.
+    - night_differential_rate: Fraction of the hourly rate added per night differential hour.
+    - rest_day: The weekday (0 = Monday ... 6 = Sunday) paid at the rest-day premium, if any.
+    - rest_day_multiplier: Multiplier applied to the rate for work on the rest day.
+    - max_deduction_ratio: Deductions may not exceed this fraction of the gross salary.
+    - is_active: Whether the rule set can be used.
+    - updated_at: The timestamp of the last change.
+    """
+
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'),
+        (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday'),
+    ]
+
+    name = models.CharField(max_length=100)
+    overtime_threshold = models.DecimalField(max_digits=5, decimal_places=2, default=10)
+    overtime_multiplier = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('1.25'))
+    night_differential_rate = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('0.10'))
+    rest_day = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, blank=True, null=True)
+    rest_day_multiplier = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('1.30'))
+    max_deduction_ratio = models.DecimalField(max_digits=5, decimal_places=2, default=1)
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """
+        Returns the name of the rule set.
+        """
+        return self.name
+
+
+class Holiday(models.Model):
+    """
+    Model representing a holiday on which work is paid at a premium.
+    - date: The date of the holiday.
+    - name: The name of the holiday.
+    - multiplier: Multiplier applied to the rate for work on that date (e.g. 2.00 for a
+      regular holiday, 1.30 for a special non-working day).
+    """
+
+    date = models.DateField(unique=True)
+    name = models.CharField(max_length=100)
+    multiplier = models.DecimalField(max_digits=5, decimal_places=2, default=2)
+
+    def __str__(self):
+        """
+        Returns the holiday name and date.
+
+        Example:
+            "Independence Day - 2025-06-12"
+        """
+        return f'{self.name} - {self.date}'
+
+
+class PositionRate(models.Model):
+    """
+    Model representing the standard daily rate for an employee position.
+
+    The rate is used whenever a payroll record is created without a daily rate.
+    - position: The position name, matching Employee.position.
+    - daily_rate: The standard daily rate for the position.
+    """
+
+    position = models.CharField(max_length=100, unique=True)
+    daily_rate = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        """
+        Returns the position and its rate.
+        """
+        return f'{self.position} - {self.daily_rate}'
+
+
+class PayRulesVersion(models.Model):
+    """
+    Single-row counter bumped whenever a PayRuleSet, Holiday or PositionRate changes.
+
+    Each process keeps the compiled pay rules in memory and recompiles them only when
+    this version differs from the one it compiled.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+
+
+class ProjectDailyCost(models.Model):
+    """
+    Model representing the labor cost of a project on one day.
+
+    Rows are materialized from live and archived Payroll records and refreshed
+    incrementally whenever records of that date change, so project cost reports
+    read a few rollup rows instead of scanning payroll records. They can be rebuilt
+    from scratch with the rebuild_project_costs command.
+    - project: The project name; records without a project are rolled up under ''.
+    - date: The day the totals cover.
+    - headcount: The number of employees with a payroll record for the project that day.
+    - The remaining fields hold the sums of the matching Payroll columns.
+    """
+
+    project = models.CharField(max_length=200, blank=True, default='')
+    date = models.DateField()
+    headcount = models.PositiveIntegerField(default=0)
+    total_hours_worked = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime_hour = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    night_differential_hour = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime_pay = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    night_differential_pay = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    allowance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    deductions = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    net_salary = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['project', 'date'], name='unique_project_cost_date')
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='project_cost_date_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the ProjectDailyCost object.
+
+        Example:
+            "Tower A - 2025-03-15"
+        """
+        return f'{self.project or "(no project)"} - {self.date}'
+
+
+class PayrollAnomaly(models.Model):
+    """
+    Model representing a suspicious time entry found by the anomaly detector.
+
+    Anomalies are recorded when payroll is uploaded and by the nightly
+    detect_payroll_anomalies command, and stay listed until someone marks them resolved.
+    - payroll: The payroll record the anomaly was found on (empty once it is archived).
+    - archived_payroll: The archived copy of the record, once it has been archived.
+    - other_payroll: For overlaps, the earlier record the shift overlaps with.
+    - employee: The employee of the record.
+    - date: The date of the record.
+    - kind: What is wrong with the record (see KIND_CHOICES).
+    - detail: A human-readable description.
+    - detected_at: The timestamp when the anomaly was first found.
+    - resolved: Whether someone reviewed the anomaly.
+    """
+
+    KIND_OVERLAP = 'overlap'
+    KIND_TOO_LONG = 'too_long'
+    KIND_NEGATIVE = 'negative'
+    KIND_DATE_MISMATCH = 'date_mismatch'
+    KIND_CHOICES = [
+        (KIND_OVERLAP, 'Overlapping shift'),
+        (KIND_TOO_LONG, 'Shift longer than 24 hours'),
+        (KIND_NEGATIVE, 'Time out not after time in'),
+        (KIND_DATE_MISMATCH, 'Date differs from the day the shift started'),
+    ]
+
+    payroll = models.ForeignKey(Payroll, on_delete=models.CASCADE, blank=True, null=True, related_name='anomalies')
+    archived_payroll = models.ForeignKey(
+        ArchivedPayroll, on_delete=models.CASCADE, blank=True, null=True, related_name='anomalies'
+    )
+    other_payroll = models.ForeignKey(Payroll, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='payroll_anomalies')
+    date = models.DateField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    detail = models.CharField(max_length=255)
+    detected_at = models.DateTimeField(auto_now_add=True)
+    resolved = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['payroll', 'kind'], name='unique_payroll_anomaly_kind')
+        ]
+        indexes = [
+            models.Index(fields=['resolved', 'date'], name='anomaly_resolved_date_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the PayrollAnomaly object.
+
+        Example:
+            "Leo Dellosa - 2025-03-15 (overlap)"
+        """
+        return f'{self.employee} - {self.date} ({self.kind})'
+
+
+class PayPeriod(models.Model):
+    """
+    Model representing a pay period and its cut-off dates.
+
+    While a period is open its payroll records can change freely. Closing it
+    (see periods.close_period) locks the Payroll records dated within it against
+    creation, edits and deletion, and stores frozen per-employee totals
+    (PayPeriodTotal) and rendered payslips (PayPeriodPayslip) that are served
+    instead of recomputing them from payroll records.
+    - name: A label such as "March 1-15, 2025".
+    - start_date: The first day of the period.
+    - end_date: The last day of the period.
+    - status: Whether the period is open or closed.
+    - closed_at: The timestamp when the period was last closed.
+    - version: Incremented on every close; part of the snapshot URLs, so a period that
+      was reopened and closed again never serves cached copies of older snapshots.
+    """
+
+    STATUS_OPEN = 'open'
+    STATUS_CLOSED = 'closed'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_CLOSED, 'Closed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_OPEN, db_index=True)
+    closed_at = models.DateTimeField(blank=True, null=True)
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-start_date']
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(end_date__gte=models.F('start_date')), name='pay_period_dates_ordered'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['start_date', 'end_date'], name='pay_period_dates_idx'),
+        ]
+
+    def clean(self):
+        """
+        Rejects periods that end before they start or overlap another period.
+        """
+        from django.core.exceptions import ValidationError
+
+        if self.start_date and self.end_date:
+            if self.end_date < self.start_date:
+                raise ValidationError("The end date cannot be before the start date.")
+            overlapping = PayPeriod.objects.filter(
+                start_date__lte=self.end_date, end_date__gte=self.start_date
+            ).exclude(pk=self.pk).first()
+            if overlapping:
+                raise ValidationError(f"The period overlaps {overlapping}.")
+
+    @property
+    def is_closed(self):
+        return self.status == self.STATUS_CLOSED
+
+    def __str__(self):
+        """
+        Returns a string representation of the PayPeriod object.
+
+        Example:
+            "March 1-15, 2025 (2025-03-01 - 2025-03-15)"
+        """
+        return f'{self.name} ({self.start_date} - {self.end_date})'
+
+
+class PayPeriodTotal(models.Model):
+    """
+    Model representing an employee's frozen totals for a closed pay period.
+
+    Written once when the period is closed, from live and archived payroll records.
+    The employee's name and position are copied so the snapshot does not change when
+    the employee record does, and the employee cannot be deleted while it exists.
+    - period: The closed pay period.
+    - employee: The employee.
+    - first_name, last_name, position: The employee's details at closing time.
+    - days_worked: The number of payroll records in the period.
+    - first_date, last_date: The first and last dates with a payroll record.
+    - daily_rate: The daily rate of the first record, as shown on the payslip.
+    - The remaining fields hold the sums of the matching Payroll columns.
+    """
+
+    period = models.ForeignKey(PayPeriod, on_delete=models.CASCADE, related_name='totals')
+    employee = models.ForeignKey(Employee, on_delete=models.PROTECT, related_name='pay_period_totals')
+    first_name = models.CharField(max_length=100)
+    last_name = models.CharField(max_length=100)
+    position = models.CharField(max_length=100)
+    days_worked = models.PositiveIntegerField(default=0)
+    first_date = models.DateField()
+    last_date = models.DateField()
+    daily_rate = models.DecimalField(max_digits=10, decimal_places=2)
+    total_hours_worked = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime_hour = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    night_differential_hour = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime_pay = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    night_differential_pay = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    allowance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    deductions = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    net_salary = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['period', 'employee'], name='unique_pay_period_employee_total')
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the PayPeriodTotal object.
+
+        Example:
+            "Leo Dellosa - March 1-15, 2025"
+        """
+        return f'{self.first_name} {self.last_name} - {self.period.name}'
+
+
+class PayPeriodPayslip(models.Model):
+    """
+    Model representing a payslip rendered when its pay period was closed.
+
+    - period: The closed pay period.
+    - employee: The employee the payslip is for.
+    - format: 'pdf' or 'xlsx'.
+    - content: The rendered file.
+    - checksum: SHA-256 of the content, used as the ETag when it is served.
+    """
+
+    FORMAT_PDF = 'pdf'
+    FORMAT_XLSX = 'xlsx'
+    FORMAT_CHOICES = [
+        (FORMAT_PDF, 'PDF'),
+        (FORMAT_XLSX, 'Excel'),
+    ]
+
+    period = models.ForeignKey(PayPeriod, on_delete=models.CASCADE, related_name='payslips')
+    employee = models.ForeignKey(Employee, on_delete=models.PROTECT, related_name='pay_period_payslips')
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES)
+    content = models.BinaryField()
+    checksum = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['period', 'employee', 'format'], name='unique_pay_period_payslip')
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the PayPeriodPayslip object.
+
+        Example:
+            "Leo Dellosa - March 1-15, 2025 (pdf)"
+        """
+        return f'{self.employee} - {self.period.name} ({self.format})'
+
+
+class PayrollUploadChunk(models.Model):
+    """
+    Model representing a chunk of uploaded payroll rows that has been imported.
+
+    Batch uploads split every sheet into chunks of rows (see importer.chunk_bounds). A
+    chunk whose fingerprint is stored here, and whose rows are all still present as
+    imported, is skipped without parsing when a file containing it is uploaded again.
+    - fingerprint: Hash of the chunk's column names and cell values.
+    - row_fingerprints: The fingerprints of the chunk's payroll rows, concatenated.
+    - first_date: The earliest date of the chunk's rows (None for a chunk without rows).
+    - last_date: The latest date of the chunk's rows.
+    - created_at: The timestamp when the chunk was first imported.
+    """
+
+    fingerprint = models.CharField(max_length=32, unique=True)
+    row_fingerprints = models.TextField(blank=True, default='')
+    first_date = models.DateField(blank=True, null=True)
+    last_date = models.DateField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def row_fingerprint_list(self):
+        """
+        Returns the fingerprints of the chunk's payroll rows.
+        """
+        size = Payroll._meta.get_field('fingerprint').max_length
+        return [self.row_fingerprints[i:i + size] for i in range(0, len(self.row_fingerprints), size)]
+
+    def __str__(self):
+        """
+        Returns a string representation of the PayrollUploadChunk object.
+
+        Example:
+            "3f2a... (2025-03-01 to 2025-03-15)"
+        """
+        return f'{self.fingerprint} ({self.first_date} to {self.last_date})'
+
+
+class PayrollUpload(models.Model):
+    """
+    Model representing an uploaded payroll file that has been imported.
+
+    An upload of a file with the same content (and sheet option) is recognized from its
+    hash before the file is read. The chunks of the latest upload under the same name are
+    the ones a modified file is compared against.
+    - content_hash: SHA-256 of the file contents.
+    - all_sheets: Whether every sheet of the workbook was imported.
+    - name: The file name, with the archive name for ZIP members.
+    - chunk_fingerprints: The fingerprints of the file's chunks in file order, concatenated.
+    - records: The number of payroll rows in the file.
+    - uploaded_at: The timestamp when the file was last imported.
+    """
+
+    content_hash = models.CharField(max_length=64)
+    all_sheets = models.BooleanField(default=False)
+    name = models.CharField(max_length=255)
+    chunk_fingerprints = models.TextField(blank=True, default='')
+    records = models.PositiveIntegerField(default=0)
+    uploaded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['content_hash', 'all_sheets'], name='unique_payroll_upload_content')
+        ]
+        indexes = [
+            models.Index(fields=['name', 'uploaded_at'], name='payroll_upload_name_idx'),
+        ]
+
+    def chunk_fingerprint_list(self):
+        """
+        Returns the fingerprints of the file's chunks in file order.
+        """
+        size = PayrollUploadChunk._meta.get_field('fingerprint').max_length
+        return [self.chunk_fingerprints[i:i + size] for i in range(0, len(self.chunk_fingerprints), size)]
+
+    def __str__(self):
+        """
+        Returns a string representation of the PayrollUpload object.
+
+        Example:
+            "site_a_march.xlsx (120 records)"
+        """
+        return f'{self.name} ({self.records} records)'
+
+
+class AuditEntryQuerySet(models.QuerySet):
+    """
+    QuerySet refusing bulk updates and deletes, so audit entries can only be added.
+    """
+    def update(self, **kwargs):
+        raise TypeError("Audit entries cannot be changed.")
+
+    def delete(self):
+        raise TypeError("Audit entries cannot be deleted.")
+
+
+class AuditEntry(models.Model):
+    """
+    Model representing one change to a Payroll or Employee record.
+
+    Entries are append-only; they are written in batches by payroll.audit and never
+    updated or deleted. Employees and records are referenced by id only, so the history
+    outlives them.
+    - changed_at: When the change was made.
+    - model: 'payroll' or 'employee'.
+    - object_id: The id of the changed record.
+    - employee_id: The employee the change concerns (the record's employee for payroll).
+    - record_date: The date of a payroll record; empty for employee changes.
+    - action: 'create', 'update' or 'delete'.
+    - username: The user who made the change; empty for commands and anonymous requests.
+    - changes: Compact JSON (see payroll.audit.encode_changes): the new values of a created
+      record, the old values of a deleted one, or [old, new] for each changed field.
+    """
+
+    MODEL_PAYROLL = 'payroll'
+    MODEL_EMPLOYEE = 'employee'
+    MODEL_CHOICES = [
+        (MODEL_PAYROLL, 'Payroll'),
+        (MODEL_EMPLOYEE, 'Employee'),
+    ]
+
+    ACTION_CREATE = 'create'
+    ACTION_UPDATE = 'update'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = [
+        (ACTION_CREATE, 'Created'),
+        (ACTION_UPDATE, 'Updated'),
+        (ACTION_DELETE, 'Deleted'),
+    ]
+
+    changed_at = models.DateTimeField(default=timezone.now)
+    model = models.CharField(max_length=10, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    employee_id = models.BigIntegerField(null=True, blank=True)
+    record_date = models.DateField(null=True, blank=True)
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES)
+    username = models.CharField(max_length=150, blank=True)
+    changes = models.TextField()
+
+    objects = AuditEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-changed_at', '-id']
+        indexes = [
+            models.Index(fields=['changed_at'], name='audit_changed_at_idx'),
+            models.Index(fields=['employee_id', 'changed_at'], name='audit_employee_idx'),
+            models.Index(fields=['record_date'], name='audit_record_date_idx'),
+            models.Index(fields=['username', 'changed_at'], name='audit_username_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the AuditEntry object.
+
+        Example:
+            "payroll 42 update by admin at 2025-03-15 08:30"
+        """
+        return f'{self.model} {self.object_id} {self.action} by {self.username or "system"} at {self.changed_at:%Y-%m-%d %H:%M}'
+
+    def save(self, *args, **kwargs):
+        """
+        Saves a new entry; existing entries cannot be changed.
+        """
+        if not self._state.adding:
+            raise TypeError("Audit entries cannot be changed.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise TypeError("Audit entries cannot be deleted.")
@@ -0,0 +1,305 @@
+"""
+Pay period closing and the snapshots of closed periods.
+
+Summaries and payslips are normally computed from payroll records on every
+request because any record might still change. Once a PayPeriod is closed its
+records are locked, so its results can be computed once:
+
+- close_period computes one PayPeriodTotal per employee and renders each
+  employee's PDF and Excel payslip (on the shared render pool,
+  rendering.shared_pool) outside any transaction, so other writers are not
+  blocked while it renders. A short transaction then marks the period closed
+  and stores the prepared snapshots; a failure leaves the period open
+  without snapshots.
+- Payroll records dated within a closed period cannot be created, edited or
+  deleted: PayrollForm, editPayroll, deletePayroll, the inline editor, batch
+  uploads, punch materialization and the admin (change form, delete view and
+  actions) check closed_dates or check_open first.
+- The snapshots never change while the period stays closed, so they are served
+  with permanent, private cache headers from URLs that include the period's
+  version. reopen_period deletes them; closing again bumps the version, so
+  browsers never see a stale copy.
+"""
+import csv
+import hashlib
+from decimal import Decimal
+from io import StringIO
+from itertools import repeat
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from employee.models import Employee
+
+from . import archive, columnar, ledger, rendering
+from .models import PayPeriod, PayPeriodPayslip, PayPeriodTotal
+
+# How long browsers may keep snapshot responses: a year, the longest widely honored max-age.
+SNAPSHOT_MAX_AGE = 365 * 24 * 60 * 60
+
+# Employees whose payslips are rendered per batch, and snapshot rows inserted per statement.
+SNAPSHOT_BATCH_SIZE = 100
+
+CENTAVO = Decimal('0.01')
+
+# Columns of the period totals CSV, in order.
+TOTAL_COLUMNS = [
+    'employee_id', 'first_name', 'last_name', 'position', 'days_worked', 'first_date', 'last_date',
+    'daily_rate', *columnar.TOTAL_FIELDS,
+]
+
+
+class PeriodClosed(Exception):
+    """
+    Raised when a change would touch payroll records of a closed pay period.
+    """
+
+
+class PeriodOpen(Exception):
+    """
+    Raised when an operation that needs a closed pay period is given an open one.
+    """
+
+
+class PeriodChanged(Exception):
+    """
+    Raised when a period's payroll records change while its snapshots are being prepared.
+    """
+
+
+def closed_dates(dates):
+    """
+    Returns the given dates that fall within a closed pay period.
+
+    Args:
+        dates (iterable): Dates to check.
+
+    Returns:
+        dict: {date: PayPeriod} for every closed date; empty when all dates are open.
+    """
+    dates = set(dates)
+    if not dates:
+        return {}
+    periods = list(PayPeriod.objects.filter(
+        status=PayPeriod.STATUS_CLOSED, start_date__lte=max(dates), end_date__gte=min(dates)
+    ))
+    return {
+        day: period
+        for day in dates
+        for period in periods
+        if period.start_date <= day <= period.end_date
+    }
+
+
+def check_open(dates):
+    """
+    Raises PeriodClosed if any of the dates falls within a closed pay period.
+    """
+    closed = closed_dates(dates)
+    if closed:
+        names = ', '.join(sorted({str(period) for period in closed.values()}))
+        raise PeriodClosed(f"The pay period {names} is closed; its payroll records cannot be changed.")
+
+
+def close_period(period):
+    """
+    Closes a pay period and writes its snapshots.
+
+    The totals and payslips are prepared first, without a transaction, because rendering
+    them takes far longer than any other write and must not hold the database lock. A
+    short transaction then marks the period closed, which locks its records, checks that
+    they are still the ones the snapshots were prepared from and stores the snapshots.
+    If anything fails, the period stays open without snapshots.
+
+    Args:
+        period (PayPeriod): The period to close.
+
+    Returns:
+        int: The number of employees with a snapshot.
+
+    Raises:
+        PeriodClosed: If the period is already closed.
+        PeriodChanged: If a record of the period changed while the snapshots were prepared.
+    """
+    period.refresh_from_db()
+    if period.is_closed:
+        raise PeriodClosed(f"The pay period {period} is already closed.")
+    closed_at = timezone.now()
+    period.closed_at = closed_at
+    rows = list(archive.payroll_history(None, period.start_date, period.end_date))
+    period_totals, documents = _prepare_snapshots(period, rows)
+
+    try:
+        with transaction.atomic():
+            closed = PayPeriod.objects.filter(pk=period.pk, status=PayPeriod.STATUS_OPEN).update(
+                status=PayPeriod.STATUS_CLOSED, closed_at=closed_at, version=F('version') + 1
+            )
+            if not closed:
+                raise PeriodClosed(f"The pay period {period} is already closed.")
+            # The status update holds the write lock, so the records cannot change after this check.
+            if list(archive.payroll_history(None, period.start_date, period.end_date)) != rows:
+                raise PeriodChanged(
+                    f"Payroll records of {period} changed while it was being closed; close it again."
+                )
+            PayPeriodTotal.objects.bulk_create(period_totals, batch_size=SNAPSHOT_BATCH_SIZE)
+            PayPeriodPayslip.objects.bulk_create(documents, batch_size=SNAPSHOT_BATCH_SIZE)
+    finally:
+        period.refresh_from_db()
+    return len(period_totals)
+
+
+def reopen_period(period):
+    """
+    Reopens a closed pay period so its records can be corrected, deleting its snapshots.
+
+    Raises:
+        PeriodOpen: If the period is not closed.
+    """
+    try:
+        with transaction.atomic():
+            reopened = PayPeriod.objects.filter(pk=period.pk, status=PayPeriod.STATUS_CLOSED).update(
+                status=PayPeriod.STATUS_OPEN
+            )
+            if not reopened:
+                raise PeriodOpen(f"The pay period {period} is not closed.")
+            PayPeriodPayslip.objects.filter(period=period).delete()
+            PayPeriodTotal.objects.filter(period=period).delete()
+    finally:
+        period.refresh_from_db()
+
+
+def totals_csv(period):
+    """
+    Returns the frozen per-employee totals of a closed period as CSV bytes.
+    """
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(TOTAL_COLUMNS)
+    writer.writerows(
+        PayPeriodTotal.objects.filter(period=period).order_by('last_name', 'first_name', 'employee_id')
+        .values_list(*TOTAL_COLUMNS)
+    )
+    return output.getvalue().encode()
+
+
+def _employee_totals(rows):
+    totals = {
+        field: sum((row[field] or 0 for row in rows), Decimal(0)).quantize(CENTAVO)
+        for field in columnar.TOTAL_FIELDS
+    }
+    totals.update(
+        days_worked=len(rows),
+        first_date=rows[0]['date'],
+        last_date=rows[-1]['date'],
+        daily_rate=rows[0]['daily_rate'],
+    )
+    return totals
+
+
+def _payslip_documents(period, employee, rows, totals, logo_path):
+    """
+    Returns the payslip HTML and the workbook values of one employee, as the export views build them.
+    """
+    ytd = ledger.year_to_date(employee, period.end_date)
+    html_string = render_to_string('payroll_payslip.html', {
+        'selected_employee': employee,
+        'payrolls': rows,
+        'total_hours_worked': totals['total_hours_worked'],
+        'total_overtime_pay': totals['overtime_pay'],
+        'total_night_differential_pay': totals['night_differential_pay'],
+        'allowance': totals['allowance'],
+        'total_deductions': totals['deductions'],
+        'total_gross_salary': totals['subtotal'],
+        'total_net_salary': totals['net_salary'],
+        'pay_period_from': period.start_date,
+        'pay_period_to': period.end_date,
+        'current_date': period.closed_at,
+        'daily_rate': totals['daily_rate'],
+        'ytd': ytd,
+        # Rendered without a request, so the logo is read from disk instead of the static URL.
+        'logo_url': Path(logo_path).as_uri() if logo_path else None,
+    })
+    payslip = {
+        'employee_name': f"{employee.first_name} {employee.last_name}",
+        'position': employee.position,
+        'pay_period_from': period.start_date,
+        'pay_period_to': period.end_date,
+        'generated_on': period.closed_at,
+        'daily_rate': totals['daily_rate'],
+        'rows': [
+            (row['date'], row['overtime_pay'], row['night_differential_pay'], row['allowance'],
+             row['deductions'], row['net_salary'])
+            for row in rows
+        ],
+        'totals': {field: totals[field] for field in columnar.TOTAL_FIELDS},
+        'ytd': ytd,
+        'logo_path': logo_path,
+    }
+    return html_string, payslip
+
+
+def _render_all(pool, html_strings, payslips, base_url, stylesheets):
+    if pool is None:
+        pdfs = [rendering.render_pdf(html, base_url, stylesheets) for html in html_strings]
+        workbooks = [rendering.build_payslip_workbook(payslip) for payslip in payslips]
+    else:
+        pdfs = pool.map(rendering.render_pdf, html_strings, repeat(base_url), repeat(stylesheets))
+        workbooks = pool.map(rendering.build_payslip_workbook, payslips)
+    return pdfs, workbooks
+
+
+def _prepare_snapshots(period, rows):
+    """
+    Computes the totals and renders the payslips of a period's records, without saving them.
+
+    Args:
+        period (PayPeriod): The period being closed, with closed_at set.
+        rows (list): The period's payroll rows, from archive.payroll_history.
+
+    Returns:
+        tuple: (PayPeriodTotal list, PayPeriodPayslip list), unsaved.
+    """
+    rows_by_employee = {}
+    for row in rows:
+        rows_by_employee.setdefault(row['employee_id'], []).append(row)
+    employees = Employee.objects.in_bulk(list(rows_by_employee))
+
+    logo_path = finders.find('img/company_logo.png')
+    css_path = finders.find('css/payslip.css')
+    stylesheets = [css_path] if css_path else []
+    base_url = Path(settings.BASE_DIR).as_uri() + '/'
+
+    employee_ids = sorted(rows_by_employee)
+    pool = rendering.shared_pool() if len(employee_ids) > 1 else None
+    period_totals = []
+    documents = []
+    for start in range(0, len(employee_ids), SNAPSHOT_BATCH_SIZE):
+        batch = employee_ids[start:start + SNAPSHOT_BATCH_SIZE]
+        html_strings = []
+        payslips = []
+        for employee_id in batch:
+            employee = employees[employee_id]
+            rows = rows_by_employee[employee_id]
+            totals = _employee_totals(rows)
+            period_totals.append(PayPeriodTotal(
+                period=period, employee=employee, first_name=employee.first_name,
+                last_name=employee.last_name, position=employee.position, **totals,
+            ))
+            html_string, payslip = _payslip_documents(period, employee, rows, totals, logo_path)
+            html_strings.append(html_string)
+            payslips.append(payslip)
+
+        pdfs, workbooks = _render_all(pool, html_strings, payslips, base_url, stylesheets)
+        for employee_id, pdf, workbook in zip(batch, pdfs, workbooks):
+            formats = ((PayPeriodPayslip.FORMAT_PDF, pdf), (PayPeriodPayslip.FORMAT_XLSX, workbook))
+            for file_format, content in formats:
+                documents.append(PayPeriodPayslip(
+                    period=period, employee_id=employee_id, format=file_format,
+                    content=content, checksum=hashlib.sha256(content).hexdigest(),
+                ))
+    return period_totals, documents
@@ -0,0 +1,216 @@
+"""
+Opt-in request profiling for finding out where a slow page spends its time.
+
+ProfilingMiddleware is listed in MIDDLEWARE but removes itself at startup
+(MiddlewareNotUsed) unless settings.PAYROLL_PROFILING_ENABLED is set, so it
+costs nothing when disabled. When enabled, a request from a staff user is
+profiled if it sends the X-Profile: 1 header, has ?profile=1 in its query
+string, or is picked by PAYROLL_PROFILING_SAMPLE_RATE. A profiled request runs
+under cProfile with every SQL query timed, and code wrapped in phase() (PDF
+and Excel rendering, pandas imports) records how long each phase took.
+Streaming responses are profiled until the response object is returned, not
+while their content is being sent.
+
+Each profile is written to PAYROLL_PROFILING_DIR as a .prof file (readable
+with pstats or snakeviz) plus a .json summary. Only the newest
+PAYROLL_PROFILING_KEEP profiles are kept; older ones are deleted as new ones
+are written.
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+# Number of functions and queries listed in a profile summary.
+TOP_FUNCTIONS = 25
+SLOWEST_QUERIES = 20
+
+# Names start with the time down to the microsecond, so they sort from oldest to newest.
+PROFILE_NAME = re.compile(r'^\d{8}-\d{6}-\d{6}-[0-9a-f]{8}$')
+
+_state = Local()
+
+
+class RequestProfile:
+    """
+    SQL queries and phases recorded while one request is profiled.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.phases = []
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+
+@contextmanager
+def phase(name):
+    """
+    Records how long the block took in the current request's profile, if it is being profiled.
+    """
+    profile = getattr(_state, 'profile', None)
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.phases.append((name, time.perf_counter() - started))
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests from staff users that ask for it, or a sample of them.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PAYROLL_PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self._wanted(request):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile.record_query))
+            _state.profile = profile
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+                _state.profile = None
+        elapsed = time.perf_counter() - started
+
+        name = save_profile(request, response, profiler, profile, elapsed)
+        response['X-Profile-Name'] = name
+        return response
+
+    def _wanted(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_staff:
+            return False
+        if request.headers.get('X-Profile') == '1' or request.GET.get('profile') == '1':
+            return True
+        return random.random() < settings.PAYROLL_PROFILING_SAMPLE_RATE
+
+
+def _top_functions(profiler):
+    stats = pstats.Stats(profiler)
+    functions = []
+    for (filename, line, function), (_, calls, own_time, cumulative_time, _) in stats.stats.items():
+        functions.append({
+            'function': function,
+            'location': f'{filename}:{line}',
+            'calls': calls,
+            'own_time': round(own_time, 6),
+            'cumulative_time': round(cumulative_time, 6),
+        })
+    functions.sort(key=lambda entry: entry['own_time'], reverse=True)
+    return functions[:TOP_FUNCTIONS]
+
+
+def save_profile(request, response, profiler, profile, elapsed):
+    """
+    Writes a request's profile to the ring directory and drops the oldest profiles beyond the limit.
+
+    Returns:
+        str: The profile name, used to look it up again with load_profile.
+    """
+    directory = settings.PAYROLL_PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:8]}"
+    profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+
+    queries = sorted(profile.queries, key=lambda query: query[1], reverse=True)
+    summary = {
+        'name': name,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'user': request.user.get_username(),
+        'status': response.status_code,
+        'duration': round(elapsed, 6),
+        'query_count': len(profile.queries),
+        'query_time': round(sum(duration for _, duration in profile.queries), 6),
+        'slowest_queries': [{'sql': sql, 'duration': round(duration, 6)} for sql, duration in queries[:SLOWEST_QUERIES]],
+        'phases': [{'name': phase_name, 'duration': round(duration, 6)} for phase_name, duration in profile.phases],
+        'top_functions': _top_functions(profiler),
+    }
+    temporary = os.path.join(directory, f'.{name}.json.tmp')
+    with open(temporary, 'w') as summary_file:
+        json.dump(summary, summary_file)
+    os.replace(temporary, os.path.join(directory, f'{name}.json'))
+
+    _prune(directory, settings.PAYROLL_PROFILING_KEEP)
+    return name
+
+
+def _prune(directory, keep):
+    names = sorted(entry[:-len('.json')] for entry in os.listdir(directory) if entry.endswith('.json'))
+    for name in names[:max(len(names) - keep, 0)]:
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def recent_profiles():
+    """
+    Returns the summaries of the stored profiles, newest first.
+    """
+    directory = settings.PAYROLL_PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    summaries = []
+    for entry in sorted(os.listdir(directory), reverse=True):
+        if entry.endswith('.json'):
+            summary = load_profile(entry[:-len('.json')])
+            if summary is not None:
+                summaries.append(summary)
+    return summaries
+
+
+def load_profile(name):
+    """
+    Returns the summary of a stored profile, or None if there is no such profile.
+    """
+    if not PROFILE_NAME.match(name):
+        return None
+    try:
+        with open(os.path.join(settings.PAYROLL_PROFILING_DIR, f'{name}.json')) as summary_file:
+            return json.load(summary_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def profile_path(name):
+    """
+    Returns the path of a stored profile's .prof file, or None if there is no such profile.
+    """
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(settings.PAYROLL_PROFILING_DIR, f'{name}.prof')
+    return path if os.path.exists(path) else None
@@ -0,0 +1,203 @@
+"""
+Per-project labor cost rollups and the drill-down report built on them.
+
+ProjectDailyCost holds one row per (project, date) with the day's headcount
+and payroll totals. Whenever payroll records change, the rollup rows of the
+affected dates are recomputed with one grouped query per table that reads
+only those dates through the date index; payroll.signals calls
+refresh_project_costs for single-record saves and deletes as well as for bulk
+changes. Archived records stay part of the rollups, so project reports cover
+the whole history without touching the archive.
+
+The report drills down from projects (read from the rollups) to the
+employees of one project and to their individual days, both answered by
+range scans on the (project, date) index of Payroll. The per-project and
+per-employee totals are grouped over columnar centavo arrays
+(columnar.load), so they are exact on every database.
+"""
+from django.db import transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from employee.models import Employee
+
+from . import columnar
+from .models import ArchivedPayroll, Payroll, ProjectDailyCost
+
+COST_FIELDS = columnar.TOTAL_FIELDS
+
+DAY_FIELDS = ['date', 'total_hours_worked', 'overtime_hour', 'overtime_pay', 'night_differential_pay',
+              'allowance', 'deductions', 'subtotal', 'net_salary']
+
+
+def _project_filter(project):
+    """
+    Matches the records of a project; '' matches the records without a project.
+    """
+    if project:
+        return Q(project=project)
+    return Q(project__isnull=True) | Q(project='')
+
+
+def _date_filter(start_date=None, end_date=None):
+    filters = Q()
+    if start_date:
+        filters &= Q(date__gte=start_date)
+    if end_date:
+        filters &= Q(date__lte=end_date)
+    return filters
+
+
+def _grouped_centavos(queryset, *group_by):
+    """
+    Sums COST_FIELDS as integer centavos per group, so totals are exact on every database.
+    """
+    return queryset.values(*group_by).annotate(
+        record_count=Count('id'), **{field: Sum(columnar.centavos(field)) for field in COST_FIELDS}
+    ).order_by()
+
+
+def _merge(groups, rows, key_fields):
+    for row in rows:
+        key = tuple(row[field] for field in key_fields)
+        totals = groups.setdefault(key, dict.fromkeys(['record_count'] + COST_FIELDS, 0))
+        for name in totals:
+            totals[name] += row[name] or 0
+
+
+def _daily_costs(dates=None):
+    """
+    Computes ProjectDailyCost rows from live and archived payroll records.
+
+    Args:
+        dates (set): Only compute these dates. Defaults to every date.
+
+    Returns:
+        list: Unsaved ProjectDailyCost objects.
+    """
+    groups = {}
+    for model in (Payroll, ArchivedPayroll):
+        queryset = model.objects.all()
+        if dates is not None:
+            queryset = queryset.filter(date__gte=min(dates), date__lte=max(dates))
+        queryset = queryset.annotate(rollup_project=Coalesce('project', Value('')))
+        _merge(groups, _grouped_centavos(queryset, 'rollup_project', 'date'), ('rollup_project', 'date'))
+
+    return [
+        ProjectDailyCost(
+            project=project,
+            date=day,
+            headcount=totals['record_count'],
+            **{field: columnar.to_decimal(totals[field]) for field in COST_FIELDS},
+        )
+        for (project, day), totals in groups.items()
+        if dates is None or day in dates
+    ]
+
+
+def refresh_project_costs(dates):
+    """
+    Recomputes the project cost rollups of the given dates.
+
+    Args:
+        dates (iterable): Dates whose payroll records changed.
+    """
+    dates = set(dates)
+    if not dates:
+        return
+    with transaction.atomic():
+        rows = _daily_costs(dates)
+        ProjectDailyCost.objects.filter(date__in=dates).delete()
+        ProjectDailyCost.objects.bulk_create(rows, batch_size=1000)
+
+
+def rebuild_project_costs():
+    """
+    Rebuilds every project cost rollup from live and archived payroll records.
+
+    Returns:
+        int: The number of rollup rows written.
+    """
+    with transaction.atomic():
+        rows = _daily_costs()
+        ProjectDailyCost.objects.all().delete()
+        ProjectDailyCost.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def project_totals(start_date=None, end_date=None):
+    """
+    Returns the labor cost of every project over a date range, read from the rollups.
+
+    Returns:
+        list: Dictionaries with 'project', 'days' (days with work), 'employee_days' and one
+              total per field in COST_FIELDS, most expensive project first.
+    """
+    columns = columnar.load(
+        ProjectDailyCost.objects.filter(_date_filter(start_date, end_date)),
+        # The headcount is loaded in hundredths like the amounts and turned back into a count below.
+        COST_FIELDS + ['headcount'],
+        keys=['project'],
+    )
+    rows = [
+        {
+            'project': project,
+            'days': totals['count'],
+            'employee_days': int(totals['headcount']),
+            **{field: totals[field] for field in COST_FIELDS},
+        }
+        for project, totals in columns.group_totals('project')
+    ]
+    rows.sort(key=lambda row: (-row['subtotal'], row['project']))
+    return rows
+
+
+def project_days(project, start_date=None, end_date=None):
+    """
+    Returns the daily rollup rows of one project over a date range, ordered by date.
+    """
+    return ProjectDailyCost.objects.filter(_date_filter(start_date, end_date), project=project).order_by('date')
+
+
+def project_employees(project, start_date=None, end_date=None):
+    """
+    Returns the labor cost of each employee who worked on a project over a date range.
+
+    Returns:
+        list: Dictionaries with 'employee_id', 'first_name', 'last_name', 'days_worked'
+              and one total per field in COST_FIELDS, most expensive employee first.
+    """
+    filters = _project_filter(project) & _date_filter(start_date, end_date)
+    columns = columnar.concatenate(
+        columnar.load(model.objects.filter(filters), COST_FIELDS, keys=['employee_id'])
+        for model in (Payroll, ArchivedPayroll)
+    )
+    groups = columns.group_totals('employee_id')
+    names = Employee.objects.in_bulk([employee_id for employee_id, _ in groups])
+
+    rows = [
+        {
+            'employee_id': employee_id,
+            'first_name': names[employee_id].first_name,
+            'last_name': names[employee_id].last_name,
+            'days_worked': totals['count'],
+            **{field: totals[field] for field in COST_FIELDS},
+        }
+        for employee_id, totals in groups
+    ]
+    rows.sort(key=lambda row: (-row['subtotal'], row['last_name'], row['first_name']))
+    return rows
+
+
+def employee_days(project, employee_id, start_date=None, end_date=None):
+    """
+    Returns one employee's payroll records on a project over a date range, ordered by date.
+
+    Returns:
+        list: Dictionaries with DAY_FIELDS and 'archived'.
+    """
+    filters = _project_filter(project) & _date_filter(start_date, end_date) & Q(employee_id=employee_id)
+    rows = [dict(row, archived=False) for row in Payroll.objects.filter(filters).values(*DAY_FIELDS)]
+    rows += [dict(row, archived=True) for row in ArchivedPayroll.objects.filter(filters).values(*DAY_FIELDS)]
+    rows.sort(key=lambda row: row['date'])
+    return rows
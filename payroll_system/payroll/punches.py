@@ -0,0 +1,426 @@
+"""
+Time-clock punch ingestion and Payroll materialization.
+
+Punches arrive in bulk (JSON from time clocks or a site's CSV/Excel export),
+are validated as a whole frame and appended to the Punch table. The
+materialize_punches job then pairs in/out punches per employee, computes
+total, overtime and night differential hours for the whole batch with pandas
+and NumPy, and upserts one Payroll row per employee per day.
+"""
+import hmac
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from employee import directory
+from employee.models import Employee
+
+from . import archive, audit, calculations, columnar, periods, rules
+from .models import AuditEntry, Payroll, Punch
+from .signals import send_rows_changed
+
+# A clock-in and the following clock-out are only paired if they are at most this far apart.
+MAX_SHIFT_HOURS = 24
+
+# Night differential applies to hours worked between 22:00 and 06:00.
+NIGHT_START_HOUR = 22
+NIGHT_LENGTH_HOURS = 8
+
+PUNCH_COLUMNS = ['employee_id', 'punched_at', 'direction']
+
+INSERT_BATCH_SIZE = 1000
+
+DIRECTION_ALIASES = {
+    'in': Punch.DIRECTION_IN,
+    'i': Punch.DIRECTION_IN,
+    'clock in': Punch.DIRECTION_IN,
+    'out': Punch.DIRECTION_OUT,
+    'o': Punch.DIRECTION_OUT,
+    'clock out': Punch.DIRECTION_OUT,
+}
+
+
+def _parse_timestamps(series):
+    """
+    Parses a column of punch timestamps into UTC.
+
+    Naive timestamps are interpreted in the project's TIME_ZONE, which is what
+    time clocks on site record.
+    """
+    try:
+        parsed = pd.to_datetime(series, errors='coerce', format='ISO8601')
+    except (ValueError, TypeError):
+        parsed = pd.to_datetime(series, errors='coerce', format='ISO8601', utc=True)
+    if parsed.dt.tz is None:
+        parsed = parsed.dt.tz_localize(str(timezone.get_default_timezone()), ambiguous='NaT', nonexistent='NaT')
+    return parsed.dt.tz_convert('UTC')
+
+
+def valid_device_token(authorization):
+    """
+    Checks an Authorization header against the device tokens in settings.PAYROLL_PUNCH_TOKENS.
+
+    Args:
+        authorization (str): The header value, expected as "Bearer <token>".
+
+    Returns:
+        bool: Whether the header carries one of the configured tokens. Always False when
+              no token is configured.
+    """
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return False
+    token = token.strip().encode()
+    # Every configured token is compared, in constant time, so timing does not reveal a match.
+    matches = [hmac.compare_digest(token, expected.encode()) for expected in settings.PAYROLL_PUNCH_TOKENS]
+    return any(matches)
+
+
+def read_punch_file(uploaded_file):
+    """
+    Reads a punch export (CSV or Excel) into a DataFrame.
+
+    Args:
+        uploaded_file (UploadedFile): The uploaded punch export.
+
+    Returns:
+        DataFrame: The raw punch rows as read from the file.
+    """
+    name = uploaded_file.name.lower()
+    if name.endswith('.csv'):
+        return pd.read_csv(uploaded_file, dtype=str)
+    return pd.read_excel(uploaded_file, dtype=str)
+
+
+def ingest_punch_frame(df, source=''):
+    """
+    Validates a frame of punches and appends the valid ones to the Punch table.
+
+    Validation is done column-wise over the whole frame: unknown employees (looked
+    up in the employee directory), unparseable timestamps and unknown directions
+    are rejected together, and duplicates (within the frame or already stored) are
+    skipped and counted so time clocks can safely resend.
+
+    Args:
+        df (DataFrame): Punch rows with employee_id, punched_at and direction columns.
+        source (str): Identifier of the device or file the punches came from.
+
+    Returns:
+        dict: 'received', 'accepted' (punches actually stored) and 'duplicates' counts, and
+              'rejected', a list of {'row': index, 'error': message} for rows that were rejected.
+    """
+    missing = [column for column in PUNCH_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required column: {', '.join(missing)}")
+
+    df = df[PUNCH_COLUMNS].copy()
+    employee_ids = pd.to_numeric(df['employee_id'], errors='coerce')
+    punched_at = _parse_timestamps(df['punched_at'])
+    direction = df['direction'].astype(str).str.strip().str.lower().map(DIRECTION_ALIASES)
+
+    employees = directory.current_directory()
+    known_ids = {
+        employee_id for employee_id in employee_ids.dropna().astype('int64').unique().tolist()
+        if employee_id in employees
+    }
+
+    errors = pd.Series('', index=df.index, dtype=object)
+    errors[direction.isna()] = 'Unknown punch direction.'
+    errors[punched_at.isna()] = 'Invalid punch timestamp.'
+    errors[~employee_ids.isin(known_ids)] = 'Unknown employee.'
+
+    valid = errors == ''
+    frame = pd.DataFrame({
+        'employee_id': employee_ids[valid].astype('int64'),
+        'punched_at': punched_at[valid],
+        'direction': direction[valid],
+    }).drop_duplicates()
+
+    punches = [
+        Punch(employee_id=employee_id, punched_at=stamp.to_pydatetime(), direction=kind, source=source)
+        for employee_id, stamp, kind in frame.itertuples(index=False, name=None)
+    ]
+    with transaction.atomic():
+        if punches:
+            # bulk_create(ignore_conflicts=True) does not say which rows it skipped, so punches
+            # already stored are filtered out first and only the new ones are counted.
+            stored = set(Punch.objects.filter(
+                employee_id__in=set(frame['employee_id'].tolist()),
+                punched_at__range=(frame['punched_at'].min().to_pydatetime(),
+                                   frame['punched_at'].max().to_pydatetime()),
+            ).values_list('employee_id', 'punched_at', 'direction').iterator())
+            punches = [
+                punch for punch in punches
+                if (punch.employee_id, punch.punched_at, punch.direction) not in stored
+            ]
+        Punch.objects.bulk_create(punches, batch_size=INSERT_BATCH_SIZE, ignore_conflicts=True)
+
+    rejected = [{'row': int(index), 'error': error} for index, error in errors[~valid].items()]
+    return {
+        'received': len(df),
+        'accepted': len(punches),
+        'duplicates': int(valid.sum()) - len(punches),
+        'rejected': rejected,
+    }
+
+
+def pair_punches(df):
+    """
+    Pairs clock-in punches with the clock-out that follows them.
+
+    The frame is sorted by employee and time, and every 'in' immediately
+    followed by an 'out' of the same employee within MAX_SHIFT_HOURS becomes a
+    shift, so shifts that cross midnight are paired naturally. Punches that
+    cannot be paired are returned separately for review.
+
+    Args:
+        df (DataFrame): Punches with employee_id, punched_at (naive local time) and direction.
+
+    Returns:
+        tuple: (shifts, unpaired) where shifts has employee_id, time_in and time_out columns.
+    """
+    df = df.sort_values(['employee_id', 'punched_at'], kind='mergesort').reset_index(drop=True)
+    next_employee = df['employee_id'].shift(-1)
+    next_direction = df['direction'].shift(-1)
+    next_punch = df['punched_at'].shift(-1)
+
+    starts = (
+        (df['direction'] == Punch.DIRECTION_IN)
+        & (next_direction == Punch.DIRECTION_OUT)
+        & (next_employee == df['employee_id'])
+        & ((next_punch - df['punched_at']) <= pd.Timedelta(hours=MAX_SHIFT_HOURS))
+    )
+    ends = starts.shift(1, fill_value=False)
+
+    shifts = pd.DataFrame({
+        'employee_id': df.loc[starts, 'employee_id'].to_numpy(),
+        'time_in': df.loc[starts, 'punched_at'].to_numpy(),
+        'time_out': next_punch[starts].to_numpy(),
+    })
+    unpaired = df[~(starts | ends)]
+    return shifts, unpaired
+
+
+def night_hours(time_in, time_out):
+    """
+    Computes the hours of each shift that fall inside the 22:00-06:00 night window.
+
+    Each shift is intersected with the night windows that start the evening
+    before, the evening of, and the evening after its clock-in day, which
+    covers every shift up to MAX_SHIFT_HOURS long.
+
+    Args:
+        time_in (ndarray): Clock-in times as datetime64 (naive local time).
+        time_out (ndarray): Clock-out times as datetime64 (naive local time).
+
+    Returns:
+        ndarray: Night differential hours per shift.
+    """
+    start = time_in.astype('datetime64[s]').astype(np.int64)
+    end = time_out.astype('datetime64[s]').astype(np.int64)
+    day = time_in.astype('datetime64[D]').astype('datetime64[s]').astype(np.int64)
+
+    seconds = np.zeros(len(start), dtype=np.int64)
+    for offset in (-1, 0, 1):
+        window_start = day + offset * 86400 + NIGHT_START_HOUR * 3600
+        window_end = window_start + NIGHT_LENGTH_HOURS * 3600
+        seconds += np.clip(np.minimum(end, window_end) - np.maximum(start, window_start), 0, None)
+    return seconds / 3600
+
+
+def _latest_daily_rates(employee_ids, pay_rules):
+    """
+    Returns the most recent daily rate recorded for each employee, in one query.
+
+    Employees without any previous payroll fall back to the standard rate of their position.
+    """
+    latest = Payroll.objects.filter(employee=OuterRef('pk')).order_by('-date').values('daily_rate')[:1]
+    rates = {}
+    for employee_id, latest_rate, position in (
+        Employee.objects.filter(id__in=employee_ids)
+        .annotate(latest_rate=Subquery(latest))
+        .values_list('id', 'latest_rate', 'position')
+    ):
+        rate = latest_rate if latest_rate is not None else pay_rules.daily_rate(position)
+        if rate is not None:
+            rates[employee_id] = rate
+    return rates
+
+
+def materialize_punches(start_date, end_date):
+    """
+    Builds Payroll rows for every employee day between start_date and end_date from stored punches.
+
+    Shifts are attributed to the day they started on. Multiple shifts on the same
+    day are added together, with time_in and time_out spanning the first clock-in
+    and the last clock-out. Existing Payroll rows that were built from punches keep their
+    daily rate, allowance, deductions and remarks; only the time and pay columns are
+    recomputed. Existing rows entered by hand or uploaded, and days already archived, are
+    left as they are and counted as conflicts. New rows use the employee's most recent
+    daily rate, or the standard rate of their position; employees with neither are
+    reported as skipped. Pay is computed with the current
+    pay rules, including holiday and rest-day premiums. Shifts dated within a closed
+    pay period are left out and counted as locked.
+
+    Args:
+        start_date (date): First shift date to materialize.
+        end_date (date): Last shift date to materialize.
+
+    Returns:
+        dict: Counts of 'punches', 'shifts', 'unpaired' punches, 'locked' shifts, 'upserted'
+              Payroll rows, 'conflicts' (days with a record that did not come from punches,
+              or an archived record) and the list of 'skipped_employees' without a known
+              daily rate.
+    """
+    tz = timezone.get_default_timezone()
+    window_start = timezone.make_aware(datetime.combine(start_date - timedelta(days=1), time.min), tz)
+    window_end = timezone.make_aware(datetime.combine(end_date + timedelta(days=2), time.min), tz)
+
+    rows = list(
+        Punch.objects.filter(punched_at__gte=window_start, punched_at__lt=window_end)
+        .values_list('employee_id', 'punched_at', 'direction')
+    )
+    result = {
+        'punches': len(rows), 'shifts': 0, 'unpaired': 0, 'locked': 0, 'upserted': 0, 'conflicts': 0,
+        'skipped_employees': [],
+    }
+    if not rows:
+        return result
+
+    df = pd.DataFrame(rows, columns=PUNCH_COLUMNS)
+    df['punched_at'] = pd.to_datetime(df['punched_at'], utc=True).dt.tz_convert(str(tz)).dt.tz_localize(None)
+
+    shifts, unpaired = pair_punches(df)
+    shifts['date'] = shifts['time_in'].dt.normalize()
+    in_range = (shifts['date'] >= pd.Timestamp(start_date)) & (shifts['date'] <= pd.Timestamp(end_date))
+    shifts = shifts[in_range]
+    shift_dates = shifts['date'].dt.date
+    locked = shift_dates.isin(list(periods.closed_dates(shift_dates.unique())))
+    result['locked'] = int(locked.sum())
+    shifts = shifts[~locked]
+    result['shifts'] = len(shifts)
+    result['unpaired'] = int(
+        ((unpaired['punched_at'] >= pd.Timestamp(start_date))
+         & (unpaired['punched_at'] < pd.Timestamp(end_date) + pd.Timedelta(days=1))).sum()
+    )
+    if shifts.empty:
+        return result
+
+    time_in = shifts['time_in'].to_numpy()
+    time_out = shifts['time_out'].to_numpy()
+    shifts = shifts.assign(
+        hours=(time_out - time_in) / np.timedelta64(1, 'h'),
+        night=night_hours(time_in, time_out),
+    )
+    days = shifts.groupby(['employee_id', 'date'], sort=True).agg(
+        time_in=('time_in', 'min'),
+        time_out=('time_out', 'max'),
+        total_hours_worked=('hours', 'sum'),
+        night_differential_hour=('night', 'sum'),
+    ).reset_index()
+
+    employee_ids = days['employee_id'].unique().tolist()
+    existing = {
+        (row['employee_id'], row['date']): row
+        for row in Payroll.objects.filter(
+            employee_id__in=employee_ids, date__range=(start_date, end_date)
+        ).values('employee_id', 'date', 'daily_rate', 'allowance', 'deductions', 'from_punches')
+    }
+    day_keys = list(zip(days['employee_id'].tolist(), days['date'].dt.date))
+    conflicts = {key for key, row in existing.items() if not row['from_punches']}
+    conflicts |= archive.archived_keys(day_keys)
+    if conflicts:
+        result['conflicts'] = len(conflicts)
+        in_conflict = pd.Series(day_keys).isin(conflicts)
+        days = days[~in_conflict.to_numpy()].reset_index(drop=True)
+        if days.empty:
+            return result
+        employee_ids = days['employee_id'].unique().tolist()
+    pay_rules = rules.current_rules()
+    latest_rates = _latest_daily_rates(employee_ids, pay_rules)
+
+    keys = list(zip(days['employee_id'].tolist(), days['date'].dt.date.tolist()))
+    daily_rate = []
+    allowance = []
+    deductions = []
+    for key in keys:
+        current = existing.get(key)
+        if current:
+            daily_rate.append(current['daily_rate'])
+            allowance.append(current['allowance'])
+            deductions.append(current['deductions'])
+        else:
+            daily_rate.append(latest_rates.get(key[0]))
+            allowance.append(Decimal('0'))
+            deductions.append(Decimal('0'))
+
+    days['daily_rate'] = daily_rate
+    days['allowance'] = allowance
+    days['deductions'] = deductions
+    known_rate = days['daily_rate'].notna()
+    result['skipped_employees'] = sorted(set(days.loc[~known_rate, 'employee_id'].tolist()))
+    days = days[known_rate].reset_index(drop=True)
+    if days.empty:
+        return result
+
+    days['total_hours_worked'] = calculations.round_centavos(days['total_hours_worked'])
+    days['night_differential_hour'] = calculations.round_centavos(days['night_differential_hour'])
+    days['overtime_hour'] = calculations.overtime_hours(days['total_hours_worked'], pay_rules)
+    pay = calculations.compute_pay(
+        days['daily_rate'].astype(float),
+        days['total_hours_worked'],
+        days['overtime_hour'],
+        days['night_differential_hour'],
+        days['allowance'].astype(float),
+        days['deductions'].astype(float),
+        premium=pay_rules.premiums(days['date'].to_numpy()),
+        rules=pay_rules,
+    )
+    for column, values in pay.items():
+        days[column] = values
+
+    payrolls = []
+    for row in days.itertuples(index=False):
+        payrolls.append(Payroll(
+            employee_id=row.employee_id,
+            date=row.date.date(),
+            time_in=timezone.make_aware(row.time_in.to_pydatetime(), tz),
+            time_out=timezone.make_aware(row.time_out.to_pydatetime(), tz),
+            daily_rate=row.daily_rate,
+            allowance=row.allowance,
+            deductions=row.deductions,
+            total_hours_worked=calculations.to_decimal(row.total_hours_worked),
+            overtime_hour=calculations.to_decimal(row.overtime_hour),
+            night_differential_hour=calculations.to_decimal(row.night_differential_hour),
+            overtime_pay=columnar.to_decimal(row.overtime_pay),
+            night_differential_pay=columnar.to_decimal(row.night_differential_pay),
+            subtotal=columnar.to_decimal(row.subtotal),
+            net_salary=columnar.to_decimal(row.net_salary),
+            from_punches=True,
+        ))
+
+    keys = {(payroll.employee_id, payroll.date) for payroll in payrolls}
+    with transaction.atomic():
+        # Upserted rows do not get their ids back, so the audit reads the records before and after.
+        before = audit.payroll_values(keys)
+        Payroll.objects.bulk_create(
+            payrolls,
+            batch_size=INSERT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['employee', 'date'],
+            update_fields=[
+                'time_in', 'time_out', 'total_hours_worked', 'overtime_hour', 'overtime_pay',
+                'night_differential_hour', 'night_differential_pay', 'subtotal', 'net_salary', 'fingerprint',
+            ],
+        )
+        after = audit.payroll_values(keys)
+        audit.record(AuditEntry.MODEL_PAYROLL, [(before.get(key), values) for key, values in after.items()])
+        send_rows_changed(keys)
+    result['upserted'] = len(payrolls)
+    return result
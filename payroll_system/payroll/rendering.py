@@ -0,0 +1,217 @@
+"""
+Payslip rendering off the request threads.
+
+Rendering a PDF with WeasyPrint or a workbook with openpyxl is CPU-bound and
+holds the GIL, so a few concurrent exports used to stall every other request
+served by the same process. The async export views now gather their data on
+the request side and hand the rendering to a small, bounded process pool:
+
+- RenderPool caps the number of renders running or waiting; when it is full,
+  run() raises RenderPoolBusy right away so the view can answer 503 instead of
+  queueing more work.
+- Each render has a timeout; the view answers 504 when it is exceeded.
+- Closing a pay period renders every payslip of the period on the same pool
+  with map(), which waits for free slots instead of failing, so batch
+  rendering never runs more processes than the exports do.
+
+Like the importer, the rendering functions take plain values and return bytes
+so worker processes never need Django to be set up.
+"""
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+
+from openpyxl import Workbook
+from openpyxl.drawing.image import Image
+from openpyxl.styles import Alignment, Font
+
+
+class RenderPoolBusy(Exception):
+    """
+    Raised when every render slot of a RenderPool is taken.
+    """
+
+
+class RenderPool:
+    """
+    A process pool that accepts at most workers + queue_limit renders at a time.
+
+    Args:
+        workers (int): Number of worker processes.
+        queue_limit (int): Number of renders allowed to wait for a free worker.
+    """
+
+    def __init__(self, workers, queue_limit):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    async def run(self, function, *args, timeout=None):
+        """
+        Runs function(*args) in a worker process and waits for the result.
+
+        A slot is held until the worker finishes, even if the caller stopped waiting
+        because of the timeout, so abandoned renders still count against the limit.
+
+        Raises:
+            RenderPoolBusy: If every slot is taken.
+            asyncio.TimeoutError: If the render takes longer than timeout seconds.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise RenderPoolBusy()
+        try:
+            future = self._get_executor().submit(function, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    def map(self, function, *iterables):
+        """
+        Runs function over the iterables in worker processes, like Executor.map.
+
+        Each call waits for a free slot instead of raising RenderPoolBusy, so batch work
+        shares the pool's limit with interactive renders.
+
+        Returns:
+            list: The results, in the order of the arguments.
+        """
+        executor = self._get_executor()
+        futures = []
+        for args in zip(*iterables):
+            self._slots.acquire()
+            try:
+                future = executor.submit(function, *args)
+            except Exception:
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda _: self._slots.release())
+            futures.append(future)
+        return [future.result() for future in futures]
+
+
+# Created on first use, so worker processes are only started once something is rendered.
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def shared_pool():
+    """
+    Returns the process's render pool, sized by PAYROLL_RENDER_WORKERS and PAYROLL_RENDER_QUEUE_LIMIT.
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = RenderPool(
+                workers=settings.PAYROLL_RENDER_WORKERS,
+                queue_limit=settings.PAYROLL_RENDER_QUEUE_LIMIT,
+            )
+        return _shared_pool
+
+
+def render_pdf(html_string, base_url, stylesheets):
+    """
+    Renders an HTML document to PDF bytes with WeasyPrint. Runs inside a worker process.
+    """
+    from weasyprint import HTML
+
+    return HTML(string=html_string, base_url=base_url).write_pdf(stylesheets=stylesheets)
+
+
+def build_payslip_workbook(payslip):
+    """
+    Builds the Excel payslip. Runs inside a worker process.
+
+    Args:
+        payslip (dict): Plain values gathered by the view: 'employee_name', 'position',
+                        'pay_period_from', 'pay_period_to', 'generated_on', 'daily_rate',
+                        'rows' (date, overtime pay, night differential pay, allowance,
+                        deductions, net salary tuples), 'totals', 'ytd' and 'logo_path'.
+
+    Returns:
+        bytes: The .xlsx file.
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Payslip"
+
+    if payslip['logo_path']:
+        img = Image(payslip['logo_path'])
+        img.width = 120
+        img.height = 80
+        ws.add_image(img, 'A1')
+
+    ws.merge_cells('C1:G1')
+    ws['C1'] = "HODREAL FIT-OUT AND CONSTRUCTION"
+    ws['C1'].alignment = Alignment(horizontal='left', vertical='center')
+    ws['C1'].font = Font(bold=True, size=14)
+
+    ws.merge_cells('C2:J2')
+    ws['C2'] = "Bantangas City | Contact: 09217292222 | Email: hodrealconstruction@yahoo.com"
+    ws['C2'].alignment = Alignment(horizontal='left', vertical='center')
+    ws['C2'].font = Font(size=10)
+
+    row_offset = 5
+
+    details = [
+        f"Employee: {payslip['employee_name']}",
+        f"Position: {payslip['position']}",
+        f"Pay Period: {payslip['pay_period_from'].strftime('%Y-%m-%d')} - {payslip['pay_period_to'].strftime('%Y-%m-%d')}",
+        f"Date Generated: {payslip['generated_on'].strftime('%Y-%m-%d')}",
+        f"Daily Rate: {payslip['daily_rate']}",
+    ]
+    for index, text in enumerate(details):
+        ws.merge_cells(f'A{row_offset + index}:F{row_offset + index}')
+        ws[f'A{row_offset + index}'] = text
+        ws[f'A{row_offset + index}'].font = Font(bold=True)
+        ws[f'A{row_offset + index}'].alignment = Alignment(horizontal='left')
+
+    row_offset += 7
+
+    headers = [
+        "Date", "Overtime", "Night Differential", "Allowance", "Deductions", "Total Amount"
+    ]
+    for col_num, header in enumerate(headers, 1):
+        ws.cell(row=row_offset, column=col_num, value=header)
+
+    for row in payslip['rows']:
+        ws.append([row[0].strftime("%Y-%m-%d"), *row[1:]])
+
+    totals = payslip['totals']
+    row_offset += len(payslip['rows']) + 3
+
+    ws[f'A{row_offset}'] = f"Total Hours Worked: {totals['total_hours_worked']}"
+    ws[f'A{row_offset + 1}'] = f"Total Overtime Pay: {totals['overtime_pay']}"
+    ws[f'A{row_offset + 2}'] = f"Total Night Differential Pay: {totals['night_differential_pay']}"
+    ws[f'A{row_offset + 3}'] = f"Total Allowance: {totals['allowance']}"
+    ws[f'A{row_offset + 4}'] = f"Total Deductions: {totals['deductions']}"
+    ws[f'A{row_offset + 5}'] = f"Total Gross Salary: {totals['subtotal']}"
+    ws[f'A{row_offset + 6}'] = f"Total Net Salary: {totals['net_salary']}"
+
+    ytd = payslip['ytd']
+    row_offset += 8
+    ws[f'A{row_offset}'] = f"Year to Date (as of {payslip['pay_period_to'].strftime('%Y-%m-%d')})"
+    ws[f'A{row_offset}'].font = Font(bold=True)
+    ws[f'A{row_offset + 1}'] = f"YTD Days Worked: {ytd['days_worked']}"
+    ws[f'A{row_offset + 2}'] = f"YTD Hours Worked: {ytd['hours']}"
+    ws[f'A{row_offset + 3}'] = f"YTD Overtime Hours: {ytd['overtime_hours']}"
+    ws[f'A{row_offset + 4}'] = f"YTD Overtime Pay: {ytd['overtime_pay']}"
+    ws[f'A{row_offset + 5}'] = f"YTD Gross Salary: {ytd['gross']}"
+    ws[f'A{row_offset + 6}'] = f"YTD Deductions: {ytd['deductions']}"
+    ws[f'A{row_offset + 7}'] = f"YTD Net Salary: {ytd['net']}"
+
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
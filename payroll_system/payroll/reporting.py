@@ -0,0 +1,159 @@
+"""
+Routing of report reads to a separate reporting database.
+
+Long report queries (the payroll summary, exports, project costs) used to share
+the default SQLite database with data entry, and their read locks delayed
+writes such as generatePayroll. When a 'reporting' database alias is
+configured (see PAYROLL_REPORTING_DB in settings), views decorated with
+reporting_reads read payroll and employee data from it while every write
+stays on 'default':
+
+- With SQLite, the reporting database is a snapshot of the default database
+  copied with the SQLite backup API by the refresh_reporting_db command.
+- With PostgreSQL, point the 'reporting' alias at a streaming replica.
+
+A snapshot lags behind the live data, so ReadYourWritesMiddleware pins a
+browser to 'default' for PAYROLL_REPORTING_PIN_SECONDS after any successful
+write it made; the user always sees their own changes. Without a reporting
+alias the router, the decorator and the middleware do nothing.
+"""
+import asyncio
+import os
+import sqlite3
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPORTING_ALIAS = 'reporting'
+
+# Only these apps are read from the reporting database; sessions, users and messages
+# must always come from the live database.
+REPORTING_APPS = {'payroll', 'employee'}
+
+PIN_COOKIE = 'payroll_read_pin'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_state = Local()
+
+
+def reporting_configured():
+    return REPORTING_ALIAS in settings.DATABASES
+
+
+class ReportingRouter:
+    """
+    Sends reads made inside use_reporting() to the reporting database and everything else to default.
+    """
+
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'reporting', False) and model._meta.app_label in REPORTING_APPS:
+            return REPORTING_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The reporting database is a copy or replica of default, never migrated directly.
+        if db == REPORTING_ALIAS:
+            return False
+        return None
+
+
+@contextmanager
+def use_reporting(enabled=True):
+    """
+    Routes payroll and employee reads made in the block to the reporting database, if one is configured.
+    """
+    previous = getattr(_state, 'reporting', False)
+    _state.reporting = enabled and reporting_configured()
+    try:
+        yield
+    finally:
+        _state.reporting = previous
+
+
+def pinned(request):
+    """
+    Returns whether the request's browser wrote recently and must read from the live database.
+    """
+    return PIN_COOKIE in request.COOKIES
+
+
+def reporting_reads(view):
+    """
+    Decorates a report view so its reads go to the reporting database unless the browser is pinned.
+
+    Works for both plain and async views. Querysets evaluated after the view returns (such
+    as the rows of a streaming response) must be bound with .using(router.db_for_read(model))
+    while the view runs.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with use_reporting(not pinned(request)):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with use_reporting(not pinned(request)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pins a browser to the live database for a while after it made a successful write.
+    """
+
+    def __init__(self, get_response):
+        if not reporting_configured():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.PAYROLL_REPORTING_PIN_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
+
+
+def refresh_snapshot(pages_per_step=4096):
+    """
+    Copies the default SQLite database over the reporting snapshot with the SQLite backup API.
+
+    The copy is written to a temporary file and moved into place, so connections to the
+    reporting database always see a complete snapshot. The backup runs pages_per_step
+    pages at a time and lets writers on the default database proceed in between.
+
+    Raises:
+        ImproperlyConfigured: If either database is not SQLite.
+    """
+    if not reporting_configured():
+        raise ImproperlyConfigured("No 'reporting' database is configured; set PAYROLL_REPORTING_DB.")
+    source = connections[DEFAULT_DB_ALIAS]
+    target = connections[REPORTING_ALIAS]
+    if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+        raise ImproperlyConfigured("Snapshots are only taken between SQLite databases; use a replica otherwise.")
+
+    path = str(target.settings_dict['NAME'])
+    temporary = f'{path}.tmp'
+    source.ensure_connection()
+    snapshot = sqlite3.connect(temporary)
+    try:
+        source.connection.backup(snapshot, pages=pages_per_step)
+    finally:
+        snapshot.close()
+    os.replace(temporary, path)
+    target.close()
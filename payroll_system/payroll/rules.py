@@ -0,0 +1,167 @@
+"""
+Data-driven pay rules compiled into an in-memory lookup structure.
+
+Rule sets, holidays and per-position rates live in the database and are
+edited through the admin. Each process compiles them into a CompiledRules
+object: a sorted holiday date array with its multipliers, the rest-day
+premium and a position -> daily rate mapping, so a whole batch of rows is
+priced with NumPy lookups instead of per-row queries. The compiled rules are
+cached per process and recompiled only when PayRulesVersion changes; the
+signal handlers in payroll.signals bump that version whenever a rule model is
+saved or deleted.
+"""
+import threading
+from fractions import Fraction
+
+import numpy as np
+from django.db.models import F
+
+from . import calculations
+from .models import Holiday, PayRulesVersion, PayRuleSet, PositionRate
+
+# 1970-01-01, day 0 of datetime64[D], was a Thursday (weekday 3 with Monday as 0).
+EPOCH_WEEKDAY = 3
+
+# Premiums are expressed in hundredths: 100 is the normal rate, 200 double pay.
+NORMAL_PREMIUM = 100
+
+
+class CompiledRules:
+    """
+    Pay rules prepared for vectorized lookups.
+
+    Attributes:
+        version (int): The PayRulesVersion the rules were compiled from.
+        overtime_threshold (Fraction): Hours from which a shift is a full day with overtime.
+        overtime_multiplier (Fraction): Multiplier of the hourly rate for overtime hours.
+        night_differential_rate (Fraction): Fraction of the hourly rate per night differential hour.
+        max_deduction_ratio (Fraction): Largest allowed deductions / gross salary.
+        rest_day (int): Weekday (Monday = 0) paid at rest_day_premium, or None.
+        rest_day_premium (int): Rest-day premium in hundredths.
+        holiday_dates (ndarray): Sorted datetime64[D] holiday dates.
+        holiday_premiums (ndarray): int64 premium in hundredths for each holiday date.
+        position_rates (dict): Position name -> daily rate (Decimal).
+    """
+
+    __slots__ = (
+        'version', 'overtime_threshold', 'overtime_multiplier', 'night_differential_rate',
+        'max_deduction_ratio', 'rest_day', 'rest_day_premium', 'holiday_dates', 'holiday_premiums',
+        'position_rates',
+    )
+
+    def __init__(self, version=0, rule_set=None, holidays=(), position_rates=None):
+        self.version = version
+        if rule_set is None:
+            self.overtime_threshold = Fraction(calculations.OVERTIME_THRESHOLD)
+            self.overtime_multiplier = Fraction(str(calculations.OVERTIME_MULTIPLIER))
+            self.night_differential_rate = Fraction(str(calculations.NIGHT_DIFFERENTIAL_RATE))
+            self.max_deduction_ratio = Fraction(1)
+            self.rest_day = None
+            self.rest_day_premium = NORMAL_PREMIUM
+        else:
+            self.overtime_threshold = Fraction(rule_set.overtime_threshold)
+            self.overtime_multiplier = Fraction(rule_set.overtime_multiplier)
+            self.night_differential_rate = Fraction(rule_set.night_differential_rate)
+            self.max_deduction_ratio = Fraction(rule_set.max_deduction_ratio)
+            self.rest_day = rule_set.rest_day
+            self.rest_day_premium = int(rule_set.rest_day_multiplier * 100)
+
+        holidays = sorted(holidays)
+        self.holiday_dates = np.array([day for day, _ in holidays], dtype='datetime64[D]')
+        self.holiday_premiums = np.array([int(multiplier * 100) for _, multiplier in holidays], dtype=np.int64)
+        self.position_rates = position_rates or {}
+
+    def premiums(self, dates):
+        """
+        Returns the pay premium for each date, in hundredths of the normal rate.
+
+        A holiday premium takes precedence over the rest-day premium.
+
+        Args:
+            dates (array-like): Dates of the payroll rows.
+
+        Returns:
+            ndarray: int64 premiums, NORMAL_PREMIUM on ordinary working days.
+        """
+        days = np.asarray(dates, dtype='datetime64[D]')
+        premiums = np.full(days.shape, NORMAL_PREMIUM, dtype=np.int64)
+        if self.rest_day is not None:
+            weekdays = (days.astype(np.int64) + EPOCH_WEEKDAY) % 7
+            premiums[weekdays == self.rest_day] = self.rest_day_premium
+        if len(self.holiday_dates):
+            positions = np.searchsorted(self.holiday_dates, days)
+            positions = np.minimum(positions, len(self.holiday_dates) - 1)
+            is_holiday = self.holiday_dates[positions] == days
+            premiums[is_holiday] = self.holiday_premiums[positions[is_holiday]]
+        return premiums
+
+    def premium(self, day):
+        """
+        Returns the premium in hundredths for a single date.
+        """
+        return int(self.premiums([day])[0])
+
+    def daily_rate(self, position):
+        """
+        Returns the standard daily rate for a position, or None if it has none.
+        """
+        return self.position_rates.get(position)
+
+    def deduction_limit(self, gross_salary):
+        """
+        Returns the largest deductions allowed for a gross salary.
+        """
+        return gross_salary * self.max_deduction_ratio.numerator / self.max_deduction_ratio.denominator
+
+
+def compile_rules(version=0):
+    """
+    Reads the active rule set, holidays and position rates and compiles them.
+
+    Args:
+        version (int): The PayRulesVersion being compiled.
+
+    Returns:
+        CompiledRules: The compiled rules.
+    """
+    rule_set = PayRuleSet.objects.filter(is_active=True).order_by('-updated_at', '-id').first()
+    holidays = list(Holiday.objects.values_list('date', 'multiplier'))
+    position_rates = dict(PositionRate.objects.values_list('position', 'daily_rate'))
+    return CompiledRules(version, rule_set, holidays, position_rates)
+
+
+_compiled = None
+_compile_lock = threading.Lock()
+
+
+def current_version():
+    """
+    Returns the current PayRulesVersion, 0 before any rule was saved.
+    """
+    return PayRulesVersion.objects.values_list('version', flat=True).first() or 0
+
+
+def current_rules():
+    """
+    Returns the compiled pay rules, recompiling them if they changed since this process compiled them.
+
+    Costs one single-row query when the cached rules are still current.
+    """
+    global _compiled
+    version = current_version()
+    compiled = _compiled
+    if compiled is None or compiled.version != version:
+        with _compile_lock:
+            if _compiled is None or _compiled.version != version:
+                _compiled = compile_rules(version)
+            compiled = _compiled
+    return compiled
+
+
+def bump_version():
+    """
+    Marks the compiled pay rules of every process as stale.
+    """
+    if not PayRulesVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        PayRulesVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
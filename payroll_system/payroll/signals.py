@@ -0,0 +1,162 @@
+"""
+Signals that keep tables derived from Payroll (the year-to-date ledger and the
+project cost rollups) in sync, and record Payroll and Employee changes in the
+audit trail.
+
+Single-record saves and deletes are handled through Django's post_save and
+post_delete signals. Bulk operations (batch uploads, punch materialization,
+admin actions) do not send those, so they send payroll_rows_changed once with
+the (employee_id, date) keys they touched instead. Code that deletes or saves
+many records through the ORM can wrap the work in suppress_row_signals() and
+send payroll_rows_changed afterwards. payroll_rows_changed only carries keys,
+so bulk operations record their changes with audit.record themselves.
+
+Deleting an employee cascades to their payroll records. Those records are
+audited and their keys remembered before the cascade (employee_deleting), the
+per-record handlers skip them, and payroll_rows_changed is sent once the
+employee is gone, so no ledger row is written back for a deleted employee.
+An employee with records in a closed pay period cannot be deleted.
+"""
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.db import transaction
+from django.db.models import Exists, OuterRef, ProtectedError, QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from employee.models import Employee
+from employee.signals import employee_rows_changed
+
+from . import audit, ledger, projects, rules
+from .models import ArchivedPayroll, AuditEntry, Holiday, PayPeriod, PayRuleSet, Payroll, PositionRate
+
+# Sent with sender=Payroll and keys, a set of (employee_id, date) pairs whose records changed in bulk.
+payroll_rows_changed = Signal()
+
+_state = Local()
+
+
+@contextmanager
+def suppress_row_signals():
+    """
+    Skips the per-record Payroll handlers for the duration of the block.
+    """
+    previous = getattr(_state, 'suppressed', False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def row_signals_suppressed():
+    return getattr(_state, 'suppressed', False)
+
+
+def send_rows_changed(keys):
+    """
+    Sends payroll_rows_changed for the given (employee_id, date) keys once the transaction commits.
+    """
+    keys = set(keys)
+    if keys:
+        transaction.on_commit(lambda: payroll_rows_changed.send(sender=Payroll, keys=keys))
+
+
+def _cascaded_from_employee(origin):
+    # Django passes the instance or queryset delete() was called on as the signal's origin.
+    if isinstance(origin, QuerySet):
+        return origin.model is Employee
+    return isinstance(origin, Employee)
+
+
+def _current_values(instance):
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+
+
+@receiver(post_save, sender=Payroll)
+def payroll_saved(sender, instance, created, **kwargs):
+    if row_signals_suppressed():
+        return
+    old_values = None if created else getattr(instance, '_loaded_values', None)
+    new_values = _current_values(instance)
+    if old_values is None and not created:
+        ledger.refresh_ledger({(instance.employee_id, instance.date)})
+    else:
+        ledger.record_change(old_values, new_values)
+    projects.refresh_project_costs(
+        {values['date'] for values in (old_values, new_values) if values and 'date' in values}
+    )
+    # Without the loaded values every field is audited as changed from unknown (null).
+    audit_old_values = None if created else old_values or dict.fromkeys(new_values)
+    audit.record(AuditEntry.MODEL_PAYROLL, [(audit_old_values, new_values)])
+    instance._loaded_values = new_values
+
+
+@receiver(post_delete, sender=Payroll)
+def payroll_deleted(sender, instance, origin=None, **kwargs):
+    if row_signals_suppressed() or _cascaded_from_employee(origin):
+        return
+    old_values = getattr(instance, '_loaded_values', None) or _current_values(instance)
+    ledger.record_change(old_values, None)
+    projects.refresh_project_costs({old_values['date']} if 'date' in old_values else {instance.date})
+    audit.record(AuditEntry.MODEL_PAYROLL, [(dict(old_values, id=instance.pk), None)])
+
+
+@receiver(payroll_rows_changed, sender=Payroll)
+def payroll_rows_changed_ledger(sender, keys, **kwargs):
+    ledger.refresh_ledger(keys)
+
+
+@receiver(payroll_rows_changed, sender=Payroll)
+def payroll_rows_changed_project_costs(sender, keys, **kwargs):
+    projects.refresh_project_costs({record_date for _, record_date in keys})
+
+
+@receiver(post_save, sender=PayRuleSet)
+@receiver(post_delete, sender=PayRuleSet)
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+@receiver(post_save, sender=PositionRate)
+@receiver(post_delete, sender=PositionRate)
+def pay_rules_changed(sender, **kwargs):
+    rules.bump_version()
+
+
+@receiver(post_save, sender=Employee)
+def employee_saved(sender, instance, created, **kwargs):
+    new_values = _current_values(instance)
+    old_values = None if created else getattr(instance, '_loaded_values', None) or dict.fromkeys(new_values)
+    audit.record(AuditEntry.MODEL_EMPLOYEE, [(old_values, new_values)])
+    instance._loaded_values = new_values
+
+
+@receiver(pre_delete, sender=Employee)
+def employee_deleting(sender, instance, **kwargs):
+    closed = Exists(PayPeriod.objects.filter(
+        status=PayPeriod.STATUS_CLOSED, start_date__lte=OuterRef('date'), end_date__gte=OuterRef('date')
+    ))
+    for model in (Payroll, ArchivedPayroll):
+        locked = model.objects.filter(closed, employee_id=instance.pk)
+        if locked.exists():
+            raise ProtectedError(
+                f"{instance} has payroll records in a closed pay period and cannot be deleted.", set(locked),
+            )
+
+    records = list(Payroll.objects.filter(employee_id=instance.pk).values(
+        *[field.attname for field in Payroll._meta.concrete_fields]
+    ))
+    audit.record(AuditEntry.MODEL_PAYROLL, [(values, None) for values in records])
+    instance._payroll_keys = {(values['employee_id'], values['date']) for values in records}
+
+
+@receiver(post_delete, sender=Employee)
+def employee_deleted(sender, instance, **kwargs):
+    old_values = getattr(instance, '_loaded_values', None) or _current_values(instance)
+    audit.record(AuditEntry.MODEL_EMPLOYEE, [(dict(old_values, id=instance.pk), None)])
+    send_rows_changed(getattr(instance, '_payroll_keys', ()))
+
+
+@receiver(employee_rows_changed, sender=Employee)
+def employee_rows_audit(sender, changes, **kwargs):
+    audit.record(AuditEntry.MODEL_EMPLOYEE, changes)
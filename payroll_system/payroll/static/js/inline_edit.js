@@ -0,0 +1,133 @@
+document.addEventListener("DOMContentLoaded", function () {
+    // Inline editing of payroll rows on the payroll summary (see the updatePayrollInline view).
+    const table = document.getElementById('payroll-rows');
+    if (!table) {
+        return;
+    }
+    const errorBox = document.getElementById('inline-edit-error');
+    const csrfInput = document.querySelector('[name=csrfmiddlewaretoken]');
+
+    // Input type of each editable column; the other columns are computed by the server.
+    const inputTypes = {
+        time_in: 'datetime-local',
+        time_out: 'datetime-local',
+        total_hours_worked: 'number',
+        daily_rate: 'number',
+        overtime_hour: 'number',
+        night_differential_hour: 'number',
+        allowance: 'number',
+        deductions: 'number',
+        deduction_remarks: 'text'
+    };
+
+    function showErrors(errors) {
+        const lines = [];
+        Object.keys(errors).forEach(function (field) {
+            errors[field].forEach(function (message) {
+                lines.push(field === '__all__' ? message : field + ': ' + message);
+            });
+        });
+        errorBox.textContent = lines.join(' ');
+        errorBox.classList.remove('d-none');
+    }
+
+    // Adds a decimal delta to a displayed amount in whole centavos, so repeated edits do not drift.
+    function addToDisplayed(element, delta) {
+        if (!element) {
+            return;
+        }
+        const decimals = element.textContent.indexOf('.') === -1 && delta.indexOf('.') === -1 ? 0 : 2;
+        const scale = Math.pow(10, decimals);
+        const value = Math.round(parseFloat(element.textContent || '0') * scale) + Math.round(parseFloat(delta) * scale);
+        element.textContent = (value / scale).toFixed(decimals);
+    }
+
+    function setEditing(row, editing) {
+        row.querySelector('.inline-edit').classList.toggle('d-none', editing);
+        row.querySelector('.inline-save').classList.toggle('d-none', !editing);
+        row.querySelector('.inline-cancel').classList.toggle('d-none', !editing);
+        Object.keys(inputTypes).forEach(function (field) {
+            const cell = row.querySelector('[data-field="' + field + '"]');
+            if (editing) {
+                cell.dataset.display = cell.textContent;
+                const input = document.createElement('input');
+                input.type = inputTypes[field];
+                input.name = field;
+                input.value = cell.dataset.value;
+                input.className = 'form-control form-control-sm';
+                if (inputTypes[field] === 'number') {
+                    input.step = '0.01';
+                }
+                cell.textContent = '';
+                cell.appendChild(input);
+            } else {
+                cell.textContent = cell.dataset.display;
+            }
+        });
+    }
+
+    function save(row) {
+        const body = new URLSearchParams();
+        Object.keys(inputTypes).forEach(function (field) {
+            const input = row.querySelector('[data-field="' + field + '"] input');
+            // Only the edited fields are sent; the server keeps the stored value of the others.
+            if (input.value !== row.querySelector('[data-field="' + field + '"]').dataset.value) {
+                body.append(field, input.value);
+            }
+        });
+        body.append('start_date', table.dataset.startDate);
+        body.append('end_date', table.dataset.endDate);
+
+        fetch(row.dataset.inlineUrl, {
+            method: 'POST',
+            headers: {'X-CSRFToken': csrfInput ? csrfInput.value : ''},
+            body: body
+        }).then(function (response) {
+            return response.json().then(function (data) {
+                return {ok: response.ok, data: data};
+            });
+        }).then(function (result) {
+            if (!result.ok) {
+                showErrors(result.data.errors || {'__all__': ['The record could not be saved.']});
+                return;
+            }
+            errorBox.classList.add('d-none');
+            const data = result.data;
+            Object.keys(data.row).forEach(function (field) {
+                const cell = row.querySelector('[data-field="' + field + '"]');
+                cell.dataset.display = data.row[field];
+                if (field in data.inputs) {
+                    cell.dataset.value = data.inputs[field];
+                }
+                if (!(field in inputTypes)) {
+                    cell.textContent = data.row[field];
+                }
+            });
+            setEditing(row, false);
+            Object.keys(data.deltas).forEach(function (field) {
+                addToDisplayed(document.querySelector('[data-total="' + field + '"]'), String(data.deltas[field]));
+            });
+            Object.keys(data.ytd_deltas).forEach(function (name) {
+                addToDisplayed(document.querySelector('[data-ytd="' + name + '"]'), String(data.ytd_deltas[name]));
+            });
+            if (!data.in_period) {
+                row.remove();
+            }
+        }).catch(function () {
+            showErrors({'__all__': ['The record could not be saved; check your connection and try again.']});
+        });
+    }
+
+    table.querySelectorAll('tr[data-inline-url]').forEach(function (row) {
+        row.querySelector('.inline-edit').addEventListener('click', function () {
+            setEditing(row, true);
+        });
+        row.querySelector('.inline-cancel').addEventListener('click', function () {
+            errorBox.classList.add('d-none');
+            setEditing(row, false);
+        });
+        row.querySelector('.inline-save').addEventListener('click', function () {
+            save(row);
+        });
+    });
+});
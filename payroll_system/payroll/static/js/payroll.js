@@ -1,4 +1,39 @@
 document.addEventListener("DOMContentLoaded", function () {
+    // Pay rules compiled on the server (see PayrollForm.client_rules); the defaults match the built-in rules.
+    const rulesElement = document.getElementById('pay-rules');
+    const rules = Object.assign({
+        overtimeThreshold: 10,
+        overtimeMultiplier: 1.25,
+        nightDifferentialRate: 0.1,
+        restDay: null,
+        restDayPremium: 100,
+        holidays: {},
+        positionRates: {}
+    }, rulesElement ? JSON.parse(rulesElement.textContent) : {});
+
+    // Premium for the shift date in hundredths: holidays first, then the rest day.
+    function datePremium() {
+        const timeIn = document.getElementById('id_time_in').value;
+        if (!timeIn) {
+            return 100;
+        }
+        const day = timeIn.slice(0, 10);
+        if (rules.holidays[day]) {
+            return rules.holidays[day];
+        }
+        // JavaScript numbers weekdays from Sunday = 0; the rules from Monday = 0.
+        const weekday = (new Date(day + 'T00:00:00').getDay() + 6) % 7;
+        return weekday === rules.restDay ? rules.restDayPremium : 100;
+    }
+
+    function applyPositionRate() {
+        const rateInput = document.getElementById("id_daily_rate");
+        const employeeId = document.getElementById("id_employee").value;
+        if (!rateInput.value && rules.positionRates[employeeId]) {
+            rateInput.value = rules.positionRates[employeeId];
+            updateSalaryCalculations();
+        }
+    }
     document.getElementById('id_time_in').addEventListener('change', calculateTotalHours);
     document.getElementById('id_time_out').addEventListener('change', calculateTotalHours);
 
@@ -24,7 +59,7 @@ document.addEventListener("DOMContentLoaded", function () {
 
     // Function to update subtotal and net salary
     function updateSalaryCalculations() {
-        const dailyRate = parseFloat(document.getElementById("id_daily_rate").value) || 0;
+        const dailyRate = (parseFloat(document.getElementById("id_daily_rate").value) || 0) * datePremium() / 100;
         const totalHours = parseFloat(document.getElementById("total_hours_worked").value) || 0;
         const nightDiff = parseFloat(document.getElementById("id_night_differential_hour").value) || 0;
         const deductions = parseFloat(document.getElementById("id_deductions").value) || 0;
@@ -32,16 +67,16 @@ document.addEventListener("DOMContentLoaded", function () {
         const allowance = parseFloat(document.getElementById("id_allowance").value) || 0;
         
         // Calculate Breaktime
-        let netHour = totalHours >= 10 ? 8 : totalHours;
+        let netHour = totalHours >= rules.overtimeThreshold ? 8 : totalHours;
         let breakHour = 1;
-        if (netHour == 8 && totalHours >= 10) {
+        if (netHour == 8 && totalHours >= rules.overtimeThreshold) {
             breakHour = 0;
         } else if (netHour >= 6) {
             breakHour = 2;
         }
 
-        let netOt = ((dailyRate / 8) * 1.25) * overtimeHour;
-        let netNightDiff = ((dailyRate / 8) * 0.1) * nightDiff;
+        let netOt = ((dailyRate / 8) * rules.overtimeMultiplier) * overtimeHour;
+        let netNightDiff = ((dailyRate / 8) * rules.nightDifferentialRate) * nightDiff;
         const hourlyRate = dailyRate / 8;
         const subtotal = (hourlyRate * (netHour - breakHour)) + netOt + netNightDiff + allowance;
         const netSalary = subtotal - deductions;
@@ -63,5 +98,7 @@ document.addEventListener("DOMContentLoaded", function () {
     document.getElementById("id_night_differential_hour").addEventListener("input", updateSalaryCalculations);
     document.getElementById("id_deductions").addEventListener("input", updateSalaryCalculations);
     document.getElementById("id_allowance").addEventListener("input", updateSalaryCalculations);
+    document.getElementById("id_time_in").addEventListener("change", updateSalaryCalculations);
+    document.getElementById("id_employee").addEventListener("change", applyPositionRate);
     
 });
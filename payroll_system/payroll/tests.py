@@ -1,3 +1,1407 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import os
+import pstats
+import tempfile
+import time as time_module
+import zipfile
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import ROUND_HALF_UP, Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management.base import CommandError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, router, transaction
+from django.db.models import ProtectedError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from employee.models import Employee
+
+from . import (
+    anomalies, archive, audit, bulk, calculations, columnar, disbursement, importer, ledger, periods, profiling,
+    projects, punches, rendering, reporting, rules, upload_template,
+)
+from .admin import PayPeriodAdmin, PayrollAdminForm
+from .forms import PayrollForm
+from .management.commands import loadtest
+from .models import (
+    ArchivedPayroll, ArchivedPayrollTotal, AuditEntry, Holiday, PayPeriod, PayPeriodPayslip, PayPeriodTotal,
+    PayRuleSet, Payroll, PayrollAnomaly, PayrollLedger, ProjectDailyCost, Punch,
+)
+
+
+def make_employee(number=1, **kwargs):
+    return Employee.objects.create(**{
+        'first_name': f'First{number}',
+        'last_name': 'Last',
+        'email': f'employee{number}@example.com',
+        'hire_date': date(2020, 1, 1),
+        'position': 'Mason',
+        **kwargs,
+    })
+
+
+def make_payroll(employee, record_date, **kwargs):
+    tz = timezone.get_default_timezone()
+    values = {
+        'daily_rate': Decimal('500.00'),
+        'total_hours_worked': Decimal('8.00'),
+        'overtime_hour': Decimal('0.00'),
+        'subtotal': Decimal('500.00'),
+        'net_salary': Decimal('500.00'),
+        'time_in': timezone.make_aware(datetime.combine(record_date, time(8)), tz),
+        'time_out': timezone.make_aware(datetime.combine(record_date, time(16)), tz),
+        'project': 'Tower A',
+        **kwargs,
+    }
+    return Payroll.objects.create(employee=employee, date=record_date, **values)
+
+
+def upload_row(employee, record_date, **kwargs):
+    return {
+        'employee_id': employee.pk, 'daily_rate': 500, 'allowance': 0, 'total_hours_worked': 8,
+        'overtime_pay': 0, 'overtime_hour': 0, 'night_differential_pay': 0, 'night_differential_hour': 0,
+        'deductions': 0, 'deduction_remarks': '', 'subtotal': 500, 'net_salary': 500,
+        'date': record_date.isoformat(), 'time_in': '08:00:00', 'time_out': '16:00:00', 'project': 'Tower A',
+        **kwargs,
+    }
+
+
+class EmployeeDeleteTests(TestCase):
+    def test_deleting_employee_with_payroll_keeps_derived_tables_consistent(self):
+        employee = make_employee(1)
+        other = make_employee(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_payroll(employee, date(2024, 3, 1))
+            make_payroll(employee, date(2024, 4, 2))
+            make_payroll(other, date(2024, 3, 1))
+        self.assertEqual(PayrollLedger.objects.filter(employee=employee).count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            employee.delete()
+        connection.check_constraints()
+
+        self.assertFalse(PayrollLedger.objects.filter(employee_id=employee.pk).exists())
+        self.assertFalse(Payroll.objects.filter(employee_id=employee.pk).exists())
+        # The project rollup of the shared day only keeps the remaining employee's cost.
+        self.assertEqual(
+            ProjectDailyCost.objects.get(project='Tower A', date=date(2024, 3, 1)).net_salary,
+            Decimal('500.00'),
+        )
+
+    def test_removal_never_creates_a_ledger_month(self):
+        employee = make_employee(1)
+        values = {
+            'employee_id': employee.pk, 'date': date(2024, 5, 1),
+            **{field: Decimal('1.00') for field in ledger.LEDGER_SOURCES.values()},
+        }
+        ledger.record_change(values, None)
+        self.assertFalse(PayrollLedger.objects.filter(employee=employee).exists())
+
+
+class ImportFingerprintTests(TestCase):
+    def setUp(self):
+        self.employees = [make_employee(number) for number in range(3)]
+        self.frame = pd.DataFrame([
+            {
+                'employee_id': employee.pk, 'daily_rate': 500, 'allowance': 0, 'total_hours_worked': 8,
+                'overtime_pay': 0, 'overtime_hour': 0, 'night_differential_pay': 0,
+                'night_differential_hour': 0, 'deductions': 0, 'deduction_remarks': '', 'subtotal': 500,
+                'net_salary': 500, 'date': (date(2023, 1, 1) + timedelta(days=day)).isoformat(),
+                'time_in': '08:00:00', 'time_out': '16:00:00', 'project': 'Tower A',
+            }
+            for employee in self.employees
+            for day in range(400)
+        ])
+
+    def upload(self, frame, name='site.csv'):
+        parsed = []
+        parse_sheet = importer.parse_sheet
+
+        def counting_parse_sheet(df):
+            parsed.append(len(df))
+            return parse_sheet(df)
+
+        with mock.patch.object(importer, 'parse_sheet', counting_parse_sheet):
+            with self.captureOnCommitCallbacks(execute=True):
+                result = importer.import_payroll_sources(
+                    [(name, frame.to_csv(index=False).encode())], max_workers=1
+                )
+        result['parsed_rows'] = sum(parsed)
+        return result
+
+    def test_identical_file_is_skipped_without_parsing(self):
+        first = self.upload(self.frame)
+        self.assertEqual((first['created'], first['errors']), (1200, []))
+
+        again = self.upload(self.frame)
+        self.assertEqual(again['skipped_files'], ['site.csv'])
+        self.assertEqual((again['created'], again['updated'], again['unchanged']), (0, 0, 1200))
+        self.assertEqual(again['parsed_rows'], 0)
+
+    def test_edited_row_only_reparses_its_chunk(self):
+        self.upload(self.frame)
+        edited = self.frame.copy()
+        edited.loc[700, 'allowance'] = 100
+
+        result = self.upload(edited)
+        self.assertEqual((result['created'], result['updated'], result['errors']), (0, 1, []))
+        self.assertLessEqual(result['parsed_rows'], importer.CHUNK_MAX_ROWS)
+        record = Payroll.objects.get(employee_id=edited.loc[700, 'employee_id'], date=edited.loc[700, 'date'])
+        self.assertEqual(record.allowance, Decimal('100.00'))
+
+    def test_inserted_row_is_created(self):
+        self.upload(self.frame)
+        inserted = pd.concat([
+            self.frame.iloc[:500], self.frame.iloc[[500]].assign(date='2025-01-01'), self.frame.iloc[500:],
+        ], ignore_index=True)
+
+        result = self.upload(inserted)
+        self.assertEqual((result['created'], result['updated'], result['errors']), (1, 0, []))
+        self.assertLess(result['parsed_rows'], len(inserted))
+        self.assertEqual(Payroll.objects.count(), 1201)
+
+    def test_deleted_record_is_restored_by_reupload(self):
+        self.upload(self.frame)
+        Payroll.objects.filter(employee=self.employees[0], date=date(2023, 2, 1)).delete()
+
+        result = self.upload(self.frame)
+        self.assertEqual((result['created'], result['skipped_files']), (1, []))
+
+    def test_records_not_imported_from_the_same_file_are_not_overwritten(self):
+        entered = make_payroll(self.employees[1], date(2023, 3, 1), allowance=Decimal('10.00'))
+        result = self.upload(self.frame)
+        self.assertEqual(result['created'], 0)
+        self.assertEqual(len(result['errors']), 1)
+        self.assertIn('already exists', result['errors'][0][1])
+        entered.delete()
+
+        self.upload(self.frame)
+        corrected = Payroll.objects.get(employee=self.employees[2], date=date(2023, 3, 1))
+        corrected.allowance = Decimal('25.00')
+        corrected.save()
+        edited = self.frame.copy()
+        edited.loc[(edited['employee_id'] == self.employees[2].pk) & (edited['date'] == '2023-03-01'), 'allowance'] = 5
+
+        result = self.upload(edited)
+        self.assertIn('already exists', result['errors'][0][1])
+        corrected.refresh_from_db()
+        self.assertEqual(corrected.allowance, Decimal('25.00'))
+
+        other = self.upload(edited, name='other_site.csv')
+        self.assertIn('already exists', other['errors'][0][1])
+
+
+class ImportSourcesTests(TestCase):
+    def setUp(self):
+        self.employees = [make_employee(number) for number in range(2)]
+
+    def sheet(self, employee, month):
+        return pd.DataFrame([upload_row(employee, date(2024, month, day)) for day in range(1, 11)])
+
+    def workbook(self):
+        buffer = BytesIO()
+        with pd.ExcelWriter(buffer) as writer:
+            self.sheet(self.employees[0], 2).to_excel(writer, sheet_name='February', index=False)
+            pd.DataFrame({'note': ['Rates as agreed on site.']}).to_excel(writer, sheet_name='Notes', index=False)
+            self.sheet(self.employees[1], 2).to_excel(writer, sheet_name='Crew B', index=False)
+        return buffer.getvalue()
+
+    def archive(self):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('site/march.csv', self.sheet(self.employees[0], 3).to_csv(index=False))
+            archive.writestr('site/project.xlsx', self.workbook())
+            archive.writestr('__MACOSX/site/._march.csv', b'')
+            archive.writestr('site/readme.txt', 'Not a payroll file.')
+        return buffer.getvalue()
+
+    def test_zip_members_and_sheets_are_parsed_in_order(self):
+        sources = importer.expand_sources([
+            SimpleUploadedFile('batch.zip', self.archive()),
+            SimpleUploadedFile('april.csv', self.sheet(self.employees[1], 4).to_csv(index=False).encode()),
+        ])
+        self.assertEqual(
+            [name for name, _ in sources], ['batch.zip/site/march.csv', 'batch.zip/site/project.xlsx', 'april.csv']
+        )
+
+        serial = importer.parse_sources(sources, all_sheets=True, max_workers=1)
+        parallel = importer.parse_sources(sources, all_sheets=True, max_workers=2)
+        self.assertEqual([result['rows'] for result in parallel], [result['rows'] for result in serial])
+        self.assertEqual([len(result['rows']) for result in parallel], [10, 20, 10])
+        self.assertEqual(parallel[1]['rows'][10][0], 'batch.zip/site/project.xlsx / Crew B / row 2')
+        self.assertEqual(sum(len(result['errors']) for result in parallel), 0)
+
+    def test_only_the_first_sheet_is_read_by_default(self):
+        results = importer.parse_sources([('project.xlsx', self.workbook())])
+        self.assertEqual(len(results[0]['rows']), 10)
+
+    def test_unreadable_file_is_reported_without_failing_the_others(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = importer.import_payroll_sources([
+                ('broken.xlsx', b'not a workbook'),
+                ('march.csv', self.sheet(self.employees[0], 3).to_csv(index=False).encode()),
+            ], max_workers=2)
+        self.assertEqual(result['created'], 0)
+        self.assertEqual([location for location, _ in result['errors']], ['broken.xlsx'])
+
+
+class UploadTemplateTests(TestCase):
+    def setUp(self):
+        self.employees = [make_employee(number) for number in range(2)]
+
+    def test_template_lists_active_employees_and_is_cached_by_version(self):
+        response = self.client.get(reverse('payroll_download_template'))
+        self.assertEqual(response.status_code, 200)
+        sheets = pd.read_excel(BytesIO(response.content), sheet_name=None)
+        self.assertEqual(list(sheets), [upload_template.TEMPLATE_SHEET, upload_template.LOOKUP_SHEET])
+        self.assertEqual(list(sheets[upload_template.TEMPLATE_SHEET].columns), importer.REQUIRED_COLUMNS)
+        self.assertEqual(
+            sheets[upload_template.LOOKUP_SHEET]['employee_id'].tolist(), [employee.pk for employee in self.employees]
+        )
+
+        etag = response['ETag']
+        response = self.client.get(reverse('payroll_download_template'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Bulk status updates bypass model signals but still produce a new version.
+        Employee.objects.filter(pk=self.employees[0].pk).set_status(Employee.STATUS_INACTIVE)
+        response = self.client.get(reverse('payroll_download_template'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        lookup = pd.read_excel(BytesIO(response.content), sheet_name=upload_template.LOOKUP_SHEET)
+        self.assertEqual(lookup['employee_id'].tolist(), [self.employees[1].pk])
+
+    def test_versioned_link_is_cached_by_the_browser(self):
+        version, _ = upload_template.template_version()
+        response = self.client.get(reverse('payroll_download_template'), {'v': version})
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(reverse('payroll_download_template'), {'v': 'stale'})
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_filled_template_uploads_without_the_lookup_sheet(self):
+        _, employees = upload_template.template_version()
+        workbook = load_workbook(BytesIO(upload_template.build_template(employees)))
+        row = upload_row(self.employees[0], date(2024, 3, 4))
+        workbook[upload_template.TEMPLATE_SHEET].append([row[column] for column in importer.REQUIRED_COLUMNS])
+        buffer = BytesIO()
+        workbook.save(buffer)
+
+        results = importer.parse_sources([('template.xlsx', buffer.getvalue())], all_sheets=True)
+        self.assertEqual((len(results[0]['rows']), results[0]['errors']), (1, []))
+
+
+class RenderPoolTests(TestCase):
+    def make_pool(self):
+        pool = rendering.RenderPool(workers=1, queue_limit=0)
+        self.addCleanup(lambda: pool._executor and pool._executor.shutdown(wait=False, cancel_futures=True))
+        return pool
+
+    def test_full_pool_refuses_instead_of_queueing(self):
+        pool = self.make_pool()
+
+        async def render_twice():
+            first = asyncio.ensure_future(pool.run(time_module.sleep, 0.5, timeout=5))
+            await asyncio.sleep(0)
+            with self.assertRaises(rendering.RenderPoolBusy):
+                await pool.run(time_module.sleep, 0)
+            await first
+            # The slot is free again once the first render finished.
+            return await pool.run(pow, 2, 10, timeout=5)
+
+        self.assertEqual(asyncio.run(render_twice()), 1024)
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(pool.run(time_module.sleep, 2, timeout=0.1))
+        self.assertEqual(pool.map(pow, [2, 3, 4], [2, 2, 2]), [4, 9, 16])
+
+    def test_payslip_views_answer_503_when_the_pool_is_busy(self):
+        employee = make_employee(1)
+        make_payroll(employee, date(2024, 3, 1))
+        url = reverse('generate_payslip_excel', args=[employee.pk])
+
+        pool = self.make_pool()
+        with mock.patch.object(rendering, 'shared_pool', return_value=pool):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(load_workbook(BytesIO(response.content)).active.title, 'Payslip')
+
+            pool._slots.acquire()
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+class PayComputationTests(TestCase):
+    def test_pay_expressions_agree_with_compute_pay(self):
+        PayRuleSet.objects.create(
+            name='Site rules', overtime_threshold=Decimal('9.50'), overtime_multiplier=Decimal('1.30'),
+            night_differential_rate=Decimal('0.15'), rest_day=6, rest_day_multiplier=Decimal('1.30'),
+        )
+        Holiday.objects.create(date=date(2024, 3, 5), name='Holiday', multiplier=Decimal('2.00'))
+        employee = make_employee(1)
+        # (daily rate, hours, overtime hours, night hours, allowance, deductions), covering
+        # full shifts, both break lengths, shifts under an hour and odd centavo rates.
+        cases = [
+            ('500.00', '8.00', '0.00', '0.00', '0.00', '0.00'),
+            ('537.33', '12.75', '3.25', '2.50', '25.00', '13.37'),
+            ('610.01', '9.50', '0.00', '1.33', '0.00', '0.00'),
+            ('499.99', '9.49', '0.00', '0.00', '0.00', '100.00'),
+            ('450.55', '6.00', '0.00', '0.00', '10.10', '0.00'),
+            ('450.55', '5.99', '0.00', '0.67', '0.00', '0.00'),
+            ('700.00', '1.00', '0.00', '0.00', '0.00', '0.00'),
+            ('700.00', '0.50', '0.00', '0.00', '50.00', '0.00'),
+            ('700.00', '0.00', '0.00', '0.00', '50.00', '0.00'),
+            ('333.33', '14.00', '4.50', '7.99', '0.00', '999.99'),
+        ]
+        start = date(2024, 3, 1)
+        for offset, case in enumerate(cases * 2):
+            rate, hours, overtime, night, allowance, deductions = map(Decimal, case)
+            make_payroll(
+                employee, start + timedelta(days=offset), daily_rate=rate, total_hours_worked=hours,
+                overtime_hour=overtime, night_differential_hour=night, allowance=allowance, deductions=deductions,
+            )
+
+        bulk.recompute_pay(Payroll.objects.all())
+
+        rows = list(Payroll.objects.order_by('date'))
+        pay_rules = rules.current_rules()
+        self.assertEqual(pay_rules.premium(date(2024, 3, 5)), 200)
+        self.assertEqual(pay_rules.premium(date(2024, 3, 3)), 130)
+        expected = calculations.compute_pay(
+            [float(row.daily_rate) for row in rows],
+            [float(row.total_hours_worked) for row in rows],
+            [float(row.overtime_hour) for row in rows],
+            [float(row.night_differential_hour) for row in rows],
+            [float(row.allowance) for row in rows],
+            [float(row.deductions) for row in rows],
+            premium=pay_rules.premiums([row.date for row in rows]),
+            rules=pay_rules,
+        )
+        for field, values in expected.items():
+            self.assertEqual(
+                [getattr(row, field) for row in rows], [columnar.to_decimal(value) for value in values], field,
+            )
+
+
+class LedgerTests(TestCase):
+    def assertLedgerIsFresh(self):
+        def state():
+            return sorted(PayrollLedger.objects.values_list(
+                'employee_id', 'year', 'month', *ledger.TOTALS, *[f'ytd_{name}' for name in ledger.TOTALS],
+            ))
+
+        maintained = state()
+        ledger.rebuild_ledger()
+        self.assertEqual(maintained, state())
+
+    def test_ledger_matches_a_rebuild_after_every_kind_of_change(self):
+        first = make_employee(1)
+        second = make_employee(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            records = [
+                make_payroll(employee, date(2024, month, day), net_salary=Decimal(f'{400 + day}.{month:02d}'))
+                for employee in (first, second) for month in (1, 2, 3) for day in (3, 4, 5)
+            ]
+            make_payroll(first, date(2023, 12, 29))
+        self.assertLedgerIsFresh()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record = records[0]
+            record.net_salary = Decimal('123.45')
+            record.overtime_hour = Decimal('2.50')
+            record.save()
+            # Moving a record to another month updates both months.
+            moved = records[1]
+            moved.date = date(2024, 3, 20)
+            moved.save()
+        self.assertLedgerIsFresh()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            records[2].delete()
+            # The only record of a month: the month's row goes away with it.
+            Payroll.objects.get(date=date(2023, 12, 29)).delete()
+        self.assertLedgerIsFresh()
+        self.assertFalse(PayrollLedger.objects.filter(year=2023).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Payroll.objects.filter(employee=second, date__month=2).update(total_hours_worked=Decimal('12.00'))
+            bulk.recompute_pay(Payroll.objects.filter(employee=second, date__month=2))
+        self.assertLedgerIsFresh()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.delete_payrolls(Payroll.objects.filter(date__month=1), chunk_size=2)
+        self.assertLedgerIsFresh()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.refresh_ledger([(first.pk, date(2024, 1, 1))])
+        self.assertLedgerIsFresh()
+
+
+class HistoryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.employee = make_employee(1)
+        self.today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payroll = make_payroll(self.employee, self.today.replace(day=1))
+
+    def current_month(self):
+        return ledger.monthly_history(self.employee)[0]
+
+    def test_history_is_served_from_the_cache(self):
+        self.assertEqual(self.current_month()['days_worked'], 1)
+        with self.assertNumQueries(0):
+            history = ledger.monthly_history(self.employee, months=24)
+        self.assertEqual(len(history), 24)
+        self.assertEqual(history[0]['net'], Decimal('500.00'))
+
+    def test_cache_is_dropped_when_the_change_commits(self):
+        self.assertEqual(self.current_month()['days_worked'], 1)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            make_payroll(self.employee, self.today.replace(day=2))
+            # Until the transaction commits, other requests keep the committed history.
+            self.assertEqual(self.current_month()['days_worked'], 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.current_month()['days_worked'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.delete_payrolls(Payroll.objects.filter(pk=self.payroll.pk))
+        self.assertEqual(self.current_month()['days_worked'], 1)
+
+    def test_details_page_shows_the_monthly_totals(self):
+        response = self.client.get(reverse('employee_details', args=[self.employee.pk]), {'months': '6'})
+        self.assertEqual(response.context['months'], 6)
+        self.assertEqual(response.context['history_totals']['days_worked'], 1)
+
+
+class PunchPairingTests(TestCase):
+    def test_pairs_each_in_with_the_next_out_of_the_same_employee(self):
+        df = pd.DataFrame([
+            (1, '2024-03-04 20:00', Punch.DIRECTION_IN),
+            (1, '2024-03-05 04:00', Punch.DIRECTION_OUT),
+            (2, '2024-03-04 08:00', Punch.DIRECTION_IN),
+            (1, '2024-03-05 20:00', Punch.DIRECTION_IN),
+            (2, '2024-03-04 16:30', Punch.DIRECTION_OUT),
+            (2, '2024-03-05 07:00', Punch.DIRECTION_OUT),
+            (3, '2024-03-04 08:00', Punch.DIRECTION_IN),
+            (3, '2024-03-06 08:00', Punch.DIRECTION_OUT),
+        ], columns=punches.PUNCH_COLUMNS)
+        df['punched_at'] = pd.to_datetime(df['punched_at'])
+
+        shifts, unpaired = punches.pair_punches(df)
+
+        self.assertEqual(
+            [(row.employee_id, str(row.time_in), str(row.time_out)) for row in shifts.itertuples()],
+            [(1, '2024-03-04 20:00:00', '2024-03-05 04:00:00'), (2, '2024-03-04 08:00:00', '2024-03-04 16:30:00')],
+        )
+        # An in without an out, an out without an in and a pair further apart than MAX_SHIFT_HOURS.
+        self.assertEqual(sorted(unpaired['employee_id'].tolist()), [1, 2, 3, 3])
+
+    def test_night_hours(self):
+        time_in = np.array(['2024-03-04T20:00', '2024-03-04T05:00', '2024-03-04T08:00', '2024-03-04T23:30'],
+                           dtype='datetime64[m]')
+        time_out = np.array(['2024-03-05T04:00', '2024-03-04T07:00', '2024-03-04T17:00', '2024-03-05T23:30'],
+                            dtype='datetime64[m]')
+        self.assertEqual(punches.night_hours(time_in, time_out).tolist(), [6.0, 1.0, 0.0, 8.0])
+
+    def test_materialized_rows_match_compute_pay(self):
+        employee = make_employee(1)
+        make_payroll(employee, date(2024, 3, 1), daily_rate=Decimal('537.33'))
+        tz = timezone.get_default_timezone()
+        for punched_at, direction in [
+            (datetime(2024, 3, 4, 18, 0), Punch.DIRECTION_IN),
+            (datetime(2024, 3, 5, 7, 15), Punch.DIRECTION_OUT),
+            (datetime(2024, 3, 6, 8, 0), Punch.DIRECTION_IN),
+            (datetime(2024, 3, 6, 12, 0), Punch.DIRECTION_OUT),
+            (datetime(2024, 3, 6, 13, 0), Punch.DIRECTION_IN),
+            (datetime(2024, 3, 6, 17, 20), Punch.DIRECTION_OUT),
+            (datetime(2024, 3, 7, 8, 0), Punch.DIRECTION_IN),
+        ]:
+            Punch.objects.create(employee=employee, punched_at=timezone.make_aware(punched_at, tz), direction=direction)
+
+        result = punches.materialize_punches(date(2024, 3, 4), date(2024, 3, 7))
+
+        self.assertEqual((result['shifts'], result['unpaired'], result['upserted']), (3, 1, 2))
+        overnight = Payroll.objects.get(employee=employee, date=date(2024, 3, 4))
+        split = Payroll.objects.get(employee=employee, date=date(2024, 3, 6))
+        self.assertEqual(
+            (overnight.total_hours_worked, overnight.overtime_hour, overnight.night_differential_hour),
+            (Decimal('13.25'), Decimal('3.25'), Decimal('8.00')),
+        )
+        self.assertEqual(
+            (split.total_hours_worked, split.overtime_hour, split.night_differential_hour),
+            (Decimal('8.33'), Decimal('0.00'), Decimal('0.00')),
+        )
+        self.assertEqual(split.time_out, timezone.make_aware(datetime(2024, 3, 6, 17, 20), tz))
+
+        rows = [overnight, split]
+        expected = calculations.compute_pay(
+            [float(row.daily_rate) for row in rows],
+            [float(row.total_hours_worked) for row in rows],
+            [float(row.overtime_hour) for row in rows],
+            [float(row.night_differential_hour) for row in rows],
+            [0, 0], [0, 0],
+        )
+        self.assertEqual([row.net_salary for row in rows], [columnar.to_decimal(value) for value in expected['net_salary']])
+
+
+    def test_records_not_built_from_punches_are_left_alone(self):
+        employee = make_employee(1)
+        tz = timezone.get_default_timezone()
+        for day in (4, 5):
+            for hour, direction in ((7, Punch.DIRECTION_IN), (19, Punch.DIRECTION_OUT)):
+                Punch.objects.create(
+                    employee=employee, direction=direction,
+                    punched_at=timezone.make_aware(datetime(2024, 3, day, hour), tz),
+                )
+        entered = make_payroll(employee, date(2024, 3, 4))
+        Payroll.objects.filter(pk=entered.pk).update(fingerprint='0123456789abcdef')
+
+        result = punches.materialize_punches(date(2024, 3, 4), date(2024, 3, 5))
+        self.assertEqual((result['upserted'], result['conflicts']), (1, 1))
+        entered.refresh_from_db()
+        self.assertEqual((entered.total_hours_worked, entered.fingerprint), (Decimal('8.00'), '0123456789abcdef'))
+        built = Payroll.objects.get(employee=employee, date=date(2024, 3, 5))
+        self.assertTrue(built.from_punches)
+
+        # Punch-built records are rewritten with their fingerprint cleared, until edited by hand.
+        Payroll.objects.filter(pk=built.pk).update(fingerprint='0123456789abcdef', total_hours_worked=Decimal('1'))
+        self.assertEqual(punches.materialize_punches(date(2024, 3, 5), date(2024, 3, 5))['upserted'], 1)
+        built.refresh_from_db()
+        self.assertEqual((built.total_hours_worked, built.fingerprint), (Decimal('12.00'), ''))
+        built.save()
+        self.assertFalse(built.from_punches)
+        self.assertEqual(punches.materialize_punches(date(2024, 3, 5), date(2024, 3, 5))['conflicts'], 1)
+
+
+class PayPeriodTests(TestCase):
+    def setUp(self):
+        self.employee = make_employee(1)
+        self.payroll = make_payroll(self.employee, date(2024, 3, 4))
+        self.period = PayPeriod.objects.create(name='Mar 1-15', start_date=date(2024, 3, 1), end_date=date(2024, 3, 15))
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def test_failed_close_leaves_the_period_open_without_snapshots(self):
+        with mock.patch.object(periods, '_payslip_documents', side_effect=RuntimeError('render failed')):
+            with self.assertRaises(RuntimeError):
+                periods.close_period(self.period)
+        self.assertFalse(self.period.is_closed)
+        self.assertFalse(PayPeriodTotal.objects.filter(period=self.period).exists())
+        self.assertFalse(PayPeriodPayslip.objects.filter(period=self.period).exists())
+
+    def test_payslips_are_rendered_outside_the_closing_transaction(self):
+        depth = len(connection.atomic_blocks)
+        render_depths = []
+        payslip_documents = periods._payslip_documents
+
+        def documents(*args):
+            render_depths.append(len(connection.atomic_blocks))
+            return payslip_documents(*args)
+
+        with mock.patch.object(periods, '_payslip_documents', documents):
+            self.assertEqual(periods.close_period(self.period), 1)
+        self.assertEqual(render_depths, [depth])
+        self.assertTrue(self.period.is_closed)
+        self.assertEqual(PayPeriodPayslip.objects.filter(period=self.period).count(), 2)
+
+    def test_records_changed_while_closing_leave_the_period_open(self):
+        payslip_documents = periods._payslip_documents
+
+        def documents(*args):
+            Payroll.objects.filter(pk=self.payroll.pk).update(net_salary=Decimal('1.00'))
+            return payslip_documents(*args)
+
+        with mock.patch.object(periods, '_payslip_documents', documents):
+            with self.assertRaises(periods.PeriodChanged):
+                periods.close_period(self.period)
+        self.assertFalse(self.period.is_closed)
+        self.assertFalse(PayPeriodTotal.objects.filter(period=self.period).exists())
+
+    def test_reopening_an_open_period_is_refused(self):
+        with self.assertRaises(periods.PeriodOpen):
+            periods.reopen_period(self.period)
+        periods.close_period(self.period)
+        periods.reopen_period(self.period)
+        self.assertFalse(self.period.is_closed)
+        self.assertFalse(PayPeriodPayslip.objects.filter(period=self.period).exists())
+
+    def test_employees_of_a_closed_period_cannot_be_deleted(self):
+        periods.close_period(self.period)
+        response = self.client.post(reverse('admin:employee_employee_delete', args=[self.employee.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Employee.objects.filter(pk=self.employee.pk).exists())
+        self.assertEqual(PayPeriodPayslip.objects.filter(period=self.period).count(), 2)
+
+        # Without snapshots, the records in the closed period still protect the employee.
+        PayPeriodPayslip.objects.filter(period=self.period).delete()
+        PayPeriodTotal.objects.filter(period=self.period).delete()
+        with self.assertRaises(ProtectedError), transaction.atomic():
+            self.employee.delete()
+        self.assertTrue(Payroll.objects.filter(pk=self.payroll.pk).exists())
+
+    def test_snapshots_are_cached_privately(self):
+        periods.close_period(self.period)
+        self.assertTrue(self.period.is_closed)
+        response = self.client.get(reverse('pay_period_totals_csv', args=[self.period.pk, self.period.version]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_admin_cannot_change_or_delete_records_of_a_closed_period(self):
+        periods.close_period(self.period)
+        change_url = reverse('admin:payroll_payroll_change', args=[self.payroll.pk])
+        response = self.client.post(change_url, {'employee': self.employee.pk, 'date': '2024-03-04'})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(reverse('admin:payroll_payroll_delete', args=[self.payroll.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Payroll.objects.filter(pk=self.payroll.pk).exists())
+
+        other = make_payroll(self.employee, date(2024, 3, 20))
+        form = PayrollAdminForm(instance=other, data={
+            'employee': self.employee.pk, 'date': '2024-03-05', 'daily_rate': '500.00', 'allowance': '0',
+            'total_hours_worked': '8', 'overtime_pay': '0', 'overtime_hour': '0', 'night_differential_pay': '0',
+            'night_differential_hour': '0', 'deductions': '0', 'subtotal': '500', 'net_salary': '500',
+            'time_in': '2024-03-05 08:00:00', 'time_out': '2024-03-05 16:00:00',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('closed', str(form.errors))
+
+    def test_admin_locks_the_dates_of_a_closed_period(self):
+        periods.close_period(self.period)
+        readonly = PayPeriodAdmin(PayPeriod, admin.site).get_readonly_fields(None, self.period)
+        self.assertIn('start_date', readonly)
+        self.assertIn('end_date', readonly)
+
+
+@override_settings(PAYROLL_PUNCH_TOKENS=['device-secret'])
+class PunchIngestTests(TestCase):
+    def setUp(self):
+        self.employee = make_employee(1)
+        self.url = reverse('ingest_punches')
+        self.punches = [
+            {'employee_id': self.employee.pk, 'punched_at': '2024-03-04T08:00:00', 'direction': 'in'},
+            {'employee_id': self.employee.pk, 'punched_at': '2024-03-04T17:00:00', 'direction': 'out'},
+        ]
+
+    def post(self, punches, **headers):
+        return self.client.post(self.url, {'punches': punches}, content_type='application/json', headers=headers)
+
+    def test_requests_without_a_valid_token_are_refused(self):
+        self.assertEqual(self.post(self.punches).status_code, 401)
+        self.assertEqual(self.post(self.punches, authorization='Bearer wrong').status_code, 401)
+        with override_settings(PAYROLL_PUNCH_TOKENS=[]):
+            self.assertEqual(self.post(self.punches, authorization='Bearer device-secret').status_code, 401)
+        self.assertFalse(Punch.objects.exists())
+
+    def test_resent_punches_are_counted_as_duplicates(self):
+        response = self.post(self.punches, authorization='Bearer device-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['accepted'], response.json()['duplicates']), (2, 0))
+
+        resent = self.punches + [
+            {'employee_id': self.employee.pk, 'punched_at': '2024-03-05T08:00:00', 'direction': 'in'},
+        ]
+        result = self.post(resent, authorization='Bearer device-secret').json()
+        self.assertEqual((result['received'], result['accepted'], result['duplicates']), (3, 1, 2))
+        self.assertEqual(Punch.objects.count(), 3)
+
+
+class ProjectCostTests(TestCase):
+    def rollups(self):
+        return sorted(ProjectDailyCost.objects.values_list('project', 'date', 'headcount', *projects.COST_FIELDS))
+
+    def recomputed(self):
+        return sorted(
+            (row.project, row.date, row.headcount, *(getattr(row, field) for field in projects.COST_FIELDS))
+            for row in projects._daily_costs()
+        )
+
+    def test_rollups_match_a_recompute_after_every_change(self):
+        employees = [make_employee(number) for number in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            first = make_payroll(employees[0], date(2024, 3, 1), net_salary=Decimal('0.29'))
+            second = make_payroll(employees[1], date(2024, 3, 1), net_salary=Decimal('1.15'))
+            make_payroll(employees[2], date(2024, 3, 2), project=None)
+        self.assertEqual(self.rollups(), self.recomputed())
+        self.assertEqual(ProjectDailyCost.objects.get(project='Tower A').headcount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.project = 'Tower B'
+            second.time_in = second.time_in + timedelta(days=1)
+            second.time_out = second.time_out + timedelta(days=1)
+            second.date = date(2024, 3, 2)
+            second.save()
+        self.assertEqual(self.rollups(), self.recomputed())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.rollups(), self.recomputed())
+        self.assertFalse(ProjectDailyCost.objects.filter(project='Tower A').exists())
+
+        rollups = self.rollups()
+        archive.archive_payroll(date(2024, 4, 1))
+        self.assertEqual(self.rollups(), rollups)
+        self.assertEqual(projects.rebuild_project_costs(), len(rollups))
+        self.assertEqual(self.rollups(), rollups)
+
+    def test_rollups_follow_batch_uploads(self):
+        employees = [make_employee(number) for number in range(2)]
+        frame = pd.DataFrame([
+            upload_row(employee, date(2024, 3, day), project=project)
+            for employee, project in zip(employees, ['Tower A', 'Tower B'])
+            for day in range(1, 6)
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            result = importer.import_payroll_sources([('site.csv', frame.to_csv(index=False).encode())], max_workers=1)
+        self.assertEqual(result['created'], 10)
+        self.assertEqual(self.rollups(), self.recomputed())
+        self.assertEqual(ProjectDailyCost.objects.count(), 10)
+
+
+class PeriodSummaryTests(TestCase):
+    def setUp(self):
+        self.employees = [make_employee(number) for number in range(3)]
+        for index, employee in enumerate(self.employees):
+            for day in range(1, index + 2):
+                make_payroll(employee, date(2024, 1, day), net_salary=Decimal('100.01') * (index + 1))
+                make_payroll(employee, date(2024, 3, day), net_salary=Decimal('0.29'))
+        archive.archive_payroll(date(2024, 2, 1))
+
+    def test_grouped_totals_include_archived_records(self):
+        page = archive.employee_period_totals(date(2024, 1, 1), date(2024, 3, 31), sort='-net_salary')
+        self.assertEqual(page.paginator.count, 3)
+        self.assertEqual([row['employee_id'] for row in page], [employee.pk for employee in reversed(self.employees)])
+        last = page.object_list[0]
+        self.assertEqual(
+            (last['days_worked'], last['first_date'], last['last_date'], last['net_salary']),
+            (6, date(2024, 1, 1), date(2024, 3, 3), Decimal('900.96')),
+        )
+        for row in page:
+            history = archive.payroll_history(row['employee_id'], date(2024, 1, 1), date(2024, 3, 31))
+            self.assertEqual(row['net_salary'], sum(record['net_salary'] for record in history))
+
+        march = archive.employee_period_totals(date(2024, 3, 1), sort='name')
+        self.assertEqual([row['net_salary'] for row in march], [Decimal('0.29'), Decimal('0.58'), Decimal('0.87')])
+
+    def test_pages_past_the_end_return_the_last_page(self):
+        page = archive.employee_period_totals(sort='days_worked', page=9, per_page=2)
+        self.assertEqual((page.number, page.paginator.num_pages), (2, 2))
+        self.assertEqual([row['employee_id'] for row in page], [self.employees[2].pk])
+
+    def test_summary_view_sorts_by_a_column(self):
+        response = self.client.get(reverse('payroll_summary'), {'sort': '-days_worked'})
+        self.assertEqual(
+            [row['employee_id'] for row in response.context['summary_page']],
+            [employee.pk for employee in reversed(self.employees)],
+        )
+        response = self.client.get(reverse('payroll_summary'), {'sort': 'password'})
+        self.assertEqual(response.context['sort'], 'name')
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profiling_settings = override_settings(
+            PAYROLL_PROFILING_ENABLED=True, PAYROLL_PROFILING_DIR=directory.name, PAYROLL_PROFILING_KEEP=2,
+        )
+        profiling_settings.enable()
+        self.addCleanup(profiling_settings.disable)
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.clerk = User.objects.create_user('clerk', password='secret')
+        make_payroll(make_employee(1), date(2024, 3, 1))
+
+    def write_temporary(self, content):
+        profile_file = tempfile.NamedTemporaryFile(suffix='.prof', delete=False)
+        self.addCleanup(os.remove, profile_file.name)
+        with profile_file:
+            profile_file.write(content)
+        return profile_file.name
+
+    def test_only_requested_staff_requests_are_profiled(self):
+        self.client.force_login(self.clerk)
+        response = self.client.get(reverse('payroll_summary'), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Name', response)
+
+        self.client.force_login(self.staff)
+        self.assertNotIn('X-Profile-Name', self.client.get(reverse('payroll_summary')))
+        response = self.client.get(reverse('payroll_summary'), {'profile': '1'})
+        name = response['X-Profile-Name']
+
+        summary = profiling.load_profile(name)
+        self.assertEqual(summary['path'], f"{reverse('payroll_summary')}?profile=1")
+        self.assertEqual((summary['status'], summary['user']), (200, 'staff'))
+        self.assertGreater(summary['query_count'], 0)
+        self.assertTrue(summary['top_functions'])
+
+        response = self.client.get(reverse('download_profile', args=[name]))
+        pstats.Stats(self.write_temporary(b''.join(response.streaming_content)))
+
+    def test_only_the_newest_profiles_are_kept(self):
+        self.client.force_login(self.staff)
+        names = [
+            self.client.get(reverse('payroll_summary'), HTTP_X_PROFILE='1')['X-Profile-Name'] for _ in range(3)
+        ]
+        self.assertEqual([summary['name'] for summary in profiling.recent_profiles()], names[:0:-1])
+        self.assertIsNone(profiling.load_profile(names[0]))
+        self.assertIsNone(profiling.profile_path(names[0]))
+
+        response = self.client.get(reverse('request_profiles'))
+        self.assertEqual([summary['name'] for summary in response.context['profiles']], names[:0:-1])
+
+    def test_profile_names_cannot_leave_the_profile_directory(self):
+        self.assertIsNone(profiling.load_profile('../settings'))
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('download_profile', args=['..%2Fdb.sqlite3']))
+        self.assertEqual(response.status_code, 404)
+
+
+class ReportingRouterTests(TestCase):
+    def setUp(self):
+        # Routing decisions only; no query is sent to the reporting alias.
+        patcher = mock.patch.object(reporting, 'reporting_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+
+    def test_report_reads_go_to_the_reporting_database(self):
+        self.assertEqual(router.db_for_read(Payroll), 'default')
+        with reporting.use_reporting():
+            self.assertEqual(router.db_for_read(Payroll), reporting.REPORTING_ALIAS)
+            self.assertEqual(router.db_for_read(Employee), reporting.REPORTING_ALIAS)
+            self.assertEqual(router.db_for_read(User), 'default')
+            self.assertEqual(router.db_for_write(Payroll), 'default')
+        self.assertEqual(router.db_for_read(Payroll), 'default')
+
+    def test_pinned_browsers_read_from_the_live_database(self):
+        @reporting.reporting_reads
+        def view(request):
+            return router.db_for_read(Payroll)
+
+        self.assertEqual(view(self.factory.get('/')), reporting.REPORTING_ALIAS)
+        request = self.factory.get('/')
+        request.COOKIES[reporting.PIN_COOKIE] = '1'
+        self.assertEqual(view(request), 'default')
+
+    def test_successful_writes_set_the_pin_cookie(self):
+        def respond(status):
+            return reporting.ReadYourWritesMiddleware(lambda request: HttpResponse(status=status))
+
+        response = respond(302)(self.factory.post('/'))
+        self.assertEqual(response.cookies[reporting.PIN_COOKIE]['max-age'], settings.PAYROLL_REPORTING_PIN_SECONDS)
+        self.assertTrue(response.cookies[reporting.PIN_COOKIE]['httponly'])
+        self.assertNotIn(reporting.PIN_COOKIE, respond(200)(self.factory.get('/')).cookies)
+        self.assertNotIn(reporting.PIN_COOKIE, respond(400)(self.factory.post('/')).cookies)
+
+    def test_middleware_is_unused_without_a_reporting_database(self):
+        with mock.patch.object(reporting, 'reporting_configured', return_value=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                reporting.ReadYourWritesMiddleware(lambda request: HttpResponse())
+            with reporting.use_reporting():
+                self.assertEqual(router.db_for_read(Payroll), 'default')
+
+
+class LoadtestTests(TestCase):
+    def test_mix_is_validated(self):
+        self.assertEqual(loadtest.parse_mix('generate=2, summary, upload=0'), {'generate': 2, 'summary': 1})
+        with self.assertRaises(CommandError):
+            loadtest.parse_mix('payroll=1')
+        with self.assertRaises(CommandError):
+            loadtest.parse_mix('generate=often')
+
+    # The in-process client sends Host: localhost, which DEBUG allows outside the test runner.
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_every_endpoint_succeeds_against_the_seeded_data(self):
+        command = loadtest.Command(stdout=StringIO())
+        employee_ids = command._seed(3, 20)
+        self.assertEqual(Payroll.objects.filter(employee_id__in=employee_ids).count(), 60)
+
+        workload = loadtest.Workload(employee_ids, 20, upload_rows=4, payslip_format='excel')
+        transport = loadtest.InProcessTransport()
+        for endpoint in loadtest.ENDPOINTS:
+            with self.subTest(endpoint=endpoint), self.captureOnCommitCallbacks(execute=True):
+                status, body = workload.run(endpoint, transport)
+                self.assertEqual(status, 200)
+                self.assertIn(loadtest.SUCCESS_MARKERS.get(endpoint, b''), body)
+        # generate and upload wrote to fresh (employee, date) slots after the seeded days.
+        self.assertEqual(Payroll.objects.filter(employee_id__in=employee_ids).count(), 65)
+
+    def test_report_names_the_saturation_point(self):
+        command = loadtest.Command(stdout=StringIO())
+        steps = [
+            (level, {'summary': {'timings': [0.01] * count, 'errors': 0, 'locked': 0}})
+            for level, count in ((1, 10), (4, 30), (8, 31))
+        ]
+        command._report_saturation(steps, {'summary': 1}, duration=1)
+        self.assertIn('saturates at 4 workers', command.stdout.getvalue())
+
+
+class AnomalyTests(TestCase):
+    HOUR = 3600
+
+    def detect(self, records):
+        # records: (id, employee_id, day ordinal, start hour, end hour), hours counted from 2024-01-01 00:00 UTC.
+        base = int(datetime(2024, 1, 1, tzinfo=dt_timezone.utc).timestamp())
+        columns = list(zip(*records))
+        arrays = [np.array(column, dtype=np.int64) for column in columns[:3]]
+        arrays += [base + np.array(column, dtype=np.int64) * self.HOUR for column in columns[3:]]
+        return sorted(anomalies.find_anomalies(*arrays))
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_overlapping_too_long_and_negative_shifts(self):
+        day = date(2024, 1, 1).toordinal()
+        found = self.detect([
+            (1, 7, day, 8, 17),
+            (2, 7, day, 16, 20),         # starts before shift 1 ends
+            (3, 7, day + 1, 30, 31),     # inside shift 4, which started earlier
+            (4, 7, day, 19, 47),         # longer than 24 hours and overlaps shift 2
+            (5, 8, day, 9, 17),          # same hours as shift 1, but another employee
+            (6, 8, day + 2, 58, 50),     # ends before it starts
+            (7, 8, day + 3, 72, 72),     # ends when it starts
+            (8, 8, day + 4, 80, 82),     # dated the day after it started
+        ])
+        self.assertEqual(found, [
+            (2, PayrollAnomaly.KIND_OVERLAP, 1),
+            (3, PayrollAnomaly.KIND_OVERLAP, 4),
+            (4, PayrollAnomaly.KIND_OVERLAP, 2),
+            (4, PayrollAnomaly.KIND_TOO_LONG, None),
+            (6, PayrollAnomaly.KIND_NEGATIVE, None),
+            (7, PayrollAnomaly.KIND_NEGATIVE, None),
+            (8, PayrollAnomaly.KIND_DATE_MISMATCH, None),
+        ])
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_sweep_matches_pairwise_comparison(self):
+        generator = np.random.default_rng(42)
+        records = []
+        for record_id in range(1, 301):
+            start = int(generator.integers(0, 24 * 60))
+            records.append((record_id, int(generator.integers(1, 6)), 0, start, start + int(generator.integers(1, 12))))
+        found = {(payroll_id, kind) for payroll_id, kind, _ in self.detect(records)}
+
+        expected = set()
+        for record in records:
+            if any(
+                other[1] == record[1] and (other[3], other[0]) < (record[3], record[0]) and record[3] < other[4]
+                for other in records
+            ):
+                expected.add((record[0], PayrollAnomaly.KIND_OVERLAP))
+        self.assertEqual({item for item in found if item[1] == PayrollAnomaly.KIND_OVERLAP}, expected)
+
+    def test_scan_keeps_resolved_anomalies(self):
+        employee = make_employee(1)
+        tz = timezone.get_default_timezone()
+        first = make_payroll(employee, date(2024, 3, 1))
+        second = make_payroll(
+            employee, date(2024, 3, 2),
+            time_in=timezone.make_aware(datetime(2024, 3, 1, 15), tz),
+            time_out=timezone.make_aware(datetime(2024, 3, 1, 18), tz),
+        )
+        self.assertEqual(anomalies.scan([employee.pk]), 2)
+        self.assertEqual(
+            sorted(PayrollAnomaly.objects.values_list('payroll', 'kind', 'other_payroll')),
+            [(second.pk, PayrollAnomaly.KIND_DATE_MISMATCH, None), (second.pk, PayrollAnomaly.KIND_OVERLAP, first.pk)],
+        )
+
+        PayrollAnomaly.objects.filter(kind=PayrollAnomaly.KIND_OVERLAP).update(resolved=True)
+        self.assertEqual(anomalies.scan(start_date=date(2024, 3, 2)), 1)
+        self.assertTrue(PayrollAnomaly.objects.get(kind=PayrollAnomaly.KIND_OVERLAP).resolved)
+
+
+class InlineEditTests(TestCase):
+    def setUp(self):
+        self.employee = make_employee(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payroll = make_payroll(self.employee, date(2024, 3, 5))
+            make_payroll(self.employee, date(2024, 3, 6))
+        self.range = {'start_date': '2024-03-01', 'end_date': '2024-03-31'}
+        # Brings the pay columns of the record in line with the pay rules.
+        self.edit()
+
+    def edit(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('update_payroll_inline', args=[self.payroll.pk]), {**self.range, **data}
+            )
+        return response.status_code, response.json()
+
+    def totals(self):
+        totals = archive.history_totals(self.employee.pk, date(2024, 3, 1), date(2024, 3, 31))
+        ytd = ledger.year_to_date(self.employee.pk, date(2024, 3, 31))
+        return totals, ytd
+
+    def assertDeltasMatchTotals(self, before, result):
+        after = self.totals()
+        for field in columnar.TOTAL_FIELDS:
+            self.assertEqual(Decimal(result['deltas'][field]), after[0][field] - before[0][field], field)
+        for name, field in ledger.LEDGER_SOURCES.items():
+            self.assertEqual(Decimal(result['ytd_deltas'][name]), after[1][name] - before[1][name], name)
+        self.assertEqual(result['ytd_deltas']['days_worked'], after[1]['days_worked'] - before[1]['days_worked'])
+
+    def test_deltas_match_the_recomputed_totals(self):
+        before = self.totals()
+        status, result = self.edit(deductions='120.50', night_differential_hour='2')
+        self.assertEqual(status, 200)
+        self.assertLessEqual(
+            {'deductions', 'night_differential_hour', 'night_differential_pay'}, set(result['changed'])
+        )
+        self.assertNotIn('daily_rate', result['changed'])
+        self.assertTrue(result['in_period'])
+        self.assertEqual(result['deltas']['days_worked'], '0')
+        self.assertEqual(Decimal(result['deltas']['deductions']), Decimal('120.50'))
+        self.assertEqual(result['inputs']['deductions'], '120.50')
+        self.assertDeltasMatchTotals(before, result)
+
+    def test_moving_a_record_out_of_the_range_removes_it_from_the_totals(self):
+        before = self.totals()
+        net_salary = Payroll.objects.get(pk=self.payroll.pk).net_salary
+        status, result = self.edit(time_in='2024-04-02T08:00', time_out='2024-04-02T16:00')
+        self.assertEqual(status, 200)
+        self.assertFalse(result['in_period'])
+        self.assertEqual(result['deltas']['days_worked'], '-1')
+        self.assertEqual(Decimal(result['deltas']['net_salary']), -net_salary)
+        self.assertDeltasMatchTotals(before, result)
+
+    def test_unchanged_values_write_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            status, result = self.edit(deductions='0.00')
+        self.assertEqual((status, result['changed']), (200, []))
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "payroll_payroll"')])
+
+    def test_invalid_edits_are_rejected(self):
+        status, result = self.edit(total_hours_worked='0')
+        self.assertEqual(status, 400)
+        self.assertIn('__all__', result['errors'])
+        status, result = self.edit(time_in='2024-03-06T08:00', time_out='2024-03-06T16:00')
+        self.assertEqual(status, 400)
+        self.assertIn('already exists', result['errors']['time_in'][0])
+
+
+class ArchiveTests(TestCase):
+    def test_interrupted_run_keeps_totals_of_the_months_already_moved(self):
+        employee = make_employee(1)
+        for day in (1, 2, 3):
+            make_payroll(employee, date(2020, 1, day))
+        for day in (1, 2):
+            make_payroll(employee, date(2020, 2, day))
+
+        calls = []
+        refresh_totals = archive._refresh_totals
+
+        def failing_second_chunk(keys):
+            calls.append(keys)
+            if len(calls) == 2:
+                raise RuntimeError('interrupted')
+            refresh_totals(keys)
+
+        with mock.patch.object(archive, '_refresh_totals', failing_second_chunk):
+            with self.assertRaises(RuntimeError):
+                archive.archive_payroll(date(2020, 3, 1), chunk_size=3)
+
+        january = ArchivedPayrollTotal.objects.get(employee=employee, month=date(2020, 1, 1))
+        self.assertEqual((january.days_worked, january.net_salary), (3, Decimal('1500.00')))
+        # The failed chunk was rolled back whole.
+        self.assertEqual(Payroll.objects.filter(date__month=2).count(), 2)
+
+        result = archive.archive_payroll(date(2020, 3, 1), chunk_size=3)
+        self.assertEqual(result['archived'], 2)
+        february = ArchivedPayrollTotal.objects.get(employee=employee, month=date(2020, 2, 1))
+        self.assertEqual(february.days_worked, 2)
+
+    def test_anomalies_move_with_their_records(self):
+        employee = make_employee(1)
+        payroll = make_payroll(employee, date(2020, 1, 2))
+        for kind, resolved in ((PayrollAnomaly.KIND_TOO_LONG, True), (PayrollAnomaly.KIND_NEGATIVE, False)):
+            PayrollAnomaly.objects.create(
+                payroll=payroll, employee=employee, date=payroll.date, kind=kind, detail='-', resolved=resolved,
+            )
+
+        archive.archive_payroll(date(2020, 2, 1))
+
+        archived = ArchivedPayroll.objects.get(original_id=payroll.pk)
+        self.assertEqual(
+            sorted(PayrollAnomaly.objects.values_list('archived_payroll', 'payroll', 'resolved')),
+            [(archived.pk, None, False), (archived.pk, None, True)],
+        )
+
+    def test_archived_days_cannot_be_entered_again(self):
+        employee = make_employee(1)
+        make_payroll(employee, date(2020, 1, 2))
+        archive.archive_payroll(date(2020, 2, 1))
+
+        form = PayrollAdminForm(data={
+            'employee': employee.pk, 'date': '2020-01-02', 'daily_rate': '500.00', 'allowance': '0',
+            'total_hours_worked': '8', 'overtime_pay': '0', 'overtime_hour': '0', 'night_differential_pay': '0',
+            'night_differential_hour': '0', 'deductions': '0', 'subtotal': '500', 'net_salary': '500',
+            'time_in': '2020-01-02 08:00:00', 'time_out': '2020-01-02 16:00:00',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('archived', str(form.errors))
+
+        form = PayrollForm(data={
+            'employee': employee.pk, 'daily_rate': '500.00', 'total_hours_worked': '8',
+            'time_in': '2020-01-02 08:00', 'time_out': '2020-01-02 16:00',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('archived', str(form.errors))
+
+        frame = pd.DataFrame([{
+            'employee_id': employee.pk, 'daily_rate': 500, 'allowance': 0, 'total_hours_worked': 8,
+            'overtime_pay': 0, 'overtime_hour': 0, 'night_differential_pay': 0, 'night_differential_hour': 0,
+            'deductions': 0, 'deduction_remarks': '', 'subtotal': 500, 'net_salary': 500, 'date': '2020-01-02',
+            'time_in': '08:00:00', 'time_out': '16:00:00', 'project': 'Tower A',
+        }])
+        result = importer.import_payroll_sources([('site.csv', frame.to_csv(index=False).encode())], max_workers=1)
+        self.assertEqual(result['created'], 0)
+        self.assertIn('archived', result['errors'][0][1])
+
+        tz = timezone.get_default_timezone()
+        for hour, direction in ((8, Punch.DIRECTION_IN), (16, Punch.DIRECTION_OUT)):
+            Punch.objects.create(
+                employee=employee, direction=direction, punched_at=timezone.make_aware(datetime(2020, 1, 2, hour), tz),
+            )
+        result = punches.materialize_punches(date(2020, 1, 2), date(2020, 1, 2))
+        self.assertEqual((result['upserted'], result['conflicts']), (0, 1))
+        self.assertEqual(Payroll.objects.count(), 0)
+
+
+class ColumnarTests(TestCase):
+    # Amounts without an exact binary float representation, so that scaling them by 100 in
+    # SQL lands just below or above a whole number of centavos.
+    AMOUNTS = [
+        '0.01', '0.07', '0.29', '0.57', '1.15', '4.35', '8.95', '1.01', '2.68', '1234.56',
+        '99999999.99', '-0.29', '-1.15', '-0.01', '0.00',
+    ]
+
+    def test_totals_match_decimal_sums(self):
+        employee = make_employee(1)
+        start = date(2020, 1, 1)
+        for offset, amount in enumerate(map(Decimal, self.AMOUNTS)):
+            make_payroll(
+                employee, start + timedelta(days=offset),
+                net_salary=amount, deductions=abs(amount), allowance=Decimal('0.01'),
+                total_hours_worked=Decimal('7.99'),
+            )
+        # Many one-centavo values are where a float running sum drifts.
+        for offset in range(300):
+            make_payroll(
+                employee, start + timedelta(days=100 + offset),
+                net_salary=Decimal('0.01'), deductions=Decimal('0.10'), allowance=Decimal('0.01'),
+                total_hours_worked=Decimal('0.33'),
+            )
+
+        fields = ['net_salary', 'deductions', 'allowance', 'total_hours_worked']
+        rows = list(Payroll.objects.all())
+        expected = {field: sum((getattr(row, field) for row in rows), Decimal('0.00')) for field in fields}
+        self.assertEqual(columnar.totals(Payroll.objects.all(), fields), expected)
+
+        hundredths = columnar.load(Payroll.objects.all(), ['net_salary']).values['net_salary']
+        self.assertEqual(
+            sorted(hundredths.tolist()), sorted(int(row.net_salary * 100) for row in rows),
+        )
+
+    def test_group_totals_match_decimal_sums(self):
+        employees = [make_employee(number) for number in (1, 2, 3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for index, amount in enumerate(map(Decimal, self.AMOUNTS * 4)):
+                make_payroll(
+                    employees[index % 3], date(2024, 1 + index % 3, 1 + index // 3), net_salary=amount,
+                    subtotal=abs(amount), project=['Tower A', 'Tower B', ''][index % 2 + index % 3 // 2],
+                )
+        rows = list(Payroll.objects.all())
+        columns = columnar.load(Payroll.objects.all(), keys=['employee_id', 'project', 'month'])
+
+        for key, key_of in (
+            ('employee_id', lambda row: row.employee_id),
+            ('project', lambda row: row.project),
+            ('month', lambda row: row.date.replace(day=1)),
+        ):
+            expected = {}
+            for row in rows:
+                group = expected.setdefault(
+                    key_of(row), {'count': 0, 'net_salary': Decimal('0.00'), 'subtotal': Decimal('0.00')},
+                )
+                group['count'] += 1
+                group['net_salary'] += row.net_salary
+                group['subtotal'] += row.subtotal
+            grouped = {
+                label: {name: totals[name] for name in ('count', 'net_salary', 'subtotal')}
+                for label, totals in columns.group_totals(key)
+            }
+            self.assertEqual(grouped, expected, key)
+
+        project_rows = {row['project']: row for row in projects.project_totals()}
+        for project in ('Tower A', 'Tower B', ''):
+            records = [row for row in rows if row.project == project]
+            self.assertEqual(project_rows[project]['net_salary'], sum(row.net_salary for row in records))
+            self.assertEqual(project_rows[project]['employee_days'], len(records))
+        for row in projects.project_employees('Tower A'):
+            records = [r for r in rows if r.project == 'Tower A' and r.employee_id == row['employee_id']]
+            self.assertEqual(
+                (row['days_worked'], row['net_salary']), (len(records), sum(r.net_salary for r in records)),
+            )
+
+        totals = archive.history_totals(employees[0], date(2024, 1, 5), date(2024, 3, 31))
+        records = [row for row in rows if row.employee_id == employees[0].pk and row.date >= date(2024, 1, 5)]
+        self.assertEqual(totals['days_worked'], len(records))
+        self.assertEqual(totals['net_salary'], sum(row.net_salary for row in records))
+
+    def test_totals_of_an_empty_queryset_are_zero(self):
+        self.assertEqual(columnar.totals(Payroll.objects.none(), ['net_salary']), {'net_salary': Decimal('0.00')})
+
+    def test_divide_round_half_up_matches_decimal(self):
+        numerators = list(range(-1000, 1001)) + [2 ** 40 + 5, -(2 ** 40) - 5]
+        for denominator in (1, 2, 3, 8, 10, 100, 480):
+            result = columnar.divide_round_half_up(numerators, denominator).tolist()
+            expected = [
+                int((Decimal(value) / denominator).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+                for value in numerators
+            ]
+            self.assertEqual(result, expected, denominator)
+
+    def test_to_hundredths_and_back(self):
+        amounts = ['0.29', '1.15', '2.68', '-0.57', '99999999.99']
+        hundredths = columnar.to_hundredths([float(amount) for amount in amounts])
+        self.assertEqual([columnar.to_decimal(value) for value in hundredths], [Decimal(a) for a in amounts])
+
+
+class DisbursementTests(TestCase):
+    def setUp(self):
+        self.employees = [
+            make_employee(number, bank_account=f'0012-3456-{number:04d}') for number in (1, 2, 3)
+        ]
+        for employee, net_salary in zip(self.employees, ('1234.57', '0.01', '0.00')):
+            make_payroll(employee, date(2024, 3, 4), net_salary=Decimal(net_salary))
+            make_payroll(employee, date(2024, 3, 5), net_salary=Decimal('500.29'))
+        self.period = PayPeriod.objects.create(name='Mar 1-15', start_date=date(2024, 3, 1), end_date=date(2024, 3, 15))
+        periods.close_period(self.period)
+
+    def generate(self, file_format):
+        totals = disbursement.ControlTotals()
+        writer = disbursement.get_writer_class(file_format)(self.period, funding_account='9999-0000')
+        return ''.join(disbursement.file_chunks(self.period, writer, totals)), totals
+
+    def test_file_reconciles_with_the_closed_period(self):
+        for file_format in ('csv', 'fixed'):
+            content, totals = self.generate(file_format)
+            self.assertEqual(totals.count, 3)
+            self.assertEqual(totals.total, Decimal('1734.86') + Decimal('500.30') + Decimal('500.29'))
+            self.assertEqual(
+                totals.total, sum(PayPeriodTotal.objects.filter(period=self.period).values_list('net_salary', flat=True)),
+            )
+            self.assertIn(str(totals.count), content.splitlines()[-1])
+
+    def test_changed_records_do_not_reconcile(self):
+        Payroll.objects.filter(employee=self.employees[0], date=date(2024, 3, 4)).update(net_salary=Decimal('1234.58'))
+        with self.assertRaises(disbursement.DisbursementMismatch):
+            self.generate('csv')
+
+    def test_open_period_cannot_be_disbursed(self):
+        period = PayPeriod.objects.create(name='Mar 16-31', start_date=date(2024, 3, 16), end_date=date(2024, 3, 31))
+        writer = disbursement.get_writer_class('csv')(period)
+        with self.assertRaises(disbursement.DisbursementError):
+            disbursement.file_chunks(period, writer)
+
+
+class AuditTests(TestCase):
+    def test_changes_are_encoded_and_written_when_the_buffer_is_flushed(self):
+        employee = make_employee(1)
+        audit.flush()
+        with audit.buffered('clerk', flush_on_exit=False):
+            with self.captureOnCommitCallbacks(execute=True):
+                payroll = make_payroll(employee, date(2024, 3, 4))
+                payroll.deductions = Decimal('25.00')
+                payroll.save()
+                # A save that changes nothing is not audited.
+                payroll.save()
+            with mock.patch.object(audit, 'encode_changes', wraps=audit.encode_changes) as encode:
+                with self.captureOnCommitCallbacks(execute=True):
+                    payroll.delete()
+                encode.assert_not_called()
+            self.assertFalse(AuditEntry.objects.filter(model=AuditEntry.MODEL_PAYROLL).exists())
+
+        self.assertEqual(audit.flush(), 3)
+        entries = list(AuditEntry.objects.filter(model=AuditEntry.MODEL_PAYROLL).order_by('id'))
+        self.assertEqual(
+            [entry.action for entry in entries],
+            [AuditEntry.ACTION_CREATE, AuditEntry.ACTION_UPDATE, AuditEntry.ACTION_DELETE],
+        )
+        self.assertEqual({entry.username for entry in entries}, {'clerk'})
+        self.assertEqual(audit.decode_changes(entries[1]), [('deductions', 0, '25.00')])
+        self.assertEqual(entries[2].record_date, date(2024, 3, 4))
+
+    def test_rolled_back_changes_are_not_audited(self):
+        employee = make_employee(1)
+        audit.flush()
+        with audit.buffered(flush_on_exit=False):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with self.assertRaises(RuntimeError), transaction.atomic():
+                    make_payroll(employee, date(2024, 3, 4))
+                    raise RuntimeError
+            self.assertEqual(callbacks, [])
+        self.assertEqual(audit.flush(), 0)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.employee = make_employee(1)
+        make_payroll(self.employee, date(2024, 1, 3), project='Tower, "A"', deduction_remarks='Cash advance')
+        make_payroll(self.employee, date(2024, 1, 2))
+        make_payroll(self.employee, date(2024, 2, 1))
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_payroll_csv'), params)
+        return response, b''.join(response.streaming_content)
+
+    def test_rows_follow_the_export_columns(self):
+        response, content = self.export(start_date='2024-01-01', end_date='2024-01-31')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('payroll_2024-01-01_to_2024-01-31.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(content.decode())))
+        self.assertEqual([row['date'] for row in rows], ['2024-01-02', '2024-01-03'])
+        self.assertEqual(rows[1], {
+            'employee_id': str(self.employee.pk), 'first_name': 'First1', 'last_name': 'Last', 'date': '2024-01-03',
+            'project': 'Tower, "A"', 'time_in': '08:00:00', 'time_out': '16:00:00', 'daily_rate': '500.00',
+            'allowance': '0.00', 'total_hours_worked': '8.00', 'overtime_hour': '0.00', 'overtime_pay': '0.00',
+            'night_differential_hour': '0.00', 'night_differential_pay': '0.00', 'deductions': '0.00',
+            'deduction_remarks': 'Cash advance', 'subtotal': '500.00', 'net_salary': '500.00',
+        })
+
+    def test_gzip_download_matches_the_plain_csv(self):
+        _, plain = self.export()
+        response, compressed = self.export(compress='gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.csv.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(compressed), plain)
+        self.assertEqual(len(plain.decode().splitlines()), 4)
+
+    def test_archived_records_are_exported(self):
+        archive.archive_payroll(date(2024, 2, 1))
+        _, content = self.export(start_date='2024-01-01')
+        self.assertEqual(len(content.decode().splitlines()), 4)
+
+    def test_impossible_dates_are_rejected(self):
+        response = self.client.get(reverse('export_payroll_csv'), {'start_date': '2024-02-30'})
+        self.assertRedirects(response, reverse('payroll_summary'), fetch_redirect_response=False)
+        response = self.client.get(reverse('project_costs'), {'start_date': '2024-02-30'})
+        self.assertEqual(response.status_code, 200)
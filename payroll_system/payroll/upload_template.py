@@ -0,0 +1,163 @@
+"""
+The Excel template offered on the batch upload page.
+
+The workbook is built with openpyxl once per distinct content and kept as
+bytes in the Django cache. Its content is identified by a version string
+derived from the template layout and the list of active employees, so any
+employee change (including bulk status updates, which bypass model signals)
+produces a new version on the next request, on every server process.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.cache import cache
+from openpyxl import Workbook
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.datavalidation import DataValidation
+
+from employee import directory
+
+from . import profiling
+from .importer import DECIMAL_COLUMNS, REQUIRED_COLUMNS
+
+# Bump when the layout of the generated workbook changes.
+TEMPLATE_FORMAT = 1
+
+TEMPLATE_SHEET = 'Payroll Template'
+LOOKUP_SHEET = 'Active Employees'
+LOOKUP_COLUMNS = ['employee_id', 'first_name', 'last_name', 'position']
+
+# Number of data rows that carry data validation and cell formats.
+VALIDATED_ROWS = 2000
+
+CACHE_KEY = 'payroll_upload_template:{version}'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+MAX_AMOUNT = '99999999.99'
+
+
+def template_version():
+    """
+    Returns the current template version and the active employees it lists.
+
+    The active employees come from the employee directory; the workbook itself is not built.
+
+    Returns:
+        tuple: (version, employees) where employees is a list of LOOKUP_COLUMNS tuples.
+    """
+    employees = [
+        (entry.id, entry.first_name, entry.last_name, entry.position)
+        for entry in directory.current_directory().active()
+    ]
+    fingerprint = repr((TEMPLATE_FORMAT, REQUIRED_COLUMNS, VALIDATED_ROWS, employees))
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16], employees
+
+
+def template_bytes(version, employees):
+    """
+    Returns the template workbook for a version, building and caching it if needed.
+
+    Args:
+        version (str): The version returned by template_version.
+        employees (list): The employees returned by template_version.
+
+    Returns:
+        bytes: The .xlsx file.
+    """
+    key = CACHE_KEY.format(version=version)
+    content = cache.get(key)
+    if content is None:
+        with profiling.phase('build_template'):
+            content = build_template(employees)
+        cache.set(key, content, CACHE_TIMEOUT)
+    return content
+
+
+def _validation(columns, **options):
+    validation = DataValidation(allow_blank=True, showErrorMessage=True, errorTitle='Invalid value', **options)
+    for column in columns:
+        letter = get_column_letter(REQUIRED_COLUMNS.index(column) + 1)
+        validation.add(f'{letter}2:{letter}{VALIDATED_ROWS + 1}')
+    return validation
+
+
+def build_template(employees):
+    """
+    Builds the batch upload workbook.
+
+    The first sheet has the REQUIRED_COLUMNS headers with data validation on the rows below
+    them: employee_id must be listed on the active employee sheet, amounts and hours must be
+    numbers, date must be a date and time_in/time_out must be times. The second sheet lists
+    the active employees; it has no 'date' column, so uploads skip it.
+
+    Args:
+        employees (list): (id, first_name, last_name, position) tuples of active employees.
+
+    Returns:
+        bytes: The .xlsx file.
+    """
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = TEMPLATE_SHEET
+    sheet.append(REQUIRED_COLUMNS)
+    sheet.freeze_panes = 'A2'
+    for index, column in enumerate(REQUIRED_COLUMNS, 1):
+        sheet.cell(row=1, column=index).font = Font(bold=True)
+        dimension = sheet.column_dimensions[get_column_letter(index)]
+        dimension.width = max(len(column) + 2, 12)
+        if column == 'date':
+            dimension.number_format = 'yyyy-mm-dd'
+        elif column in ('time_in', 'time_out'):
+            dimension.number_format = 'hh:mm:ss'
+        elif column in DECIMAL_COLUMNS:
+            dimension.number_format = '0.00'
+
+    lookup = workbook.create_sheet(LOOKUP_SHEET)
+    lookup.append(LOOKUP_COLUMNS)
+    for index in range(1, len(LOOKUP_COLUMNS) + 1):
+        lookup.cell(row=1, column=index).font = Font(bold=True)
+    for employee in employees:
+        lookup.append(list(employee))
+
+    if employees:
+        employee_validation = _validation(
+            ['employee_id'], type='list',
+            formula1=f"'{LOOKUP_SHEET}'!$A$2:$A${len(employees) + 1}",
+            error=f'Pick an employee ID from the {LOOKUP_SHEET} sheet.',
+        )
+    else:
+        employee_validation = _validation(
+            ['employee_id'], type='whole', operator='greaterThan', formula1='0',
+            error='employee_id must be a whole number.',
+        )
+    validations = [
+        employee_validation,
+        _validation(
+            [column for column in DECIMAL_COLUMNS if column != 'net_salary'],
+            type='decimal', operator='between', formula1='0', formula2=MAX_AMOUNT,
+            error='Enter a number that is zero or more.',
+        ),
+        _validation(
+            ['net_salary'], type='decimal', operator='between', formula1=f'-{MAX_AMOUNT}', formula2=MAX_AMOUNT,
+            error='Enter a number.',
+        ),
+        _validation(
+            ['date'], type='date', operator='greaterThanOrEqual', formula1='DATE(2000,1,1)',
+            error='Enter a date (yyyy-mm-dd).',
+        ),
+        _validation(
+            ['time_in', 'time_out'], type='time', operator='between', formula1='0', formula2='0.999988426',
+            error='Enter a time (hh:mm:ss).',
+        ),
+        _validation(
+            ['deduction_remarks', 'project'], type='textLength', operator='lessThanOrEqual', formula1='200',
+            error='Use at most 200 characters.',
+        ),
+    ]
+    for validation in validations:
+        sheet.add_data_validation(validation)
+
+    output = BytesIO()
+    workbook.save(output)
+    return output.getvalue()
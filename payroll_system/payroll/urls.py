@@ -22,10 +22,62 @@ urlpatterns = [
     # This will render the exportPayslipPdf view to generate and download a payslip in PDF format.
     path('export-payslip-pdf/<int:employee_id>/', views.exportPayslipPdf, name='export_payslip_pdf'),
 
+    # Route to export payroll records for all employees as CSV.
+    # This will call the exportPayrollCsv view, which streams the CSV (optionally gzip-compressed).
+    path('payroll/export-csv/', views.exportPayrollCsv, name='export_payroll_csv'),
+
+    # Route to the project labor cost report.
+    # This will render the projectCosts view, drilling down from projects to employees to days.
+    path('payroll/project-costs/', views.projectCosts, name='project_costs'),
+
+    # Route to the shift anomaly report.
+    # This will render the payrollAnomalies view to review and resolve overlapping or implausible shifts.
+    path('payroll/anomalies/', views.payrollAnomalies, name='payroll_anomalies'),
+
+    # Route to the audit trail of payroll and employee changes.
+    # This will render the auditTrail view, filtered by employee, user or period.
+    path('payroll/audit/', views.auditTrail, name='audit_trail'),
+
+    # Route to the list of pay periods.
+    # This will render the payPeriods view with each period's status.
+    path('payroll/periods/', views.payPeriods, name='pay_periods'),
+
+    # Route to a pay period.
+    # This will render the payPeriodDetail view, reading the snapshot of a closed period.
+    path('payroll/periods/<int:period_id>/', views.payPeriodDetail, name='pay_period_detail'),
+
+    # Route to a payslip stored when the pay period was closed.
+    # The version in the URL lets the response be cached permanently.
+    path(
+        'payroll/periods/<int:period_id>/v<int:version>/payslips/<int:employee_id>.<str:file_format>',
+        views.payPeriodPayslip,
+        name='pay_period_payslip',
+    ),
+
+    # Route to the frozen per-employee totals of a closed pay period as CSV.
+    # The version in the URL lets the response be cached permanently.
+    path(
+        'payroll/periods/<int:period_id>/v<int:version>/totals.csv',
+        views.payPeriodTotalsCsv,
+        name='pay_period_totals_csv',
+    ),
+
+    # Route to the bank disbursement file of a closed pay period.
+    # This will call the payPeriodDisbursement view, which streams the payouts in the chosen format.
+    path(
+        'payroll/periods/<int:period_id>/disbursement/<str:file_format>/',
+        views.payPeriodDisbursement,
+        name='pay_period_disbursement',
+    ),
+
     # Route to edit a payroll.
     # This will render the edit_payroll view to edit payroll information.
     path('payroll/edit/<int:payroll_id>/', views.editPayroll, name='edit_payroll'),
 
+    # Route to update a payroll inline from the payroll summary.
+    # This will call the updatePayrollInline view, which saves the edited fields and returns JSON.
+    path('payroll/edit/<int:payroll_id>/inline/', views.updatePayrollInline, name='update_payroll_inline'),
+
     # Route to delete a payroll.
     # This will render the delete_payroll view to delete payroll information.
     path('payroll/delete/<int:payroll_id>/', views.deletePayroll, name='delete_payroll'),
@@ -37,4 +89,20 @@ urlpatterns = [
     # Route to download a template for batch upload.
     # This will render the downloadTemplate view to download a template for batch upload.
     path('download-template/', views.downloadTemplate, name='payroll_download_template'),
+
+    # Route to receive raw time-clock punches in bulk (JSON or CSV body).
+    # This will call the ingestPunches view, which stores the punches and returns a JSON result.
+    path('punches/ingest/', views.ingestPunches, name='ingest_punches'),
+
+    # Route to import a punch export file and materialize punches into payroll records.
+    # This will render the punchUpload view.
+    path('punches/upload/', views.punchUpload, name='punch_upload'),
+
+    # Route to the staff page listing recent request profiles.
+    # This will render the requestProfiles view, or one profile's details with ?name=.
+    path('profiles/', views.requestProfiles, name='request_profiles'),
+
+    # Route to download the raw cProfile data of a request profile.
+    # This will call the downloadProfile view, which returns the .prof file.
+    path('profiles/<str:name>/download/', views.downloadProfile, name='download_profile'),
 ]
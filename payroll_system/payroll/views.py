@@ -1,24 +1,89 @@
 from django.shortcuts import get_object_or_404, redirect, render
-from .forms import PayrollForm,PayrollUploadForm
-from .models import Payroll
+from .forms import PayrollForm,PayrollUploadForm,PunchUploadForm
+from .models import AuditEntry, PayPeriod, PayPeriodPayslip, PayPeriodTotal, Payroll, PayrollAnomaly
 from django.contrib import messages
 from django.utils.dateparse import parse_datetime
-from employee.models import Employee
-from django.http import HttpResponse
+from employee import directory
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.template.loader import render_to_string
-from weasyprint import HTML
-from openpyxl import Workbook
 from django.contrib.staticfiles import finders
 from django.db.models import Min, Max
-from django.utils import timezone
-from openpyxl.drawing.image import Image
-from openpyxl.styles import Alignment, Font
+from django.core.paginator import Paginator
+from django.utils import formats, timezone
 from django.utils.dateparse import parse_date
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.db import IntegrityError
 import pandas as pd
 from datetime import datetime
 from django.core.exceptions import ValidationError
 from decimal import Decimal
+import asyncio
+import json
+from io import StringIO
+from asgiref.sync import sync_to_async
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from . import (
+    anomalies, archive, audit, columnar, disbursement, exports, importer, ledger, periods, profiling, projects, punches,
+    rendering, reporting, upload_template,
+)
+
+# Maximum number of validation errors shown after a failed batch upload.
+MAX_UPLOAD_ERRORS = 20
+
+# Employees without a bank account named in the error of a refused disbursement file.
+MAX_MISSING_ACCOUNTS = 20
+
+# Employees per page of the all-employee summary.
+SUMMARY_PAGE_SIZE = 50
+
+# Anomalies per page of the shift anomaly report.
+ANOMALY_PAGE_SIZE = 50
+
+# Audit entries per page of the audit trail.
+AUDIT_PAGE_SIZE = 50
+
+# Fields of a payroll row that can be edited inline on the payroll summary.
+INLINE_EDIT_FIELDS = [
+    'time_in', 'time_out', 'daily_rate', 'total_hours_worked', 'overtime_hour',
+    'night_differential_hour', 'allowance', 'deductions', 'deduction_remarks',
+]
+
+# Fields returned for an inline-edited row, in the order of the summary table.
+INLINE_ROW_FIELDS = [
+    'date', 'time_in', 'time_out', 'total_hours_worked', 'daily_rate', 'overtime_hour', 'overtime_pay',
+    'night_differential_hour', 'night_differential_pay', 'allowance', 'subtotal', 'deductions',
+    'deduction_remarks', 'net_salary',
+]
+
+# (sort key, column heading) of the all-employee summary table.
+SUMMARY_COLUMNS = [
+    ('name', 'Employee'),
+    ('days_worked', 'Days Worked'),
+    ('first_date', 'First Date'),
+    ('last_date', 'Last Date'),
+    ('total_hours_worked', 'Total Hours Worked'),
+    ('overtime_pay', 'Overtime Pay'),
+    ('night_differential_pay', 'Night Differential Pay'),
+    ('allowance', 'Allowance'),
+    ('subtotal', 'Subtotal (Gross Salary)'),
+    ('deductions', 'Deductions'),
+    ('net_salary', 'Net Salary'),
+]
+
+def _parse_date(value):
+    """
+    Parses a yyyy-mm-dd request parameter, returning None when it is empty or not a valid date.
+
+    parse_date returns None for malformed values but raises ValueError for well-formed
+    ones that are not a real date, such as 2024-02-30.
+    """
+    try:
+        return parse_date(value) if value else None
+    except ValueError:
+        return None
 
 def dashboard(request):
     return redirect('employee_list')
@@ -106,37 +171,60 @@ def generatePayroll(request):
         form = PayrollForm()
         return render(request, 'generate_payroll.html', {'form': form})
 
+@reporting.reporting_reads
 def payrollSummary(request):
     """
     View to display the payroll summary for all employees or a specific employee.
 
-    This view displays a list of generated payrolls, with the option to filter by employee.
-    The summary will show the payroll details such as the employee's name, pay period, 
-    gross salary, deductions, and net salary.
+    With an employee selected, this view lists that employee's payroll records for the
+    period with their totals and year-to-date figures. Without one, it shows one line per
+    employee with the period's totals, computed by the database in a single grouped query;
+    the sort GET parameter orders the lines by any total ('-' prefix for descending) and
+    page selects the page.
     """
-    employees = Employee.objects.all()
+    employees = directory.current_directory()
     selected_employee = None
-    payrolls = Payroll.objects.all()
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
 
     if request.method == 'GET':
         selected_employee_id = request.GET.get('employee')
         if selected_employee_id:
-            selected_employee = get_object_or_404(Employee, id=selected_employee_id)
-            payrolls = Payroll.objects.filter(employee=selected_employee)
-        if start_date:
-            payrolls = payrolls.filter(date__gte=parse_date(start_date))
-        if end_date:
-            payrolls = payrolls.filter(date__lte=parse_date(end_date))
-
-        total_hours_worked = sum(payroll.total_hours_worked for payroll in payrolls)
-        total_overtime_pay = sum(payroll.overtime_pay for payroll in payrolls)
-        total_night_differential_pay = sum(payroll.night_differential_pay for payroll in payrolls)
-        allowance = sum(payroll.allowance for payroll in payrolls)
-        total_deductions = sum(payroll.deductions for payroll in payrolls)
-        total_gross_salary = sum(payroll.subtotal for payroll in payrolls)
-        total_net_salary = sum(payroll.net_salary for payroll in payrolls)
+            selected_employee = directory.get_entry_or_404(selected_employee_id, employees)
+        employee_id = selected_employee.id if selected_employee else None
+
+        # Archived records are included automatically when the range reaches back into the archive.
+        period_start = _parse_date(start_date)
+        period_end = _parse_date(end_date)
+        totals = archive.history_totals(employee_id, period_start, period_end)
+
+        total_hours_worked = totals['total_hours_worked']
+        total_overtime_pay = totals['overtime_pay']
+        total_night_differential_pay = totals['night_differential_pay']
+        allowance = totals['allowance']
+        total_deductions = totals['deductions']
+        total_gross_salary = totals['subtotal']
+        total_net_salary = totals['net_salary']
+
+        payrolls = []
+        ytd = None
+        summary_page = None
+        summary_columns = None
+        sort = request.GET.get('sort', 'name')
+        if sort.lstrip('-') not in archive.SUMMARY_SORTS:
+            sort = 'name'
+        if selected_employee:
+            payrolls = archive.payroll_history(employee_id, period_start, period_end)
+            ytd = ledger.year_to_date(employee_id, period_end or timezone.localdate())
+        else:
+            page = request.GET.get('page', '1')
+            summary_page = archive.employee_period_totals(
+                period_start, period_end, sort, int(page) if page.isdigit() else 1, SUMMARY_PAGE_SIZE
+            )
+            summary_columns = [
+                {'label': label, 'sort': f'-{key}' if sort == key else key, 'active': sort.lstrip('-') == key}
+                for key, label in SUMMARY_COLUMNS
+            ]
 
         return render(request, 'payroll_summary.html', {
             'payrolls': payrolls,
@@ -151,27 +239,372 @@ def payrollSummary(request):
             'allowance': allowance,
             'total_deductions': total_deductions,
             'total_gross_salary': total_gross_salary,
-            'total_net_salary': total_net_salary
+            'total_net_salary': total_net_salary,
+            'ytd': ytd,
+            'summary_page': summary_page,
+            'summary_columns': summary_columns,
+            'sort': sort,
         })
 
-def exportPayslipPdf(request, employee_id):
+@reporting.reporting_reads
+def exportPayrollCsv(request):
     """
-    Generate and return a PDF payslip for a specific employee, including the company logo,
-    name, position, pay period, date generated, daily rate, and summary.
+    Stream payroll records for all employees as a CSV download.
+
+    Optional GET parameters filter the export by start_date, end_date (yyyy-mm-dd) and
+    project. Passing compress=gzip returns a gzip-compressed .csv.gz file instead.
+    Rows are streamed straight from the database, so large periods download without
+    being built up in memory first.
+    """
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    period_start = _parse_date(start_date)
+    period_end = _parse_date(end_date)
+    if (start_date and not period_start) or (end_date and not period_end):
+        messages.error(request, "Invalid date range for the CSV export (expected yyyy-mm-dd).")
+        return redirect('payroll_summary')
+
+    project = request.GET.get('project', '').strip() or None
+    rows = exports.export_rows(period_start, period_end, project)
+    filename = f"payroll_{start_date or 'start'}_to_{end_date or 'end'}"
+    if project:
+        filename += f"_{project}"
+    filename = ''.join(character if character.isalnum() or character in '-_' else '_' for character in filename)
+
+    if request.GET.get('compress') == 'gzip':
+        response = StreamingHttpResponse(exports.gzip_chunks(exports.csv_chunks(rows)), content_type='application/gzip')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv.gz"'
+    else:
+        response = StreamingHttpResponse(exports.csv_chunks(rows), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+@reporting.reporting_reads
+def projectCosts(request):
+    """
+    View to report labor cost per project, with drill-down to employees and days.
+
+    Without a project the view lists every project's totals over the optional start_date
+    and end_date range. The project GET parameter ('' for records without a project)
+    shows that project's employees and its daily totals, and adding employee shows the
+    employee's individual days on the project. Project and daily totals are read from
+    the ProjectDailyCost rollups; employees and days are indexed range scans.
+    """
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    period_start = _parse_date(start_date)
+    period_end = _parse_date(end_date)
+    if (start_date and not period_start) or (end_date and not period_end):
+        messages.error(request, "Invalid date range (expected yyyy-mm-dd).")
+        period_start = period_end = None
+        start_date = end_date = None
+
+    context = {'start_date': start_date, 'end_date': end_date}
+    project = request.GET.get('project')
+    if project is None:
+        context['project_rows'] = projects.project_totals(period_start, period_end)
+        return render(request, 'project_costs.html', context)
+
+    context['project'] = project
+    employee_id = request.GET.get('employee')
+    if employee_id:
+        context['selected_employee'] = directory.get_entry_or_404(employee_id)
+        context['day_rows'] = projects.employee_days(project, employee_id, period_start, period_end)
+    else:
+        context['employee_rows'] = projects.project_employees(project, period_start, period_end)
+        context['daily_rows'] = projects.project_days(project, period_start, period_end)
+    return render(request, 'project_costs.html', context)
+
+def payrollAnomalies(request):
+    """
+    View to review overlapping and implausible shifts found by the anomaly detector.
+
+    GET lists the anomalies, newest dates first, filtered by the optional kind and
+    status ('open', 'resolved' or 'all'; open by default) parameters. POST marks the
+    anomalies whose ids are given as 'anomaly' as resolved, so later scans keep them
+    out of the open list. The records themselves are corrected on the edit page.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: The rendered report, or a redirect back to it after a POST.
+    """
+    if request.method == 'POST':
+        ids = request.POST.getlist('anomaly')
+        resolved = PayrollAnomaly.objects.filter(id__in=ids, resolved=False).update(resolved=True)
+        messages.success(request, f"{resolved} anomalies marked as resolved.")
+        return redirect(request.get_full_path())
+
+    kind = request.GET.get('kind', '')
+    status = request.GET.get('status', 'open')
+    queryset = PayrollAnomaly.objects.select_related('employee', 'payroll', 'other_payroll').order_by(
+        '-date', 'employee_id', 'kind'
+    )
+    if kind in dict(PayrollAnomaly.KIND_CHOICES):
+        queryset = queryset.filter(kind=kind)
+    else:
+        kind = ''
+    if status == 'open':
+        queryset = queryset.filter(resolved=False)
+    elif status == 'resolved':
+        queryset = queryset.filter(resolved=True)
+    else:
+        status = 'all'
+
+    page = Paginator(queryset, ANOMALY_PAGE_SIZE).get_page(request.GET.get('page'))
+    return render(request, 'anomalies.html', {
+        'page': page,
+        'kind': kind,
+        'status': status,
+        'kind_choices': PayrollAnomaly.KIND_CHOICES,
+    })
+
+@staff_member_required
+def auditTrail(request):
+    """
+    Staff page listing the audited changes to payroll records and employees, newest first.
+
+    The optional GET parameters filter the entries by employee (id), user (username) and
+    a period of record dates (start_date and end_date, yyyy-mm-dd); a period only matches
+    payroll changes, since employee changes have no record date.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: The rendered audit trail.
     """
-    employee = get_object_or_404(Employee, id=employee_id)
-    payrolls = Payroll.objects.filter(employee=employee)
+    employee_id = request.GET.get('employee', '')
+    username = request.GET.get('user', '').strip()
+    start_date = request.GET.get('start_date', '')
+    end_date = request.GET.get('end_date', '')
+
+    entries = AuditEntry.objects.all()
+    if employee_id.isdigit():
+        entries = entries.filter(employee_id=int(employee_id))
+    else:
+        employee_id = ''
+    if username:
+        entries = entries.filter(username=username)
+    period_start = _parse_date(start_date)
+    period_end = _parse_date(end_date)
+    if period_start:
+        entries = entries.filter(record_date__gte=period_start)
+    if period_end:
+        entries = entries.filter(record_date__lte=period_end)
+
+    employees = directory.current_directory()
+    page = Paginator(entries, AUDIT_PAGE_SIZE).get_page(request.GET.get('page'))
+    rows = [
+        {'entry': entry, 'employee': employees.get(entry.employee_id), 'changes': audit.decode_changes(entry)}
+        for entry in page
+    ]
+    return render(request, 'audit_trail.html', {
+        'page': page,
+        'rows': rows,
+        'employees': employees,
+        'employee_id': employee_id,
+        'username': username,
+        'start_date': start_date,
+        'end_date': end_date,
+    })
+
+def payPeriods(request):
+    """
+    View to list the pay periods with their status.
+
+    Periods are created, closed and reopened in the admin or with the close_pay_period command.
+    """
+    return render(request, 'pay_periods.html', {'periods': PayPeriod.objects.all()})
+
+def payPeriodDetail(request, period_id):
+    """
+    View to display a pay period.
+
+    For a closed period, the per-employee totals are read from the snapshot written when it
+    was closed, with links to the stored payslips, the totals CSV and the bank disbursement
+    files. An open period links to the live payroll summary for its dates instead.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        period_id (int): The ID of the pay period.
+
+    Returns:
+        HttpResponse: Renders the 'pay_period_detail.html' template.
+    """
+    period = get_object_or_404(PayPeriod, id=period_id)
+    totals = []
+    period_totals = {}
+    missing_accounts = []
+    if period.is_closed:
+        totals = PayPeriodTotal.objects.filter(period=period).order_by('last_name', 'first_name', 'employee_id')
+        period_totals = columnar.totals(totals)
+        missing_accounts = disbursement.missing_accounts(period)
+    return render(request, 'pay_period_detail.html', {
+        'period': period,
+        'totals': totals,
+        'period_totals': period_totals,
+        'disbursement_formats': disbursement.writer_formats(),
+        'missing_accounts': missing_accounts,
+    })
+
+def _snapshot_response(request, period, version, etag, build_response):
+    """
+    Serves a snapshot of a closed period with permanent, private cache headers.
+
+    Snapshots hold personal pay data, so only the user's browser may keep them; shared
+    proxies and CDNs must not.
+
+    The URL carries the period version; requests for an older version are redirected to
+    the current one, and snapshots of a reopened period no longer exist.
+    """
+    if not period.is_closed:
+        raise Http404("The pay period is open; it has no snapshots.")
+    if version != period.version:
+        return None
+    response = get_conditional_response(request, etag=f'"{etag}"') or build_response()
+    response['ETag'] = f'"{etag}"'
+    patch_cache_control(response, private=True, max_age=periods.SNAPSHOT_MAX_AGE, immutable=True)
+    return response
+
+def payPeriodPayslip(request, period_id, version, employee_id, file_format):
+    """
+    Serves the PDF or Excel payslip rendered when the pay period was closed.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        period_id (int): The ID of the pay period.
+        version (int): The period version the URL was built for.
+        employee_id (int): The ID of the employee.
+        file_format (str): 'pdf' or 'xlsx'.
+
+    Returns:
+        HttpResponse: The stored payslip, cached permanently by the browser.
+    """
+    period = get_object_or_404(PayPeriod, id=period_id)
+    payslip = get_object_or_404(PayPeriodPayslip, period=period, employee_id=employee_id, format=file_format)
+    content_types = {
+        PayPeriodPayslip.FORMAT_PDF: 'application/pdf',
+        PayPeriodPayslip.FORMAT_XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    }
+
+    def build_response():
+        total = PayPeriodTotal.objects.get(period=period, employee_id=employee_id)
+        response = HttpResponse(bytes(payslip.content), content_type=content_types[file_format])
+        response['Content-Disposition'] = (
+            f'attachment; filename="payslip_{total.first_name}_{total.last_name}_{period.start_date}.{file_format}"'
+        )
+        return response
+
+    response = _snapshot_response(request, period, version, payslip.checksum, build_response)
+    if response is None:
+        return redirect('pay_period_payslip', period.id, period.version, employee_id, file_format)
+    return response
+
+def payPeriodTotalsCsv(request, period_id, version):
+    """
+    Serves the frozen per-employee totals of a closed pay period as CSV.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        period_id (int): The ID of the pay period.
+        version (int): The period version the URL was built for.
+
+    Returns:
+        HttpResponse: The CSV, cached permanently by the browser.
+    """
+    period = get_object_or_404(PayPeriod, id=period_id)
+
+    def build_response():
+        response = HttpResponse(periods.totals_csv(period), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="pay_period_{period.start_date}_{period.end_date}.csv"'
+        return response
+
+    response = _snapshot_response(request, period, version, f'{period.id}-{period.version}', build_response)
+    if response is None:
+        return redirect('pay_period_totals_csv', period.id, period.version)
+    return response
+
+@staff_member_required
+def payPeriodDisbursement(request, period_id, file_format):
+    """
+    Streams the bank disbursement file of a closed pay period.
+
+    The payouts are read with one grouped query while the file is written, and the file
+    is reconciled with the period's frozen totals before its trailer is written (see
+    payroll.disbursement). Periods that are open or have employees without a bank account
+    redirect back to the period with an error instead.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        period_id (int): The ID of the pay period.
+        file_format (str): A format name from settings.PAYROLL_DISBURSEMENT_WRITERS, e.g. 'csv' or 'fixed'.
+
+    Returns:
+        StreamingHttpResponse: The payout file as a download.
+    """
+    period = get_object_or_404(PayPeriod, id=period_id)
+    try:
+        writer = disbursement.get_writer_class(file_format)(period)
+    except disbursement.DisbursementError as e:
+        raise Http404(str(e))
+
+    try:
+        chunks = disbursement.file_chunks(period, writer)
+    except disbursement.DisbursementError as e:
+        messages.error(request, str(e))
+        return redirect('pay_period_detail', period.id)
+    missing = list(disbursement.missing_accounts(period)[:MAX_MISSING_ACCOUNTS])
+    if missing:
+        names = ', '.join(str(employee) for employee in missing)
+        messages.error(request, f"Add the bank accounts of these employees before disbursing: {names}")
+        return redirect('pay_period_detail', period.id)
+
+    response = StreamingHttpResponse(chunks, content_type=writer.content_type)
+    response['Content-Disposition'] = f'attachment; filename="{writer.filename()}"'
+    return response
+
+async def _render(function, *args):
+    """
+    Runs a rendering function on the render pool and wraps the outcome in a response.
+
+    Returns:
+        tuple: (content, None) on success, or (None, HttpResponse) with 503 and Retry-After
+               when the pool is saturated, or 504 when rendering timed out.
+    """
+    try:
+        with profiling.phase(function.__name__):
+            content = await rendering.shared_pool().run(function, *args, timeout=settings.PAYROLL_RENDER_TIMEOUT)
+    except rendering.RenderPoolBusy:
+        response = HttpResponse("The server is busy generating other payslips. Please try again shortly.", status=503)
+        response['Retry-After'] = str(settings.PAYROLL_RENDER_RETRY_AFTER)
+        return None, response
+    except asyncio.TimeoutError:
+        return None, HttpResponse("Generating the payslip took too long. Please try again later.", status=504)
+    return content, None
+
+def _payslip_pdf_document(request, employee_id):
+    """
+    Loads the payslip data and renders the payslip HTML for exportPayslipPdf.
+
+    Returns:
+        tuple: (employee, html_string, css_path), or an HttpResponse if the payslip cannot be generated.
+    """
+    employee = directory.get_entry_or_404(employee_id)
+    payrolls = Payroll.objects.filter(employee_id=employee.id)
 
     if not payrolls:
         return HttpResponse("No payroll records found for this employee.", status=404)
 
-    total_hours_worked = sum(payroll.total_hours_worked for payroll in payrolls)
-    total_overtime_pay = sum(payroll.overtime_pay for payroll in payrolls)
-    total_night_differential_pay = sum(payroll.night_differential_pay for payroll in payrolls)
-    allowance = sum(payroll.allowance for payroll in payrolls)
-    total_deductions = sum(payroll.deductions for payroll in payrolls)
-    total_gross_salary = sum(payroll.subtotal for payroll in payrolls)
-    total_net_salary = sum(payroll.net_salary for payroll in payrolls)
+    totals = columnar.totals(payrolls)
+    total_hours_worked = totals['total_hours_worked']
+    total_overtime_pay = totals['overtime_pay']
+    total_night_differential_pay = totals['night_differential_pay']
+    allowance = totals['allowance']
+    total_deductions = totals['deductions']
+    total_gross_salary = totals['subtotal']
+    total_net_salary = totals['net_salary']
     pay_period_from = payrolls.aggregate(Min('date'))['date__min']
     pay_period_to = payrolls.aggregate(Max('date'))['date__max']
     current_date = timezone.now()
@@ -190,7 +623,8 @@ def exportPayslipPdf(request, employee_id):
         'pay_period_from': pay_period_from,
         'pay_period_to': pay_period_to,
         'current_date': current_date,
-        'daily_rate': daily_rate
+        'daily_rate': daily_rate,
+        'ytd': ledger.year_to_date(employee.id, pay_period_to)
     })
 
     css_path = finders.find('css/payslip.css')
@@ -198,118 +632,86 @@ def exportPayslipPdf(request, employee_id):
     if not css_path:
         return HttpResponse("CSS file not found.", status=404)
 
-    pdf_file = HTML(string=html_string,base_url=request.build_absolute_uri()).write_pdf(stylesheets=[css_path])
+    return employee, html_string, css_path
+
+@reporting.reporting_reads
+async def exportPayslipPdf(request, employee_id):
+    """
+    Generate and return a PDF payslip for a specific employee, including the company logo,
+    name, position, pay period, date generated, daily rate, and summary.
+
+    The payslip data is loaded on the request side; the PDF itself is rendered on a bounded
+    process pool so concurrent exports do not block other pages. When the pool is full the
+    response is 503 with a Retry-After header, and 504 when rendering times out.
+    """
+    document = await sync_to_async(_payslip_pdf_document)(request, employee_id)
+    if isinstance(document, HttpResponse):
+        return document
+    employee, html_string, css_path = document
+
+    pdf_file, error_response = await _render(
+        rendering.render_pdf, html_string, request.build_absolute_uri(), [css_path]
+    )
+    if error_response:
+        return error_response
 
     response = HttpResponse(pdf_file, content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="payslip_{employee.first_name}_{employee.last_name}.pdf"'
     return response
 
 
-def generatePayslipExcel(request, employee_id):
+def _payslip_excel_data(employee_id):
     """
-    Generate and return an Excel payslip for a specific employee, including the company logo, 
-    name, position, pay period, date generated, daily rate, and summary.
+    Loads the plain values rendering.build_payslip_workbook needs for generatePayslipExcel.
+
+    Returns:
+        tuple: (employee, payslip), or an HttpResponse if the employee has no payroll records.
     """
-    employee = get_object_or_404(Employee, id=employee_id)
-    payrolls = Payroll.objects.filter(employee=employee).select_related('employee')
+    employee = directory.get_entry_or_404(employee_id)
+    payrolls = Payroll.objects.filter(employee_id=employee.id)
 
     if not payrolls:
         return HttpResponse("No payroll records found for this employee.", status=404)
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Payslip"
-
-    logo_path = finders.find('img/company_logo.png')
-    if logo_path:
-        img = Image(logo_path)
-        img.width = 120
-        img.height = 80
-        ws.add_image(img, 'A1')
-    
-    ws.merge_cells('C1:G1')
-    ws['C1'] = "HODREAL FIT-OUT AND CONSTRUCTION"
-    ws['C1'].alignment = Alignment(horizontal='left', vertical='center')
-    ws['C1'].font = Font(bold=True, size=14)
-    
-    ws.merge_cells('C2:J2')
-    ws['C2'] = "Bantangas City | Contact: 09217292222 | Email: hodrealconstruction@yahoo.com"
-    ws['C2'].alignment = Alignment(horizontal='left', vertical='center')
-    ws['C2'].font = Font(size=10)
-
-    row_offset = 5 
-
-    ws.merge_cells(f'A{row_offset}:F{row_offset}')
-    ws[f'A{row_offset}'] = f"Employee: {employee.first_name} {employee.last_name}"
-    ws[f'A{row_offset}'].font = Font(bold=True)
-    ws[f'A{row_offset}'].alignment = Alignment(horizontal='left')
-
-    ws.merge_cells(f'A{row_offset + 1}:F{row_offset + 1}')
-    ws[f'A{row_offset + 1}'] = f"Position: {employee.position}"
-    ws[f'A{row_offset + 1}'].font = Font(bold=True)
-    ws[f'A{row_offset + 1}'].alignment = Alignment(horizontal='left')
-
-    pay_period_from = payrolls.aggregate(Min('date'))['date__min']
     pay_period_to = payrolls.aggregate(Max('date'))['date__max']
+    payslip = {
+        'employee_name': f"{employee.first_name} {employee.last_name}",
+        'position': employee.position,
+        'pay_period_from': payrolls.aggregate(Min('date'))['date__min'],
+        'pay_period_to': pay_period_to,
+        'generated_on': timezone.now(),
+        'daily_rate': payrolls.first().daily_rate,
+        'rows': list(payrolls.values_list(
+            'date', 'overtime_pay', 'night_differential_pay', 'allowance', 'deductions', 'net_salary'
+        )),
+        'totals': columnar.totals(payrolls),
+        'ytd': ledger.year_to_date(employee.id, pay_period_to),
+        'logo_path': finders.find('img/company_logo.png'),
+    }
+    return employee, payslip
 
-    ws.merge_cells(f'A{row_offset + 2}:F{row_offset + 2}')
-    ws[f'A{row_offset + 2}'] = f"Pay Period: {pay_period_from.strftime('%Y-%m-%d')} - {pay_period_to.strftime('%Y-%m-%d')}"
-    ws[f'A{row_offset + 2}'].font = Font(bold=True)
-    ws[f'A{row_offset + 2}'].alignment = Alignment(horizontal='left')
-
-    ws.merge_cells(f'A{row_offset + 3}:F{row_offset + 3}')
-    ws[f'A{row_offset + 3}'] = f"Date Generated: {timezone.now().strftime('%Y-%m-%d')}"
-    ws[f'A{row_offset + 3}'].font = Font(bold=True)
-    ws[f'A{row_offset + 3}'].alignment = Alignment(horizontal='left')
-
-    daily_rate = payrolls.first().daily_rate
-    ws.merge_cells(f'A{row_offset + 4}:F{row_offset + 4}')
-    ws[f'A{row_offset + 4}'] = f"Daily Rate: {daily_rate}"
-    ws[f'A{row_offset + 4}'].font = Font(bold=True)
-    ws[f'A{row_offset + 4}'].alignment = Alignment(horizontal='left')
+@reporting.reporting_reads
+async def generatePayslipExcel(request, employee_id):
+    """
+    Generate and return an Excel payslip for a specific employee, including the company logo, 
+    name, position, pay period, date generated, daily rate, and summary.
 
-    row_offset += 7
+    The workbook is built on the same bounded process pool as the PDF payslip.
+    """
+    data = await sync_to_async(_payslip_excel_data)(employee_id)
+    if isinstance(data, HttpResponse):
+        return data
+    employee, payslip = data
 
-    headers = [
-        "Date", "Overtime", "Night Differential", "Allowance", "Deductions", "Total Amount"
-    ]
-    for col_num, header in enumerate(headers, 1):
-        ws.cell(row=row_offset, column=col_num, value=header)
-    
-    for payroll in payrolls:
-        ws.append([
-            payroll.date.strftime("%Y-%m-%d"),
-            payroll.overtime_pay,
-            payroll.night_differential_pay,
-            payroll.allowance,
-            payroll.deductions,
-            payroll.net_salary
-        ])
-
-    total_hours_worked = sum(payroll.total_hours_worked for payroll in payrolls)
-    total_overtime_pay = sum(payroll.overtime_pay for payroll in payrolls)
-    total_night_differential_pay = sum(payroll.night_differential_pay for payroll in payrolls)
-    total_allowance = sum(payroll.allowance for payroll in payrolls)
-    total_deductions = sum(payroll.deductions for payroll in payrolls)
-    total_gross_salary = sum(payroll.subtotal for payroll in payrolls)
-    total_net_salary = sum(payroll.net_salary for payroll in payrolls)
-
-    row_offset += len(payrolls) + 3 
-
-    ws[f'A{row_offset}'] = f"Total Hours Worked: {total_hours_worked}"
-    ws[f'A{row_offset + 1}'] = f"Total Overtime Pay: {total_overtime_pay}"
-    ws[f'A{row_offset + 2}'] = f"Total Night Differential Pay: {total_night_differential_pay}"
-    ws[f'A{row_offset + 3}'] = f"Total Allowance: {total_allowance}"
-    ws[f'A{row_offset + 4}'] = f"Total Deductions: {total_deductions}"
-    ws[f'A{row_offset + 5}'] = f"Total Gross Salary: {total_gross_salary}"
-    ws[f'A{row_offset + 6}'] = f"Total Net Salary: {total_net_salary}"
+    content, error_response = await _render(rendering.build_payslip_workbook, payslip)
+    if error_response:
+        return error_response
 
     response = HttpResponse(
+        content,
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
     response['Content-Disposition'] = f'attachment; filename="payslip_{employee.first_name}_{employee.last_name}.xlsx"'
-
-    wb.save(response)
     return response
 
 def editPayroll(request, payroll_id):
@@ -318,10 +720,14 @@ def editPayroll(request, payroll_id):
 
     This view handles both displaying the edit form and processing the submitted data.
     - If the request method is GET, the current payroll details are displayed in a form for editing.
-    - If the request method is POST, the form is validated, and if successful, the payroll record is updated in the database.
-    - In case of a successful update, a success message is displayed, and the user is redirected to the payroll summary page.
-    - If there is an error while updating the record (e.g., database constraint issues), an error message is shown to the user.
+    - If the request method is POST, the form is validated, and if successful, the payroll record
+      is updated in the database.
+    - In case of a successful update, a success message is displayed, and the user is redirected
+      to the payroll summary page.
+    - If there is an error while updating the record (e.g., database constraint issues), an error
+      message is shown to the user.
     - If the form contains errors, those errors are displayed next to the relevant fields.
+    - Records within a closed pay period cannot be edited; the user is sent back to the summary.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -332,6 +738,11 @@ def editPayroll(request, payroll_id):
         If the form is valid, the user is redirected to the payroll summary page.
     """
     payroll = get_object_or_404(Payroll, id=payroll_id)
+    try:
+        periods.check_open([payroll.date])
+    except periods.PeriodClosed as e:
+        messages.error(request, str(e))
+        return redirect('payroll_summary')
     if request.method == 'POST':
         form = PayrollForm(request.POST, instance=payroll)
         if form.is_valid():
@@ -359,6 +770,121 @@ def editPayroll(request, payroll_id):
         # print(form.initial)
     return render(request, 'edit_payroll.html', {'form': form})
 
+def _in_period(record_date, start_date, end_date):
+    return (start_date is None or record_date >= start_date) and (end_date is None or record_date <= end_date)
+
+def _total_deltas(old_values, new_values, start_date, end_date):
+    """
+    Returns how an edit changes the sums of the payroll columns over a date range.
+
+    A record moved into or out of the range adds or removes all of its values.
+    """
+    deltas = {}
+    was_in = _in_period(old_values['date'], start_date, end_date)
+    is_in = _in_period(new_values['date'], start_date, end_date)
+    for field in columnar.TOTAL_FIELDS:
+        old = old_values[field] if was_in else Decimal(0)
+        new = new_values[field] if is_in else Decimal(0)
+        deltas[field] = new - old
+    deltas['days_worked'] = int(is_in) - int(was_in)
+    return deltas
+
+@require_POST
+def updatePayrollInline(request, payroll_id):
+    """
+    Updates fields of a payroll record edited inline on the payroll summary page.
+
+    The POST data holds only the edited fields (see INLINE_EDIT_FIELDS); every other
+    field keeps its stored value. Records within a closed pay period are rejected. The
+    record is validated with the PayrollForm rules, which also recompute the pay
+    columns, and only the columns whose value changed are written. Instead of the
+    summary being recomputed, the response carries the differences to add to the
+    totals shown for the page's start_date and end_date and to the year-to-date
+    figures as of end_date (today without one).
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        payroll_id (int): The ID of the payroll record to be updated.
+
+    Returns:
+        JsonResponse: 'row' with the record's displayed values, 'in_period' telling whether
+        it is still within the range, 'deltas' and 'ytd_deltas'; or 'errors' with status 400.
+    """
+    payroll = get_object_or_404(Payroll, id=payroll_id)
+    try:
+        periods.check_open([payroll.date])
+    except periods.PeriodClosed as e:
+        return JsonResponse({'errors': {'__all__': [str(e)]}}, status=400)
+    old_values = dict(payroll._loaded_values)
+
+    data = {}
+    for field in PayrollForm.Meta.fields:
+        value = getattr(payroll, 'employee_id' if field == 'employee' else field)
+        if field in ('time_in', 'time_out'):
+            value = timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S')
+        data[field] = value
+    for field in INLINE_EDIT_FIELDS:
+        if field in request.POST:
+            data[field] = request.POST[field]
+
+    form = PayrollForm(data, instance=payroll)
+    if not form.is_valid():
+        return JsonResponse({'errors': {
+            field: [str(error) for error in errors] for field, errors in form.errors.items()
+        }}, status=400)
+
+    payroll.date = timezone.localtime(form.cleaned_data['time_in']).date()
+    changed = [
+        field.attname for field in Payroll._meta.concrete_fields
+        if field.attname in old_values and getattr(payroll, field.attname) != old_values[field.attname]
+        # The form cleans empty text to '' where older records may hold NULL.
+        and not (getattr(payroll, field.attname) in ('', None) and old_values[field.attname] in ('', None))
+    ]
+    if changed:
+        try:
+            payroll.save(update_fields=changed)
+        except IntegrityError:
+            return JsonResponse({'errors': {
+                'time_in': [f"A payroll record for this employee on {payroll.date} already exists."]
+            }}, status=400)
+
+    new_values = {field: getattr(payroll, field) for field in ['date'] + columnar.TOTAL_FIELDS}
+    start_date = _parse_date(request.POST.get('start_date'))
+    end_date = _parse_date(request.POST.get('end_date'))
+    as_of = end_date or timezone.localdate()
+    deltas = _total_deltas(old_values, new_values, start_date, end_date)
+    ytd_deltas = _total_deltas(old_values, new_values, as_of.replace(month=1, day=1), as_of)
+
+    # Displayed the way the summary template renders them, plus the raw values for the inputs.
+    displayed = {}
+    for field in INLINE_ROW_FIELDS:
+        value = getattr(payroll, field)
+        decimal_places = getattr(Payroll._meta.get_field(field), 'decimal_places', None)
+        if decimal_places is not None:
+            value = Decimal(value).quantize(Decimal(1).scaleb(-decimal_places))
+        displayed[field] = value
+    row = {}
+    for field, value in displayed.items():
+        if field in ('time_in', 'time_out'):
+            value = formats.date_format(timezone.localtime(value), 'DATETIME_FORMAT')
+        elif field == 'date':
+            value = formats.date_format(value, 'DATE_FORMAT')
+        row[field] = str(value)
+    inputs = {field: str(displayed[field]) for field in INLINE_EDIT_FIELDS}
+    for field in ('time_in', 'time_out'):
+        inputs[field] = timezone.localtime(displayed[field]).strftime('%Y-%m-%dT%H:%M')
+    return JsonResponse({
+        'row': row,
+        'inputs': inputs,
+        'changed': changed,
+        'in_period': _in_period(payroll.date, start_date, end_date),
+        'deltas': {field: str(value) for field, value in deltas.items()},
+        'ytd_deltas': {
+            'days_worked': ytd_deltas['days_worked'],
+            **{name: str(ytd_deltas[field]) for name, field in ledger.LEDGER_SOURCES.items()},
+        },
+    })
+
 def deletePayroll(request, payroll_id):
     """
     Deletes a payroll record based on the provided payroll ID.
@@ -366,6 +892,7 @@ def deletePayroll(request, payroll_id):
     This view handles the deletion of an existing payroll record from the database.
     - If the request method is POST, the payroll record is deleted, and a success message is displayed.
     - After deletion, the user is redirected to the payroll summary page.
+    - Records within a closed pay period are not deleted; an error message is shown instead.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -376,153 +903,272 @@ def deletePayroll(request, payroll_id):
     """
     payroll = get_object_or_404(Payroll, id=payroll_id)
     if request.method == 'POST':
+        try:
+            periods.check_open([payroll.date])
+        except periods.PeriodClosed as e:
+            messages.error(request, str(e))
+            return redirect('payroll_summary')
         payroll.delete()
         messages.success(request, 'Payroll record deleted successfully.')
     return redirect('payroll_summary')
 
 def batchUpload(request):
     """
-    Handles the bulk upload of payroll records from an Excel file.
+    Handles the bulk upload of payroll records from Excel files.
 
-    This view allows users to upload an Excel file containing payroll information, validate the data, 
-    and save the records to the database. The process includes the following steps:
-    - The user uploads an Excel file containing payroll data.
-    - The uploaded file is validated to ensure it contains the required columns.
-    - Missing or invalid data is handled appropriately (e.g., setting missing values to defaults).
-    - The payroll records are created for each row in the uploaded file, associating each record with an existing employee.
-    - Errors in processing, such as missing required columns or invalid employee IDs, are communicated to the user.
+    This view allows users to upload one or more Excel/CSV files (or a ZIP of them) containing
+    payroll information, validate the data, and save the records to the database. The process
+    includes the following steps:
+    - The uploaded files are expanded (ZIP archives are unpacked) and parsed in parallel worker
+      processes, optionally reading every sheet of each workbook.
+    - Each sheet is validated to ensure it contains the required columns and valid values.
+    - Missing data is handled appropriately (e.g., setting missing values to defaults).
+    - Files uploaded before with the same content, and unchanged chunks of rows of a file
+      uploaded before under the same name, are skipped without being parsed.
+    - Rows are checked for unknown employees and for duplicate (employee_id, date) entries,
+      both across the uploaded files and against existing payroll records that were not
+      imported from an earlier upload of the same file.
+    - If everything is valid, new records are created and records imported from the earlier
+      upload of the same file are overwritten where their row changed, in bulk; rows
+      identical to the ones their records were imported from are left alone.
 
     Args:
         request (HttpRequest): The HTTP request object.
     Returns:
         HttpResponse: Renders the 'batch_upload.html' template with the form. 
-            If the file is successfully uploaded, the user is redirected with a success message.
+            If the files are successfully uploaded, the user is redirected with a success message.
             If there are errors during the process (e.g., missing columns, employee not found), 
-            an error message is shown and the user is redirected to the upload page.
+            error messages are shown and the user is redirected to the upload page.
     """
     # Date format: yyyy-mm-dd
-    # Time format: hh:mm AM/PM
-    if request.method == 'POST' and request.FILES['excel_file']:
+    # Time format: hh:mm:ss
+    if request.method == 'POST':
         form = PayrollUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            excel_file = request.FILES['excel_file']
             try:
-                df = pd.read_excel(excel_file)
-                required_columns = [
-                    'employee_id', 'daily_rate', 'allowance', 'total_hours_worked', 'overtime_pay', 
-                    'overtime_hour', 'night_differential_pay', 'night_differential_hour', 
-                    'deductions', 'deduction_remarks', 'subtotal', 'net_salary', 'date', 
-                    'time_in', 'time_out', 'project'
-                ]
-                for column in required_columns:
-                    if column not in df.columns:
-                        messages.error(request, f'Missing required column: {column}')
-                        return redirect('payroll_batch_upload')
-                    
-                # df = df.applymap(lambda x: '' if pd.isna(x) else x)
-                for column in df.columns:
-                    for index, value in df[column].items():
-                        if pd.isna(value):
-                            field_type = Payroll._meta.get_field(column).get_internal_type()
-                            if field_type == 'DecimalField':
-                                df.at[index, column] = Decimal('0.00') 
-                            elif field_type == 'CharField':
-                                df.at[index, column] = '' 
-                payroll_list = []
-                for index, row in df.iterrows():
-                    try:
-                        employee = Employee.objects.get(id=row['employee_id'])
-                        time_in = pd.to_datetime(row['time_in'], format='%H:%M:%S').time()
-                        time_out = pd.to_datetime(row['time_out'], format='%H:%M:%S').time()
-                        date_value = pd.to_datetime(row['date']).date()
-                        time_in_full = datetime.combine(date_value, time_in)
-                        time_out_full = datetime.combine(date_value, time_out)
-                        payroll = Payroll(
-                            employee=employee,
-                            daily_rate=row['daily_rate'],
-                            allowance=row['allowance'],
-                            total_hours_worked=row['total_hours_worked'],
-                            overtime_pay=row['overtime_pay'],
-                            overtime_hour=row['overtime_hour'],
-                            night_differential_pay=row['night_differential_pay'],
-                            night_differential_hour=row['night_differential_hour'],
-                            deductions=row['deductions'],
-                            deduction_remarks=row.get('deduction_remarks', ''),
-                            subtotal=row['subtotal'],
-                            net_salary=row['net_salary'],
-                            date=pd.to_datetime(row['date']).date(),
-                            time_in=time_in_full,
-                            time_out=time_out_full,
-                            project=row.get('project', ''),
-                        )
-                        payroll_list.append(payroll)
-                    except Employee.DoesNotExist:
-                        messages.error(request, f"Employee with ID {row['employee_id']} does not exist.")
-                        return redirect('payroll_batch_upload')
-                    except Exception as e:
-                        messages.error(request, f"An error occurred: {str(e)}")
-                        return redirect('payroll_batch_upload')
-
-                Payroll.objects.bulk_create(payroll_list)
-                messages.success(request, 'Payroll records uploaded successfully!')
+                sources = importer.expand_sources(form.cleaned_data['excel_file'])
+                if not sources:
+                    messages.error(request, 'No Excel or CSV files found in the upload.')
+                    return redirect('payroll_batch_upload')
+
+                with profiling.phase('import_payroll_sources'):
+                    result = importer.import_payroll_sources(
+                        sources,
+                        all_sheets=form.cleaned_data['all_sheets'],
+                        max_workers=settings.PAYROLL_IMPORT_WORKERS,
+                    )
+            except IntegrityError:
+                messages.error(request, 'Error uploading payroll record: Duplicate record for date entry.')
                 return redirect('payroll_batch_upload')
-            except IntegrityError as e:
-                messages.error(request, f'Error uploading payroll record: Duplicate record for date entry.')
             except Exception as e:
                 messages.error(request, f"An error occurred: {str(e)}")
                 return redirect('payroll_batch_upload')
+
+            if result['errors']:
+                for location, error in result['errors'][:MAX_UPLOAD_ERRORS]:
+                    messages.error(request, f"{location}: {error}")
+                if len(result['errors']) > MAX_UPLOAD_ERRORS:
+                    messages.error(request, f"... and {len(result['errors']) - MAX_UPLOAD_ERRORS} more errors.")
+                return redirect('payroll_batch_upload')
+
+            messages.success(
+                request,
+                f"{result['created']} payroll records uploaded successfully from {len(sources)} file(s)! "
+                f"{result['updated']} updated, {result['unchanged']} unchanged."
+            )
+            if result['skipped_files']:
+                messages.warning(
+                    request,
+                    f"Already imported with the same content: {', '.join(result['skipped_files'])}."
+                )
+            if result['anomalies']:
+                messages.warning(
+                    request,
+                    f"{result['anomalies']} overlapping or implausible shifts need review on the Shift Anomalies page."
+                )
+            return redirect('payroll_batch_upload')
     else:
         form = PayrollUploadForm()
 
-    return render(request, 'batch_upload.html', {'form': form})
+    template_version, _ = upload_template.template_version()
+    return render(request, 'batch_upload.html', {'form': form, 'template_version': template_version})
 
 def downloadTemplate(request):
     """
-    Generates and downloads an Excel template for payroll data entry.
+    Downloads the Excel template for payroll batch uploads.
 
-    This view creates an Excel file with predefined column headers and blank fields, 
-    which serves as a template for users to fill in payroll data. The template includes columns 
-    such as employee ID, daily rate, allowances, total hours worked, overtime pay, and more. 
-    The generated file is returned as an Excel file for download.
+    The template has the columns batchUpload expects, data validation for employee IDs,
+    amounts, dates and times, and a lookup sheet of active employees. The workbook is
+    built once per template version (see payroll.upload_template) and served from the
+    cache afterwards. Responses carry an ETag, so unchanged templates are answered with
+    304 Not Modified, and links that include the current version (?v=...) may be cached
+    by the browser indefinitely.
 
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        HttpResponse: An Excel file containing the payroll template, which the user can download.
-                      The file is named 'payroll_template.xlsx' and includes predefined columns 
-                      with empty values for data entry.
-    """
-    columns = [
-        'employee_id', 'daily_rate', 'allowance', 'total_hours_worked', 'overtime_pay', 
-        'overtime_hour', 'night_differential_pay', 'night_differential_hour', 
-        'deductions', 'deduction_remarks', 'subtotal', 'net_salary', 'date', 
-        'time_in', 'time_out', 'project'
-    ]
-    data = {
-        'employee_id': [''],
-        'daily_rate': [''],
-        'allowance': [0],
-        'total_hours_worked': [0],
-        'overtime_pay': [0],
-        'overtime_hour': [0],
-        'night_differential_pay': [0],
-        'night_differential_hour': [0],
-        'deductions': [0],
-        'deduction_remarks': [''],
-        'subtotal': [0],
-        'net_salary': [0],
-        'date': [''],
-        'time_in': [''],
-        'time_out': [''],
-        'project': ['']
-    }
-    df = pd.DataFrame(data, columns=columns)
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=payroll_template.xlsx'
-
-    with pd.ExcelWriter(response, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Payroll Template')
+        HttpResponse: The 'payroll_template.xlsx' file, or 304 if the client's copy is current.
+    """
+    version, employees = upload_template.template_version()
+    etag = f'"{version}"'
+    if request.GET.get('v') == version:
+        cache_control = 'private, max-age=31536000, immutable'
+    else:
+        cache_control = 'private, no-cache'
 
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(
+            upload_template.template_bytes(version, employees),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+        response['Content-Disposition'] = 'attachment; filename=payroll_template.xlsx'
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
     return response
+
+
+@csrf_exempt
+@require_POST
+def ingestPunches(request):
+    """
+    Receives a batch of raw time-clock punches from a device or integration.
+
+    The request body is either JSON (a list of punches, or an object with a 'punches' list)
+    or CSV with a header row. Each punch needs employee_id, punched_at and direction ('in' or 'out').
+    Thousands of punches can be sent per request; they are validated together and stored
+    with a single bulk insert. Resending punches that were already stored is harmless.
+
+    Devices authenticate with one of the tokens in settings.PAYROLL_PUNCH_TOKENS, sent as
+    "Authorization: Bearer <token>". The endpoint is exempt from CSRF checks because
+    devices have no session, so requests without a valid token are refused; with no
+    tokens configured the endpoint is disabled.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: The received, accepted and duplicate counts and the rejected rows with
+        their errors, or 401 for a missing or invalid token.
+    """
+    if not punches.valid_device_token(request.headers.get('Authorization', '')):
+        response = JsonResponse({'error': 'A valid device token is required.'}, status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+
+    source = request.GET.get('source', '')
+    try:
+        if request.content_type == 'text/csv':
+            df = pd.read_csv(StringIO(request.body.decode('utf-8')), dtype=str)
+        else:
+            payload = json.loads(request.body)
+            if isinstance(payload, dict):
+                source = payload.get('source', source)
+                payload = payload.get('punches', [])
+            df = pd.DataFrame(payload, columns=punches.PUNCH_COLUMNS, dtype=str)
+        result = punches.ingest_punch_frame(df, source=source)
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse(result)
+
+def punchUpload(request):
+    """
+    Imports a punch export file and materializes punches into payroll records.
+
+    - POST with a punch file: Validates and stores all punches from the CSV or Excel export.
+    - POST with start_date and end_date: Pairs the stored punches in that range into shifts
+      and creates or updates the corresponding payroll records.
+    - GET method: Displays the upload and materialize forms.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: Renders the 'punch_upload.html' template, or redirects back to it
+        with a success or error message.
+    """
+    if request.method == 'POST' and 'materialize' in request.POST:
+        start_date = _parse_date(request.POST.get('start_date'))
+        end_date = _parse_date(request.POST.get('end_date'))
+        if not start_date or not end_date or start_date > end_date:
+            messages.error(request, 'Please provide a valid date range.')
+            return redirect('punch_upload')
+
+        with profiling.phase('materialize_punches'):
+            result = punches.materialize_punches(start_date, end_date)
+        messages.success(
+            request,
+            f"Paired {result['shifts']} shifts into {result['upserted']} payroll records "
+            f"({result['unpaired']} unpaired punches)."
+        )
+        if result['locked']:
+            messages.error(request, f"Left out {result['locked']} shifts dated within closed pay periods.")
+        if result['conflicts']:
+            messages.error(
+                request,
+                f"Left {result['conflicts']} payroll records entered by hand or uploaded unchanged; "
+                f"delete them to rebuild them from punches."
+            )
+        if result['skipped_employees']:
+            messages.error(
+                request,
+                f"No daily rate on record for employee IDs: {', '.join(map(str, result['skipped_employees']))}."
+            )
+        return redirect('punch_upload')
+
+    if request.method == 'POST':
+        form = PunchUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            punch_file = form.cleaned_data['punch_file']
+            try:
+                df = punches.read_punch_file(punch_file)
+                result = punches.ingest_punch_frame(df, source=form.cleaned_data['source'] or punch_file.name)
+            except Exception as e:
+                messages.error(request, f"An error occurred: {str(e)}")
+                return redirect('punch_upload')
+
+            messages.success(
+                request,
+                f"{result['accepted']} of {result['received']} punches imported "
+                f"({result['duplicates']} already stored)."
+            )
+            for rejected in result['rejected'][:20]:
+                messages.error(request, f"Row {rejected['row'] + 2}: {rejected['error']}")
+            return redirect('punch_upload')
+    else:
+        form = PunchUploadForm()
+
+    return render(request, 'punch_upload.html', {'form': form})
+
+@staff_member_required
+def requestProfiles(request):
+    """
+    Staff page listing the most recent request profiles.
+
+    With the name GET parameter, shows that profile's SQL queries, phases and top
+    functions instead. Profiles are only recorded when PAYROLL_PROFILING_ENABLED is set.
+    """
+    name = request.GET.get('name')
+    if name:
+        profile = profiling.load_profile(name)
+        if profile is None:
+            raise Http404("Profile not found.")
+        return render(request, 'request_profiles.html', {'profile': profile})
+
+    return render(request, 'request_profiles.html', {
+        'profiles': profiling.recent_profiles(),
+        'profiling_enabled': settings.PAYROLL_PROFILING_ENABLED,
+    })
+
+@staff_member_required
+def downloadProfile(request, name):
+    """
+    Downloads the raw cProfile data of a request profile, for pstats or snakeviz.
+    """
+    path = profiling.profile_path(name)
+    if path is None:
+        raise Http404("Profile not found.")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{name}.prof')
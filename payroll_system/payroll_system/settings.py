@@ -49,9 +49,12 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'payroll.audit.AuditMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'payroll.profiling.ProfilingMiddleware',
+    'payroll.reporting.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'payroll_system.urls'
@@ -85,6 +88,23 @@ DATABASES = {
     }
 }
 
+# Reporting database (see payroll.reporting)
+# Report views read from a 'reporting' database when one is configured. Set PAYROLL_REPORTING_DB
+# to the path of a SQLite snapshot kept fresh with the refresh_reporting_db command, or replace
+# this with a 'reporting' entry pointing at a PostgreSQL replica.
+PAYROLL_REPORTING_DB = os.environ.get('PAYROLL_REPORTING_DB')
+if PAYROLL_REPORTING_DB:
+    DATABASES['reporting'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': PAYROLL_REPORTING_DB,
+    }
+
+DATABASE_ROUTERS = ['payroll.reporting.ReportingRouter']
+
+# Seconds a browser keeps reading from the live database after it saved something, so users
+# see their own changes before the next snapshot refresh.
+PAYROLL_REPORTING_PIN_SECONDS = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -137,3 +157,58 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # MEDIA_URL = '/media/' 
 # MEDIA_ROOT = BASE_DIR / 'media'
 
+
+# Payroll batch upload
+# Number of worker processes used to parse uploaded files (None uses every CPU core).
+PAYROLL_IMPORT_WORKERS = None
+
+# Time clock punch ingestion (see payroll.views.ingestPunches)
+# Devices posting punches must send one of these tokens as "Authorization: Bearer <token>".
+# Set PAYROLL_PUNCH_TOKENS to a comma-separated list; the endpoint is disabled while it is empty.
+PAYROLL_PUNCH_TOKENS = [
+    token.strip() for token in os.environ.get('PAYROLL_PUNCH_TOKENS', '').split(',') if token.strip()
+]
+
+# Payroll records older than this many days (rounded down to whole months) are moved to
+# the archive tables by the archive_payroll command.
+PAYROLL_ARCHIVE_HORIZON_DAYS = 730
+
+# Payslip PDF/Excel rendering
+# Number of worker processes rendering payslips, and how many more renders may wait for one.
+# Further export requests are answered with 503 and Retry-After (seconds) until a slot frees up.
+PAYROLL_RENDER_WORKERS = 2
+PAYROLL_RENDER_QUEUE_LIMIT = 4
+PAYROLL_RENDER_RETRY_AFTER = 10
+# Seconds an export request waits for its payslip before answering 504.
+PAYROLL_RENDER_TIMEOUT = 60
+
+# Bank disbursement files (see payroll.disbursement)
+# Payout file formats offered for closed pay periods: format name -> DisbursementWriter subclass.
+PAYROLL_DISBURSEMENT_WRITERS = {
+    'csv': 'payroll.disbursement.CsvWriter',
+    'fixed': 'payroll.disbursement.FixedWidthWriter',
+}
+# Company name and funding account number written in the header of every payout file.
+PAYROLL_DISBURSEMENT_COMPANY = os.environ.get('PAYROLL_DISBURSEMENT_COMPANY', 'Dellosa Payroll')
+PAYROLL_DISBURSEMENT_ACCOUNT = os.environ.get('PAYROLL_DISBURSEMENT_ACCOUNT', '')
+
+# Employee payroll history (see payroll.ledger.monthly_history)
+# Months of totals shown on the employee details page by default, and the most that can be requested.
+# The history is cached per employee; use a shared CACHES backend (Redis, Memcached or the database)
+# when running several server processes, so a payroll change clears it in all of them.
+PAYROLL_HISTORY_MONTHS = 12
+PAYROLL_HISTORY_MAX_MONTHS = 36
+
+# Audit trail (see payroll.audit)
+# Buffered audit entries are written when the request finishes, after its response, or earlier once this
+# many are pending. Large enough that a batch upload's entries are not encoded and written while it runs.
+PAYROLL_AUDIT_FLUSH_SIZE = 50000
+
+# Request profiling (see payroll.profiling)
+# Disabled unless the PAYROLL_PROFILING environment variable is set to 1; the middleware then
+# profiles staff requests sent with X-Profile: 1 or ?profile=1, plus this fraction of the others.
+PAYROLL_PROFILING_ENABLED = os.environ.get('PAYROLL_PROFILING') == '1'
+PAYROLL_PROFILING_SAMPLE_RATE = 0.0
+# Directory the profiles are written to, and how many of the newest profiles are kept.
+PAYROLL_PROFILING_DIR = BASE_DIR / 'profiles'
+PAYROLL_PROFILING_KEEP = 50